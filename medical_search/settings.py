@@ -194,3 +194,94 @@ GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-3-pro-preview')
 # Chemin vers le dossier contenant les embeddings
 # Par défaut, utiliser le chemin local, sur Heroku utiliser /app/Embedding
 EMBEDDINGS_FOLDER = os.getenv('EMBEDDINGS_FOLDER', str(BASE_DIR / 'Embedding'))
+
+# ============= GÉNÉRATION DES EMBEDDINGS DU CORPUS =============
+# Textes sources des sections (un .txt par pathologie), utilisés par manage.py embed_corpus
+CORPUS_SOURCE_DIR = os.getenv('CORPUS_SOURCE_DIR', str(BASE_DIR / 'disorders'))
+# Chunks par requête d'embedding
+EMBED_CORPUS_BATCH_SIZE = int(os.getenv('EMBED_CORPUS_BATCH_SIZE', '100'))
+# Requêtes d'embedding simultanées
+EMBED_CORPUS_CONCURRENCY = int(os.getenv('EMBED_CORPUS_CONCURRENCY', '4'))
+# Limites de débit du fournisseur (0 = pas de limite)
+EMBED_CORPUS_REQUESTS_PER_MINUTE = int(os.getenv('EMBED_CORPUS_REQUESTS_PER_MINUTE', '500'))
+EMBED_CORPUS_TOKENS_PER_MINUTE = int(os.getenv('EMBED_CORPUS_TOKENS_PER_MINUTE', '1000000'))
+
+# ============= STOCKAGE DES RÉSULTATS =============
+# Durée de vie (secondes) des résultats de recherche et diagnostics stockés côté serveur
+RESULT_STORE_TTL = int(os.getenv('RESULT_STORE_TTL', str(6 * 3600)))
+# Probabilité de purger les entrées expirées à chaque écriture
+RESULT_STORE_PURGE_PROBABILITY = float(os.getenv('RESULT_STORE_PURGE_PROBABILITY', '0.01'))
+# Nombre maximum de diagnostics référencés dans une session
+RESULT_STORE_MAX_DIAGNOSES = int(os.getenv('RESULT_STORE_MAX_DIAGNOSES', '20'))
+
+# ============= RAPPORTS PDF =============
+# Dossier de cache des rapports PDF pré-rendus (un fichier par version de consultation)
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', str(BASE_DIR / 'report_cache'))
+# Nombre de threads de rendu PDF en arrière-plan par worker
+REPORT_RENDER_WORKERS = int(os.getenv('REPORT_RENDER_WORKERS', '1'))
+# Attente maximale (secondes) d'un rendu en arrière-plan déjà lancé avant de rendre soi-même
+REPORT_RENDER_WAIT_TIMEOUT = float(os.getenv('REPORT_RENDER_WAIT_TIMEOUT', '30'))
+# Processus de rendu pour l'export en masse des rapports (par défaut : nombre de cœurs)
+REPORT_EXPORT_WORKERS = int(os.getenv('REPORT_EXPORT_WORKERS', str(os.cpu_count() or 1)))
+
+# ============= RECHERCHE AVEC HISTORIQUE =============
+# Poids de la requête dans le vecteur de recherche (le reste va aux symptômes validés du patient)
+HISTORY_SEARCH_QUERY_WEIGHT = float(os.getenv('HISTORY_SEARCH_QUERY_WEIGHT', '0.75'))
+# Demi-vie (jours) du poids d'un symptôme selon l'ancienneté de la consultation
+HISTORY_SEARCH_HALF_LIFE_DAYS = float(os.getenv('HISTORY_SEARCH_HALF_LIFE_DAYS', '180'))
+# Nombre maximum de symptômes (les plus récents) pris en compte
+HISTORY_SEARCH_MAX_SYMPTOMS = int(os.getenv('HISTORY_SEARCH_MAX_SYMPTOMS', '50'))
+# Taille des lots d'appels à l'API d'embedding pour les symptômes
+SYMPTOM_EMBEDDING_BATCH_SIZE = int(os.getenv('SYMPTOM_EMBEDDING_BATCH_SIZE', '100'))
+
+# ============= CAS SIMILAIRES =============
+# Modèle d'embedding des consultations (doit accepter le paramètre `dimensions`)
+CASE_EMBEDDING_MODEL = os.getenv('CASE_EMBEDDING_MODEL', 'text-embedding-3-small')
+# Dimension réduite des vecteurs : 256 float32 = 1 Ko par consultation
+CASE_EMBEDDING_DIMENSIONS = int(os.getenv('CASE_EMBEDDING_DIMENSIONS', '256'))
+# Taille des lots d'appels à l'API d'embedding pour les consultations
+CASE_EMBEDDING_BATCH_SIZE = int(os.getenv('CASE_EMBEDDING_BATCH_SIZE', '100'))
+# Dossier de l'index local (fichiers en ajout seul, reconstruits depuis la base si absents)
+CASE_INDEX_DIR = os.getenv('CASE_INDEX_DIR', str(BASE_DIR / 'case_index'))
+
+# ============= HISTORIQUE DES PATIENTS =============
+# Consultations affichées par page sur /patient/<id>/history/
+PATIENT_HISTORY_PAGE_SIZE = int(os.getenv('PATIENT_HISTORY_PAGE_SIZE', '50'))
+
+# ============= RECHERCHE INSTANTANÉE DES PATIENTS =============
+# Sans pg_trgm : intervalle (secondes) de rechargement de l'index en mémoire des patients
+PATIENT_TYPEAHEAD_REFRESH_SECONDS = float(os.getenv('PATIENT_TYPEAHEAD_REFRESH_SECONDS', '300'))
+
+# ============= IMPORT DES PATIENTS =============
+# Nombre de lignes validées puis insérées ensemble (bulk_create, un bloc d'identifiants par lot)
+PATIENT_IMPORT_BATCH_SIZE = int(os.getenv('PATIENT_IMPORT_BATCH_SIZE', '500'))
+# Lignes rejetées détaillées dans la réponse de /api/patients/import/ (le total est toujours renvoyé)
+PATIENT_IMPORT_MAX_REPORTED_REJECTS = int(os.getenv('PATIENT_IMPORT_MAX_REPORTED_REJECTS', '200'))
+
+# ============= RECHERCHE PLEIN TEXTE DES CONSULTATIONS =============
+# Configuration PostgreSQL (langue) du tsvector des consultations
+# (après modification : manage.py rebuild_fulltext_index)
+FULLTEXT_SEARCH_CONFIG = os.getenv('FULLTEXT_SEARCH_CONFIG', 'french')
+
+# ============= EXPORTS DE DONNÉES =============
+# Lignes lues par aller-retour avec la base (curseur côté serveur sous PostgreSQL)
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+# Taille approximative (octets) des blocs envoyés au client ou écrits dans le fichier
+EXPORT_FLUSH_BYTES = int(os.getenv('EXPORT_FLUSH_BYTES', str(64 * 1024)))
+
+# ============= BUDGET DE REQUÊTES SQL =============
+# Comptage des requêtes SQL de chaque réponse et journalisation des dépassements de budget (développement par défaut)
+QUERY_BUDGET_MIDDLEWARE = os.getenv('QUERY_BUDGET_MIDDLEWARE', str(DEBUG)) == 'True'
+if QUERY_BUDGET_MIDDLEWARE:
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'pathology_search.query_budget.QueryBudgetMiddleware')
+# En-tête X-DB-Queries (nombre de requêtes SQL de la réponse), si le middleware est actif
+QUERY_BUDGET_HEADER = os.getenv('QUERY_BUDGET_HEADER', str(DEBUG)) == 'True'
+
+# ============= CACHE HTTP DES PATHOLOGIES =============
+# Durée de cache navigateur (secondes) de /api/pathologies/ et /pathology/<page>/ (revalidés par ETag)
+PATHOLOGY_CACHE_MAX_AGE = int(os.getenv('PATHOLOGY_CACHE_MAX_AGE', '86400'))
+
+# ============= TABLEAU DE BORD CLINIQUE =============
+# Pathologies les plus fréquentes détaillées par période sur /analytics/
+ANALYTICS_TOP_PATHOLOGIES = int(os.getenv('ANALYTICS_TOP_PATHOLOGIES', '20'))
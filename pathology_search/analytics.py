@@ -0,0 +1,249 @@
+"""
+Tableau de bord clinique (/analytics/, /api/analytics/).
+
+Les graphiques ne lisent jamais la table des consultations : ils agrègent la
+table ConsultationStat (consultation_stats), dont la taille dépend du nombre
+de valeurs distinctes par jour et par mois, et non du nombre de
+consultations. Une période longue se lit en lignes mensuelles complétées par
+les lignes journalières des mois entamés.
+
+- Mise à jour incrémentale : chaque création, modification ou suppression de
+  consultation ajuste ses compteurs (signals.py, record_saved /
+  record_deleted) par UPDATE ... SET consultations = consultations + 1.
+- Recalcul par lots : `manage.py refresh_consultation_stats` (refresh)
+  reconstruit les mois d'une période par une seule agrégation sur les
+  consultations ; nécessaire après les écritures qui n'émettent pas de
+  signaux (QuerySet.update, bulk_create, loaddata).
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import consultation_stats
+from .consultation_stats import DAY, MONTH
+from .models import Consultation, ConsultationStat, Medecin
+from .utils import period_filter
+
+
+# Champs de la consultation qui déterminent ses lignes d'agrégat
+SOURCE_FIELDS = ('date_consultation', 'pathologie_identifiee', 'criteres_valides', 'medecin_id', 'statut', 'score_similarite')
+KEY_FIELDS = ('dimension', 'granularite', 'periode', 'valeur', 'statut')
+
+# Sauvegarde partielle (update_fields) sans effet sur les agrégats
+UNCHANGED = object()
+
+GRANULARITIES = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Période affichée par défaut
+DEFAULT_PERIOD_DAYS = 365
+
+
+def _contribution(values):
+    """(clés, score) d'une consultation ; values : dictionnaire des SOURCE_FIELDS."""
+    keys = consultation_stats.consultation_keys(
+        values['date_consultation'], values['pathologie_identifiee'], values['criteres_valides'],
+        values['medecin_id'], values['statut'],
+    )
+    return keys, values['score_similarite'] or 0.0
+
+
+def _apply(key, count, score):
+    """Ajoute (count, score) à la ligne `key`, créée au besoin, supprimée si elle ne compte plus rien."""
+    filters = dict(zip(KEY_FIELDS, key))
+    stats = ConsultationStat.objects.filter(**filters)
+    with transaction.atomic():
+        increment = {'consultations': F('consultations') + count, 'somme_scores': F('somme_scores') + score}
+        if not stats.update(**increment):
+            try:
+                with transaction.atomic():
+                    ConsultationStat.objects.create(consultations=count, somme_scores=score, **filters)
+            except IntegrityError:
+                # Ligne créée entre-temps par une écriture concurrente
+                stats.update(**increment)
+        if count < 0:
+            stats.filter(consultations__lte=0).delete()
+
+
+def previous_values(consultation, update_fields=None):
+    """SOURCE_FIELDS de la consultation en base avant sa sauvegarde : None pour une création, UNCHANGED si hors sujet."""
+    if update_fields is not None and not set(update_fields) & {'medecin', *SOURCE_FIELDS}:
+        return UNCHANGED
+    if consultation._state.adding or consultation.pk is None:
+        return None
+    return Consultation.objects.filter(pk=consultation.pk).values(*SOURCE_FIELDS).first()
+
+
+def record_saved(consultation, previous=None):
+    """Reporte une création ou une modification ; previous : résultat de previous_values."""
+    if previous is UNCHANGED:
+        return
+    deltas = defaultdict(lambda: [0, 0.0])
+    keys, score = _contribution({field: getattr(consultation, field) for field in SOURCE_FIELDS})
+    for key in keys:
+        deltas[key][0] += 1
+        deltas[key][1] += score
+    if previous is not None:
+        keys, score = _contribution(previous)
+        for key in keys:
+            deltas[key][0] -= 1
+            deltas[key][1] -= score
+    with transaction.atomic():
+        for key, (count, score) in deltas.items():
+            if count or score:
+                _apply(key, count, score)
+
+
+def record_deleted(consultation):
+    keys, score = _contribution({field: getattr(consultation, field) for field in SOURCE_FIELDS})
+    with transaction.atomic():
+        for key in keys:
+            _apply(key, -1, -score)
+
+
+def detach_medecin(medecin_id):
+    """Reporte les agrégats d'un médecin supprimé sur « sans médecin » (ses consultations passent à NULL)."""
+    with transaction.atomic():
+        stats = list(ConsultationStat.objects.select_for_update().filter(dimension='medecin', valeur=str(medecin_id)))
+        for stat in stats:
+            _apply((stat.dimension, stat.granularite, stat.periode, '0', stat.statut), stat.consultations, stat.somme_scores)
+        ConsultationStat.objects.filter(pk__in=[stat.pk for stat in stats]).delete()
+
+
+@transaction.atomic
+def refresh(date_from=None, date_to=None):
+    """Recalcule les agrégats des mois couvrant la période (tout l'historique par défaut) ; renvoie le nombre de lignes."""
+    date_from = consultation_stats.month_start(date_from) if date_from else None
+    date_to = consultation_stats.month_end(date_to) if date_to else None
+    stat_totals = consultation_stats.totals(
+        Consultation.objects.filter(**period_filter('date_consultation', date_from, date_to))
+    )
+
+    stats = ConsultationStat.objects.all()
+    if date_from:
+        stats = stats.filter(periode__gte=date_from)
+    if date_to:
+        stats = stats.filter(periode__lte=date_to)
+    stats.delete()
+    ConsultationStat.objects.bulk_create(
+        consultation_stats.stat_objects(ConsultationStat, stat_totals), batch_size=consultation_stats.BATCH_SIZE
+    )
+    return len(stat_totals)
+
+
+# ============= TABLEAU DE BORD =============
+
+def default_period():
+    today = timezone.localdate()
+    return today - timedelta(days=DEFAULT_PERIOD_DAYS - 1), today
+
+
+def covering(date_from, date_to):
+    """Lignes couvrant [date_from, date_to] : mois complets, jours des mois entamés."""
+    first_month = consultation_stats.month_start(date_from)
+    if first_month != date_from:
+        first_month = consultation_stats.month_end(date_from) + timedelta(days=1)
+    last_month_end = consultation_stats.month_end(date_to)
+    if last_month_end != date_to:
+        last_month_end = consultation_stats.month_start(date_to) - timedelta(days=1)
+    if first_month > last_month_end:
+        return Q(granularite=DAY, periode__gte=date_from, periode__lte=date_to)
+    return (
+        Q(granularite=MONTH, periode__gte=first_month, periode__lte=last_month_end)
+        | Q(granularite=DAY, periode__gte=date_from, periode__lt=first_month)
+        | Q(granularite=DAY, periode__gt=last_month_end, periode__lte=date_to)
+    )
+
+
+def _measures():
+    return {
+        'total': Sum('consultations'),
+        'total_valides': Sum('consultations', filter=Q(statut='valide')),
+        'total_non_valides': Sum('consultations', filter=Q(statut='non_valide')),
+        'total_scores': Sum('somme_scores'),
+    }
+
+
+def _rates(row):
+    """Complète un groupe agrégé : taux de validation / non-validation (sur les consultations) et score moyen."""
+    total = row.pop('total') or 0
+    valides = row.pop('total_valides') or 0
+    non_valides = row.pop('total_non_valides') or 0
+    somme_scores = row.pop('total_scores') or 0.0
+    row.update({
+        'consultations': total,
+        'valides': valides,
+        'non_valides': non_valides,
+        'taux_validation': round(valides / total, 4) if total else None,
+        'taux_non_validation': round(non_valides / total, 4) if total else None,
+        'score_moyen': round(somme_scores / total, 4) if total else None,
+    })
+    return row
+
+
+def _grouped(stats, dimension, name, limit=None):
+    rows = stats.filter(dimension=dimension).values('valeur').annotate(**_measures()).order_by('-total', 'valeur')
+    if limit:
+        rows = rows[:limit]
+    rows = [_rates(row) for row in rows]
+    for row in rows:
+        row[name] = row.pop('valeur')
+    return rows
+
+
+def dashboard(date_from, date_to, granularity='month', top_pathologies=None):
+    """Séries du tableau de bord pour les jours [date_from, date_to] ; 8 requêtes, dont 7 sur ConsultationStat."""
+    top_pathologies = top_pathologies or settings.ANALYTICS_TOP_PATHOLOGIES
+    stats = ConsultationStat.objects.filter(covering(date_from, date_to))
+    trunc = GRANULARITIES[granularity]
+    if granularity == 'month':
+        periodic = stats.annotate(date=trunc('periode'))
+    else:
+        periodic = ConsultationStat.objects.filter(granularite=DAY, periode__gte=date_from, periode__lte=date_to)
+        periodic = periodic.annotate(date=trunc('periode') if trunc else F('periode'))
+
+    pathologies = _grouped(stats, 'pathologie', 'pathologie', top_pathologies)
+    top = [row['pathologie'] for row in pathologies]
+    pathologies_par_periode = defaultdict(dict)
+    for row in (periodic.filter(dimension='pathologie', valeur__in=top).values('date', 'valeur')
+                .annotate(total=Sum('consultations')).order_by('date')):
+        pathologies_par_periode[row['valeur']][row['date'].isoformat()] = row['total']
+
+    # Chaque consultation a exactement un modèle : totaux lus sur la plus petite dimension
+    par_periode = [
+        _rates(row)
+        for row in periodic.filter(dimension='modele').values('date').annotate(**_measures()).order_by('date')
+    ]
+    for row in par_periode:
+        row['periode'] = row.pop('date').isoformat()
+
+    medecins = _grouped(stats, 'medecin', 'medecin_id')
+    for row in medecins:
+        row['medecin_id'] = int(row['medecin_id'])
+    names = {
+        medecin['id']: f"Dr. {medecin['prenom']} {medecin['nom']}"
+        for medecin in Medecin.objects.filter(id__in=[row['medecin_id'] for row in medecins]).values('id', 'nom', 'prenom')
+    }
+    for row in medecins:
+        row['medecin'] = names.get(row['medecin_id'], 'Non renseigné')
+
+    return {
+        'periode': {'debut': date_from.isoformat(), 'fin': date_to.isoformat(), 'granularite': granularity},
+        'total': _rates(stats.filter(dimension='modele').aggregate(**_measures())),
+        'par_periode': par_periode,
+        'par_pathologie': pathologies,
+        'pathologies_par_periode': [
+            {'pathologie': pathologie, 'series': pathologies_par_periode.get(pathologie, {})} for pathologie in top
+        ],
+        'par_modele': _grouped(stats, 'modele', 'modele'),
+        'par_modele_embedding': _grouped(stats, 'modele_embedding', 'modele_embedding'),
+        'par_medecin': medecins,
+    }
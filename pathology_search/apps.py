@@ -5,3 +5,6 @@ class PathologySearchConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pathology_search'
     verbose_name = 'Recherche de Pathologies'
+
+    def ready(self):
+        from . import signals  # noqa: F401
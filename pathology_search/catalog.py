@@ -0,0 +1,159 @@
+"""
+Catalogue en mémoire des pathologies (métadonnées des fichiers JSON d'embeddings).
+
+Le catalogue est construit une seule fois par version de l'index, puis sert
+toutes les recherches de métadonnées des vues (nom, page HTML, emplacement,
+texte du premier chunk) sans accès au système de fichiers.
+"""
+import hashlib
+import json
+import threading
+import urllib.parse
+from pathlib import Path
+
+from django.conf import settings
+
+from .utils import clean_pathology_name
+
+
+def normalize_html_page(html_page):
+    """Chemin HTML relatif au dossier d'embeddings, tel qu'il apparaît dans les JSON."""
+    html_page = urllib.parse.unquote(str(html_page or '')).replace('\\', '/').lstrip('/')
+    folder = str(settings.EMBEDDINGS_FOLDER).replace('\\', '/').lstrip('/')
+    if html_page.startswith(folder + '/'):
+        html_page = html_page[len(folder) + 1:]
+    return html_page
+
+
+class PathologyCatalog:
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.entries = []
+        self.by_file_name = {}
+        self.by_json_path = {}
+        self.by_html_page = {}
+        self.by_stem = {}
+        self.by_name = {}
+        self.version = ''
+        self.last_modified = 0
+        self._build()
+
+    def _build(self):
+        version_hash = hashlib.sha1()
+
+        for json_file in sorted(self.folder.rglob('*.json')):
+            if json_file.name.endswith('.criteria.json'):
+                # Schémas de critères (manage.py build_pathology_pages), pas des métadonnées d'embeddings
+                continue
+            try:
+                stat = json_file.stat()
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception:
+                # Ignorer les fichiers JSON invalides
+                continue
+            if not isinstance(data, dict) or 'source_file' not in data:
+                continue
+
+            relative_json = json_file.relative_to(self.folder).as_posix()
+            version_hash.update(f"{relative_json}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+            self.last_modified = max(self.last_modified, stat.st_mtime)
+
+            hierarchy = data.get('hierarchy', {}) if isinstance(data.get('hierarchy'), dict) else {}
+            original_name = hierarchy.get('parsed_name', '') or hierarchy.get('file_stem', '')
+            if not original_name:
+                # Dossiers 3072 : pas de hiérarchie, le nom vient du fichier source
+                original_name = Path(data['source_file']).stem.replace('_', ' ')
+            chunks = data.get('chunks') if isinstance(data.get('chunks'), list) else []
+            first_chunk_text = chunks[0].get('text_preview', '') if chunks and isinstance(chunks[0], dict) else ''
+
+            entry = {
+                'name': clean_pathology_name(original_name) if original_name else '',
+                'original_name': original_name,
+                'file_name': Path(data['source_file']).name,
+                'source_file': data['source_file'],
+                'stem': json_file.stem,
+                'json_path': relative_json,
+                'html_page': data.get('html_page', '') or '',
+                'location': hierarchy.get('location', ''),
+                'first_chunk_text': first_chunk_text,
+                'embedding_model': data.get('embedding_model') or data.get('model', 'unknown'),
+            }
+            self.entries.append(entry)
+            self.by_json_path[relative_json] = entry
+
+            self.by_file_name.setdefault(entry['file_name'], entry)
+            self.by_file_name.setdefault(Path(entry['file_name']).stem, entry)
+            self.by_stem.setdefault(entry['stem'], entry)
+            if entry['html_page']:
+                self.by_html_page.setdefault(normalize_html_page(entry['html_page']), entry)
+            if entry['name']:
+                self.by_name.setdefault(entry['name'].lower(), entry)
+
+        # Les pages HTML font aussi partie de la version (cache HTTP des pages de pathologie)
+        for html_file in sorted(self.folder.rglob('*.html')):
+            stat = html_file.stat()
+            version_hash.update(f"{html_file.relative_to(self.folder).as_posix()}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+            self.last_modified = max(self.last_modified, stat.st_mtime)
+
+        self.version = version_hash.hexdigest()[:16]
+
+        # Liste servie par /api/pathologies/ (triée par nom)
+        self.pathology_list = sorted(
+            (
+                {
+                    'name': entry['name'],
+                    'original_name': entry['original_name'],
+                    'html_page': entry['html_page'],
+                    'location': entry['location'],
+                }
+                for entry in self.entries
+                if entry['html_page'] and entry['original_name']
+            ),
+            key=lambda x: x['name']
+        )
+
+    def find_by_file_name(self, file_name):
+        """Retrouver une pathologie à partir du nom de fichier source (avec ou sans .txt)."""
+        if not file_name:
+            return None
+        file_name = file_name.replace('.txt', '')
+        entry = self.by_file_name.get(file_name)
+        if entry is None:
+            # Même tolérance que l'ancien parcours des JSON : correspondance partielle
+            for candidate in self.entries:
+                if file_name in candidate['source_file']:
+                    return candidate
+        return entry
+
+    def find_by_html_page(self, html_page):
+        return self.by_html_page.get(normalize_html_page(html_page)) if html_page else None
+
+    def find_by_name(self, name):
+        return self.by_name.get(clean_pathology_name(name).lower()) if name else None
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(folder=None):
+    """Catalogue du dossier d'embeddings (par défaut EMBEDDINGS_FOLDER), construit au premier appel."""
+    key = str(folder or settings.EMBEDDINGS_FOLDER)
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.get(key)
+            if catalog is None:
+                catalog = PathologyCatalog(key)
+                _catalogs[key] = catalog
+    return catalog
+
+
+def reload_catalog(folder=None):
+    """Reconstruire le catalogue après une reconstruction de l'index."""
+    key = str(folder or settings.EMBEDDINGS_FOLDER)
+    with _catalogs_lock:
+        _catalogs[key] = PathologyCatalog(key)
+        return _catalogs[key]
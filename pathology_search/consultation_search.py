@@ -0,0 +1,162 @@
+"""
+Recherche plein texte dans les consultations (/api/consultations/search/).
+
+Champs indexés, par poids décroissant : pathologie identifiée, description
+clinique, plans de traitement (proposé et validé), notes du médecin. L'index
+est tenu à jour par la base elle-même, à chaque écriture (fulltext_schema) :
+
+- PostgreSQL : colonne tsvector search_vector (configuration
+  FULLTEXT_SEARCH_CONFIG) remplie par trigger, index GIN
+  consultation_search_vector_idx, tri par ts_rank_cd.
+- SQLite (développement) : table FTS5 consultation_fts alimentée par
+  triggers, tri par bm25.
+
+Les résultats sont triés par pertinence puis par id et paginés par clé : le
+curseur porte (pertinence, id) de la dernière ligne de la page précédente.
+"""
+import re
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from . import fulltext_schema
+from .models import Consultation
+from .patient_timeline import STATUT_LABELS
+from .utils import (
+    PATIENT_NAME_FIELDS, clean_pathology_name, decode_cursor, encode_cursor, patient_full_name,
+    period_filter, typed,
+)
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Longueur de l'extrait de description renvoyé
+EXCERPT_LENGTH = 240
+
+# Mots de recherche pris en compte (SQLite)
+MAX_SEARCH_TERMS = 8
+
+# Poids bm25 des colonnes de consultation_fts (consultation_id, pathologie, description, plan, plan validé, notes)
+FTS_WEIGHTS = (0.0, 10.0, 4.0, 2.0, 2.0, 1.0)
+
+# Colonnes lues par serialize
+RESULT_FIELDS = (
+    'id', 'date_consultation', 'statut', 'pathologie_identifiee', 'description_clinique',
+    'patient_id', *(f'patient__{field}' for field in PATIENT_NAME_FIELDS),
+    'medecin_id', 'medecin__nom', 'medecin__prenom',
+)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def fulltext_engine():
+    """'postgresql', 'sqlite' ou None si l'index plein texte est absent (vérifié une fois par processus)."""
+    alias = connection.alias
+    if alias not in _engines:
+        with _engines_lock:
+            if alias not in _engines:
+                engine = None
+                with connection.cursor() as cursor:
+                    if connection.vendor == 'postgresql':
+                        cursor.execute(
+                            "SELECT 1 FROM information_schema.columns "
+                            "WHERE table_name = 'pathology_search_consultation' AND column_name = 'search_vector'"
+                        )
+                        engine = 'postgresql' if cursor.fetchone() else None
+                    elif connection.vendor == 'sqlite':
+                        # Table et triggers (perdus si une migration reconstruit la table des consultations)
+                        names = ('consultation_fts',) + fulltext_schema.SQLITE_TRIGGERS
+                        cursor.execute(
+                            f"SELECT count(*) FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names
+                        )
+                        engine = 'sqlite' if cursor.fetchone()[0] == len(names) else None
+                _engines[alias] = engine
+    return _engines[alias]
+
+
+def fts5_query(query):
+    """Requête FTS5 : chaque mot entre guillemets (pas d'opérateurs), tous requis."""
+    terms = re.findall(r'\w+', query)[:MAX_SEARCH_TERMS]
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def _match_and_rank(query):
+    """(condition de correspondance, expression de pertinence) ; pertinence croissante avec la qualité."""
+    if fulltext_engine() == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = (settings.FULLTEXT_SEARCH_CONFIG, query)
+        match = RawSQL(f'pathology_search_consultation.search_vector @@ {tsquery}', params, output_field=BooleanField())
+        # float8 : valeur relue exactement depuis le curseur de pagination
+        rank = RawSQL(
+            f'ts_rank_cd(pathology_search_consultation.search_vector, {tsquery})::float8',
+            params, output_field=FloatField()
+        )
+        return match, rank
+
+    fts_query = fts5_query(query)
+    match = RawSQL(
+        'pathology_search_consultation.id IN (SELECT consultation_id FROM consultation_fts WHERE consultation_fts MATCH %s)',
+        (fts_query,), output_field=BooleanField()
+    )
+    # bm25 est négatif (plus petit = plus pertinent) : opposé pour trier comme PostgreSQL
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    rank = RawSQL(
+        f'(SELECT -bm25(consultation_fts, {weights}) FROM consultation_fts '
+        'WHERE consultation_fts MATCH %s AND consultation_id = pathology_search_consultation.id)',
+        (fts_query,), output_field=FloatField()
+    )
+    return match, rank
+
+
+def serialize(row):
+    description = row['description_clinique'] or ''
+    if len(description) > EXCERPT_LENGTH:
+        description = description[:EXCERPT_LENGTH].rsplit(' ', 1)[0] + '…'
+    return {
+        'id': str(row['id']),
+        'date_consultation': timezone.localtime(row['date_consultation']).strftime('%d/%m/%Y à %H:%M'),
+        'statut': STATUT_LABELS.get(row['statut'], row['statut']),
+        'pathologie_identifiee': clean_pathology_name(row['pathologie_identifiee']),
+        'extrait': description,
+        'patient_id': row['patient_id'],
+        # Même format que Medecin.nom_complet
+        'patient': patient_full_name(row, 'patient__'),
+        'medecin': f"Dr. {row['medecin__prenom']} {row['medecin__nom']}" if row['medecin_id'] else 'Non renseigné',
+        'pertinence': row['rank'],
+    }
+
+
+def search_consultations(query, medecin_id=None, statut=None, date_from=None, date_to=None,
+                         cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """(consultations sérialisées, curseur de la page suivante ou None)."""
+    if not query.strip() or fulltext_engine() is None:
+        return [], None
+    if fulltext_engine() == 'sqlite' and not fts5_query(query):
+        return [], None
+
+    match, rank = _match_and_rank(query)
+    consultations = Consultation.objects.filter(match, **period_filter('date_consultation', date_from, date_to))
+    if medecin_id:
+        consultations = consultations.filter(medecin_id=medecin_id)
+    if statut:
+        consultations = consultations.filter(statut=statut)
+    consultations = consultations.annotate(rank=rank)
+    if cursor:
+        last_rank, consultation_id = decode_cursor(cursor, typed(int, float), uuid.UUID)
+        consultations = consultations.filter(Q(rank__lt=last_rank) | Q(rank=last_rank, id__gt=consultation_id))
+
+    rows = list(consultations.order_by('-rank', 'id').values(*RESULT_FIELDS, 'rank')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['rank'], str(last['id']))
+    return [serialize(row) for row in rows], next_cursor
@@ -0,0 +1,102 @@
+"""
+Clés des agrégats du tableau de bord clinique (ConsultationStat, analytics).
+
+Partagé par la migration 0019, le recalcul par lots et la mise à jour
+incrémentale ; ne dépend pas des modèles (les fonctions reçoivent un
+queryset ou un modèle, éventuellement historique).
+
+Chaque consultation compte, pour son statut, dans une ligne par dimension
+(pathologie, modèle, modèle d'embedding, médecin) et par granularité : son
+jour et son mois. Les lectures ne parcourent ainsi qu'une dimension, et les
+longues périodes se lisent en lignes mensuelles.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Sum
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .utils import clean_pathology_name
+
+
+DAY = 'jour'
+MONTH = 'mois'
+DIMENSIONS = ('pathologie', 'modele', 'modele_embedding', 'medecin')
+
+# Modèle des consultations sans métadonnées (même valeur par défaut que les rapports)
+DEFAULT_MODEL = 'chatgpt-5.1'
+# Modèle d'embedding des consultations antérieures à son enregistrement dans _metadata
+NOT_RECORDED = 'non_renseigne'
+
+BATCH_SIZE = 1000
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return (month_start(day) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def metadata_models(criteres_valides):
+    """(modèle, modèle d'embedding) enregistrés dans criteres_valides['_metadata']."""
+    metadata = criteres_valides.get('_metadata') if isinstance(criteres_valides, dict) else None
+    metadata = metadata if isinstance(metadata, dict) else {}
+    return metadata.get('model_used'), metadata.get('embedding_model')
+
+
+def stat_keys(jour, pathologie_identifiee, modele, modele_embedding, medecin_id, statut):
+    """Clés (dimension, granularité, période, valeur, statut) des lignes d'une consultation."""
+    values = (
+        ('pathologie', (clean_pathology_name(pathologie_identifiee) or '')[:200]),
+        ('modele', str(modele or DEFAULT_MODEL)[:50]),
+        ('modele_embedding', str(modele_embedding or NOT_RECORDED)[:50]),
+        ('medecin', str(medecin_id or 0)),
+    )
+    return [
+        (dimension, granularite, periode, valeur, statut)
+        for dimension, valeur in values
+        for granularite, periode in ((DAY, jour), (MONTH, month_start(jour)))
+    ]
+
+
+def consultation_keys(date_consultation, pathologie_identifiee, criteres_valides, medecin_id, statut):
+    return stat_keys(
+        timezone.localdate(date_consultation), pathologie_identifiee, *metadata_models(criteres_valides),
+        medecin_id, statut,
+    )
+
+
+def totals(consultations):
+    """{clé: [consultations, somme des scores]} d'un queryset de consultations (une requête groupée)."""
+    metadata = KeyTransform('_metadata', 'criteres_valides')
+    groups = (
+        consultations
+        .annotate(
+            jour=TruncDate('date_consultation'),
+            modele=KeyTextTransform('model_used', metadata),
+            modele_embedding=KeyTextTransform('embedding_model', metadata),
+        )
+        .values_list('jour', 'pathologie_identifiee', 'modele', 'modele_embedding', 'medecin_id', 'statut')
+        .annotate(total=Count('id'), scores=Sum('score_similarite'))
+        .order_by()
+    )
+    result = {}
+    # Les libellés bruts qui se confondent une fois nettoyés sont additionnés
+    for *fields, total, scores in groups.iterator(chunk_size=BATCH_SIZE):
+        for key in stat_keys(*fields):
+            counters = result.setdefault(key, [0, 0.0])
+            counters[0] += total
+            counters[1] += scores or 0.0
+    return result
+
+
+def stat_objects(model, stat_totals):
+    """Instances (non enregistrées) du modèle ConsultationStat pour bulk_create."""
+    for (dimension, granularite, periode, valeur, statut), (total, scores) in stat_totals.items():
+        yield model(
+            dimension=dimension, granularite=granularite, periode=periode, valeur=valeur, statut=statut,
+            consultations=total, somme_scores=scores,
+        )
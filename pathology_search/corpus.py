@@ -0,0 +1,434 @@
+"""
+Génération hors ligne des embeddings du corpus (`manage.py embed_corpus`).
+
+Les textes sources (CORPUS_SOURCE_DIR/**/*.txt, un fichier par section du DSM)
+sont découpés en chunks de mots avec recouvrement, comme les fichiers
+d'origine. Chaque chunk est identifié par l'empreinte SHA-256 de son texte et
+du modèle : les vecteurs déjà calculés sont lus dans un cache SQLite
+(<dossier>/.embedding_cache.sqlite3) et seuls les chunks absents sont envoyés à
+l'API, par lots, avec un nombre borné de requêtes simultanées et une limite de
+requêtes / tokens par minute. Chaque lot est enregistré dès sa réception : une
+exécution interrompue reprend là où elle s'était arrêtée.
+
+Le pipeline écrit ensuite les fichiers historiques (<section>.npy et
+<section>.json) puis l'index compilé (search_index.npz) et la matrice de
+similarité (pathology_similarity.npz).
+
+Reconstruction incrémentale : chaque JSON enregistre l'empreinte du fichier
+source et de chacun de ses chunks. Les vecteurs des fichiers existants sont
+repris dans le cache (par empreinte de chunk), seuls les fichiers dont le
+texte a changé sont réécrits, et l'index compilé est mis à jour par segments :
+les lignes des fichiers inchangés sont recopiées sans relire leur .npy.
+"""
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_NAME = '.embedding_cache.sqlite3'
+
+# Découpage des fichiers d'origine
+MAX_WORDS_PER_CHUNK = 1000
+OVERLAP_WORDS = 100
+
+# Longueur de l'aperçu de chaque chunk dans le JSON
+PREVIEW_LENGTH = 200
+
+# Limite de tokens d'une requête (l'API OpenAI refuse au-delà de 300 000)
+MAX_BATCH_TOKENS = 250000
+
+MAX_RETRIES = 6
+
+
+def estimate_tokens(text):
+    # Approximation suffisante pour le découpage en lots et la limite de débit
+    return len(text) // 4 + 1
+
+
+def chunk_words(text, max_words=MAX_WORDS_PER_CHUNK, overlap=OVERLAP_WORDS):
+    """Chunks de `max_words` mots, chacun reprenant les `overlap` derniers mots du précédent."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(max_words - overlap, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(' '.join(words[start:start + max_words]))
+        if start + max_words >= len(words):
+            break
+    return chunks
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def chunk_key(embedding_model_name, text):
+    """Clé de cache d'un chunk : même texte et même modèle => même vecteur."""
+    return content_hash(f"{embedding_model_name}\0{text}")
+
+
+class EmbeddingCache:
+    """Vecteurs déjà calculés, par clé de chunk (SQLite, partagé entre threads)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS chunk_embedding ('
+            'chunk_key TEXT PRIMARY KEY, model TEXT NOT NULL, dimension INTEGER NOT NULL, vector BLOB NOT NULL)'
+        )
+        self._connection.commit()
+
+    def get_many(self, keys):
+        """{clé: vecteur float32} des clés présentes dans le cache."""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._connection.execute(
+                    f"SELECT chunk_key, vector FROM chunk_embedding WHERE chunk_key IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, model, items):
+        """Enregistrer [(clé, vecteur)] ; validé immédiatement (point de reprise)."""
+        rows = [
+            (key, model, len(vector), np.asarray(vector, dtype=np.float32).tobytes())
+            for key, vector in items
+        ]
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO chunk_embedding VALUES (?, ?, ?, ?)', rows)
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class RateLimiter:
+    """Limite de requêtes et de tokens par minute (fenêtre glissante de 60 s), partagée entre threads."""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._events = []   # (instant, tokens)
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._events = [(t, n) for t, n in self._events if now - t < 60]
+                used_tokens = sum(n for _, n in self._events)
+                requests_ok = not self.requests_per_minute or len(self._events) < self.requests_per_minute
+                # Un lot plus gros que la limite passe seul plutôt que jamais
+                tokens_ok = (
+                    not self.tokens_per_minute or not self._events
+                    or used_tokens + tokens <= self.tokens_per_minute
+                )
+                if requests_ok and tokens_ok:
+                    self._events.append((now, tokens))
+                    return
+                wait = 60 - (now - self._events[0][0])
+            time.sleep(max(wait, 0.05))
+
+
+def discover_sources(source_dir):
+    """Fichiers texte du corpus, triés par chemin relatif."""
+    return sorted(Path(source_dir).rglob('*.txt'))
+
+
+def _html_page(relative_json, output_folder):
+    """Page HTML associée à une section (reprise du JSON existant, ou du dossier ada)."""
+    for folder in (Path(output_folder), Path(settings.EMBEDDINGS_FOLDER)):
+        try:
+            with open(folder / relative_json, 'r', encoding='utf-8') as f:
+                html_page = json.load(f).get('html_page')
+            if html_page:
+                return html_page
+        except (OSError, ValueError):
+            continue
+    return ''
+
+
+def plan_corpus(source_dir, embedding_model_name, max_words=MAX_WORDS_PER_CHUNK, overlap=OVERLAP_WORDS):
+    """Documents du corpus avec leurs chunks, empreintes et clés de cache."""
+    source_dir = Path(source_dir)
+    documents = []
+    for source_file in discover_sources(source_dir):
+        text = source_file.read_text(encoding='utf-8')
+        chunks = [
+            {
+                'text': chunk,
+                'word_count': len(chunk.split()),
+                'content_hash': content_hash(chunk),
+                'key': chunk_key(embedding_model_name, chunk),
+            }
+            for chunk in chunk_words(text, max_words, overlap)
+        ]
+        if not chunks:
+            continue
+        relative_path = source_file.relative_to(source_dir)
+        documents.append({
+            'source_file': source_file,
+            'relative_path': relative_path,
+            'file_hash': content_hash(text),
+            'total_word_count': len(text.split()),
+            'chunks': chunks,
+        })
+    return documents
+
+
+def _batches(chunks, batch_size):
+    """Lots d'au plus `batch_size` chunks et MAX_BATCH_TOKENS tokens."""
+    batch, batch_tokens = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk['text'])
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > MAX_BATCH_TOKENS):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+
+def _embed_batch(service, limiter, batch, tokens):
+    for attempt in range(MAX_RETRIES):
+        limiter.acquire(tokens)
+        try:
+            return service.get_embeddings([chunk['text'] for chunk in batch], task_type='retrieval_document')
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            # Limite de débit ou erreur transitoire : attente exponentielle
+            delay = min(2 ** attempt, 60) + random.random()
+            logger.warning(f"Embedding batch failed ({e}), retry in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def embed_missing(documents, service, cache, batch_size=100, concurrency=4, limiter=None, progress=None):
+    """
+    Vectoriser les chunks absents du cache (dédupliqués). Retourne le nombre de
+    chunks vectorisés ; `progress(fait, total)` est appelé après chaque lot.
+    """
+    limiter = limiter or RateLimiter()
+    distinct = {}
+    for document in documents:
+        for chunk in document['chunks']:
+            distinct.setdefault(chunk['key'], chunk)
+    cached = cache.get_many(distinct)
+    missing = [chunk for key, chunk in distinct.items() if key not in cached]
+    if not missing:
+        return 0
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix='embed-corpus') as executor:
+        futures = {
+            executor.submit(_embed_batch, service, limiter, batch, tokens): batch
+            for batch, tokens in _batches(missing, batch_size)
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            vectors = future.result()
+            cache.put_many(service.embedding_model_name, [(chunk['key'], vector) for chunk, vector in zip(batch, vectors)])
+            done += len(batch)
+            if progress:
+                progress(done, len(missing))
+    return done
+
+
+def _atomic_write(path, write):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    tmp_path.replace(path)
+
+
+def write_artifacts(document, vectors, output_folder, embedding_model_name, max_words=MAX_WORDS_PER_CHUNK, overlap=OVERLAP_WORDS):
+    """Écrire <section>.npy et <section>.json au format des fichiers d'origine."""
+    output_folder = Path(output_folder)
+    relative_path = document['relative_path']
+    npy_file = output_folder / relative_path.with_suffix('.npy')
+    json_file = npy_file.with_suffix('.json')
+    npy_file.parent.mkdir(parents=True, exist_ok=True)
+    relative_json = json_file.relative_to(output_folder).as_posix()
+
+    embeddings = np.vstack(vectors).astype(np.float32)
+    folders = list(relative_path.parts[:-1])
+    metadata = {
+        'source_file': document['source_file'].as_posix(),
+        'relative_path': relative_path.as_posix(),
+        'html_page': _html_page(relative_json, output_folder),
+        'hierarchy': {
+            'file_name': relative_path.name,
+            'file_stem': relative_path.stem,
+            'folders': folders,
+            'full_path': relative_path.as_posix(),
+            'parsed_name': relative_path.stem.replace('_', ' '),
+            'location': ' > '.join(folders + [relative_path.stem]),
+        },
+        'total_word_count': document['total_word_count'],
+        'num_chunks': len(document['chunks']),
+        'max_words_per_chunk': max_words,
+        'overlap_words': overlap,
+        'embedding_model': embedding_model_name,
+        'embedding_shape': list(embeddings.shape),
+        'file_hash': document['file_hash'],
+        'chunks': [
+            {
+                'chunk_id': i,
+                'word_count': chunk['word_count'],
+                'text_preview': chunk['text'][:PREVIEW_LENGTH] + ('...' if len(chunk['text']) > PREVIEW_LENGTH else ''),
+                'content_hash': chunk['content_hash'],
+            }
+            for i, chunk in enumerate(document['chunks'])
+        ],
+    }
+    _atomic_write(npy_file, lambda f: np.save(f, embeddings))
+    _atomic_write(json_file, lambda f: f.write(json.dumps(metadata, ensure_ascii=False, indent=2).encode('utf-8')))
+    return npy_file
+
+
+def read_artifacts(output_folder, relative_path):
+    """(métadonnées, embeddings) existants d'une section, ou (None, None)."""
+    npy_file = Path(output_folder) / Path(relative_path).with_suffix('.npy')
+    try:
+        with open(npy_file.with_suffix('.json'), 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        embeddings = np.load(npy_file)
+    except (OSError, ValueError):
+        return None, None
+    chunks = metadata.get('chunks') if isinstance(metadata.get('chunks'), list) else []
+    if embeddings.ndim != 2 or len(embeddings) != len(chunks):
+        return None, None
+    return metadata, embeddings
+
+
+def seed_cache(documents, output_folder, cache, embedding_model_name):
+    """
+    Reprendre dans le cache les vecteurs des fichiers existants pour les chunks
+    inchangés : par empreinte, ou, pour les JSON d'origine sans empreinte, par
+    position et aperçu identiques. Retourne le nombre de vecteurs repris.
+    """
+    adopted = []
+    for document in documents:
+        metadata, embeddings = read_artifacts(output_folder, document['relative_path'])
+        if metadata is None or (metadata.get('embedding_model') or metadata.get('model')) != embedding_model_name:
+            continue
+        existing = metadata['chunks']
+        by_hash = {chunk.get('content_hash'): i for i, chunk in enumerate(existing) if chunk.get('content_hash')}
+        for position, chunk in enumerate(document['chunks']):
+            row = by_hash.get(chunk['content_hash'])
+            if row is None and not by_hash and position < len(existing):
+                preview = chunk['text'][:PREVIEW_LENGTH] + ('...' if len(chunk['text']) > PREVIEW_LENGTH else '')
+                if existing[position].get('text_preview') == preview and existing[position].get('word_count') == chunk['word_count']:
+                    row = position
+            if row is not None:
+                adopted.append((chunk['key'], embeddings[row]))
+
+    cached = cache.get_many(key for key, _ in adopted)
+    adopted = [(key, vector) for key, vector in adopted if key not in cached]
+    if adopted:
+        cache.put_many(embedding_model_name, adopted)
+    return len(adopted)
+
+
+def document_status(document, output_folder, embedding_model_name, max_words=MAX_WORDS_PER_CHUNK, overlap=OVERLAP_WORDS):
+    """'added', 'modified' ou 'unchanged' selon le JSON existant de la section."""
+    metadata, _ = read_artifacts(output_folder, document['relative_path'])
+    if metadata is None:
+        json_file = Path(output_folder) / document['relative_path'].with_suffix('.json')
+        return 'modified' if json_file.exists() else 'added'
+    unchanged = (
+        metadata.get('file_hash') == document['file_hash']
+        and metadata.get('embedding_model') == embedding_model_name
+        and metadata.get('max_words_per_chunk') == max_words
+        and metadata.get('overlap_words') == overlap
+        and [chunk.get('content_hash') for chunk in metadata['chunks']] == [chunk['content_hash'] for chunk in document['chunks']]
+    )
+    return 'unchanged' if unchanged else 'modified'
+
+
+def find_orphans(documents, output_folder):
+    """Chemins relatifs (sans extension) des sections présentes dans le dossier mais plus dans les sources."""
+    output_folder = Path(output_folder)
+    sources = {document['relative_path'].with_suffix('').as_posix() for document in documents}
+    orphans = []
+    for npy_file in sorted(output_folder.rglob('*.npy')):
+        path = npy_file.relative_to(output_folder).with_suffix('').as_posix()
+        if path not in sources and npy_file.with_suffix('.json').exists():
+            orphans.append(path)
+    return orphans
+
+
+def remove_artifacts(output_folder, paths):
+    """Supprimer les .npy / .json des sections (les pages HTML sont conservées)."""
+    for path in paths:
+        for suffix in ('.npy', '.json'):
+            (Path(output_folder) / f"{path}{suffix}").unlink(missing_ok=True)
+
+
+def diff_corpus(documents, output_folder, embedding_model_name, max_words=MAX_WORDS_PER_CHUNK, overlap=OVERLAP_WORDS):
+    """Rapport des changements : {'added': [...], 'modified': [...], 'unchanged': [...], 'orphans': [...]} (chemins sans extension)."""
+    report = {'added': [], 'modified': [], 'unchanged': [], 'orphans': find_orphans(documents, output_folder)}
+    for document in documents:
+        status = document_status(document, output_folder, embedding_model_name, max_words, overlap)
+        report[status].append(document['relative_path'].with_suffix('').as_posix())
+    return report
+
+
+def write_corpus(documents, cache, output_folder, embedding_model_name, report, max_words=MAX_WORDS_PER_CHUNK, overlap=OVERLAP_WORDS):
+    """Écrire, à partir du cache, les fichiers des sections ajoutées ou modifiées du rapport. Retourne le nombre de fichiers écrits."""
+    changed = set(report['added']) | set(report['modified'])
+    written = 0
+    for document in documents:
+        if document['relative_path'].with_suffix('').as_posix() not in changed:
+            continue
+        vectors = cache.get_many(chunk['key'] for chunk in document['chunks'])
+        missing = [chunk for chunk in document['chunks'] if chunk['key'] not in vectors]
+        if missing:
+            raise ValueError(f"{len(missing)} chunk(s) non vectorisé(s) pour {document['relative_path']}")
+        write_artifacts(
+            document, [vectors[chunk['key']] for chunk in document['chunks']],
+            output_folder, embedding_model_name, max_words, overlap,
+        )
+        written += 1
+    return written
+
+
+def compile_folder(folder, previous=None, changed_paths=(), removed_paths=()):
+    """
+    Index compilé et matrice de similarité du dossier, rechargés dans ce processus.
+    Avec `previous` (index compilé à jour avant l'écriture), seuls les segments
+    des fichiers modifiés sont relus.
+    """
+    from . import catalog, differentials, search_index
+
+    if previous is not None:
+        index = previous.patched(changed_paths, removed_paths)
+    else:
+        index = search_index.SearchIndex(folder)
+    index.save(search_index.compiled_path(folder))
+    differentials.build_matrix_file(folder, index=index)
+    catalog.reload_catalog(folder)
+    search_index.reload_index(folder)
+    differentials.reload_matrix(folder)
+    return index
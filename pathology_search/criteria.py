@@ -0,0 +1,300 @@
+"""
+Critères diagnostiques structurés extraits des pages HTML des pathologies.
+
+Chaque page est analysée une fois (à la construction de l'index via
+`manage.py build_pathology_pages`, sinon au premier accès) en un schéma JSON :
+
+    {"sections": [{"id": "formulaire", "title": "...", "hidden": false,
+                   "groups": [{"id": "critereA", "legend": "Critère A – ...",
+                               "subtitle": "...", "notes": [...], "hidden": false,
+                               "items": [{"id": "critereA-0", "type": "checkbox",
+                                          "name": "critereA", "label": "..."}]}]}]}
+
+La page de validation affiche ce schéma côté client et renvoie les identifiants
+des éléments cochés, convertis ici en form_data ({légende: [libellés]}).
+"""
+import json
+import os
+import re
+import threading
+from html.parser import HTMLParser
+from pathlib import Path
+
+from django.conf import settings
+
+from . import catalog
+
+
+CRITERIA_SUFFIX = '.criteria.json'
+
+# Version du format du schéma (à incrémenter si l'extraction change)
+SCHEMA_VERSION = 1
+
+CHOICE_TYPES = ('checkbox', 'radio')
+INPUT_TYPES = CHOICE_TYPES + ('text',)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _clean(text):
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+class CriteriaParser(HTMLParser):
+    """Analyse les formulaires (form > fieldset > label > input) d'une page de pathologie."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections = []
+        self._section = None
+        self._group = None
+        self._pending_title = None
+        self._capture = None      # ('title' | 'legend' | 'subtitle' | 'note' | 'label', [morceaux])
+        self._label_items = []    # éléments rattachés au <label> en cours
+        self._skip_depth = 0      # dans <script> / <style>
+
+    # --- structure ---
+
+    def _current_section(self):
+        if self._section is None:
+            # Fieldsets hors <form> : section par défaut
+            self._section = {'id': 'formulaire', 'title': self._pending_title or '', 'hidden': False, 'groups': []}
+            self._pending_title = None
+            self.sections.append(self._section)
+        return self._section
+
+    def _current_group(self):
+        if self._group is None:
+            section = self._current_section()
+            self._group = {
+                'id': f"{section['id']}-groupe-{len(section['groups'])}",
+                'legend': section['title'],
+                'subtitle': '',
+                'notes': [],
+                'hidden': False,
+                'items': [],
+            }
+            section['groups'].append(self._group)
+        return self._group
+
+    def _start_capture(self, kind):
+        self._capture = (kind, [])
+
+    def _end_capture(self, kind):
+        if self._capture is None or self._capture[0] != kind:
+            return None
+        text = _clean(''.join(self._capture[1]))
+        self._capture = None
+        return text
+
+    # --- HTMLParser ---
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        hidden = 'hidden' in classes or 'display: none' in (attrs.get('style') or '').replace('display:none', 'display: none')
+
+        if tag == 'h2' and 'section-title' in classes:
+            self._start_capture('title')
+        elif tag == 'form':
+            self._section = {
+                'id': attrs.get('id') or f"formulaire-{len(self.sections)}",
+                'title': self._pending_title or '',
+                'hidden': hidden,
+                'groups': [],
+            }
+            self._pending_title = None
+            self.sections.append(self._section)
+        elif tag == 'fieldset':
+            section = self._current_section()
+            self._group = {
+                'id': attrs.get('id') or f"{section['id']}-groupe-{len(section['groups'])}",
+                'legend': '',
+                'subtitle': '',
+                'notes': [],
+                'hidden': hidden,
+                'items': [],
+            }
+            section['groups'].append(self._group)
+        elif tag == 'legend' and self._group is not None:
+            self._start_capture('legend')
+        elif tag == 'p' and self._group is not None and self._capture is None:
+            self._start_capture('subtitle' if 'subtitle' in classes else 'note')
+        elif tag == 'label':
+            self._start_capture('label')
+            self._label_items = []
+        elif tag == 'input' and (attrs.get('type') or 'text').lower() in INPUT_TYPES:
+            group = self._current_group()
+            item = {
+                'id': f"{group['id']}-{len(group['items'])}",
+                'type': (attrs.get('type') or 'text').lower(),
+                'name': attrs.get('name') or attrs.get('id') or '',
+                'value': attrs.get('value') or '',
+                'label': '',
+            }
+            if attrs.get('placeholder'):
+                item['placeholder'] = attrs['placeholder']
+            group['items'].append(item)
+            if self._capture is not None and self._capture[0] == 'label':
+                self._label_items.append(item)
+            else:
+                item['label'] = _clean(item['value']) or item['name']
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._skip_depth:
+            return
+
+        if tag == 'h2':
+            title = self._end_capture('title')
+            if title is not None:
+                self._pending_title = title
+        elif tag == 'form':
+            self._section = None
+            self._group = None
+        elif tag == 'fieldset':
+            self._group = None
+        elif tag == 'legend':
+            legend = self._end_capture('legend')
+            if legend is not None and self._group is not None:
+                self._group['legend'] = legend
+        elif tag == 'p':
+            if self._capture is not None and self._capture[0] in ('subtitle', 'note') and self._group is not None:
+                kind = self._capture[0]
+                text = self._end_capture(kind)
+                if text:
+                    if kind == 'subtitle' and not self._group['subtitle']:
+                        self._group['subtitle'] = text
+                    else:
+                        self._group['notes'].append(text)
+        elif tag == 'label':
+            text = self._end_capture('label')
+            for item in self._label_items:
+                item['label'] = text or _clean(item['value']) or item['name']
+            self._label_items = []
+
+    def close(self):
+        super().close()
+        # La valeur n'est conservée que si elle diffère du libellé (schéma compact)
+        for section in self.sections:
+            for group in section['groups']:
+                for item in group['items']:
+                    if item['value'] == item['label']:
+                        del item['value']
+
+    def handle_data(self, data):
+        if self._capture is not None and not self._skip_depth:
+            self._capture[1].append(data)
+
+
+def extract_criteria(html_text):
+    """Schéma des critères d'une page HTML (sections et groupes sans élément ignorés)."""
+    parser = CriteriaParser()
+    parser.feed(html_text)
+    parser.close()
+
+    sections = []
+    for section in parser.sections:
+        groups = [group for group in section['groups'] if group['items']]
+        if groups:
+            sections.append({**section, 'groups': groups})
+    return {'schema_version': SCHEMA_VERSION, 'sections': sections}
+
+
+def criteria_path(html_file):
+    return Path(html_file).with_name(Path(html_file).name + CRITERIA_SUFFIX)
+
+
+def build_criteria_file(html_file, force=False):
+    """Écrire le schéma à côté de la page HTML. Retourne False s'il était déjà à jour."""
+    html_file = Path(html_file)
+    target = criteria_path(html_file)
+    if not force and target.exists() and target.stat().st_mtime >= html_file.stat().st_mtime:
+        return False
+    schema = extract_criteria(html_file.read_text(encoding='utf-8'))
+    target.write_text(json.dumps(schema, ensure_ascii=False, separators=(',', ':')), encoding='utf-8')
+    return True
+
+
+def _load_criteria(full_path):
+    target = criteria_path(full_path)
+    try:
+        if target.stat().st_mtime >= full_path.stat().st_mtime:
+            with open(target, 'r', encoding='utf-8') as f:
+                schema = json.load(f)
+            if schema.get('schema_version') == SCHEMA_VERSION:
+                return schema
+    except (OSError, ValueError):
+        pass
+    # Schéma absent ou périmé : extraction à la volée
+    return extract_criteria(full_path.read_text(encoding='utf-8'))
+
+
+_schemas = {}
+_schemas_version = None
+_schemas_lock = threading.Lock()
+
+
+def get_criteria(html_page):
+    """Schéma des critères d'une page (chemin relatif au dossier d'embeddings), ou None si introuvable."""
+    global _schemas, _schemas_version
+    html_page = catalog.normalize_html_page(html_page)
+    if not html_page:
+        return None
+
+    version = catalog.get_catalog().version
+    with _schemas_lock:
+        if _schemas_version != version:
+            # Nouvel index : les schémas en mémoire sont obsolètes
+            _schemas = {}
+            _schemas_version = version
+        schema = _schemas.get(html_page)
+    if schema is not None:
+        return schema
+
+    full_path = Path(settings.EMBEDDINGS_FOLDER) / html_page
+    # Vérifier que le chemin est bien dans le dossier embeddings (sécurité)
+    if not os.path.abspath(full_path).startswith(os.path.abspath(settings.EMBEDDINGS_FOLDER)):
+        return None
+    if not full_path.is_file():
+        return None
+
+    schema = _load_criteria(full_path)
+    with _schemas_lock:
+        if _schemas_version == version:
+            _schemas[html_page] = schema
+    return schema
+
+
+def has_items(schema):
+    return bool(schema) and any(section['groups'] for section in schema.get('sections', []))
+
+
+def form_data_from_selection(schema, selection):
+    """
+    Convertir la sélection renvoyée par la page ({id: true | texte}) en form_data
+    groupé par légende, au même format que les critères déjà enregistrés.
+    """
+    form_data = {}
+    if not schema or not isinstance(selection, dict):
+        return form_data
+
+    for section in schema.get('sections', []):
+        for group in section['groups']:
+            section_name = group['legend'] or section['title'] or 'Critères'
+            for item in group['items']:
+                selected = selection.get(item['id'])
+                if not selected:
+                    continue
+                if item['type'] in CHOICE_TYPES:
+                    form_data.setdefault(section_name, []).append(item['label'])
+                elif isinstance(selected, str) and selected.strip():
+                    form_data[item['label'] or item['name']] = selected.strip()
+    return form_data
@@ -0,0 +1,160 @@
+"""
+Exports en flux des consultations et des patients (CSV ou NDJSON).
+
+Les lignes sont lues en projection (values_list, jointures patient et médecin
+dans la même requête) par paquets de EXPORT_CHUNK_SIZE : curseur côté serveur
+sous PostgreSQL, fetchmany ailleurs. Elles sont encodées au fil de l'eau et
+envoyées par blocs d'environ EXPORT_FLUSH_BYTES vers la réponse HTTP ou le
+fichier : la mémoire utilisée ne dépend pas du volume exporté.
+
+Les colonnes de l'export patients reprennent les clés de l'import
+(patient_import) : un export peut être réimporté tel quel.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Consultation, Patient
+from .utils import period_filter
+
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+
+CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson; charset=utf-8',
+}
+
+# Colonne exportée -> champ lu
+CONSULTATION_COLUMNS = (
+    ('id', 'id'),
+    ('date_consultation', 'date_consultation'),
+    ('statut', 'statut'),
+    ('pathologie_identifiee', 'pathologie_identifiee'),
+    ('score_similarite', 'score_similarite'),
+    ('patient_id', 'patient_id'),
+    ('patient_identifier', 'patient__patient_identifier'),
+    ('patient_nom', 'patient__nom'),
+    ('patient_prenom', 'patient__prenom'),
+    ('patient_cin', 'patient__cin'),
+    ('patient_sexe', 'patient__gender'),
+    ('patient_date_naissance', 'patient__date_naissance'),
+    ('medecin_id', 'medecin_id'),
+    ('medecin_nom', 'medecin__nom'),
+    ('medecin_prenom', 'medecin__prenom'),
+    ('medecin_specialite', 'medecin__specialite'),
+    ('medecin_numero_ordre', 'medecin__numero_ordre'),
+    ('description_clinique', 'description_clinique'),
+    ('criteres_valides', 'criteres_valides'),
+    ('plan_traitement_valide', 'plan_traitement_valide'),
+    ('notes_medecin', 'notes_medecin'),
+)
+
+# Anciennes et nouvelles colonnes fusionnées (les fiches n'ont souvent que l'une des deux)
+PATIENT_ANNOTATIONS = {
+    'export_last_name': Coalesce('last_name', 'nom'),
+    'export_first_name': Coalesce('first_name', 'prenom'),
+    'export_birth_date': Coalesce('birth_date', 'date_naissance'),
+    'export_identifier': Coalesce('patient_identifier', 'numero_dossier'),
+}
+
+PATIENT_COLUMNS = (
+    ('id', 'id'),
+    ('patient_identifier', 'export_identifier'),
+    ('last_name', 'export_last_name'),
+    ('first_name', 'export_first_name'),
+    ('cin', 'cin'),
+    ('passport_number', 'passport_number'),
+    ('gender', 'gender'),
+    ('birth_date', 'export_birth_date'),
+    ('nationality', 'nationality'),
+    ('profession', 'profession'),
+    ('city', 'city'),
+    ('email', 'email'),
+    ('phone', 'phone'),
+    ('mobile_number', 'mobile_number'),
+    ('has_insurance', 'has_insurance'),
+    ('insurance_number', 'insurance_number'),
+    ('affiliation_number', 'affiliation_number'),
+    ('date_creation', 'date_creation'),
+)
+
+
+def consultation_rows(date_from=None, date_to=None, statut=None):
+    """Consultations (tuples dans l'ordre de CONSULTATION_COLUMNS), ordre chronologique."""
+    consultations = Consultation.objects.filter(**period_filter('date_consultation', date_from, date_to))
+    if statut:
+        consultations = consultations.filter(statut=statut)
+    return (
+        consultations.order_by('date_consultation', 'id')
+        .values_list(*(field for _, field in CONSULTATION_COLUMNS))
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+def patient_rows(date_from=None, date_to=None):
+    """Patients (tuples dans l'ordre de PATIENT_COLUMNS), par date de création."""
+    patients = Patient.objects.filter(**period_filter('date_creation', date_from, date_to))
+    return (
+        patients.annotate(**PATIENT_ANNOTATIONS)
+        .order_by('id')
+        .values_list(*(field for _, field in PATIENT_COLUMNS))
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        # Même écriture que l'import (patient_import) et le JSON
+        return 'true' if value else 'false'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def iter_encoded(rows, columns, fmt):
+    """Octets de l'export, par blocs d'environ EXPORT_FLUSH_BYTES."""
+    names = [name for name, _ in columns]
+    flush_bytes = settings.EXPORT_FLUSH_BYTES
+    buffer = io.StringIO()
+    if fmt == CSV:
+        writer = csv.writer(buffer)
+        # BOM : accents lisibles à l'ouverture dans un tableur
+        buffer.write('\ufeff')
+        writer.writerow(names)
+    for row in rows:
+        if fmt == CSV:
+            writer.writerow([_csv_value(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder, ensure_ascii=False))
+            buffer.write('\n')
+        if buffer.tell() >= flush_bytes:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def export_consultations(fmt, date_from=None, date_to=None, statut=None):
+    return iter_encoded(consultation_rows(date_from, date_to, statut), CONSULTATION_COLUMNS, fmt)
+
+
+def export_patients(fmt, date_from=None, date_to=None):
+    return iter_encoded(patient_rows(date_from, date_to), PATIENT_COLUMNS, fmt)
+
+
+def export_filename(kind, fmt):
+    return f"{kind}_{timezone.now():%Y%m%d_%H%M%S}.{fmt}"
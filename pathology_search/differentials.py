@@ -0,0 +1,207 @@
+"""
+Matrice de similarité pathologie × pathologie, par dossier d'embeddings.
+
+Chaque pathologie est représentée par la moyenne de ses chunks normalisés.
+La matrice des cosinus et les plus proches voisins de chaque pathologie sont
+calculés une fois (`manage.py build_similarity_matrix`, sinon au premier
+accès) : un diagnostic différentiel n'est ensuite qu'une lecture en mémoire,
+sans appel d'embedding ni recherche.
+"""
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from . import catalog
+from .search_index import embedding_files, embeddings_version
+
+
+MATRIX_FILE_NAME = 'pathology_similarity.npz'
+
+# Nombre de voisins conservés par pathologie
+MAX_NEIGHBOURS = 20
+
+
+def pathology_embeddings(folder):
+    """Clés (JSON relatif) et embedding agrégé normalisé de chaque pathologie du dossier."""
+    folder = Path(folder)
+    keys = []
+    vectors = []
+    dimension = None
+    for npy_file in embedding_files(folder):
+        json_file = npy_file.with_suffix('.json')
+        if not json_file.exists():
+            continue
+        embeddings = np.load(npy_file).astype(np.float32)
+        if embeddings.ndim != 2 or len(embeddings) == 0:
+            continue
+        # Même règle que la recherche : on ignore les fichiers d'une autre dimension
+        if dimension is None:
+            dimension = embeddings.shape[1]
+        elif embeddings.shape[1] != dimension:
+            continue
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vector = (embeddings / norms).mean(axis=0)
+        norm = np.linalg.norm(vector)
+        vectors.append(vector / norm if norm else vector)
+        keys.append(json_file.relative_to(folder).as_posix())
+
+    if not vectors:
+        return keys, np.zeros((0, 0), dtype=np.float32)
+    return keys, np.vstack(vectors)
+
+
+class SimilarityMatrix:
+
+    def __init__(self, keys, matrix, neighbours, version):
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.matrix = matrix
+        self.neighbours = neighbours
+        self.version = version
+
+    @classmethod
+    def build(cls, folder):
+        version = embeddings_version(folder)
+        keys, vectors = pathology_embeddings(folder)
+        return cls.from_vectors(keys, vectors, version)
+
+    @classmethod
+    def from_index(cls, index):
+        """Matrice calculée à partir d'un index de recherche (chunks déjà chargés et normalisés)."""
+        keys = []
+        vectors = []
+        for file_info in index.files:
+            vector = index.chunks[file_info['start']:file_info['stop']].mean(axis=0)
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+            keys.append(f"{file_info['path']}.json")
+        vectors = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return cls.from_vectors(keys, vectors, index.version)
+
+    @classmethod
+    def from_vectors(cls, keys, vectors, version):
+        matrix = (vectors @ vectors.T).astype(np.float32)
+
+        # Voisins triés par similarité décroissante, sans la pathologie elle-même
+        scores = matrix.copy()
+        np.fill_diagonal(scores, -np.inf)
+        limit = min(MAX_NEIGHBOURS, max(len(keys) - 1, 0))
+        neighbours = np.argsort(-scores, axis=1)[:, :limit].astype(np.int32)
+        return cls(keys, matrix, neighbours, version)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                [str(key) for key in data['keys']],
+                data['matrix'],
+                data['neighbours'],
+                str(data['version']),
+            )
+
+    def save(self, path):
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                keys=np.array(self.keys, dtype=str),
+                matrix=self.matrix,
+                neighbours=self.neighbours,
+                version=np.array(self.version),
+            )
+        tmp_path.replace(path)
+
+    def nearest(self, key, limit=5):
+        """[(clé, similarité)] des pathologies les plus proches de `key`."""
+        row = self.index.get(key)
+        if row is None:
+            return []
+        return [(self.keys[j], float(self.matrix[row, j])) for j in self.neighbours[row, :limit]]
+
+
+def matrix_path(folder):
+    return Path(folder) / MATRIX_FILE_NAME
+
+
+def build_matrix_file(folder, index=None):
+    """Calculer et enregistrer la matrice du dossier (à partir de `index` s'il est fourni)."""
+    matrix = SimilarityMatrix.from_index(index) if index is not None else SimilarityMatrix.build(folder)
+    matrix.save(matrix_path(folder))
+    return matrix
+
+
+_matrices = {}
+_matrices_lock = threading.Lock()
+
+
+def _load_or_build(folder):
+    path = matrix_path(folder)
+    if path.exists():
+        try:
+            matrix = SimilarityMatrix.load(path)
+            if matrix.version == embeddings_version(folder):
+                return matrix
+        except (OSError, ValueError, KeyError):
+            pass
+    # Matrice absente ou périmée : calcul en mémoire (quelques centaines de pathologies)
+    return SimilarityMatrix.build(folder)
+
+
+def get_matrix(folder):
+    """Matrice du dossier d'embeddings, chargée ou calculée au premier appel."""
+    key = str(folder)
+    matrix = _matrices.get(key)
+    if matrix is None:
+        with _matrices_lock:
+            matrix = _matrices.get(key)
+            if matrix is None:
+                matrix = _load_or_build(key)
+                _matrices[key] = matrix
+    return matrix
+
+
+def reload_matrix(folder):
+    """Recharger la matrice après une reconstruction de l'index."""
+    key = str(folder)
+    with _matrices_lock:
+        _matrices[key] = _load_or_build(key)
+        return _matrices[key]
+
+
+def find_entry(folder, file_name=None, html_page=None, name=None):
+    """Entrée du catalogue du dossier correspondant à l'un des identifiants fournis."""
+    pathology_catalog = catalog.get_catalog(folder)
+    entry = None
+    if file_name:
+        entry = pathology_catalog.find_by_file_name(file_name)
+    if entry is None and html_page:
+        entry = pathology_catalog.find_by_html_page(html_page)
+    if entry is None and name:
+        entry = pathology_catalog.find_by_name(name)
+    return entry
+
+
+def get_differentials(folder, entry, limit=5):
+    """Diagnostics différentiels (pathologies les plus proches) d'une entrée du catalogue."""
+    if entry is None:
+        return []
+    pathology_catalog = catalog.get_catalog(folder)
+
+    differentials = []
+    for key, similarity in get_matrix(folder).nearest(entry['json_path'], limit):
+        candidate = pathology_catalog.by_json_path.get(key)
+        if candidate is None:
+            continue
+        differentials.append({
+            'name': candidate['name'],
+            'file_name': candidate['file_name'],
+            'html_page': candidate['html_page'],
+            'location': candidate['location'],
+            'similarity': similarity,
+            'similarity_percent': round(similarity * 100, 1),
+        })
+    return differentials
@@ -0,0 +1,128 @@
+"""
+Schéma de l'index plein texte des consultations (consultation_search).
+
+Partagé par la migration 0017 et `manage.py rebuild_fulltext_index` ; ne
+dépend pas des modèles. Après une modification de FULLTEXT_SEARCH_CONFIG, ou
+sous SQLite après une migration qui reconstruit la table des consultations
+(les triggers disparaissent avec l'ancienne table), relancer la commande.
+"""
+from django.conf import settings
+
+
+TABLE = 'pathology_search_consultation'
+BATCH_SIZE = 5000
+
+
+def _pg_vector(record):
+    # Pathologie (A), description (B), plans de traitement (C), notes (D)
+    return (
+        f"setweight(to_tsvector(%(config)s, coalesce({record}.pathologie_identifiee, '')), 'A') || "
+        f"setweight(to_tsvector(%(config)s, coalesce({record}.description_clinique, '')), 'B') || "
+        f"setweight(to_tsvector(%(config)s, coalesce({record}.plan_traitement, '') || ' ' || "
+        f"coalesce({record}.plan_traitement_valide, '')), 'C') || "
+        f"setweight(to_tsvector(%(config)s, coalesce({record}.notes_medecin, '')), 'D')"
+    )
+
+
+def _install_postgresql(schema_editor):
+    config = "'%s'::regconfig" % settings.FULLTEXT_SEARCH_CONFIG.replace("'", "''")
+    schema_editor.execute(f'ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector')
+    # Tenu à jour par la base à chaque écriture, y compris QuerySet.update() et bulk_create()
+    schema_editor.execute(
+        'CREATE OR REPLACE FUNCTION consultation_search_vector_update() RETURNS trigger AS $$\n'
+        'BEGIN\n'
+        f'  NEW.search_vector := {_pg_vector("NEW") % {"config": config}};\n'
+        '  RETURN NEW;\n'
+        'END\n'
+        '$$ LANGUAGE plpgsql'
+    )
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS consultation_search_vector_insert ON {TABLE}')
+    schema_editor.execute(
+        f'CREATE TRIGGER consultation_search_vector_insert BEFORE INSERT ON {TABLE} '
+        'FOR EACH ROW EXECUTE FUNCTION consultation_search_vector_update()'
+    )
+    # save() réécrit toutes les colonnes : recalcul seulement si un texte indexé a changé
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS consultation_search_vector_modify ON {TABLE}')
+    schema_editor.execute(
+        f'CREATE TRIGGER consultation_search_vector_modify BEFORE UPDATE ON {TABLE} FOR EACH ROW WHEN ('
+        'OLD.pathologie_identifiee IS DISTINCT FROM NEW.pathologie_identifiee'
+        ' OR OLD.description_clinique IS DISTINCT FROM NEW.description_clinique'
+        ' OR OLD.plan_traitement IS DISTINCT FROM NEW.plan_traitement'
+        ' OR OLD.plan_traitement_valide IS DISTINCT FROM NEW.plan_traitement_valide'
+        ' OR OLD.notes_medecin IS DISTINCT FROM NEW.notes_medecin'
+        ') EXECUTE FUNCTION consultation_search_vector_update()'
+    )
+    # Remplissage par lots (verrous courts sur les grandes tables)
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                f'UPDATE {TABLE} SET search_vector = {_pg_vector(TABLE) % {"config": config}} '
+                f'WHERE id IN (SELECT id FROM {TABLE} WHERE search_vector IS NULL LIMIT {BATCH_SIZE})'
+            )
+            if cursor.rowcount < BATCH_SIZE:
+                break
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS consultation_search_vector_idx ON {TABLE} USING gin (search_vector)'
+    )
+
+
+FTS_COLUMNS = 'pathologie_identifiee, description_clinique, plan_traitement, plan_traitement_valide, notes_medecin'
+FTS_VALUES = (
+    '{r}.id, {r}.pathologie_identifiee, {r}.description_clinique, '
+    '{r}.plan_traitement, {r}.plan_traitement_valide, {r}.notes_medecin'
+)
+
+
+def _install_sqlite(schema_editor):
+    # Table FTS5 séparée (développement local) : l'id UUID ne peut pas servir de rowid
+    try:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS consultation_fts USING fts5('
+            f'consultation_id UNINDEXED, {FTS_COLUMNS}, '
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    except Exception:
+        # SQLite compilé sans FTS5 : recherche indisponible (consultation_search.fulltext_engine)
+        return
+    schema_editor.execute(
+        f'CREATE TRIGGER IF NOT EXISTS consultation_fts_insert AFTER INSERT ON {TABLE} BEGIN '
+        f'INSERT INTO consultation_fts (consultation_id, {FTS_COLUMNS}) VALUES ({FTS_VALUES.format(r="NEW")}); END'
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER IF NOT EXISTS consultation_fts_update AFTER UPDATE OF {FTS_COLUMNS} ON {TABLE} BEGIN '
+        'DELETE FROM consultation_fts WHERE consultation_id = OLD.id; '
+        f'INSERT INTO consultation_fts (consultation_id, {FTS_COLUMNS}) VALUES ({FTS_VALUES.format(r="NEW")}); END'
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER IF NOT EXISTS consultation_fts_delete AFTER DELETE ON {TABLE} BEGIN '
+        'DELETE FROM consultation_fts WHERE consultation_id = OLD.id; END'
+    )
+    schema_editor.execute('DELETE FROM consultation_fts')
+    schema_editor.execute(
+        f'INSERT INTO consultation_fts (consultation_id, {FTS_COLUMNS}) '
+        f'SELECT {FTS_VALUES.format(r=TABLE)} FROM {TABLE}'
+    )
+
+
+SQLITE_TRIGGERS = ('consultation_fts_insert', 'consultation_fts_update', 'consultation_fts_delete')
+
+
+def install(schema_editor):
+    """Créer (ou compléter) l'index, ses triggers, et l'alimenter."""
+    if schema_editor.connection.vendor == 'postgresql':
+        _install_postgresql(schema_editor)
+    elif schema_editor.connection.vendor == 'sqlite':
+        _install_sqlite(schema_editor)
+
+
+def uninstall(schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS consultation_search_vector_idx')
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS consultation_search_vector_modify ON {TABLE}')
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS consultation_search_vector_insert ON {TABLE}')
+        schema_editor.execute('DROP FUNCTION IF EXISTS consultation_search_vector_update()')
+        schema_editor.execute(f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector')
+    elif schema_editor.connection.vendor == 'sqlite':
+        for trigger in SQLITE_TRIGGERS:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS consultation_fts')
@@ -0,0 +1,95 @@
+"""
+Attribution des identifiants patients (EE-AAAA-NNN) et médecins (MED-AAAA-NNN).
+
+Un compteur par préfixe et par année (IdentifierCounter) est incrémenté par
+une seule requête UPDATE ... SET dernier_numero = dernier_numero + n : deux
+créations simultanées obtiennent des numéros distincts, sans relire la
+dernière ligne créée. Le verrou de ligne ne dure que la transaction de
+l'attribution, à appeler hors des transactions longues.
+
+- Changement d'année : nouveau préfixe, numérotation reprise à 001.
+- Pré-attribution par blocs (allocate) : un import de N patients réserve ses
+  N numéros en une requête.
+- À sa création, un compteur part du plus grand numéro déjà présent en base
+  pour ce préfixe ; un identifiant saisi à la main fait avancer le compteur
+  (reserve), l'allocateur ne le redonnera pas.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import IdentifierCounter, Medecin, Patient
+
+
+PATIENT = 'EE'
+MEDECIN = 'MED'
+
+# Colonnes déjà numérotées par préfixe (point de départ d'un nouveau compteur)
+EXISTING_COLUMNS = {
+    PATIENT: ((Patient, 'patient_identifier'), (Patient, 'numero_dossier')),
+    MEDECIN: ((Medecin, 'numero_ordre'),),
+}
+
+IDENTIFIER_PATTERN = re.compile(r'^([A-Z]+-\d{4})-(\d+)$')
+
+
+def counter_prefix(kind, year=None):
+    return f"{kind}-{year or timezone.localdate().year}"
+
+
+def format_identifier(prefix, number):
+    return f"{prefix}-{number:03d}"
+
+
+def _existing_max(kind, prefix):
+    """Plus grand numéro déjà attribué pour ce préfixe (comparaison numérique, 1000 > 999)."""
+    highest = 0
+    for model, column in EXISTING_COLUMNS[kind]:
+        values = model.objects.filter(**{f'{column}__startswith': f'{prefix}-'}).values_list(column, flat=True)
+        for value in values.iterator(chunk_size=2000):
+            match = IDENTIFIER_PATTERN.match(value)
+            if match and match.group(1) == prefix:
+                highest = max(highest, int(match.group(2)))
+    return highest
+
+
+def _ensure_counter(kind, prefix):
+    if IdentifierCounter.objects.filter(prefixe=prefix).exists():
+        return
+    try:
+        with transaction.atomic():
+            IdentifierCounter.objects.create(prefixe=prefix, dernier_numero=_existing_max(kind, prefix))
+    except IntegrityError:
+        # Créé entre-temps par un autre processus
+        pass
+
+
+def allocate(kind, count=1, year=None):
+    """Réserver `count` numéros consécutifs ; retourne la liste des identifiants."""
+    if count < 1:
+        return []
+    prefix = counter_prefix(kind, year)
+    with transaction.atomic():
+        updated = IdentifierCounter.objects.filter(prefixe=prefix).update(dernier_numero=F('dernier_numero') + count)
+        if not updated:
+            _ensure_counter(kind, prefix)
+            IdentifierCounter.objects.filter(prefixe=prefix).update(dernier_numero=F('dernier_numero') + count)
+        # Ligne verrouillée par l'UPDATE jusqu'à la fin de la transaction : valeur propre à cet appel
+        last = IdentifierCounter.objects.filter(prefixe=prefix).values_list('dernier_numero', flat=True).get()
+    return [format_identifier(prefix, number) for number in range(last - count + 1, last + 1)]
+
+
+def next_identifier(kind, year=None):
+    return allocate(kind, 1, year)[0]
+
+
+def reserve(kind, identifier):
+    """Faire avancer le compteur au-delà d'un identifiant choisi hors de l'allocateur."""
+    match = IDENTIFIER_PATTERN.match(identifier or '')
+    if not match or not match.group(1).startswith(f'{kind}-'):
+        return
+    prefix, number = match.group(1), int(match.group(2))
+    _ensure_counter(kind, prefix)
+    IdentifierCounter.objects.filter(prefixe=prefix, dernier_numero__lt=number).update(dernier_numero=number)
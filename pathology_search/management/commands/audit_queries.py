@@ -0,0 +1,48 @@
+"""
+Audit des accès à la base : nombre de requêtes SQL des vues budgétées
+(query_budget.VIEW_BUDGETS) et utilisation des index par les chemins d'accès
+principaux (EXPLAIN). Sort en erreur au moindre écart : utilisable en
+intégration continue sur une base de démonstration.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from pathology_search import query_budget
+
+
+class Command(BaseCommand):
+    help = "Vérifier les budgets de requêtes SQL des vues et l'utilisation des index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true', help="Afficher les plans d'exécution")
+        parser.add_argument('--sql', action='store_true', help="Afficher les requêtes des vues hors budget")
+
+    def handle(self, *args, **options):
+        if query_budget.sample_patient_id() is None:
+            raise CommandError("Aucun patient en base : vues non auditées (charger une base de démonstration)")
+        # Client de test : hôte 'testserver' autorisé
+        setup_test_environment()
+        failures = 0
+
+        self.stdout.write("Requêtes SQL par vue :")
+        for name, path, status, count, budget, queries in query_budget.audit_budgets():
+            ok = count <= budget and status < 400
+            failures += not ok
+            style = self.style.SUCCESS if ok else self.style.ERROR
+            self.stdout.write(style(f"  {'OK ' if ok else 'KO '} {count:>2} / {budget:<2} {name} ({path}, HTTP {status})"))
+            if not ok and options['sql']:
+                for sql in queries:
+                    self.stdout.write(f"        {sql}")
+
+        self.stdout.write("Index des chemins d'accès :")
+        for description, index_name, used, plan in query_budget.audit_plans():
+            failures += not used
+            style = self.style.SUCCESS if used else self.style.ERROR
+            self.stdout.write(style(f"  {'OK ' if used else 'KO '} {description} ({index_name})"))
+            if options['plans'] or not used:
+                for line in plan.splitlines():
+                    self.stdout.write(f"        {line}")
+
+        if failures:
+            raise CommandError(f"{failures} écart(s) détecté(s)")
+        self.stdout.write(self.style.SUCCESS("Aucun écart"))
@@ -0,0 +1,61 @@
+"""
+Génère les variantes précompressées (gzip et brotli) des pages HTML de
+pathologies, servies directement par la vue view_pathology, ainsi que le
+schéma des critères diagnostiques de chaque page (<page>.html.criteria.json),
+servi par /api/pathologies/criteria/.
+
+À exécuter après chaque reconstruction du corpus (et au déploiement).
+"""
+import gzip
+from pathlib import Path
+
+import brotli
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pathology_search.criteria import build_criteria_file
+
+
+class Command(BaseCommand):
+    help = "Précompresser (gzip, brotli) les pages HTML des pathologies et extraire leurs critères"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--folder', default=settings.EMBEDDINGS_FOLDER, help="Dossier des pages HTML")
+        parser.add_argument('--force', action='store_true', help="Régénérer même les variantes à jour")
+
+    def handle(self, *args, **options):
+        folder = Path(options['folder'])
+
+        built = 0
+        skipped = 0
+        original_size = 0
+        compressed_size = 0
+        criteria_built = 0
+        for html_file in sorted(folder.rglob('*.html')):
+            if build_criteria_file(html_file, force=options['force']):
+                criteria_built += 1
+
+            content = html_file.read_bytes()
+            original_size += len(content)
+
+            variants = [
+                ('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+                ('.br', lambda data: brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)),
+            ]
+
+            for suffix, compress in variants:
+                target = html_file.with_name(html_file.name + suffix)
+                if not options['force'] and target.exists() and target.stat().st_mtime >= html_file.stat().st_mtime:
+                    skipped += 1
+                    compressed_size += target.stat().st_size
+                    continue
+                data = compress(content)
+                target.write_bytes(data)
+                compressed_size += len(data)
+                built += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{built} variante(s) générée(s), {skipped} déjà à jour "
+            f"({original_size / 1024:.0f} Ko de HTML, {compressed_size / 1024:.0f} Ko compressés), "
+            f"{criteria_built} schéma(s) de critères extrait(s)"
+        ))
@@ -0,0 +1,41 @@
+"""
+Compile l'index de recherche de chaque dossier d'embeddings
+(<dossier>/search_index.npz) : une seule matrice des chunks normalisés et les
+métadonnées des fichiers, chargées au démarrage sans relire les .npy / .json.
+
+À exécuter après chaque reconstruction du corpus (et au déploiement).
+"""
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from pathology_search.search_index import build_compiled_index
+from pathology_search.services import get_embedding_config
+
+
+EMBEDDING_MODELS = ('openai-ada', 'openai-3-large', 'gemini')
+
+
+class Command(BaseCommand):
+    help = "Compiler l'index de recherche des dossiers d'embeddings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--embedding-model', choices=EMBEDDING_MODELS, action='append',
+            help="Modèle(s) d'embedding à traiter (par défaut : tous)"
+        )
+
+    def handle(self, *args, **options):
+        for embedding_model in options['embedding_model'] or EMBEDDING_MODELS:
+            folder = Path(get_embedding_config(embedding_model)['folder'])
+            if not folder.exists():
+                self.stdout.write(self.style.WARNING(f"{embedding_model}: dossier {folder} absent, ignoré"))
+                continue
+
+            start = time.perf_counter()
+            index = build_compiled_index(folder)
+            self.stdout.write(self.style.SUCCESS(
+                f"{embedding_model}: {len(index.files)} fichiers, {index.chunks.shape[0]} chunks "
+                f"compilés en {(time.perf_counter() - start) * 1000:.0f} ms"
+            ))
@@ -0,0 +1,41 @@
+"""
+Calcule la matrice de similarité pathologie × pathologie de chaque dossier
+d'embeddings (<dossier>/pathology_similarity.npz), utilisée pour les
+diagnostics différentiels.
+
+À exécuter après chaque reconstruction du corpus (et au déploiement).
+"""
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from pathology_search.differentials import build_matrix_file
+from pathology_search.services import get_embedding_config
+
+
+EMBEDDING_MODELS = ('openai-ada', 'openai-3-large', 'gemini')
+
+
+class Command(BaseCommand):
+    help = "Calculer la matrice de similarité entre pathologies (diagnostics différentiels)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--embedding-model', choices=EMBEDDING_MODELS, action='append',
+            help="Modèle(s) d'embedding à traiter (par défaut : tous)"
+        )
+
+    def handle(self, *args, **options):
+        for embedding_model in options['embedding_model'] or EMBEDDING_MODELS:
+            folder = Path(get_embedding_config(embedding_model)['folder'])
+            if not folder.exists():
+                self.stdout.write(self.style.WARNING(f"{embedding_model}: dossier {folder} absent, ignoré"))
+                continue
+
+            start = time.perf_counter()
+            matrix = build_matrix_file(folder)
+            self.stdout.write(self.style.SUCCESS(
+                f"{embedding_model}: {len(matrix.keys)} pathologies, matrice {matrix.matrix.shape[0]}x{matrix.matrix.shape[1]} "
+                f"calculée en {(time.perf_counter() - start) * 1000:.0f} ms"
+            ))
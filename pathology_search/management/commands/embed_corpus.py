@@ -0,0 +1,120 @@
+"""
+Génère les embeddings du corpus (CORPUS_SOURCE_DIR/**/*.txt) pour un modèle :
+chunks vectorisés par lots en parallèle, avec reprise sur interruption et
+réutilisation des chunks inchangés, puis écriture des fichiers .npy / .json,
+de l'index compilé et de la matrice de similarité.
+
+Seules les sections dont le texte a changé sont revectorisées (chunks
+modifiés uniquement) et réécrites ; l'index compilé est mis à jour par
+segments. Le rapport liste les sections ajoutées, modifiées et orphelines
+(--dry-run : rapport seul, sans appel API).
+
+Revectoriser tout le corpus pour un nouveau modèle :
+    python manage.py embed_corpus --embedding-model openai-3-large
+"""
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pathology_search import corpus, search_index
+from pathology_search.services import PathologySearchService, get_embedding_config
+
+
+EMBEDDING_MODELS = ('openai-ada', 'openai-3-large', 'gemini')
+
+
+class Command(BaseCommand):
+    help = "Générer les embeddings du corpus (par lots, en parallèle, avec reprise)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--embedding-model', default='openai-ada', choices=EMBEDDING_MODELS,
+            help="Modèle d'embedding à utiliser"
+        )
+        parser.add_argument('--source', default=settings.CORPUS_SOURCE_DIR, help="Dossier des textes sources (.txt)")
+        parser.add_argument('--output', default=None, help="Dossier de sortie (par défaut : celui du modèle)")
+        parser.add_argument('--batch-size', type=int, default=settings.EMBED_CORPUS_BATCH_SIZE, help="Chunks par requête")
+        parser.add_argument('--concurrency', type=int, default=settings.EMBED_CORPUS_CONCURRENCY, help="Requêtes simultanées")
+        parser.add_argument('--rpm', type=int, default=settings.EMBED_CORPUS_REQUESTS_PER_MINUTE, help="Requêtes par minute (0 = illimité)")
+        parser.add_argument('--tpm', type=int, default=settings.EMBED_CORPUS_TOKENS_PER_MINUTE, help="Tokens par minute (0 = illimité)")
+        parser.add_argument('--max-words', type=int, default=corpus.MAX_WORDS_PER_CHUNK, help="Mots par chunk")
+        parser.add_argument('--overlap', type=int, default=corpus.OVERLAP_WORDS, help="Mots repris du chunk précédent")
+        parser.add_argument('--dry-run', action='store_true', help="Afficher les changements sans appeler l'API ni écrire les fichiers")
+        parser.add_argument(
+            '--prune', action='store_true',
+            help="Supprimer les sections dont le texte source n'existe plus"
+        )
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        if not source.is_dir():
+            raise CommandError(f"Dossier source introuvable : {source}")
+        embedding_model = options['embedding_model']
+        output = Path(options['output'] or get_embedding_config(embedding_model)['folder'])
+        output.mkdir(parents=True, exist_ok=True)
+
+        service = PathologySearchService(embedding_model_type=embedding_model)
+        start = time.perf_counter()
+        documents = corpus.plan_corpus(source, service.embedding_model_name, options['max_words'], options['overlap'])
+        total_chunks = sum(len(document['chunks']) for document in documents)
+        self.stdout.write(f"{len(documents)} fichier(s), {total_chunks} chunk(s) ({service.embedding_model_name})")
+
+        cache = corpus.EmbeddingCache(output / corpus.CACHE_FILE_NAME)
+        try:
+            adopted = corpus.seed_cache(documents, output, cache, service.embedding_model_name)
+            report = corpus.diff_corpus(documents, output, service.embedding_model_name, options['max_words'], options['overlap'])
+            changed = set(report['added']) | set(report['modified'])
+            changed_documents = [
+                document for document in documents
+                if document['relative_path'].with_suffix('').as_posix() in changed
+            ]
+            cached = cache.get_many(chunk['key'] for document in changed_documents for chunk in document['chunks'])
+            self._report(report, changed_documents, cached, options['prune'])
+            if options['dry_run']:
+                return
+
+            # Index compilé à jour avant l'écriture : mise à jour par segments
+            previous = search_index.load_compiled(output)
+            embedded = corpus.embed_missing(
+                changed_documents, service, cache,
+                batch_size=options['batch_size'],
+                concurrency=options['concurrency'],
+                limiter=corpus.RateLimiter(options['rpm'], options['tpm']),
+                progress=lambda done, total: self.stdout.write(f"  {done}/{total} chunk(s) vectorisé(s)"),
+            )
+            written = corpus.write_corpus(
+                documents, cache, output, service.embedding_model_name, report, options['max_words'], options['overlap']
+            )
+        finally:
+            cache.close()
+
+        removed = report['orphans'] if options['prune'] else []
+        corpus.remove_artifacts(output, removed)
+
+        if previous is not None and not written and not removed:
+            compiled = "index compilé inchangé"
+        else:
+            index = corpus.compile_folder(output, previous, changed, removed)
+            mode = "mis à jour par segments" if previous is not None else "reconstruit"
+            compiled = f"index compilé {mode} ({index.chunks.shape[0]} chunks)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{embedded} chunk(s) vectorisé(s), {adopted} repris des fichiers existants, "
+            f"{written} fichier(s) écrit(s), {len(removed)} supprimé(s), {compiled} "
+            f"en {time.perf_counter() - start:.1f} s"
+        ))
+
+    def _report(self, report, changed_documents, cached, prune):
+        for document in changed_documents:
+            path = document['relative_path'].with_suffix('').as_posix()
+            to_embed = sum(1 for chunk in document['chunks'] if chunk['key'] not in cached)
+            marker = '+' if path in report['added'] else '~'
+            self.stdout.write(f"  {marker} {path} ({to_embed}/{len(document['chunks'])} chunk(s) à vectoriser)")
+        for path in report['orphans']:
+            action = "supprimé" if prune else "source absente, conservé (--prune pour supprimer)"
+            self.stdout.write(f"  - {path} ({action})")
+        self.stdout.write(
+            f"{len(report['added'])} ajouté(s), {len(report['modified'])} modifié(s), "
+            f"{len(report['unchanged'])} inchangé(s), {len(report['orphans'])} orphelin(s)"
+        )
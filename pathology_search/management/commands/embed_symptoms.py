@@ -0,0 +1,33 @@
+"""
+Vectorise (par lots) les symptômes des consultations validées absents du
+cache SymptomEmbedding, utilisé par la recherche avec historique.
+
+Les nouvelles validations sont vectorisées automatiquement en arrière-plan ;
+cette commande sert au rattrapage de l'existant ou après un changement de
+modèle d'embedding.
+"""
+from django.core.management.base import BaseCommand
+
+from pathology_search.models import Consultation
+from pathology_search.symptom_history import consultation_symptoms, embed_symptoms
+
+
+class Command(BaseCommand):
+    help = "Vectoriser les symptômes des consultations validées (recherche avec historique)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--embedding-model', default='openai-ada', choices=('openai-ada', 'openai-3-large', 'gemini'),
+            help="Modèle d'embedding à utiliser"
+        )
+
+    def handle(self, *args, **options):
+        symptoms = set()
+        consultations = Consultation.objects.filter(statut='valide').values_list('criteres_valides', flat=True)
+        for criteres_valides in consultations.iterator(chunk_size=500):
+            symptoms.update(consultation_symptoms(criteres_valides))
+
+        created = embed_symptoms(symptoms, options['embedding_model'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(symptoms)} symptôme(s) distinct(s), {created} nouveau(x) vecteur(s) ({options['embedding_model']})"
+        ))
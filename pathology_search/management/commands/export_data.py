@@ -0,0 +1,48 @@
+"""
+Exporte les consultations (avec les champs du patient et du médecin) ou les
+patients en CSV ou NDJSON, en flux vers un fichier ou la sortie standard.
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from pathology_search import data_export
+
+
+class Command(BaseCommand):
+    help = "Exporter les consultations ou les patients en CSV ou NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['consultations', 'patients'], help="Données à exporter")
+        parser.add_argument('--format', choices=data_export.FORMATS, default=data_export.CSV, help="Format (par défaut : csv)")
+        parser.add_argument('--from', dest='date_from', help="Date de début (AAAA-MM-JJ)")
+        parser.add_argument('--to', dest='date_to', help="Date de fin (AAAA-MM-JJ)")
+        parser.add_argument('--statut', help="Statut des consultations (valide, non_valide, ...)")
+        parser.add_argument('--output', default='-', help="Fichier de sortie (par défaut : sortie standard)")
+
+    def handle(self, *args, **options):
+        try:
+            date_from = parse_date(options['date_from'] or '')
+            date_to = parse_date(options['date_to'] or '')
+        except ValueError as e:
+            raise CommandError(f"Date invalide: {e}")
+        if options['kind'] == 'consultations':
+            chunks = data_export.export_consultations(options['format'], date_from, date_to, statut=options['statut'])
+        else:
+            if options['statut']:
+                raise CommandError("--statut ne s'applique qu'aux consultations")
+            chunks = data_export.export_patients(options['format'], date_from, date_to)
+
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        size = 0
+        with open(options['output'], 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Export terminé : {options['output']} ({size / 1024:.0f} Ko)"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from pathology_search import reports
+
+
+class Command(BaseCommand):
+    help = "Exporter les rapports PDF d'un patient, d'un médecin ou d'une période dans une archive ZIP"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, help="ID du patient")
+        parser.add_argument('--medecin', type=int, help="ID du médecin")
+        parser.add_argument('--from', dest='date_from', help="Date de début (AAAA-MM-JJ)")
+        parser.add_argument('--to', dest='date_to', help="Date de fin (AAAA-MM-JJ)")
+        parser.add_argument('--statut', help="Statut des consultations (valide, non_valide, ...)")
+        parser.add_argument('--output', required=True, help="Fichier ZIP de sortie")
+
+    def handle(self, *args, **options):
+        try:
+            date_from = parse_date(options['date_from'] or '')
+            date_to = parse_date(options['date_to'] or '')
+        except ValueError as e:
+            raise CommandError(f"Date invalide: {e}")
+        if not (options['patient'] or options['medecin'] or date_from or date_to):
+            raise CommandError("Préciser --patient, --medecin ou une période (--from / --to)")
+
+        consultations = reports.export_queryset(
+            patient_id=options['patient'],
+            medecin_id=options['medecin'],
+            date_from=date_from,
+            date_to=date_to,
+            statut=options['statut'],
+        )
+        total = consultations.count()
+        self.stdout.write(f"{total} rapport(s) à exporter vers {options['output']}")
+
+        size = 0
+        with open(options['output'], 'wb') as f:
+            for chunk in reports.iter_reports_zip(consultations):
+                f.write(chunk)
+                size += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Export terminé ({size / 1024:.0f} Ko)"))
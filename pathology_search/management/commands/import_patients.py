@@ -0,0 +1,48 @@
+"""
+Importe des patients depuis un fichier CSV (séparateur « , » ou « ; ») ou
+NDJSON (un objet JSON par ligne), avec les mêmes clés que le formulaire de
+création (last_name, first_name, cin, birth_date AAAA-MM-JJ, ...).
+
+Le fichier est lu en flux et inséré par lots (PATIENT_IMPORT_BATCH_SIZE) ;
+les lignes rejetées sont écrites avec leur motif dans un rapport CSV.
+"""
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pathology_search import patient_import
+
+
+class Command(BaseCommand):
+    help = "Importer des patients depuis un fichier CSV ou NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier à importer")
+        parser.add_argument('--format', choices=patient_import.FORMATS, help="Format du fichier (par défaut : d'après l'extension)")
+        parser.add_argument('--report', help="Rapport des lignes rejetées (par défaut : <fichier>.rejets.csv)")
+        parser.add_argument('--batch-size', type=int, help="Lignes insérées par lot (par défaut : PATIENT_IMPORT_BATCH_SIZE)")
+        parser.add_argument('--dry-run', action='store_true', help="Valider le fichier sans rien enregistrer")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f"Fichier introuvable : {path}")
+        try:
+            fmt = options['format'] or patient_import.detect_format(path.name)
+        except patient_import.ImportFormatError as e:
+            raise CommandError(str(e))
+        report_path = Path(options['report'] or f"{path}.rejets.csv")
+
+        with path.open('rb') as stream, report_path.open('w', newline='', encoding='utf-8') as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(patient_import.REPORT_HEADER)
+            report = patient_import.ImportReport(writer=writer)
+            patient_import.import_patients(
+                stream, fmt, report, batch_size=options['batch_size'], dry_run=options['dry_run']
+            )
+
+        verb = "valide(s)" if options['dry_run'] else "importé(s)"
+        self.stdout.write(self.style.SUCCESS(f"{report.created} patient(s) {verb}, {report.rejected} ligne(s) rejetée(s)"))
+        if report.rejected:
+            self.stdout.write(f"Rapport des rejets : {report_path}")
@@ -0,0 +1,45 @@
+"""
+Vectorise (par lots) les consultations absentes de l'index des cas similaires
+et met à jour l'index local.
+
+Les nouvelles consultations sont indexées automatiquement en arrière-plan ;
+cette commande sert au rattrapage de l'existant, après un changement de modèle
+d'embedding (CASE_EMBEDDING_MODEL / CASE_EMBEDDING_DIMENSIONS) ou pour
+compacter l'index (--rebuild).
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pathology_search import similar_cases
+from pathology_search.models import ConsultationEmbedding
+
+
+class Command(BaseCommand):
+    help = "Indexer les consultations pour la recherche de cas similaires"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Nombre maximum de consultations à vectoriser")
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Réécrire l'index local depuis la base (écarte les consultations supprimées)"
+        )
+
+    def handle(self, *args, **options):
+        # Embeddings d'un autre modèle ou d'une autre dimension : à recalculer
+        deleted, _ = ConsultationEmbedding.objects.exclude(
+            modele_embedding=settings.CASE_EMBEDDING_MODEL, dimension=settings.CASE_EMBEDDING_DIMENSIONS
+        ).delete()
+        if deleted:
+            self.stdout.write(f"{deleted} embedding(s) d'un autre modèle supprimé(s)")
+
+        created = similar_cases.index_consultations(limit=options['limit'])
+        index = similar_cases.get_index()
+        if options['rebuild']:
+            rows = index.rebuild()
+        else:
+            index.sync()
+            rows = len(index)
+        self.stdout.write(self.style.SUCCESS(
+            f"{created} consultation(s) vectorisée(s), {rows} ligne(s) dans l'index "
+            f"({settings.CASE_EMBEDDING_MODEL}, {settings.CASE_EMBEDDING_DIMENSIONS} dimensions)"
+        ))
@@ -0,0 +1,277 @@
+"""
+Test de charge de bout en bout rejouant le parcours clinique complet
+(recherche -> sélection -> validation -> diagnostic -> rapport PDF)
+contre un serveur déjà démarré.
+
+Chaque ligne du fichier de scénarios (NDJSON) décrit un parcours :
+
+    {"query": "Attaques de panique répétées...", "patient_id": 1,
+     "embedding_model": "openai-ada", "top_k": 5, "model": "chatgpt-5.1",
+     "validate_index": 0, "form_data": {"Critère A": ["..."]}, "print": true}
+
+Seul "query" est obligatoire. Exemple :
+
+    python manage.py loadtest --base-url http://localhost:8000 \\
+        --scenarios scenarios.ndjson --concurrency 8 --iterations 50
+"""
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.cookiejar import CookieJar
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+DEFAULT_SCENARIO = {
+    'query': "Patient présentant des attaques de panique récurrentes avec peur de mourir",
+    'embedding_model': 'openai-ada',
+    'top_k': 5,
+    'model': 'chatgpt-5.1',
+    'validate_index': 0,
+    'form_data': {},
+    'print': True,
+}
+
+PRINT_URL_RE = re.compile(r'/print/([0-9a-fA-F-]{36})/')
+
+
+class ClinicianSession:
+    """Session HTTP d'un clinicien : cookies (session Django + csrftoken) et en-têtes CSRF."""
+
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def _csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, endpoint, path, method='GET', payload=None):
+        """Exécuter une requête et l'enregistrer sous le nom d'endpoint donné."""
+        url = self.base_url + path
+        headers = {'Referer': self.base_url + '/'}
+        data = None
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if method != 'GET':
+            headers['X-CSRFToken'] = self._csrf_token()
+
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        status = 0
+        body = b''
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                status = response.status
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            body = e.read()
+        except Exception:
+            status = 0
+        elapsed = time.perf_counter() - start
+
+        self.stats.record(endpoint, elapsed, ok=200 <= status < 400, size=len(body))
+        return status, body
+
+
+class LoadTestStats:
+    """Latences, volumes et erreurs agrégés par endpoint (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def record(self, endpoint, elapsed, ok, size=0):
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            self.bytes[endpoint] += size
+            if not ok:
+                self.errors[endpoint] += 1
+
+    @staticmethod
+    def _percentile(sorted_values, pct):
+        if not sorted_values:
+            return 0.0
+        k = (len(sorted_values) - 1) * pct / 100
+        lower = int(k)
+        upper = min(lower + 1, len(sorted_values) - 1)
+        return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+    def summary(self, wall_time):
+        report = {}
+        for endpoint, values in self.latencies.items():
+            values = sorted(values)
+            count = len(values)
+            report[endpoint] = {
+                'requests': count,
+                'errors': self.errors[endpoint],
+                'error_rate': self.errors[endpoint] / count if count else 0.0,
+                'throughput_rps': count / wall_time if wall_time else 0.0,
+                'mean_ms': sum(values) / count * 1000 if count else 0.0,
+                'p50_ms': self._percentile(values, 50) * 1000,
+                'p90_ms': self._percentile(values, 90) * 1000,
+                'p95_ms': self._percentile(values, 95) * 1000,
+                'p99_ms': self._percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000 if values else 0.0,
+                'avg_bytes': self.bytes[endpoint] / count if count else 0,
+            }
+        return report
+
+
+def run_scenario(base_url, scenario, stats, timeout):
+    """Rejouer un parcours clinique complet dans une nouvelle session."""
+    session = ClinicianSession(base_url, stats, timeout)
+
+    # Page d'accueil : récupère le cookie csrftoken
+    session.request('/', '/')
+
+    search_payload = {
+        'query': scenario['query'],
+        'top_k': scenario.get('top_k', 5),
+        'aggregation': scenario.get('aggregation', 'max'),
+        'embedding_model': scenario.get('embedding_model', 'openai-ada'),
+        'use_validation': True,
+    }
+    if scenario.get('patient_id'):
+        search_payload['patient_id'] = scenario['patient_id']
+    status, body = session.request('/search/', '/search/', 'POST', search_payload)
+    if status != 200:
+        return False
+
+    session.request('/results-selection/', '/results-selection/')
+
+    index = scenario.get('validate_index', 0)
+    status, _ = session.request('/validate/', f'/validate/?index={index}')
+    if status != 200:
+        return False
+
+    status, body = session.request('/validate/action/', '/validate/action/', 'POST', {
+        'action': 'validate',
+        'current_index': index,
+        'form_data': scenario.get('form_data', {}),
+        'direct_access': False,
+        'model': scenario.get('model', 'chatgpt-5.1'),
+    })
+    try:
+        diagnosis_id = json.loads(body).get('diagnosis_id')
+    except ValueError:
+        diagnosis_id = None
+    if status != 200 or not diagnosis_id:
+        return False
+
+    status, body = session.request('/diagnosis/<id>/', f'/diagnosis/{urllib.parse.quote(diagnosis_id)}/')
+    if status != 200:
+        return False
+
+    if scenario.get('print', True):
+        match = PRINT_URL_RE.search(body.decode('utf-8', errors='ignore'))
+        if match:
+            status, _ = session.request('/print/<uuid>/', f'/print/{match.group(1)}/')
+            if status != 200:
+                return False
+    return True
+
+
+def load_scenarios(path):
+    scenarios = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                scenario = json.loads(line)
+            except ValueError as e:
+                raise CommandError(f"Ligne {line_number} invalide dans {path}: {e}")
+            if not scenario.get('query'):
+                raise CommandError(f"Ligne {line_number}: le champ 'query' est obligatoire")
+            scenarios.append({**DEFAULT_SCENARIO, **scenario})
+    return scenarios
+
+
+class Command(BaseCommand):
+    help = "Test de charge du parcours clinique complet contre un serveur démarré"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000', help="URL du serveur à tester")
+        parser.add_argument('--scenarios', help="Fichier NDJSON de scénarios (un parcours par ligne)")
+        parser.add_argument('--concurrency', type=int, default=4, help="Nombre de cliniciens simultanés")
+        parser.add_argument('--iterations', type=int, default=20, help="Nombre total de parcours à rejouer")
+        parser.add_argument('--timeout', type=float, default=120, help="Timeout par requête (secondes)")
+        parser.add_argument('--json', dest='json_output', help="Écrire le rapport au format JSON dans ce fichier")
+
+    def handle(self, *args, **options):
+        scenarios = load_scenarios(options['scenarios']) if options['scenarios'] else [DEFAULT_SCENARIO]
+        if not scenarios:
+            raise CommandError("Aucun scénario à rejouer")
+
+        iterations = options['iterations']
+        concurrency = max(1, options['concurrency'])
+        stats = LoadTestStats()
+
+        self.stdout.write(
+            f"{iterations} parcours, {concurrency} cliniciens simultanés, "
+            f"{len(scenarios)} scénario(s) -> {options['base_url']}"
+        )
+
+        completed = 0
+        failed = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [
+                pool.submit(run_scenario, options['base_url'], scenarios[i % len(scenarios)], stats, options['timeout'])
+                for i in range(iterations)
+            ]
+            for future in as_completed(futures):
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    ok = False
+                    self.stderr.write(f"Parcours interrompu: {e}")
+                if ok:
+                    completed += 1
+                else:
+                    failed += 1
+        wall_time = time.perf_counter() - start
+
+        report = stats.summary(wall_time)
+        self.stdout.write(
+            f"\n{'Endpoint':<22}{'Req':>6}{'Err%':>7}{'RPS':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+        )
+        for endpoint, row in report.items():
+            self.stdout.write(
+                f"{endpoint:<22}{row['requests']:>6}{row['error_rate'] * 100:>6.1f}%{row['throughput_rps']:>8.2f}"
+                f"{row['p50_ms']:>8.0f}ms{row['p90_ms']:>7.0f}ms{row['p95_ms']:>7.0f}ms"
+                f"{row['p99_ms']:>7.0f}ms{row['max_ms']:>7.0f}ms"
+            )
+        self.stdout.write(
+            f"\nParcours terminés: {completed}/{iterations} (échecs: {failed}) "
+            f"en {wall_time:.1f}s soit {completed / wall_time if wall_time else 0:.2f} parcours/s"
+        )
+
+        if options['json_output']:
+            with open(options['json_output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'base_url': options['base_url'],
+                    'concurrency': concurrency,
+                    'iterations': iterations,
+                    'completed': completed,
+                    'failed': failed,
+                    'wall_time_s': wall_time,
+                    'endpoints': report,
+                }, f, indent=2)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pathology_search import result_store
+
+
+class Command(BaseCommand):
+    help = "Supprimer les résultats de recherche et diagnostics expirés du stockage serveur"
+
+    def handle(self, *args, **options):
+        deleted = result_store.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} résultat(s) expiré(s) supprimé(s)"))
@@ -0,0 +1,23 @@
+"""
+Recrée l'index plein texte des consultations (tsvector et GIN sous
+PostgreSQL, table FTS5 sous SQLite) avec ses triggers, puis le réalimente.
+
+À lancer après une modification de FULLTEXT_SEARCH_CONFIG, ou sous SQLite
+après une migration qui reconstruit la table des consultations.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from pathology_search import fulltext_schema
+from pathology_search.models import Consultation
+
+
+class Command(BaseCommand):
+    help = "Recréer l'index plein texte des consultations"
+
+    def handle(self, *args, **options):
+        # Une seule transaction (schema_editor atomique)
+        with connection.schema_editor() as schema_editor:
+            fulltext_schema.uninstall(schema_editor)
+            fulltext_schema.install(schema_editor)
+        self.stdout.write(self.style.SUCCESS(f"Index plein texte recréé ({Consultation.objects.count()} consultation(s))"))
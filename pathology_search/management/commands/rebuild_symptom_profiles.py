@@ -0,0 +1,32 @@
+"""
+Reconstruit le profil de symptômes des patients (PatientSymptom) et ses
+sources (ConsultationSymptom) depuis les critères des consultations.
+
+Le profil est tenu à jour à chaque enregistrement ou suppression de
+consultation ; cette commande sert après un import en masse (bulk_create,
+loaddata), une modification directe en base ou un changement de la règle
+d'extraction des symptômes.
+"""
+from django.core.management.base import BaseCommand
+
+from pathology_search import symptom_profile
+from pathology_search.models import Consultation, PatientSymptom
+
+
+class Command(BaseCommand):
+    help = "Reconstruire le profil de symptômes des patients"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', help="Patient à reconstruire (répétable, par défaut : tous)")
+
+    def handle(self, *args, **options):
+        patient_ids = options['patient']
+        if not patient_ids:
+            # Patients ayant des consultations ou un profil (éventuellement périmé)
+            patient_ids = set(Consultation.objects.order_by().values_list('patient_id', flat=True).distinct())
+            patient_ids.update(PatientSymptom.objects.order_by().values_list('patient_id', flat=True).distinct())
+
+        symptoms = 0
+        for patient_id in sorted(patient_ids):
+            symptoms += symptom_profile.rebuild_patient(patient_id)
+        self.stdout.write(self.style.SUCCESS(f"{len(patient_ids)} patient(s), {symptoms} symptôme(s) distinct(s)"))
@@ -0,0 +1,35 @@
+"""
+Recalcule les agrégats du tableau de bord clinique (ConsultationStat) à
+partir des consultations : après un chargement de fixtures, un import en
+masse ou toute écriture qui n'émet pas de signaux (QuerySet.update,
+bulk_create).
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from pathology_search import analytics
+
+
+class Command(BaseCommand):
+    help = "Recalculer les agrégats du tableau de bord clinique"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="Premier jour recalculé (AAAA-MM-JJ ; par défaut : tout l'historique)")
+        parser.add_argument('--to', dest='date_to', help="Dernier jour recalculé (AAAA-MM-JJ)")
+
+    def handle(self, *args, **options):
+        try:
+            date_from = parse_date(options['date_from'] or '')
+            date_to = parse_date(options['date_to'] or '')
+        except ValueError as e:
+            raise CommandError(f"Date invalide: {e}")
+        if (options['date_from'] and not date_from) or (options['date_to'] and not date_to):
+            raise CommandError("Date invalide (format AAAA-MM-JJ)")
+
+        start = time.monotonic()
+        rows = analytics.refresh(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(
+            f"{rows} ligne(s) d'agrégat recalculée(s) en {time.monotonic() - start:.1f} s"
+        ))
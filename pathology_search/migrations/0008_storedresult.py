@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:19
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0007_alter_patient_numero_dossier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredResult',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type_resultat', models.CharField(choices=[('search', 'Résultats de recherche'), ('diagnosis', 'Diagnostic')], max_length=20, verbose_name='Type de résultat')),
+                ('donnees', models.BinaryField(verbose_name='Données compressées')),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_expiration', models.DateTimeField(db_index=True, verbose_name="Date d'expiration")),
+            ],
+            options={
+                'verbose_name': 'Résultat stocké',
+                'verbose_name_plural': 'Résultats stockés',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0008_storedresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SymptomEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('texte_hash', models.CharField(max_length=64, verbose_name='Empreinte du texte')),
+                ('texte', models.TextField(verbose_name='Symptôme')),
+                ('modele_embedding', models.CharField(max_length=100, verbose_name="Modèle d'embedding")),
+                ('vecteur', models.BinaryField(verbose_name='Vecteur')),
+                ('dimension', models.PositiveIntegerField(verbose_name='Dimension')),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Embedding de symptôme',
+                'verbose_name_plural': 'Embeddings de symptômes',
+                'constraints': [models.UniqueConstraint(fields=('modele_embedding', 'texte_hash'), name='unique_symptom_embedding')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0009_symptomembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('texte_hash', models.CharField(max_length=64, verbose_name='Empreinte du texte')),
+                ('modele_embedding', models.CharField(max_length=100, verbose_name="Modèle d'embedding")),
+                ('vecteur', models.BinaryField(verbose_name='Vecteur')),
+                ('dimension', models.PositiveIntegerField(verbose_name='Dimension')),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('consultation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='embedding', to='pathology_search.consultation')),
+            ],
+            options={
+                'verbose_name': 'Embedding de consultation',
+                'verbose_name_plural': 'Embeddings de consultations',
+                'indexes': [models.Index(fields=['modele_embedding', 'dimension', 'id'], name='consult_embedding_sync_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:55
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+# Colonnes de la recherche de l'annuaire (patient_directory.search_filter)
+PREFIX_INDEX_COLUMNS = ('nom', 'prenom', 'patient_identifier', 'numero_dossier', 'cin', 'telephone', 'mobile_number')
+
+
+def create_prefix_indexes(apps, schema_editor):
+    # istartswith => UPPER("col"::text) LIKE UPPER('x%') : index d'expression PostgreSQL uniquement
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in PREFIX_INDEX_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS patient_{column}_prefix_idx '
+            f'ON pathology_search_patient ((UPPER({column}::text)) text_pattern_ops)'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in PREFIX_INDEX_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS patient_{column}_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0010_consultationembedding'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('nom', models.Value('')), django.db.models.functions.comparison.Coalesce('prenom', models.Value('')), models.F('id'), name='patient_directory_order_idx'),
+        ),
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
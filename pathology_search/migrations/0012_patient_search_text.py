@@ -0,0 +1,94 @@
+# Generated by Django 5.2.3 on 2026-10-19 03:10
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Même liste que Patient.SEARCH_TEXT_FIELDS
+SEARCH_TEXT_FIELDS = ('last_name', 'first_name', 'nom', 'prenom', 'cin', 'patient_identifier', 'numero_dossier')
+BATCH_SIZE = 1000
+
+
+def fold_text(text):
+    """Copie figée de utils.fold_text à la date de la migration (ne pas la modifier avec l'original)."""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    text = re.sub(r'[^\w\s-]|_', ' ', text)
+    return ' '.join(text.split())
+
+
+def fill_search_text(apps, schema_editor):
+    Patient = apps.get_model('pathology_search', 'Patient')
+    batch = []
+    for patient in Patient.objects.only('id', *SEARCH_TEXT_FIELDS).iterator(chunk_size=BATCH_SIZE):
+        values = []
+        for field in SEARCH_TEXT_FIELDS:
+            value = fold_text(getattr(patient, field))
+            if value and value not in values:
+                values.append(value)
+        patient.search_text = ' '.join(values)
+        batch.append(patient)
+        if len(batch) >= BATCH_SIZE:
+            Patient.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ['search_text'])
+
+
+def create_typeahead_indexes(apps, schema_editor):
+    # Index trigramme (pg_trgm) et préfixe : PostgreSQL uniquement
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS patient_search_text_prefix_idx '
+        'ON pathology_search_patient (search_text text_pattern_ops)'
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    # L'extension peut exiger des droits que l'utilisateur n'a pas : la recherche
+    # se rabat alors sur l'index en mémoire (patient_typeahead)
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('SAVEPOINT patient_trgm')
+            try:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            except Exception:
+                cursor.execute('ROLLBACK TO SAVEPOINT patient_trgm')
+                return
+            cursor.execute('RELEASE SAVEPOINT patient_trgm')
+    except Exception:
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS patient_search_text_trgm_idx '
+        'ON pathology_search_patient USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_typeahead_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS patient_search_text_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS patient_search_text_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0011_patient_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Texte de recherche'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_typeahead_indexes, drop_typeahead_indexes),
+    ]
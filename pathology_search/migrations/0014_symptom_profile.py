@@ -0,0 +1,127 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:08
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+# Copies figées de symptom_history à la date de la migration (ne pas les modifier avec l'original)
+
+def normalize_symptom(text):
+    return ' '.join(str(text).split())
+
+
+def symptom_hash(text):
+    return hashlib.sha256(normalize_symptom(text).lower().encode('utf-8')).hexdigest()
+
+
+def consultation_symptoms(criteres_valides):
+    symptoms = []
+    for key, value in (criteres_valides or {}).items():
+        if key == '_metadata':
+            continue
+        if isinstance(value, list):
+            values = value
+        elif isinstance(value, dict):
+            values = list(value.values())
+        else:
+            values = [value]
+        for item in values:
+            item = normalize_symptom(item) if item is not None else ''
+            if len(item) >= 2:
+                symptoms.append(item)
+    return symptoms
+
+
+def fill_symptom_profiles(apps, schema_editor):
+    Consultation = apps.get_model('pathology_search', 'Consultation')
+    ConsultationSymptom = apps.get_model('pathology_search', 'ConsultationSymptom')
+    PatientSymptom = apps.get_model('pathology_search', 'PatientSymptom')
+
+    # (patient, empreinte) -> agrégat ; consultations les plus récentes d'abord (libellé retenu)
+    profiles = {}
+    sources = []
+    consultations = Consultation.objects.order_by('-date_consultation').values_list(
+        'id', 'patient_id', 'criteres_valides', 'date_consultation', 'statut'
+    )
+    for consultation_id, patient_id, criteres_valides, date_consultation, statut in consultations.iterator(chunk_size=BATCH_SIZE):
+        valide = statut == 'valide'
+        seen = set()
+        for symptom in consultation_symptoms(criteres_valides):
+            key = symptom_hash(symptom)
+            if key in seen:
+                continue
+            seen.add(key)
+            sources.append(ConsultationSymptom(
+                consultation_id=consultation_id, patient_id=patient_id, symptome_hash=key,
+                date_consultation=date_consultation, valide=valide,
+            ))
+            profile = profiles.get((patient_id, key))
+            if profile is None:
+                profile = profiles[(patient_id, key)] = PatientSymptom(
+                    patient_id=patient_id, symptome_hash=key, symptome=symptom, occurrences=0, occurrences_validees=0,
+                    premiere_date=date_consultation, derniere_date=date_consultation,
+                )
+            profile.occurrences += 1
+            profile.premiere_date = date_consultation
+            if valide:
+                profile.occurrences_validees += 1
+                if profile.derniere_date_validee is None:
+                    profile.derniere_date_validee = date_consultation
+        if len(sources) >= BATCH_SIZE:
+            ConsultationSymptom.objects.bulk_create(sources)
+            sources = []
+    ConsultationSymptom.objects.bulk_create(sources)
+    PatientSymptom.objects.bulk_create(profiles.values(), batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0013_consultation_timeline_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationSymptom',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symptome_hash', models.CharField(max_length=64, verbose_name='Empreinte du symptôme')),
+                ('date_consultation', models.DateTimeField(verbose_name='Date de consultation')),
+                ('valide', models.BooleanField(default=False, verbose_name='Consultation validée')),
+                ('consultation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='symptoms', to='pathology_search.consultation')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consultation_symptoms', to='pathology_search.patient')),
+            ],
+            options={
+                'verbose_name': 'Symptôme de consultation',
+                'verbose_name_plural': 'Symptômes de consultation',
+                'indexes': [models.Index(fields=['patient', 'symptome_hash'], name='consult_symptom_patient_idx')],
+                'constraints': [models.UniqueConstraint(fields=('consultation', 'symptome_hash'), name='unique_consultation_symptom')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PatientSymptom',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symptome_hash', models.CharField(max_length=64, verbose_name='Empreinte du symptôme')),
+                ('symptome', models.TextField(verbose_name='Symptôme')),
+                ('occurrences', models.PositiveIntegerField(default=0, verbose_name='Consultations')),
+                ('occurrences_validees', models.PositiveIntegerField(default=0, verbose_name='Consultations validées')),
+                ('premiere_date', models.DateTimeField(verbose_name='Première observation')),
+                ('derniere_date', models.DateTimeField(verbose_name='Dernière observation')),
+                ('derniere_date_validee', models.DateTimeField(blank=True, null=True, verbose_name='Dernière observation validée')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='symptom_profile', to='pathology_search.patient')),
+            ],
+            options={
+                'verbose_name': 'Symptôme du patient',
+                'verbose_name_plural': 'Profil de symptômes des patients',
+                'indexes': [models.Index(fields=['patient', '-derniere_date'], name='patient_symptom_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('patient', 'symptome_hash'), name='unique_patient_symptom')],
+            },
+        ),
+        migrations.RunPython(fill_symptom_profiles, migrations.RunPython.noop),
+    ]
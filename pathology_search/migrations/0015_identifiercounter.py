@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0014_symptom_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdentifierCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefixe', models.CharField(max_length=30, unique=True, verbose_name='Préfixe')),
+                ('dernier_numero', models.PositiveBigIntegerField(default=0, verbose_name='Dernier numéro attribué')),
+            ],
+            options={
+                'verbose_name': "Compteur d'identifiants",
+                'verbose_name_plural': "Compteurs d'identifiants",
+            },
+        ),
+    ]
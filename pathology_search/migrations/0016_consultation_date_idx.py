@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0015_identifiercounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['date_consultation', 'id'], name='consultation_date_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 04:05
+
+from django.db import migrations
+
+from pathology_search import fulltext_schema
+
+
+def create_fulltext_index(apps, schema_editor):
+    fulltext_schema.install(schema_editor)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    fulltext_schema.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0016_consultation_date_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0017_consultation_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['statut', 'date_consultation'], name='consultation_statut_date_idx'),
+        ),
+    ]
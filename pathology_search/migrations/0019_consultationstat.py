@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:33
+
+from django.db import migrations, models
+
+from pathology_search import consultation_stats
+
+
+def fill_consultation_stats(apps, schema_editor):
+    Consultation = apps.get_model('pathology_search', 'Consultation')
+    ConsultationStat = apps.get_model('pathology_search', 'ConsultationStat')
+    stat_totals = consultation_stats.totals(Consultation.objects.all())
+    ConsultationStat.objects.bulk_create(
+        consultation_stats.stat_objects(ConsultationStat, stat_totals), batch_size=consultation_stats.BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pathology_search', '0018_consultation_statut_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('pathologie', 'Pathologie identifiée'), ('modele', 'Modèle'), ('modele_embedding', "Modèle d'embedding"), ('medecin', 'Médecin')], max_length=20, verbose_name='Dimension')),
+                ('granularite', models.CharField(choices=[('jour', 'Jour'), ('mois', 'Mois')], max_length=4, verbose_name='Granularité')),
+                ('periode', models.DateField(verbose_name='Période')),
+                ('valeur', models.CharField(max_length=200, verbose_name='Valeur')),
+                ('statut', models.CharField(max_length=20, verbose_name='Statut')),
+                ('consultations', models.IntegerField(default=0, verbose_name='Consultations')),
+                ('somme_scores', models.FloatField(default=0, verbose_name='Somme des scores de similarité')),
+            ],
+            options={
+                'verbose_name': 'Statistique de consultations',
+                'verbose_name_plural': 'Statistiques de consultations',
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'granularite', 'periode', 'valeur', 'statut'), name='unique_consultation_stat')],
+            },
+        ),
+        migrations.RunPython(fill_consultation_stats, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.core.validators import RegexValidator
+
+from .utils import fold_text
 import uuid
 
 
@@ -187,10 +191,23 @@ class Patient(models.Model):
     
     date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     
+    # Noms et identifiants normalisés (sans accents, minuscules) pour la recherche instantanée
+    search_text = models.TextField(blank=True, default='', editable=False, verbose_name="Texte de recherche")
+    
+    # Champs repris dans search_text
+    SEARCH_TEXT_FIELDS = ('last_name', 'first_name', 'nom', 'prenom', 'cin', 'patient_identifier', 'numero_dossier')
+    
     class Meta:
         verbose_name = "Patient"
         verbose_name_plural = "Patients"
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Ordre de l'annuaire paginé (patient_directory.list_patients)
+            models.Index(
+                Coalesce('nom', Value('')), Coalesce('prenom', Value('')), F('id'),
+                name='patient_directory_order_idx',
+            ),
+        ]
     
     def __str__(self):
         nom = self.last_name or self.nom or ''
@@ -198,6 +215,23 @@ class Patient(models.Model):
         dossier = self.patient_identifier or self.numero_dossier or 'N/A'
         return f"{prenom} {nom} ({dossier})"
     
+    def build_search_text(self):
+        """Texte de recherche à partir des noms et identifiants (à appeler avant bulk_create / bulk_update)."""
+        values = []
+        for field in self.SEARCH_TEXT_FIELDS:
+            value = fold_text(getattr(self, field))
+            if value and value not in values:
+                values.append(value)
+        self.search_text = ' '.join(values)
+        return self.search_text
+    
+    def save(self, *args, **kwargs):
+        self.build_search_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(self.SEARCH_TEXT_FIELDS):
+            kwargs['update_fields'] = set(update_fields) | {'search_text'}
+        super().save(*args, **kwargs)
+    
     @property
     def nom_complet(self):
         nom = self.last_name or self.nom or ''
@@ -248,6 +282,197 @@ class Consultation(models.Model):
         verbose_name = "Consultation"
         verbose_name_plural = "Consultations"
         ordering = ['-date_consultation']
+        indexes = [
+            # Historique paginé d'un patient (patient_timeline)
+            models.Index(fields=['patient', '-date_consultation', '-id'], name='consultation_timeline_idx'),
+            # Exports chronologiques et filtres par période (data_export)
+            models.Index(fields=['date_consultation', 'id'], name='consultation_date_idx'),
+            # Filtres par statut et période (exports, rapports, recherche plein texte)
+            models.Index(fields=['statut', 'date_consultation'], name='consultation_statut_date_idx'),
+        ]
     
     def __str__(self):
         return f"Consultation {self.patient.nom_complet} - {self.date_consultation.strftime('%d/%m/%Y')}"
+
+
+class StoredResult(models.Model):
+    """Résultats de recherche et diagnostics conservés côté serveur (la session ne garde que l'identifiant)."""
+
+    TYPE_CHOICES = [
+        ('search', 'Résultats de recherche'),
+        ('diagnosis', 'Diagnostic'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    type_resultat = models.CharField(max_length=20, choices=TYPE_CHOICES, verbose_name="Type de résultat")
+    # JSON compressé (zlib) pour limiter les E/S
+    donnees = models.BinaryField(verbose_name="Données compressées")
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_expiration = models.DateTimeField(db_index=True, verbose_name="Date d'expiration")
+
+    class Meta:
+        verbose_name = "Résultat stocké"
+        verbose_name_plural = "Résultats stockés"
+
+    def __str__(self):
+        return f"{self.get_type_resultat_display()} {self.id}"
+
+
+class SymptomEmbedding(models.Model):
+    """Embedding d'un symptôme (critère validé), calculé une seule fois par texte et par modèle d'embedding."""
+
+    # SHA-256 du texte normalisé : index unique compact, le texte pouvant être long
+    texte_hash = models.CharField(max_length=64, verbose_name="Empreinte du texte")
+    texte = models.TextField(verbose_name="Symptôme")
+    modele_embedding = models.CharField(max_length=100, verbose_name="Modèle d'embedding")
+    # Vecteur float32 brut
+    vecteur = models.BinaryField(verbose_name="Vecteur")
+    dimension = models.PositiveIntegerField(verbose_name="Dimension")
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Embedding de symptôme"
+        verbose_name_plural = "Embeddings de symptômes"
+        constraints = [
+            models.UniqueConstraint(fields=['modele_embedding', 'texte_hash'], name='unique_symptom_embedding'),
+        ]
+
+    def __str__(self):
+        return f"{self.texte[:50]} ({self.modele_embedding})"
+
+
+class ConsultationEmbedding(models.Model):
+    """Embedding d'une consultation (description clinique et critères validés) pour la recherche de cas similaires."""
+
+    consultation = models.OneToOneField(Consultation, on_delete=models.CASCADE, related_name='embedding')
+    # SHA-256 du texte vectorisé : permet de détecter une description modifiée
+    texte_hash = models.CharField(max_length=64, verbose_name="Empreinte du texte")
+    modele_embedding = models.CharField(max_length=100, verbose_name="Modèle d'embedding")
+    # Vecteur float32 normalisé brut
+    vecteur = models.BinaryField(verbose_name="Vecteur")
+    dimension = models.PositiveIntegerField(verbose_name="Dimension")
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Embedding de consultation"
+        verbose_name_plural = "Embeddings de consultations"
+        indexes = [
+            models.Index(fields=['modele_embedding', 'dimension', 'id'], name='consult_embedding_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.consultation_id} ({self.modele_embedding})"
+
+
+class ConsultationSymptom(models.Model):
+    """Symptôme coché dans une consultation (source du profil de symptômes du patient)."""
+
+    consultation = models.ForeignKey(Consultation, on_delete=models.CASCADE, related_name='symptoms')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='consultation_symptoms')
+    # Même empreinte que SymptomEmbedding (texte normalisé, insensible à la casse)
+    symptome_hash = models.CharField(max_length=64, verbose_name="Empreinte du symptôme")
+    # Copies de la consultation pour agréger sans jointure
+    date_consultation = models.DateTimeField(verbose_name="Date de consultation")
+    valide = models.BooleanField(default=False, verbose_name="Consultation validée")
+
+    class Meta:
+        verbose_name = "Symptôme de consultation"
+        verbose_name_plural = "Symptômes de consultation"
+        constraints = [
+            models.UniqueConstraint(fields=['consultation', 'symptome_hash'], name='unique_consultation_symptom'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'symptome_hash'], name='consult_symptom_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.symptome_hash[:12]} ({self.consultation_id})"
+
+
+class PatientSymptom(models.Model):
+    """
+    Profil de symptômes d'un patient : un symptôme distinct, agrégé sur ses
+    consultations (sources : ConsultationSymptom). Tenu à jour par symptom_profile.
+    """
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='symptom_profile')
+    symptome_hash = models.CharField(max_length=64, verbose_name="Empreinte du symptôme")
+    symptome = models.TextField(verbose_name="Symptôme")
+    occurrences = models.PositiveIntegerField(default=0, verbose_name="Consultations")
+    occurrences_validees = models.PositiveIntegerField(default=0, verbose_name="Consultations validées")
+    premiere_date = models.DateTimeField(verbose_name="Première observation")
+    derniere_date = models.DateTimeField(verbose_name="Dernière observation")
+    derniere_date_validee = models.DateTimeField(null=True, blank=True, verbose_name="Dernière observation validée")
+
+    class Meta:
+        verbose_name = "Symptôme du patient"
+        verbose_name_plural = "Profil de symptômes des patients"
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'symptome_hash'], name='unique_patient_symptom'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', '-derniere_date'], name='patient_symptom_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.symptome[:50]} ({self.occurrences})"
+
+
+class IdentifierCounter(models.Model):
+    """Dernier numéro attribué par préfixe annuel (EE-2025, MED-2025), voir identifiers.py."""
+
+    prefixe = models.CharField(max_length=30, unique=True, verbose_name="Préfixe")
+    dernier_numero = models.PositiveBigIntegerField(default=0, verbose_name="Dernier numéro attribué")
+
+    class Meta:
+        verbose_name = "Compteur d'identifiants"
+        verbose_name_plural = "Compteurs d'identifiants"
+
+    def __str__(self):
+        return f"{self.prefixe} : {self.dernier_numero}"
+
+
+class ConsultationStat(models.Model):
+    """
+    Agrégat des consultations pour le tableau de bord (voir analytics.py).
+
+    Une ligne par dimension (pathologie, modèle, modèle d'embedding, médecin),
+    valeur, statut et période (jour ou mois) : chaque consultation compte dans
+    huit lignes. Tenue à jour à chaque écriture de consultation (signals.py) et
+    recalculable par `manage.py refresh_consultation_stats`.
+    """
+
+    DIMENSION_CHOICES = [
+        ('pathologie', 'Pathologie identifiée'),
+        ('modele', 'Modèle'),
+        ('modele_embedding', "Modèle d'embedding"),
+        ('medecin', 'Médecin'),
+    ]
+    GRANULARITE_CHOICES = [
+        ('jour', 'Jour'),
+        ('mois', 'Mois'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES, verbose_name="Dimension")
+    granularite = models.CharField(max_length=4, choices=GRANULARITE_CHOICES, verbose_name="Granularité")
+    # Jour, ou premier jour du mois
+    periode = models.DateField(verbose_name="Période")
+    # Médecin : identifiant ("0" sans médecin), pas de clé étrangère
+    valeur = models.CharField(max_length=200, verbose_name="Valeur")
+    statut = models.CharField(max_length=20, verbose_name="Statut")
+    consultations = models.IntegerField(default=0, verbose_name="Consultations")
+    somme_scores = models.FloatField(default=0, verbose_name="Somme des scores de similarité")
+
+    class Meta:
+        verbose_name = "Statistique de consultations"
+        verbose_name_plural = "Statistiques de consultations"
+        constraints = [
+            # Sert aussi les lectures par dimension et période
+            models.UniqueConstraint(
+                fields=['dimension', 'granularite', 'periode', 'valeur', 'statut'],
+                name='unique_consultation_stat',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.valeur} ({self.periode}) : {self.consultations}"
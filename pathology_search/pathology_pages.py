@@ -0,0 +1,204 @@
+"""
+Pages HTML des pathologies préparées une seule fois en mémoire.
+
+Pour chaque page, le contenu (octets) et les positions d'injection des
+boutons de validation (après <body>, avant </body>) sont calculés au premier
+accès ; la vue envoie ensuite directement les tranches d'octets, sans
+recopier ni re-parcourir la page à chaque requête.
+"""
+import os
+import re
+import threading
+
+from django.conf import settings
+
+from . import catalog
+
+
+# Boutons de validation sticky injectés en haut de la page (mode validation)
+TOP_BUTTONS_HTML = """
+            <!-- Charger Font Awesome pour les icônes -->
+            <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
+            
+            <style>
+            #topValidationButtons {
+                position: -webkit-sticky !important;
+                position: sticky !important;
+                top: 0 !important;
+                left: 0 !important;
+                right: 0 !important;
+                z-index: 999999 !important;
+                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%) !important;
+                padding: 15px 20px !important;
+                box-shadow: 0 4px 15px rgba(0,0,0,0.2) !important;
+                display: flex !important;
+                gap: 15px !important;
+                justify-content: center !important;
+                align-items: center !important;
+                border-bottom: 3px solid rgba(255,255,255,0.2) !important;
+                margin: 0 !important;
+                width: 100% !important;
+                box-sizing: border-box !important;
+            }
+            .validation-btn {
+                flex: 0 0 auto !important;
+                min-width: 180px !important;
+                color: white !important;
+                font-weight: bold !important;
+                padding: 14px 28px !important;
+                border: none !important;
+                border-radius: 10px !important;
+                cursor: pointer !important;
+                font-size: 16px !important;
+                transition: all 0.3s ease !important;
+                display: inline-flex !important;
+                align-items: center !important;
+                justify-content: center !important;
+                gap: 10px !important;
+                font-family: Arial, sans-serif !important;
+            }
+            .validation-btn-valide {
+                background: linear-gradient(135deg, #10b981 0%, #059669 100%) !important;
+                box-shadow: 0 4px 10px rgba(16, 185, 129, 0.4) !important;
+            }
+            .validation-btn-valide:hover {
+                transform: translateY(-3px) !important;
+                box-shadow: 0 6px 15px rgba(16, 185, 129, 0.5) !important;
+            }
+            .validation-btn-non-valide {
+                background: linear-gradient(135deg, #ef4444 0%, #dc2626 100%) !important;
+                box-shadow: 0 4px 10px rgba(239, 68, 68, 0.4) !important;
+            }
+            .validation-btn-non-valide:hover {
+                transform: translateY(-3px) !important;
+                box-shadow: 0 6px 15px rgba(239, 68, 68, 0.5) !important;
+            }
+            @media (max-width: 640px) {
+                #topValidationButtons {
+                    flex-direction: column;
+                    padding: 12px 15px;
+                    gap: 10px;
+                }
+                .validation-btn {
+                    width: 100%;
+                    min-width: auto;
+                }
+            }
+            </style>
+            
+            <script>
+            console.log('Boutons de validation sticky injectés !');
+            console.log('Position: En haut de l\'iframe, sticky');
+            </script>
+            
+            <div id="topValidationButtons">
+                <button onclick="window.validerFormulaire()" class="validation-btn validation-btn-valide">
+                    <i class="fas fa-check-circle" style="font-size: 20px;"></i>
+                    <span>VALIDER</span>
+                </button>
+                <button onclick="window.nonValiderFormulaire()" class="validation-btn validation-btn-non-valide">
+                    <i class="fas fa-times-circle" style="font-size: 20px;"></i>
+                    <span>NON VALIDER</span>
+                </button>
+            </div>
+            """.encode('utf-8')
+
+# Script pour REMPLACER les fonctions de validation et communiquer avec la page parent,
+# injecté juste avant la fermeture du body (après tous les autres scripts)
+COMMUNICATION_SCRIPT = """
+            <script>
+            // REMPLACER complètement les fonctions de validation pour communiquer avec la page parent
+            console.log('Injection du script de communication parent-iframe');
+            
+            // Forcer le remplacement des fonctions
+            window.validerFormulaire = function() {
+                console.log('VALIDER cliqué dans iframe - envoi message au parent');
+                // Envoyer message à la page parent
+                if (window.parent && window.parent !== window) {
+                    window.parent.postMessage({action: 'validate', source: 'pathology'}, '*');
+                    console.log('Message "validate" envoyé au parent');
+                } else {
+                    console.warn('Pas de parent window détecté');
+                    alert('Formulaire validé (mode standalone)');
+                }
+            };
+            
+            window.nonValiderFormulaire = function() {
+                console.log('NON VALIDER cliqué dans iframe - envoi message au parent');
+                // Envoyer message à la page parent
+                if (window.parent && window.parent !== window) {
+                    window.parent.postMessage({action: 'not_validate', source: 'pathology'}, '*');
+                    console.log('Message "not_validate" envoyé au parent');
+                } else {
+                    console.warn('Pas de parent window détecté');
+                    alert('Formulaire non validé (mode standalone)');
+                }
+            };
+            
+            console.log(' Fonctions de validation remplacées avec succès');
+            </script>
+            """.encode('utf-8')
+
+_BODY_OPEN_RE = re.compile(rb'<body[^>]*>', re.IGNORECASE)
+
+
+class PreparedPage:
+
+    def __init__(self, full_path):
+        self.full_path = full_path
+        with open(full_path, 'rb') as f:
+            self.content = f.read()
+
+        # Positions d'injection (en octets)
+        body_match = _BODY_OPEN_RE.search(self.content)
+        self.body_open_end = body_match.end() if body_match else 0
+        body_close = self.content.find(b'</body>', self.body_open_end)
+        self.body_close_start = body_close if body_close != -1 else None
+
+    def chunks(self, validation=False):
+        """Tranches d'octets de la page, avec les boutons de validation si demandé."""
+        view = memoryview(self.content)
+        if not validation:
+            return [view]
+        if self.body_close_start is None:
+            return [view[:self.body_open_end], TOP_BUTTONS_HTML, view[self.body_open_end:]]
+        return [
+            view[:self.body_open_end],
+            TOP_BUTTONS_HTML,
+            view[self.body_open_end:self.body_close_start],
+            COMMUNICATION_SCRIPT,
+            view[self.body_close_start:],
+        ]
+
+
+_pages = {}
+_pages_version = None
+_pages_lock = threading.Lock()
+
+
+def get_page(html_path):
+    """Page préparée pour ce chemin relatif, ou None si absente ou hors du dossier d'embeddings."""
+    global _pages, _pages_version
+    version = catalog.get_catalog().version
+    with _pages_lock:
+        if _pages_version != version:
+            # Nouvel index : les pages préparées sont obsolètes
+            _pages = {}
+            _pages_version = version
+        page = _pages.get(html_path)
+    if page is not None:
+        return page
+
+    full_path = os.path.join(settings.EMBEDDINGS_FOLDER, html_path)
+    # Vérifier que le chemin est bien dans le dossier embeddings (sécurité)
+    folder = os.path.abspath(settings.EMBEDDINGS_FOLDER)
+    if os.path.commonpath([folder, os.path.abspath(full_path)]) != folder:
+        return None
+    if not os.path.isfile(full_path):
+        return None
+
+    page = PreparedPage(full_path)
+    with _pages_lock:
+        if _pages_version == version:
+            _pages[html_path] = page
+    return page
@@ -0,0 +1,96 @@
+"""
+Annuaire des patients paginé par clé (keyset) pour /api/patients/.
+
+Les patients sont triés par (nom, prénom, id) ; une page commence juste après
+la dernière ligne de la page précédente, transmise au client sous forme de
+curseur opaque. Le coût d'une page ne dépend donc ni de sa position ni de la
+taille de la base (index patient_directory_order_idx). La recherche compare
+chaque mot de la requête au début du nom, du prénom, de l'identifiant, du
+numéro de dossier, du CIN ou du téléphone (index préfixe sous PostgreSQL).
+"""
+import re
+
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+
+from .models import Patient
+from .utils import PATIENT_NAME_FIELDS, decode_cursor, encode_cursor, patient_full_name, typed
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Mots de recherche pris en compte
+MAX_SEARCH_TERMS = 4
+
+# Colonnes comparées au début de chaque mot de recherche
+SEARCH_FIELDS = ('nom', 'prenom', 'patient_identifier', 'numero_dossier', 'cin')
+PHONE_FIELDS = ('telephone', 'mobile_number')
+
+# Colonnes lues par serialize
+DIRECTORY_FIELDS = (
+    'id', *PATIENT_NAME_FIELDS, 'numero_dossier', 'patient_identifier',
+    'date_naissance', 'birth_date', 'telephone', 'mobile_number', 'email',
+)
+
+
+def search_filter(query):
+    """Chaque mot doit correspondre au début d'au moins une colonne de recherche."""
+    condition = Q()
+    for term in query.split()[:MAX_SEARCH_TERMS]:
+        term_condition = Q()
+        for field in SEARCH_FIELDS:
+            term_condition |= Q(**{f'{field}__istartswith': term})
+        digits = re.sub(r'\D', '', term)
+        if len(digits) >= 3 and len(digits) >= len(term) - 2:
+            for field in PHONE_FIELDS:
+                term_condition |= Q(**{f'{field}__istartswith': digits})
+        condition &= term_condition
+    return condition
+
+
+def serialize(row):
+    date_naissance = row['date_naissance'] or row['birth_date']
+    return {
+        'id': row['id'],
+        'nom': row['nom'],
+        'prenom': row['prenom'],
+        'nom_complet': patient_full_name(row),
+        'numero_dossier': row['numero_dossier'] or row['patient_identifier'],
+        'patient_identifier': row['patient_identifier'],
+        'date_naissance': date_naissance.isoformat() if date_naissance else None,
+        'telephone': row['telephone'] or row['mobile_number'],
+        'email': row['email'],
+    }
+
+
+def list_patients(query='', cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """(patients sérialisés, curseur de la page suivante ou None)."""
+    patients = Patient.objects.annotate(
+        sort_nom=Coalesce('nom', Value('')),
+        sort_prenom=Coalesce('prenom', Value('')),
+    )
+    if query.strip():
+        patients = patients.filter(search_filter(query))
+    if cursor:
+        sort_nom, sort_prenom, patient_id = decode_cursor(cursor, typed(str), typed(str), typed(int))
+        # La première condition borne le parcours de l'index, le reste départage les ex aequo
+        patients = patients.filter(
+            Q(sort_nom__gte=sort_nom)
+            & (
+                Q(sort_nom__gt=sort_nom)
+                | Q(sort_nom=sort_nom, sort_prenom__gt=sort_prenom)
+                | Q(sort_nom=sort_nom, sort_prenom=sort_prenom, id__gt=patient_id)
+            )
+        )
+
+    rows = list(
+        patients.order_by('sort_nom', 'sort_prenom', 'id').values(*DIRECTORY_FIELDS, 'sort_nom', 'sort_prenom')[:limit + 1]
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['sort_nom'], last['sort_prenom'], last['id'])
+    return [serialize(row) for row in rows], next_cursor
+
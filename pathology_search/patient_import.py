@@ -0,0 +1,295 @@
+"""
+Import en masse de patients (manage.py import_patients, /api/patients/import/).
+
+Le fichier (CSV ou NDJSON, une fiche patient par ligne, mêmes clés que le
+formulaire de création) est lu ligne à ligne et traité par lots de
+PATIENT_IMPORT_BATCH_SIZE : validation par les validateurs du modèle (format
+du CIN, choix, longueurs, e-mail), contrôle d'unicité du CIN et de
+l'identifiant (une requête par lot), attribution des identifiants manquants en
+un bloc, puis bulk_create. La mémoire utilisée ne dépend que de la taille d'un
+lot, quelle que soit celle du fichier ; chaque ligne rejetée est transmise au
+rapport avec son motif.
+"""
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from . import identifiers, patient_typeahead
+from .models import Patient
+
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+
+# Anciens noms de colonnes acceptés
+COLUMN_ALIASES = {
+    'nom': 'last_name',
+    'prenom': 'first_name',
+    'date_naissance': 'birth_date',
+    'telephone': 'mobile_number',
+    'numero_dossier': 'patient_identifier',
+}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def parse_birth_date(date_str):
+    """Parse birth date string to date object."""
+    if not date_str:
+        return None
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return None
+
+
+def patient_fields(data, patient_identifier):
+    """Champs du modèle Patient à partir des clés du formulaire de création."""
+    birth_date = parse_birth_date(data.get('birth_date'))
+    has_insurance = data.get('has_insurance') in (True, 'true')
+
+    return {
+        'patient_identifier': patient_identifier,
+        'cin': data.get('cin', '').strip() or None,
+        'passport_number': data.get('passport_number', '').strip() or None,
+        'last_name': data.get('last_name', '').strip().upper() or None,
+        'first_name': data.get('first_name', '').strip().capitalize() or None,
+        'gender': data.get('gender', '') or None,
+        'birth_date': birth_date,
+        'nationality': data.get('nationality', 'MA').strip() or 'MA',
+        'profession': data.get('profession', '').strip() or '',
+        'city': data.get('city', '').strip() or '',
+        'email': data.get('email', '').strip() or '',
+        'phone': data.get('phone', '').strip() or '',
+        'mobile_number': data.get('mobile_number', '').strip() or '',
+        'spouse_name': data.get('spouse_name', '').strip() or '',
+        'treating_physician': data.get('treating_physician', '').strip() or None,
+        'referring_physician': data.get('referring_physician', '').strip() or None,
+        'disease_speciality': data.get('disease_speciality', '').strip() or None,
+        'has_insurance': has_insurance,
+        'insurance_number': data.get('insurance_number', '').strip() or None,
+        'affiliation_number': data.get('affiliation_number', '').strip() or None,
+        'nom': data.get('last_name', '').strip().upper() or None,
+        'prenom': data.get('first_name', '').strip().capitalize() or None,
+        'date_naissance': birth_date,
+        'numero_dossier': patient_identifier,
+        'telephone': data.get('mobile_number', '').strip() or data.get('phone', '').strip() or ''
+    }
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return CSV
+    if name.endswith(('.ndjson', '.jsonl')):
+        return NDJSON
+    raise ImportFormatError("Format non reconnu (fichiers .csv, .ndjson ou .jsonl)")
+
+
+def _text_lines(stream):
+    """Lignes décodées d'un flux binaire, morceau par morceau (BOM UTF-8 ignoré)."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        buffer += decoder.decode(chunk)
+        lines = buffer.splitlines(keepends=True)
+        # Dernière ligne peut-être incomplète : conservée pour le morceau suivant
+        buffer = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+        yield from lines
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer
+
+
+def iter_records(stream, fmt):
+    """(numéro de ligne, fiche ou None, erreur) pour chaque ligne du fichier."""
+    lines = _text_lines(stream)
+    if fmt == CSV:
+        first = next(lines, '')
+        # Séparateur « ; » fréquent dans les exports de tableurs français
+        delimiter = ';' if first.count(';') > first.count(',') else ','
+        header = next(csv.reader(io.StringIO(first), delimiter=delimiter), [])
+        fieldnames = [column.strip() for column in header]
+        reader = csv.reader(lines, delimiter=delimiter)
+        while True:
+            # Ligne où commence la fiche (1 : en-tête) ; line_num compte les lignes des champs sur plusieurs lignes
+            line_number = reader.line_num + 2
+            row = next(reader, None)
+            if row is None:
+                break
+            if not row:
+                continue
+            # Comme csv.DictReader : colonnes manquantes à None, valeurs en trop sous la clé None
+            record = dict(zip(fieldnames, row))
+            if len(row) > len(fieldnames):
+                record[None] = row[len(fieldnames):]
+            for column in fieldnames[len(row):]:
+                record[column] = None
+            yield line_number, record, None
+    else:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"JSON invalide : {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Objet JSON attendu"
+                continue
+            yield line_number, record, None
+
+
+def normalize_record(record):
+    """Clés du formulaire, valeurs en texte (les nombres JSON deviennent des chaînes)."""
+    data = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        key = COLUMN_ALIASES.get(key.strip(), key.strip())
+        if value is None:
+            value = ''
+        elif isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif not isinstance(value, str):
+            value = str(value)
+        # Colonne d'alias et colonne principale : la principale l'emporte
+        if key not in data or not data[key]:
+            data[key] = value
+    return data
+
+
+def validate_record(record):
+    """(Patient non enregistré sans identifiant attribué, erreur)."""
+    data = normalize_record(record)
+    if not data.get('last_name', '').strip():
+        return None, "Nom manquant"
+    if data.get('birth_date', '').strip() and parse_birth_date(data['birth_date'].strip()) is None:
+        return None, "Date de naissance invalide (format attendu : AAAA-MM-JJ)"
+
+    patient = Patient(**patient_fields(data, data.get('patient_identifier', '').strip() or None))
+    try:
+        patient.full_clean(validate_unique=False, validate_constraints=False)
+    except ValidationError as e:
+        return None, '; '.join(
+            f"{field} : {' '.join(messages)}" for field, messages in e.message_dict.items()
+        )
+    return patient, None
+
+
+class ImportReport:
+    """Compteurs de l'import et lignes rejetées (écrites au fur et à mesure, `writer` facultatif)."""
+
+    def __init__(self, writer=None, keep_rejected=0):
+        self.created = 0
+        self.rejected = 0
+        self.writer = writer
+        self.keep_rejected = keep_rejected
+        self.rejected_rows = []
+
+    def reject(self, line_number, error, record=None):
+        self.rejected += 1
+        if self.writer is not None:
+            self.writer.writerow([line_number, error, json.dumps(record or {}, ensure_ascii=False, default=str)])
+        if len(self.rejected_rows) < self.keep_rejected:
+            self.rejected_rows.append({'ligne': line_number, 'erreur': error})
+
+    def as_dict(self):
+        return {'created': self.created, 'rejected': self.rejected, 'rejected_rows': self.rejected_rows}
+
+
+REPORT_HEADER = ['ligne', 'erreur', 'donnees']
+
+
+def _reject_duplicates(batch, report):
+    """Écarter les CIN et identifiants déjà en base ou répétés dans le lot."""
+    cins = {patient.cin for _, patient, _ in batch if patient.cin}
+    given = {patient.patient_identifier for _, patient, _ in batch if patient.patient_identifier}
+    existing_cins = set(Patient.objects.filter(cin__in=cins).values_list('cin', flat=True)) if cins else set()
+    existing_ids = set(
+        Patient.objects.filter(patient_identifier__in=given).values_list('patient_identifier', flat=True)
+    ) if given else set()
+
+    kept = []
+    for line_number, patient, record in batch:
+        if patient.cin and patient.cin in existing_cins:
+            report.reject(line_number, f"CIN {patient.cin} déjà enregistré", record)
+        elif patient.patient_identifier and patient.patient_identifier in existing_ids:
+            report.reject(line_number, f"Identifiant {patient.patient_identifier} déjà enregistré", record)
+        else:
+            if patient.cin:
+                existing_cins.add(patient.cin)
+            if patient.patient_identifier:
+                existing_ids.add(patient.patient_identifier)
+            kept.append((line_number, patient, record))
+    return kept
+
+
+def _insert_batch(batch, report, dry_run=False):
+    batch = _reject_duplicates(batch, report)
+    if dry_run:
+        report.created += len(batch)
+        return
+    if not batch:
+        return
+
+    # Identifiants saisis : le compteur passe au-delà ; les autres sont attribués en un bloc
+    for _, patient, _ in batch:
+        if patient.patient_identifier:
+            identifiers.reserve(identifiers.PATIENT, patient.patient_identifier)
+    missing = [patient for _, patient, _ in batch if not patient.patient_identifier]
+    for patient, patient_identifier in zip(missing, identifiers.allocate(identifiers.PATIENT, len(missing))):
+        patient.patient_identifier = patient.numero_dossier = patient_identifier
+
+    patients = [patient for _, patient, _ in batch]
+    for patient in patients:
+        # bulk_create n'appelle pas save()
+        patient.build_search_text()
+    try:
+        with transaction.atomic():
+            Patient.objects.bulk_create(patients)
+        report.created += len(patients)
+    except IntegrityError:
+        # Conflit avec une création simultanée : ligne par ligne pour isoler les fautives
+        for line_number, patient, record in batch:
+            try:
+                with transaction.atomic():
+                    patient.pk = None
+                    patient.save()
+                report.created += 1
+            except IntegrityError as e:
+                report.reject(line_number, f"Conflit d'unicité : {e}", record)
+
+
+def import_patients(stream, fmt, report, batch_size=None, dry_run=False):
+    """Importer les patients du flux binaire `stream` ; retourne `report`."""
+    batch_size = batch_size or settings.PATIENT_IMPORT_BATCH_SIZE
+    batch = []
+    for line_number, record, error in iter_records(stream, fmt):
+        if error is None:
+            patient, error = validate_record(record)
+        if error is not None:
+            report.reject(line_number, error, record)
+            continue
+        batch.append((line_number, patient, record))
+        if len(batch) >= batch_size:
+            _insert_batch(batch, report, dry_run)
+            batch = []
+    if batch:
+        _insert_batch(batch, report, dry_run)
+    if report.created and not dry_run:
+        patient_typeahead.reload_index()
+    return report
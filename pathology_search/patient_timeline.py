@@ -0,0 +1,191 @@
+"""
+Historique des consultations d'un patient, paginé par clé (keyset).
+
+Les consultations sont triées de la plus récente à la plus ancienne
+(date_consultation, id) ; une page commence juste après la dernière ligne de
+la page précédente, transmise sous forme de curseur opaque (index
+consultation_timeline_idx). Seules les colonnes des champs demandés sont lues :
+par défaut, ni la description clinique ni les critères.
+
+Les réponses sont validées par un ETag calculé à partir de la dernière
+date_modification et du nombre de consultations du patient (une requête
+d'agrégat indexée) : un historique inchangé est renvoyé en 304 sans relire
+les consultations.
+"""
+import hashlib
+import json
+import uuid
+
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import symptom_profile
+from .models import Consultation
+from .utils import clean_pathology_name, decode_cursor, encode_cursor
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+STATUT_LABELS = dict(Consultation._meta.get_field('statut').choices)
+
+# Champ renvoyé -> colonnes lues
+FIELD_COLUMNS = {
+    'date_consultation': ('date_consultation',),
+    'pathologie_identifiee': ('pathologie_identifiee',),
+    'statut': ('statut',),
+    'medecin': ('medecin__nom', 'medecin__prenom', 'medecin__specialite'),
+    'nombre_criteres': ('criteres_valides',),
+    'score_similarite': ('score_similarite',),
+    'description_clinique': ('description_clinique',),
+    'criteres_valides': ('criteres_valides',),
+    'plan_traitement_valide': ('plan_traitement_valide',),
+    'notes_medecin': ('notes_medecin',),
+}
+
+# Champs par défaut : une ligne de la liste d'historique
+DEFAULT_FIELDS = ('date_consultation', 'pathologie_identifiee', 'statut', 'medecin', 'nombre_criteres')
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(value):
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in FIELD_COLUMNS]
+    if unknown or not fields:
+        raise InvalidFields(', '.join(unknown))
+    return fields
+
+
+def _cursor_datetime(value):
+    date_consultation = parse_datetime(value)
+    if date_consultation is None:
+        raise ValueError(value)
+    return date_consultation
+
+
+def decode_page_cursor(cursor):
+    """(date_consultation, id) de la dernière consultation de la page précédente ; InvalidCursor sinon."""
+    return decode_cursor(cursor, _cursor_datetime, uuid.UUID)
+
+
+def encode_page_cursor(consultation_date, consultation_id):
+    return encode_cursor(consultation_date.isoformat(), str(consultation_id))
+
+
+def flatten_criteria(criteres_valides):
+    """Critères validés à plat (même règle que l'historique complet)."""
+    criteria_list = []
+    for value in (criteres_valides or {}).values():
+        if isinstance(value, list):
+            criteria_list.extend(value)
+        else:
+            criteria_list.append(str(value))
+    return criteria_list
+
+
+def history_state(patient_id):
+    """(nombre de consultations, dernière date_modification) du patient."""
+    state = Consultation.objects.filter(patient_id=patient_id).aggregate(
+        total=Count('id'), last_modified=Max('date_modification')
+    )
+    return state['total'], state['last_modified']
+
+
+def history_etag(patient_id, state, *parts):
+    total, last_modified = state
+    key = json.dumps([patient_id, total, last_modified.isoformat() if last_modified else None, *parts], default=str)
+    return f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def serialize(row, fields):
+    data = {'id': str(row['id'])}
+    for field in fields:
+        if field == 'date_consultation':
+            data[field] = timezone.localtime(row['date_consultation']).strftime('%d/%m/%Y à %H:%M')
+        elif field == 'pathologie_identifiee':
+            data[field] = clean_pathology_name(row['pathologie_identifiee'])
+        elif field == 'statut':
+            data[field] = STATUT_LABELS.get(row['statut'], row['statut'])
+        elif field == 'medecin':
+            if row['medecin__nom'] is None and row['medecin__prenom'] is None:
+                data['medecin'] = 'Non renseigné'
+                data['medecin_specialite'] = ''
+            else:
+                # Même format que Medecin.nom_complet
+                data['medecin'] = f"Dr. {row['medecin__prenom']} {row['medecin__nom']}"
+                data['medecin_specialite'] = row['medecin__specialite']
+        elif field == 'nombre_criteres':
+            data[field] = len(flatten_criteria(row['criteres_valides']))
+        elif field == 'criteres_valides':
+            data[field] = flatten_criteria(row['criteres_valides'])
+        else:
+            data[field] = row[field]
+    return data
+
+
+def _page(patient_id, cursor):
+    """Consultations du patient après le curseur, dans l'ordre de l'historique."""
+    consultations = Consultation.objects.filter(patient_id=patient_id)
+    if cursor:
+        date_consultation, consultation_id = decode_page_cursor(cursor)
+        consultations = consultations.filter(
+            Q(date_consultation__lte=date_consultation)
+            & (Q(date_consultation__lt=date_consultation) | Q(date_consultation=date_consultation, id__lt=consultation_id))
+        )
+    return consultations.order_by('-date_consultation', '-id')
+
+
+def consultation_page(patient_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """(consultations complètes, curseur de la page suivante ou None) pour la page HTML d'historique."""
+    consultations = list(_page(patient_id, cursor)[:limit + 1])
+    next_cursor = None
+    if len(consultations) > limit:
+        consultations = consultations[:limit]
+        next_cursor = encode_page_cursor(consultations[-1].date_consultation, consultations[-1].id)
+    return consultations, next_cursor
+
+
+def list_consultations(patient_id, fields=DEFAULT_FIELDS, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """(consultations sérialisées, curseur de la page suivante ou None)."""
+    columns = {'id', 'date_consultation'}
+    for field in fields:
+        columns.update(FIELD_COLUMNS[field])
+    rows = list(_page(patient_id, cursor).values(*sorted(columns))[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_page_cursor(last['date_consultation'], last['id'])
+    return [serialize(row, fields) for row in rows], next_cursor
+
+
+def history_summary(patient_id):
+    """Nombre de consultations par statut, dates extrêmes, dernière pathologie et symptômes dédupliqués."""
+    consultations = Consultation.objects.filter(patient_id=patient_id)
+    by_statut = {
+        STATUT_LABELS.get(row['statut'], row['statut']): row['total']
+        for row in consultations.order_by().values('statut').annotate(total=Count('id'))
+    }
+    bounds = consultations.order_by().aggregate(
+        first=Min('date_consultation'), last=Max('date_consultation')
+    )
+    latest = consultations.order_by('-date_consultation', '-id').values('pathologie_identifiee').first()
+
+    # Profil de symptômes matérialisé (symptom_profile), plus récents d'abord
+    symptoms = symptom_profile.symptom_labels(patient_id)
+
+    return {
+        'total_consultations': sum(by_statut.values()),
+        'consultations_par_statut': by_statut,
+        'premiere_consultation': bounds['first'].isoformat() if bounds['first'] else None,
+        'derniere_consultation': bounds['last'].isoformat() if bounds['last'] else None,
+        'derniere_pathologie': clean_pathology_name(latest['pathologie_identifiee']) if latest else None,
+        'all_symptoms': symptoms,
+        'total_symptoms': len(symptoms),
+    }
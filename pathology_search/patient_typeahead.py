@@ -0,0 +1,300 @@
+"""
+Recherche instantanée des patients (/api/patients/typeahead/).
+
+La requête est normalisée comme Patient.search_text (sans accents, minuscules)
+puis chaque mot doit commencer un mot du texte de recherche du patient (mot
+entier ou partie d'un nom composé : « fas » trouve « el-fassi », pas
+« kafas »). Les deux moteurs appliquent cette même règle :
+
+- PostgreSQL avec pg_trgm : filtres LIKE 'mot%', '% mot%' ou '%-mot%' servis
+  par l'index GIN trigramme (patient_search_text_trgm_idx), tri par
+  similarité de mots.
+- Ailleurs (SQLite, pg_trgm indisponible) : index en mémoire par processus,
+  liste triée des mots des patients interrogée par dichotomie sur le préfixe
+  de chaque mot de la requête (voir TypeaheadIndex). Les lectures se font
+  sans verrou sur un instantané immuable : une création de patient dans ce
+  processus (patient_changed) publie une copie modifiée, et le rechargement
+  complet toutes les PATIENT_TYPEAHEAD_REFRESH_SECONDS (modifications des
+  autres workers) est construit en arrière-plan pendant que les recherches
+  continuent sur l'index précédent.
+"""
+import bisect
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from django.db.models import Q
+
+from .models import Patient
+from .utils import PATIENT_NAME_FIELDS, fold_text, patient_full_name
+
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 25
+
+# Mots de recherche pris en compte
+MAX_SEARCH_TERMS = 4
+
+# Longueur minimale d'un mot pour le filtre trigramme (en dessous : préfixe du texte)
+TRIGRAM_MIN_LENGTH = 3
+
+# Colonnes lues par serialize
+TYPEAHEAD_FIELDS = (
+    'id', *PATIENT_NAME_FIELDS, 'cin', 'numero_dossier', 'patient_identifier',
+    'date_naissance', 'birth_date',
+)
+
+
+def search_terms(query):
+    return fold_text(query).split()[:MAX_SEARCH_TERMS]
+
+
+def serialize(row):
+    date_naissance = row['date_naissance'] or row['birth_date']
+    return {
+        'id': row['id'],
+        'nom_complet': patient_full_name(row),
+        'numero_dossier': row['numero_dossier'] or row['patient_identifier'],
+        'cin': row['cin'],
+        'date_naissance': date_naissance.isoformat() if date_naissance else None,
+    }
+
+
+# ============= POSTGRESQL (pg_trgm) =============
+
+_trigram_available = {}
+_trigram_lock = threading.Lock()
+
+
+def trigram_available():
+    """pg_trgm installé sur la base courante (vérifié une fois par processus)."""
+    alias = connection.alias
+    if alias not in _trigram_available:
+        with _trigram_lock:
+            if alias not in _trigram_available:
+                available = False
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                        available = cursor.fetchone() is not None
+                _trigram_available[alias] = available
+    return _trigram_available[alias]
+
+
+def _search_trigram(terms, limit):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    patients = Patient.objects.all()
+    long_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_LENGTH]
+    if not long_terms:
+        # Aucun trigramme exploitable : début du texte (nom), index patient_search_text_prefix_idx
+        patients = patients.filter(search_text__startswith=terms[0])
+    for term in terms:
+        # Début d'un mot (comme l'index en mémoire), pas n'importe quelle sous-chaîne
+        patients = patients.filter(
+            Q(search_text__startswith=term) | Q(search_text__contains=f' {term}') | Q(search_text__contains=f'-{term}')
+        )
+    rows = patients.annotate(
+        similarity=TrigramWordSimilarity(' '.join(terms), 'search_text')
+    ).order_by('-similarity', 'search_text', 'id').values(*TYPEAHEAD_FIELDS)[:limit]
+    return [serialize(row) for row in rows]
+
+
+# ============= INDEX EN MÉMOIRE =============
+
+def _tokens(search_text):
+    """Mots du texte de recherche, plus les parties des mots composés (el-fassi => fassi)."""
+    tokens = []
+    for word in search_text.split():
+        for token in [word] + word.split('-'):
+            if token and token not in tokens:
+                tokens.append(token)
+    return tokens
+
+
+class TypeaheadIndex:
+    """
+    Mots triés et données d'affichage, par processus.
+
+    Les patients y sont désignés par leur rang dans l'ordre du texte de
+    recherche (nom d'abord). Chaque mot de la requête donne une plage de la
+    liste triée, convertie en masque de rangs : l'intersection et le tri des
+    résultats sont vectorisés (numpy), quel que soit le nombre de patients
+    correspondants.
+    """
+
+    def __init__(self):
+        # Mots triés et rang du patient de chaque mot (tableau parallèle)
+        self.tokens = []
+        self.postings = np.zeros(0, dtype=np.int32)
+        # rang -> (mots, données d'affichage)
+        self.patients = {}
+        self.ranks = {}
+        self.size = 0
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        rows = Patient.objects.order_by('search_text', 'id').values('search_text', *TYPEAHEAD_FIELDS)
+        entries = []
+        for rank, row in enumerate(rows.iterator(chunk_size=2000)):
+            tokens = _tokens(row.pop('search_text'))
+            index.patients[rank] = (tokens, row)
+            index.ranks[row['id']] = rank
+            entries.extend((token, rank) for token in tokens)
+        entries.sort()
+        index.tokens = [token for token, _ in entries]
+        index.postings = np.fromiter((rank for _, rank in entries), dtype=np.int32, count=len(entries))
+        index.size = len(index.patients)
+        return index
+
+    def _position(self, token, rank):
+        start = bisect.bisect_left(self.tokens, token)
+        end = bisect.bisect_right(self.tokens, token, start)
+        return start + int(np.searchsorted(self.postings[start:end], rank)), end
+
+    def copy(self):
+        index = TypeaheadIndex()
+        index.tokens = list(self.tokens)
+        index.postings = self.postings.copy()
+        index.patients = dict(self.patients)
+        index.ranks = dict(self.ranks)
+        index.size = self.size
+        index.built_at = self.built_at
+        return index
+
+    def _remove(self, patient_id):
+        rank = self.ranks.pop(patient_id, None)
+        if rank is None:
+            return
+        tokens, _ = self.patients.pop(rank)
+        for token in tokens:
+            position, end = self._position(token, rank)
+            if position < end and self.postings[position] == rank:
+                del self.tokens[position]
+                self.postings = np.delete(self.postings, position)
+
+    def with_patient(self, patient_id, search_text, row):
+        """Copie de l'index contenant le patient (créé ou modifié) ; l'index courant reste inchangé."""
+        index = self.copy()
+        index._remove(patient_id)
+        # Classé après les autres patients jusqu'au prochain rechargement
+        rank = index.size
+        index.size += 1
+        tokens = _tokens(search_text)
+        index.patients[rank] = (tokens, row)
+        index.ranks[patient_id] = rank
+        for token in tokens:
+            position, _ = index._position(token, rank)
+            index.tokens.insert(position, token)
+            index.postings = np.insert(index.postings, position, rank)
+        return index
+
+    def _mask(self, term, prefix=True):
+        start = bisect.bisect_left(self.tokens, term)
+        end = bisect.bisect_right(self.tokens, term + '\uffff' if prefix else term, start)
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.postings[start:end]] = True
+        return mask
+
+    def _matching(self, terms, prefix=True):
+        mask = None
+        for term in terms:
+            term_mask = self._mask(term, prefix)
+            mask = term_mask if mask is None else mask & term_mask
+        return mask
+
+    def search(self, terms, limit):
+        # Chaque mot de la requête doit commencer un mot du patient ; mots entiers d'abord
+        exact = self._matching(terms, prefix=False)
+        ranks = np.flatnonzero(exact)[:limit].tolist()
+        if len(ranks) < limit:
+            others = self._matching(terms) & ~exact
+            ranks += np.flatnonzero(others)[:limit - len(ranks)].tolist()
+        return [serialize(self.patients[rank][1]) for rank in ranks]
+
+
+# Index publié : remplacé en bloc (affectation atomique), jamais modifié en place
+_index = None
+# Sérialise les publications ; jamais pris pendant une recherche
+_index_lock = threading.Lock()
+# Rechargement en arrière-plan en cours, et patients modifiés pendant celui-ci (à reporter)
+_rebuilding = False
+_pending = {}
+
+
+def _publish_rebuild(index):
+    global _index, _rebuilding
+    with _index_lock:
+        for patient_id, (search_text, row) in _pending.items():
+            index = index.with_patient(patient_id, search_text, row)
+        _pending.clear()
+        _index = index
+        _rebuilding = False
+
+
+def _rebuild_in_background():
+    global _rebuilding
+    close_old_connections()
+    try:
+        index = TypeaheadIndex.build()
+    except Exception:
+        with _index_lock:
+            _rebuilding = False
+            _pending.clear()
+        raise
+    finally:
+        connections.close_all()
+    _publish_rebuild(index)
+
+
+def get_index():
+    """Index courant ; construit dans la requête au premier appel, rechargé ensuite en arrière-plan."""
+    global _index, _rebuilding
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TypeaheadIndex.build()
+            return _index
+    if time.monotonic() - index.built_at > settings.PATIENT_TYPEAHEAD_REFRESH_SECONDS and not _rebuilding:
+        with _index_lock:
+            if _rebuilding:
+                return index
+            _rebuilding = True
+        threading.Thread(target=_rebuild_in_background, name='typeahead-index', daemon=True).start()
+    return index
+
+
+def reload_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def patient_changed(patient):
+    """À appeler après création ou modification d'un patient (index en mémoire de ce processus)."""
+    global _index
+    if _index is None:
+        return
+    row = {field: getattr(patient, field) for field in TYPEAHEAD_FIELDS}
+    with _index_lock:
+        if _index is not None:
+            _index = _index.with_patient(patient.id, patient.search_text, row)
+        if _rebuilding:
+            _pending[patient.id] = (patient.search_text, row)
+
+
+# ============= RECHERCHE =============
+
+def search_patients(query, limit=DEFAULT_LIMIT):
+    """(patients sérialisés, moteur utilisé)."""
+    terms = search_terms(query)
+    if not terms:
+        return [], None
+    if trigram_available():
+        return _search_trigram(terms, limit), 'trigram'
+    return get_index().search(terms, limit), 'memory'
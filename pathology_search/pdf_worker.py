@@ -0,0 +1,49 @@
+"""
+Service de rendu PDF WeasyPrint réutilisable.
+
+La configuration des polices et les feuilles de style du rapport sont
+préparées une seule fois par processus, puis réutilisées à chaque rendu.
+Ce module n'importe pas Django : il est aussi exécuté dans les processus
+de l'export en masse, qui reçoivent du HTML déjà rendu.
+"""
+import threading
+import time
+
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+
+class PdfRenderer:
+
+    def __init__(self, stylesheet_paths=()):
+        self.font_config = FontConfiguration()
+        self.stylesheets = [CSS(filename=str(path), font_config=self.font_config) for path in stylesheet_paths]
+        # La configuration de polices n'est pas prévue pour un usage concurrent
+        self._lock = threading.Lock()
+
+    def render(self, html):
+        """Retourner (pdf_bytes, timings) ; timings en secondes pour la mise en page et le dessin."""
+        with self._lock:
+            start = time.perf_counter()
+            document = HTML(string=html).render(font_config=self.font_config, stylesheets=self.stylesheets)
+            layout_done = time.perf_counter()
+            pdf_bytes = document.write_pdf()
+            drawing_done = time.perf_counter()
+        return pdf_bytes, {'layout': layout_done - start, 'drawing': drawing_done - layout_done}
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(stylesheet_paths=()):
+    """Service de rendu du processus courant pour ces feuilles de style (créé au premier appel)."""
+    key = tuple(str(path) for path in stylesheet_paths)
+    with _renderers_lock:
+        if key not in _renderers:
+            _renderers[key] = PdfRenderer(key)
+        return _renderers[key]
+
+
+def html_to_pdf(html, stylesheet_paths=()):
+    return get_renderer(stylesheet_paths).render(html)[0]
@@ -0,0 +1,164 @@
+"""
+Budget de requêtes SQL par vue et contrôle des plans d'exécution.
+
+- QueryCounter : compte les requêtes exécutées sur une connexion
+  (connection.execute_wrapper, actif aussi sans DEBUG) ; le texte SQL n'est
+  conservé que sur demande (audit).
+- QueryBudgetMiddleware (QUERY_BUDGET_MIDDLEWARE, activé par défaut sous
+  DEBUG) : compte les requêtes de chaque réponse, journalise
+  un avertissement au-delà du budget de la vue (VIEW_BUDGETS) et, si
+  QUERY_BUDGET_HEADER, renvoie le nombre dans l'en-tête X-DB-Queries. Les
+  réponses en flux (exports) ne sont comptées que jusqu'au premier octet.
+- `manage.py audit_queries` : appelle les vues budgétées sur le patient qui a
+  le plus de consultations (le nombre de requêtes ne doit pas dépendre de la
+  taille de l'historique) et vérifie par EXPLAIN que les chemins d'accès
+  principaux utilisent leur index (plan_checks).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Consultation, ConsultationStat, Patient, PatientSymptom
+
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de requêtes par vue (nom d'URL), indépendant du volume de données
+VIEW_BUDGETS = {
+    'pathology_search:get_patients': 1,
+    'pathology_search:typeahead_patients': 1,
+    'pathology_search:patient_history': 3,
+    'pathology_search:get_patient_history': 3,
+    'pathology_search:get_patient_timeline': 3,
+    'pathology_search:get_patient_history_summary': 6,
+    'pathology_search:search_consultations': 1,
+    'pathology_search:get_analytics': 8,
+}
+
+
+class QueryCounter:
+    """Contexte qui compte les requêtes exécutées sur `using` (toutes, y compris en transaction) ; record_sql : garde leur texte."""
+
+    def __init__(self, using=None, record_sql=False):
+        self.connection = connection if using is None else connections[using]
+        self.count = 0
+        self.queries = [] if record_sql else None
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if self.queries is not None:
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+class QueryBudgetMiddleware:
+    """Compte les requêtes SQL de chaque réponse et signale les dépassements de budget."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+        name = getattr(request.resolver_match, 'view_name', None)
+        budget = VIEW_BUDGETS.get(name)
+        if budget is not None and counter.count > budget:
+            logger.warning("%s : %d requêtes SQL (budget %d) pour %s", name, counter.count, budget, request.path)
+        if settings.QUERY_BUDGET_HEADER:
+            response['X-DB-Queries'] = str(counter.count)
+        return response
+
+
+# ============= AUDIT =============
+
+def sample_patient_id():
+    """Patient ayant le plus de consultations (None si aucun patient)."""
+    return (
+        Patient.objects.annotate(total=Count('consultations')).order_by('-total', 'id')
+        .values_list('id', flat=True).first()
+    )
+
+
+def budget_requests(patient_id):
+    """(nom de vue, chemin) des appels audités."""
+    return [
+        ('pathology_search:get_patients', '/api/patients/?limit=50'),
+        ('pathology_search:typeahead_patients', '/api/patients/typeahead/?q=a'),
+        ('pathology_search:patient_history', f'/patient/{patient_id}/history/'),
+        ('pathology_search:get_patient_history', f'/api/patients/{patient_id}/history/'),
+        ('pathology_search:get_patient_timeline', f'/api/patients/{patient_id}/timeline/?limit=20'),
+        ('pathology_search:get_patient_history_summary', f'/api/patients/{patient_id}/history/summary/'),
+        ('pathology_search:search_consultations', '/api/consultations/search/?q=douleur'),
+        ('pathology_search:get_analytics', '/api/analytics/?granularity=week'),
+    ]
+
+
+def audit_budgets():
+    """[(vue, chemin, statut HTTP, nombre de requêtes, budget, requêtes)] ; un premier appel amorce les caches de processus."""
+    from django.test import Client
+
+    patient_id = sample_patient_id()
+    if patient_id is None:
+        return []
+    client = Client(raise_request_exception=False)
+    results = []
+    for name, path in budget_requests(patient_id):
+        client.get(path)
+        with QueryCounter(record_sql=True) as counter:
+            response = client.get(path)
+        results.append((name, path, response.status_code, counter.count, VIEW_BUDGETS[name], counter.queries))
+    return results
+
+
+def plan_checks(patient_id):
+    """(description, queryset, index attendu) des chemins d'accès principaux."""
+    since = timezone.now() - timedelta(days=30)
+    return [
+        ("Historique d'un patient (timeline)",
+         Consultation.objects.filter(patient_id=patient_id).order_by('-date_consultation', '-id'),
+         'consultation_timeline_idx'),
+        ("Historique d'un patient (page HTML)",
+         Consultation.objects.filter(patient_id=patient_id).order_by('-date_consultation'),
+         'consultation_timeline_idx'),
+        ('Consultations par période',
+         Consultation.objects.filter(date_consultation__gte=since).order_by('date_consultation', 'id'),
+         'consultation_date_idx'),
+        ('Consultations par statut et période',
+         Consultation.objects.filter(statut='valide', date_consultation__gte=since),
+         'consultation_statut_date_idx'),
+        ('Profil de symptômes',
+         PatientSymptom.objects.filter(patient_id=patient_id).order_by('-derniere_date'),
+         'patient_symptom_recent_idx'),
+        ('Tableau de bord (agrégats par période)',
+         ConsultationStat.objects.filter(dimension='pathologie', granularite='jour', periode__gte=since.date()),
+         # SQLite : la contrainte d'unicité est un index implicite
+         'unique_consultation_stat' if connection.vendor == 'postgresql' else 'sqlite_autoindex_pathology_search_consultationstat'),
+    ]
+
+
+def audit_plans():
+    """[(description, index attendu, index utilisé ?, plan)]."""
+    patient_id = sample_patient_id()
+    results = []
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Vérifier que l'index peut servir la requête, même sur une petite table
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for description, queryset, index_name in plan_checks(patient_id or 0):
+            plan = queryset.explain()
+            results.append((description, index_name, index_name in plan, plan))
+    return results
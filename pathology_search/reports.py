@@ -0,0 +1,387 @@
+"""
+Génération et mise en cache des rapports PDF de consultation.
+
+Les PDF sont stockés sur disque, indexés par consultation et par
+date_modification : toute modification de la consultation produit une
+nouvelle version, les anciennes sont supprimées.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.timesince import timesince
+
+from . import pdf_worker
+from .models import Consultation
+from .utils import clean_pathology_name, clean_text_for_pdf, format_plan_traitement_html, period_filter
+
+
+logger = logging.getLogger(__name__)
+
+# Feuille de style du rapport, compilée une fois par processus par le service de rendu
+REPORT_TEMPLATE = Path(__file__).resolve().parent / 'templates' / 'pathology_search' / 'print_report_pdf.html'
+REPORT_STYLESHEETS = (str(REPORT_TEMPLATE.with_suffix('.css')),)
+
+# Champs du patient et du médecin imprimés dans le rapport (clé du cache : le patient n'a pas de date de modification)
+REPORT_PATIENT_FIELDS = (
+    'nom', 'prenom', 'last_name', 'first_name', 'numero_dossier', 'patient_identifier',
+    'date_naissance', 'telephone', 'email',
+)
+REPORT_MEDECIN_FIELDS = ('nom', 'prenom', 'specialite', 'numero_ordre', 'telephone')
+
+
+def _template_version():
+    # Toute modification du gabarit ou de la feuille de style invalide les PDF en cache
+    digest = hashlib.sha1()
+    for path in (REPORT_TEMPLATE, *map(Path, REPORT_STYLESHEETS)):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:8]
+
+
+REPORT_TEMPLATE_VERSION = _template_version()
+
+MODEL_DISPLAY_NAMES = {
+    'chatgpt-5.1': 'Model 1',
+    'claude-4.5': 'Model 2'
+}
+
+_executor = ThreadPoolExecutor(max_workers=settings.REPORT_RENDER_WORKERS, thread_name_prefix='pdf-report')
+_in_flight_lock = threading.Lock()
+_in_flight = {}  # consultation_id -> Future du rendu en arrière-plan
+
+_export_pool = None
+_export_pool_lock = threading.Lock()
+
+
+def build_report_context(consultation):
+    """Construire le contexte du template print_report_pdf.html."""
+    criteres_valides = consultation.criteres_valides or {}
+
+    model_used = 'chatgpt-5.1'  # Par défaut
+    model_display_name = 'Model 1'
+    if '_metadata' in criteres_valides:
+        metadata = criteres_valides['_metadata']
+        model_used = metadata.get('model_used', 'chatgpt-5.1')
+        model_display_name = MODEL_DISPLAY_NAMES.get(model_used, metadata.get('model_display_name', 'Model 1'))
+
+    plan_traitement_a_utiliser = consultation.plan_traitement_valide if consultation.plan_traitement_valide else consultation.plan_traitement
+
+    criteres_valides_clean = {}
+    for key, value in criteres_valides.items():
+        if key == '_metadata':  # Exclure les métadonnées de l'affichage
+            continue
+        criteres_valides_clean[clean_text_for_pdf(key)] = clean_text_for_pdf(value)
+
+    return {
+        'consultation': consultation,
+        'patient': consultation.patient,
+        'medecin': consultation.medecin,
+        'date_impression': timezone.now(),
+        'plan_traitement_clean': format_plan_traitement_html(plan_traitement_a_utiliser),
+        'pathologie_clean': clean_pathology_name(consultation.pathologie_identifiee),
+        'notes_medecin': consultation.notes_medecin if consultation.notes_medecin else '',
+        'criteres_valides_clean': criteres_valides_clean,
+        'model_used': model_used,
+        'model_display_name': model_display_name,
+        'is_direct_access': consultation.description_clinique.startswith('Accès direct à la pathologie'),
+    }
+
+
+def render_report_html(consultation):
+    return render_to_string('pathology_search/print_report_pdf.html', build_report_context(consultation))
+
+
+def render_report_pdf(consultation):
+    """Rendre le rapport PDF d'une consultation (sans cache)."""
+    start = time.perf_counter()
+    html = render_report_html(consultation)
+    template_time = time.perf_counter() - start
+    pdf_bytes, timings = pdf_worker.get_renderer(REPORT_STYLESHEETS).render(html)
+    logger.info(
+        f"PDF rendered for consultation {consultation.id}: template {template_time * 1000:.0f} ms, "
+        f"layout {timings['layout'] * 1000:.0f} ms, drawing {timings['drawing'] * 1000:.0f} ms"
+    )
+    return pdf_bytes
+
+
+def report_filename(consultation):
+    # Nettoyer le nom de fichier pour éviter les caractères spéciaux
+    filename = f'rapport_{consultation.patient.nom}_{consultation.patient.prenom}_{consultation.patient.numero_dossier}.pdf'
+    return filename.replace(' ', '_').replace("'", '')
+
+
+def _printed_fields_digest(consultation):
+    patient, medecin = consultation.patient, consultation.medecin
+    values = [REPORT_TEMPLATE_VERSION]
+    values += [getattr(patient, field) for field in REPORT_PATIENT_FIELDS]
+    # Âge affiché (timesince), qui évolue sans modification du patient
+    values.append(timesince(patient.date_naissance) if patient.date_naissance else '')
+    values += [getattr(medecin, field) for field in REPORT_MEDECIN_FIELDS] if medecin else []
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()[:12]
+
+
+def report_version(consultation):
+    """Version du rapport : consultation, date de modification, champs imprimés du patient et du médecin, gabarit."""
+    return (
+        f"{consultation.id}-{int(consultation.date_modification.timestamp() * 1_000_000)}"
+        f"-{_printed_fields_digest(consultation)}"
+    )
+
+
+def report_etag(consultation):
+    return f'"{report_version(consultation)}"'
+
+
+def _cache_dir():
+    cache_dir = Path(settings.REPORT_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def _cache_path(consultation):
+    return _cache_dir() / f"{report_version(consultation)}.pdf"
+
+
+def get_cached_pdf(consultation):
+    try:
+        return _cache_path(consultation).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def store_pdf(consultation, pdf_bytes):
+    """Écrire le PDF de façon atomique et supprimer les versions précédentes."""
+    path = _cache_path(consultation)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    invalidate(consultation.id, keep=path.name)
+
+
+def invalidate_patient(patient_id):
+    """Supprimer les PDF en cache des consultations d'un patient (une lecture du dossier de cache)."""
+    consultation_ids = {
+        str(consultation_id)
+        for consultation_id in Consultation.objects.filter(patient_id=patient_id).values_list('id', flat=True)
+    }
+    if not consultation_ids:
+        return
+    for path in _cache_dir().glob('*.pdf'):
+        if path.name[:36] in consultation_ids:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def schedule_patient_invalidation(patient_id):
+    """Invalider les rapports d'un patient modifié, en arrière-plan une fois la transaction validée."""
+    def run():
+        close_old_connections()
+        try:
+            invalidate_patient(patient_id)
+        finally:
+            connections.close_all()
+
+    transaction.on_commit(lambda: _executor.submit(run))
+
+
+def invalidate(consultation_id, keep=None):
+    """Supprimer les PDF en cache d'une consultation (sauf éventuellement `keep`)."""
+    for path in _cache_dir().glob(f"{consultation_id}-*.pdf"):
+        if path.name != keep:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def get_or_render_pdf(consultation):
+    """Retourner le PDF en cache, attendre un rendu en cours, ou rendre immédiatement."""
+    pdf_bytes = get_cached_pdf(consultation)
+    if pdf_bytes is not None:
+        return pdf_bytes
+
+    with _in_flight_lock:
+        future = _in_flight.get(str(consultation.id))
+    if future is not None:
+        try:
+            future.result(timeout=settings.REPORT_RENDER_WAIT_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Background PDF render failed for consultation {consultation.id}: {e}")
+        pdf_bytes = get_cached_pdf(consultation)
+        if pdf_bytes is not None:
+            return pdf_bytes
+
+    pdf_bytes = render_report_pdf(consultation)
+    store_pdf(consultation, pdf_bytes)
+    return pdf_bytes
+
+
+def _render_in_background(consultation_id):
+    close_old_connections()
+    try:
+        consultation = Consultation.objects.select_related('patient', 'medecin').get(id=consultation_id)
+        if get_cached_pdf(consultation) is None:
+            store_pdf(consultation, render_report_pdf(consultation))
+            logger.info(f"PDF pre-rendered for consultation {consultation_id}")
+    except Consultation.DoesNotExist:
+        pass
+    finally:
+        # Connexions propres à ce thread de rendu
+        connections.close_all()
+
+
+def _forget_render(key, future):
+    with _in_flight_lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+
+def schedule_render(consultation_id):
+    """Pré-rendre le PDF en arrière-plan une fois la transaction validée."""
+    key = str(consultation_id)
+
+    def submit():
+        with _in_flight_lock:
+            if key in _in_flight:
+                return
+            future = _executor.submit(_render_in_background, consultation_id)
+            _in_flight[key] = future
+        future.add_done_callback(partial(_forget_render, key))
+
+    transaction.on_commit(submit)
+
+
+# ============= EXPORT EN MASSE =============
+
+def export_queryset(patient_id=None, medecin_id=None, date_from=None, date_to=None, statut=None):
+    """Consultations à exporter, dans l'ordre chronologique."""
+    consultations = Consultation.objects.select_related('patient', 'medecin').order_by('date_consultation')
+    if patient_id:
+        consultations = consultations.filter(patient_id=patient_id)
+    if medecin_id:
+        consultations = consultations.filter(medecin_id=medecin_id)
+    # Bornes datetime : l'index sur date_consultation reste utilisable
+    consultations = consultations.filter(**period_filter('date_consultation', date_from, date_to))
+    if statut:
+        consultations = consultations.filter(statut=statut)
+    return consultations
+
+
+def _get_export_pool():
+    """Pool de processus partagé, dimensionné sur le nombre de cœurs disponibles."""
+    global _export_pool
+    with _export_pool_lock:
+        if _export_pool is None:
+            # 'spawn' : les processus n'héritent ni des threads ni des connexions DB du worker web
+            _export_pool = ProcessPoolExecutor(
+                max_workers=settings.REPORT_EXPORT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _export_pool
+
+
+def _discard_export_pool(pool):
+    """Abandonner un pool cassé (processus tué) pour qu'un nouveau soit créé au prochain export."""
+    global _export_pool
+    with _export_pool_lock:
+        if _export_pool is pool:
+            _export_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _zip_entry_name(consultation):
+    patient = consultation.patient
+    identifier = patient.patient_identifier or patient.numero_dossier or str(patient.id)
+    pathology = clean_pathology_name(consultation.pathologie_identifiee) or 'rapport'
+    name = f"{consultation.date_consultation:%Y-%m-%d}_{identifier}_{pathology}_{str(consultation.id)[:8]}"
+    return re.sub(r'[^\w.-]+', '_', name) + '.pdf'
+
+
+class _ZipStreamBuffer:
+    """Flux non adressable pour zipfile : les octets écrits sont vidés à chaque envoi."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_reports_zip(consultations):
+    """
+    Générer une archive ZIP des rapports, envoyée au fil de l'eau.
+
+    Les PDF absents du cache sont rendus en parallèle dans le pool de processus ;
+    le nombre de rendus en attente est borné pour limiter la mémoire.
+    """
+    buffer = _ZipStreamBuffer()
+    pool = _get_export_pool()
+    max_pending = settings.REPORT_EXPORT_WORKERS * 2
+    pending = {}
+
+    def write_done(archive, done):
+        for future in done:
+            name = pending.pop(future)
+            try:
+                archive.writestr(name, future.result())
+            except BrokenProcessPool:
+                _discard_export_pool(pool)
+                raise
+            except Exception as e:
+                logger.error(f"Error rendering {name} during export: {e}")
+                archive.writestr(name[:-len('.pdf')] + '_erreur.txt', f"Erreur lors de la création du PDF: {e}")
+
+    try:
+        # Les PDF sont déjà compressés : pas de recompression
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for consultation in consultations.iterator(chunk_size=100):
+                name = _zip_entry_name(consultation)
+                pdf_bytes = get_cached_pdf(consultation)
+                if pdf_bytes is not None:
+                    archive.writestr(name, pdf_bytes)
+                else:
+                    pending[pool.submit(pdf_worker.html_to_pdf, render_report_html(consultation), REPORT_STYLESHEETS)] = name
+
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    write_done(archive, done)
+
+                chunk = buffer.drain()
+                if chunk:
+                    yield chunk
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                write_done(archive, done)
+                yield buffer.drain()
+        yield buffer.drain()
+    finally:
+        # Client déconnecté : ne pas laisser tourner les rendus restants
+        for future in pending:
+            future.cancel()
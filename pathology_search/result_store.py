@@ -0,0 +1,91 @@
+"""
+Stockage serveur des résultats de recherche et des diagnostics.
+
+La session Django ne contient plus que des identifiants : les résultats sont
+stockés en base sous forme de JSON compressé, avec une durée de vie (TTL),
+afin que les E/S de session restent constantes d'une requête à l'autre.
+"""
+import json
+import random
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import StoredResult
+
+
+SEARCH = 'search'
+DIAGNOSIS = 'diagnosis'
+
+# Champs volumineux inutiles une fois les résultats placés en attente de validation
+_SEARCH_RESULT_DROPPED_FIELDS = ('all_chunk_scores',)
+
+
+def _encode(payload):
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _decode(blob):
+    return json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+
+
+def compact_search_results(results):
+    """Retirer des résultats de recherche les champs non relus par les vues de validation."""
+    return [
+        {key: value for key, value in result.items() if key not in _SEARCH_RESULT_DROPPED_FIELDS}
+        for result in results
+    ]
+
+
+def put(type_resultat, payload, result_id=None, ttl=None):
+    """Enregistrer un résultat et retourner son identifiant (str)."""
+    ttl = ttl if ttl is not None else settings.RESULT_STORE_TTL
+    defaults = {
+        'type_resultat': type_resultat,
+        'donnees': _encode(payload),
+        'date_expiration': timezone.now() + timedelta(seconds=ttl),
+    }
+    if result_id:
+        stored, _ = StoredResult.objects.update_or_create(id=result_id, defaults=defaults)
+    else:
+        stored = StoredResult.objects.create(**defaults)
+
+    # Éviction paresseuse des entrées expirées (comme le "culling" des caches Django)
+    if random.random() < settings.RESULT_STORE_PURGE_PROBABILITY:
+        purge_expired()
+
+    return str(stored.id)
+
+
+def get(result_id, type_resultat):
+    """Retourner le résultat décodé, ou None s'il est absent ou expiré."""
+    if not result_id:
+        return None
+    try:
+        blob = StoredResult.objects.filter(
+            id=result_id,
+            type_resultat=type_resultat,
+            date_expiration__gt=timezone.now(),
+        ).values_list('donnees', flat=True).first()
+    except Exception:
+        # Identifiant mal formé (UUID invalide)
+        return None
+    if blob is None:
+        return None
+    return _decode(blob)
+
+
+def delete(result_id):
+    if result_id:
+        try:
+            StoredResult.objects.filter(id=result_id).delete()
+        except Exception:
+            pass
+
+
+def purge_expired():
+    """Supprimer les résultats expirés et retourner leur nombre."""
+    deleted, _ = StoredResult.objects.filter(date_expiration__lte=timezone.now()).delete()
+    return deleted
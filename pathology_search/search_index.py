@@ -0,0 +1,381 @@
+"""
+Index de recherche en mémoire d'un dossier d'embeddings.
+
+Tous les chunks du dossier sont empilés dans une seule matrice normalisée
+(une ligne par chunk). Les fichiers sont triés par chemin : chaque famille de
+troubles (dossier de premier niveau, ex. Anxiety_Disorders_out) occupe donc
+un intervalle contigu de lignes. Les intervalles correspondant à chaque
+combinaison de filtres sont calculés une fois puis mis en cache : une
+recherche filtrée ne calcule les similarités que sur les lignes retenues.
+
+L'index compilé (<dossier>/search_index.npz, `manage.py embed_corpus` ou
+`manage.py build_search_index`) évite de relire les fichiers .npy / .json au
+démarrage ; il est ignoré dès que les fichiers .npy ont changé.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+# Nombre de sélections (combinaisons de filtres) gardées en cache par index
+SELECTION_CACHE_SIZE = 64
+
+COMPILED_FILE_NAME = 'search_index.npz'
+
+
+def embedding_files(folder):
+    """Fichiers .npy du dossier, triés par chemin."""
+    return sorted(Path(folder).rglob('*.npy'))
+
+
+def embeddings_version(folder):
+    """Empreinte des fichiers .npy du dossier (taille et date de modification)."""
+    folder = Path(folder)
+    version_hash = hashlib.sha1()
+    for npy_file in embedding_files(folder):
+        stat = npy_file.stat()
+        version_hash.update(f"{npy_file.relative_to(folder).as_posix()}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    return version_hash.hexdigest()[:16]
+
+
+def category_label(category):
+    """Libellé lisible d'une famille de troubles (nom de dossier)."""
+    label = category[:-len('_out')] if category.endswith('_out') else category
+    return label.replace('_', ' ').strip()
+
+
+def _normalize_filter(values):
+    if not values:
+        return ()
+    if isinstance(values, str):
+        values = [values]
+    return tuple(sorted({str(value).strip().lower() for value in values if str(value).strip()}))
+
+
+def normalize_filters(filters):
+    """Filtres de recherche sous forme canonique (clé de cache)."""
+    filters = filters or {}
+    return (
+        _normalize_filter(filters.get('include_categories')),
+        _normalize_filter(filters.get('exclude_categories')),
+        _normalize_filter(filters.get('include_locations')),
+        _normalize_filter(filters.get('exclude_locations')),
+    )
+
+
+class Selection:
+    """Fichiers retenus par un filtre et intervalles de lignes correspondants."""
+
+    def __init__(self, file_indices, ranges):
+        self.file_indices = file_indices
+        self.ranges = ranges
+        self.num_rows = sum(stop - start for start, stop in ranges)
+
+
+class SearchIndex:
+
+    def __init__(self, folder, build=True):
+        self.folder = Path(folder)
+        self.files = []
+        self.dimension = None
+        self.embedding_models = set()
+        self.categories = OrderedDict()   # catégorie -> (première ligne, dernière ligne + 1)
+        self.chunks = np.zeros((0, 0), dtype=np.float32)
+        self.version = ''
+        self._selections = OrderedDict()
+        self._selections_lock = threading.Lock()
+        if build:
+            self.version = embeddings_version(self.folder)
+            self._build()
+
+    @classmethod
+    def load(cls, folder, path):
+        """Index compilé enregistré par `save`."""
+        index = cls(folder, build=False)
+        with np.load(path, allow_pickle=False) as data:
+            index.chunks = data['chunks']
+            meta = json.loads(str(data['meta']))
+        index.version = meta['version']
+        index.dimension = meta['dimension']
+        index.files = meta['files']
+        index._index_files()
+        return index
+
+    def save(self, path):
+        path = Path(path)
+        meta = {
+            'version': self.version,
+            'dimension': self.dimension,
+            'files': self.files,
+        }
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, chunks=self.chunks, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        tmp_path.replace(path)
+
+    def _build(self):
+        segments = []
+        for npy_file in embedding_files(self.folder):
+            segment = self._read_file(npy_file)
+            if segment is not None:
+                segments.append(segment)
+        self._assemble(segments)
+
+    def patched(self, changed_paths=(), removed_paths=()):
+        """
+        Nouvel index où seuls les fichiers modifiés ou ajoutés (chemins relatifs
+        sans extension, ex. Anxiety_Disorders_out/SubSection5_Panic_Disorder)
+        sont relus ; les lignes des autres fichiers sont recopiées telles quelles.
+        """
+        changed_paths = set(changed_paths)
+        skipped = changed_paths | set(removed_paths)
+        index = SearchIndex(self.folder, build=False)
+        index.dimension = self.dimension
+
+        segments = [
+            (dict(file_info), self.chunks[file_info['start']:file_info['stop']])
+            for file_info in self.files
+            if file_info['path'] not in skipped
+        ]
+        for path in sorted(changed_paths):
+            segment = index._read_file(self.folder / f"{path}.npy")
+            if segment is not None:
+                segments.append(segment)
+        segments.sort(key=lambda segment: segment[0]['path'])
+        index._assemble(segments)
+        index.version = embeddings_version(self.folder)
+        return index
+
+    def _read_file(self, npy_file):
+        """(métadonnées, chunks normalisés) d'un fichier .npy et de son JSON, ou None s'il est ignoré."""
+        metadata_file = npy_file.with_suffix('.json')
+        try:
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            embeddings = np.load(npy_file)
+        except Exception:
+            return None
+        if embeddings.ndim != 2 or len(embeddings) == 0 or 'source_file' not in metadata:
+            return None
+
+        # La dimension de référence est celle du premier fichier
+        if self.dimension is None:
+            self.dimension = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dimension:
+            return None
+
+        embeddings = embeddings.astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        relative_path = npy_file.relative_to(self.folder)
+        chunks = metadata.get('chunks') if isinstance(metadata.get('chunks'), list) else []
+        file_info = {
+            'file': metadata['source_file'],
+            'file_name': Path(metadata['source_file']).name,
+            'location': self._location(metadata, relative_path),
+            'html_page': metadata.get('html_page', ''),
+            'category': relative_path.parts[0] if len(relative_path.parts) > 1 else '',
+            'path': relative_path.with_suffix('').as_posix(),
+            'embedding_model': metadata.get('embedding_model') or metadata.get('model', 'unknown'),
+            'chunk_texts': [chunk.get('text_preview', '') if isinstance(chunk, dict) else '' for chunk in chunks],
+        }
+        return file_info, embeddings / norms
+
+    def _assemble(self, segments):
+        """Empiler les segments (triés par chemin) et calculer les intervalles de lignes."""
+        row = 0
+        self.files = []
+        for file_info, embeddings in segments:
+            file_info['start'] = row
+            file_info['stop'] = row + len(embeddings)
+            self.files.append(file_info)
+            row += len(embeddings)
+        if segments:
+            self.chunks = np.vstack([embeddings for _, embeddings in segments])
+        self._index_files()
+
+    def _index_files(self):
+        self.categories = OrderedDict()
+        self.embedding_models = set()
+        for file_info in self.files:
+            start, _ = self.categories.get(file_info['category'], (file_info['start'], file_info['start']))
+            self.categories[file_info['category']] = (start, file_info['stop'])
+            self.embedding_models.add(file_info.get('embedding_model', 'unknown'))
+
+    @staticmethod
+    def _location(metadata, relative_path):
+        hierarchy = metadata.get('hierarchy', {})
+        location = hierarchy.get('location') if isinstance(hierarchy, dict) else None
+        # Si location n'est pas disponible, le construire à partir du chemin du fichier
+        if not location or location == 'N/A':
+            path_parts = relative_path.parts[:-1]
+            location = ' > '.join(path_parts) + ' > ' + relative_path.stem if path_parts else relative_path.stem
+        return location
+
+    def category_list(self):
+        """Familles de troubles de l'index avec leur nombre de pathologies."""
+        counts = {}
+        for file_info in self.files:
+            counts[file_info['category']] = counts.get(file_info['category'], 0) + 1
+        return [
+            {'id': category, 'label': category_label(category), 'count': counts.get(category, 0)}
+            for category in self.categories
+            if category
+        ]
+
+    def select(self, filters=None):
+        """Sélection (fichiers et intervalles de lignes) correspondant aux filtres, mise en cache."""
+        key = normalize_filters(filters)
+        with self._selections_lock:
+            selection = self._selections.get(key)
+            if selection is not None:
+                self._selections.move_to_end(key)
+                return selection
+
+        selection = self._compute_selection(*key)
+        with self._selections_lock:
+            self._selections[key] = selection
+            if len(self._selections) > SELECTION_CACHE_SIZE:
+                self._selections.popitem(last=False)
+        return selection
+
+    def _compute_selection(self, include_categories, exclude_categories, include_locations, exclude_locations):
+        if not (include_categories or exclude_categories or include_locations or exclude_locations):
+            return Selection(list(range(len(self.files))), [(0, len(self.chunks))] if len(self.chunks) else [])
+
+        def category_matches(category, values):
+            return category.lower() in values or category_label(category).lower() in values
+
+        def location_matches(file_info, values):
+            haystack = f"{file_info['location']} {file_info['path']}".lower()
+            return any(value in haystack for value in values)
+
+        file_indices = []
+        for i, file_info in enumerate(self.files):
+            if include_categories and not category_matches(file_info['category'], include_categories):
+                continue
+            if exclude_categories and category_matches(file_info['category'], exclude_categories):
+                continue
+            if include_locations and not location_matches(file_info, include_locations):
+                continue
+            if exclude_locations and location_matches(file_info, exclude_locations):
+                continue
+            file_indices.append(i)
+
+        # Fusionner les lignes des fichiers retenus en intervalles contigus
+        ranges = []
+        for i in file_indices:
+            start, stop = self.files[i]['start'], self.files[i]['stop']
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], stop)
+            else:
+                ranges.append((start, stop))
+        return Selection(file_indices, ranges)
+
+    def search(self, query_embedding, top_k=5, aggregation='max', selection=None):
+        """Scorer les fichiers de la sélection et retourner les top_k résultats."""
+        if selection is None:
+            selection = self.select()
+        if not selection.file_indices:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        # Similarités cosinus calculées uniquement sur les lignes retenues
+        similarities = np.empty(len(self.chunks), dtype=np.float32)
+        for start, stop in selection.ranges:
+            similarities[start:stop] = self.chunks[start:stop] @ query
+
+        results = []
+        for i in selection.file_indices:
+            file_info = self.files[i]
+            scores = similarities[file_info['start']:file_info['stop']]
+
+            # Agréger les scores par fichier
+            if aggregation == 'mean':
+                file_score = scores.mean()
+            elif aggregation == 'weighted_mean':
+                weights = 1.0 / np.arange(1, len(scores) + 1)
+                file_score = np.sum(scores * (weights / weights.sum()))
+            else:
+                file_score = scores.max()
+
+            best_chunk_id = int(np.argmax(scores))
+            chunk_texts = file_info['chunk_texts']
+            results.append({
+                'file': file_info['file'],
+                'file_name': file_info['file_name'],
+                'location': file_info['location'],
+                'similarity': float(file_score),
+                'num_chunks': len(scores),
+                'best_chunk_id': best_chunk_id,
+                'best_chunk_text': chunk_texts[best_chunk_id] if best_chunk_id < len(chunk_texts) else '',
+                'all_chunk_scores': [float(s) for s in scores],
+                'html_page': file_info['html_page'],
+                'category': file_info['category'],
+            })
+
+        # Trier par similarité
+        results.sort(key=lambda x: x['similarity'], reverse=True)
+        return results[:top_k]
+
+
+def compiled_path(folder):
+    return Path(folder) / COMPILED_FILE_NAME
+
+
+def build_compiled_index(folder):
+    """Construire et enregistrer l'index compilé du dossier."""
+    index = SearchIndex(folder)
+    index.save(compiled_path(folder))
+    return index
+
+
+def load_compiled(folder):
+    """Index compilé du dossier s'il est à jour des fichiers .npy, sinon None."""
+    path = compiled_path(folder)
+    if not path.exists():
+        return None
+    try:
+        index = SearchIndex.load(folder, path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return index if index.version == embeddings_version(folder) else None
+
+
+def _load_or_build(folder):
+    # Index compilé absent ou périmé : lecture des fichiers .npy / .json
+    return load_compiled(folder) or SearchIndex(folder)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(folder):
+    """Index du dossier d'embeddings, chargé ou construit au premier appel."""
+    key = str(folder)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _load_or_build(key)
+                _indexes[key] = index
+    return index
+
+
+def reload_index(folder):
+    """Recharger l'index après une reconstruction du corpus."""
+    key = str(folder)
+    with _indexes_lock:
+        _indexes[key] = _load_or_build(key)
+        return _indexes[key]
@@ -7,6 +7,34 @@ import json
 from openai import OpenAI
 from django.conf import settings
 
+from . import differentials, search_index
+
+
+# Antécédents cités au plus dans les prompts (les plus récents ; le total est annoncé à part)
+PROMPT_HISTORY_SYMPTOMS = 15
+
+
+def get_embedding_config(embedding_model_type='openai-ada'):
+    """Dossier d'embeddings, nom et dimension du modèle d'embedding choisi."""
+    if embedding_model_type == 'openai-3-large':
+        return {
+            'folder': settings.BASE_DIR / 'Embedding_OpenAI_3072',
+            'model_name': 'text-embedding-3-large',
+            'dim': 3072,
+        }
+    if embedding_model_type == 'gemini':
+        return {
+            'folder': settings.BASE_DIR / 'Embedding_Gemini_3072',
+            'model_name': 'models/gemini-embedding-001',
+            'dim': 3072,
+        }
+    # Par défaut: OpenAI ada-002
+    return {
+        'folder': settings.EMBEDDINGS_FOLDER,
+        'model_name': settings.EMBEDDING_MODEL,
+        'dim': 1536,
+    }
+
 
 class PathologySearchService:
     
@@ -15,26 +43,18 @@ class PathologySearchService:
         self.embedding_model_type = embedding_model_type
         
         # Définir le dossier d'embeddings selon le modèle choisi
-        if embedding_model_type == 'openai-3-large':
-            self.embeddings_folder = settings.BASE_DIR / 'Embedding_OpenAI_3072'
-            self.embedding_model_name = 'text-embedding-3-large'
-            self.embedding_dim = 3072
-        elif embedding_model_type == 'gemini':
-            self.embeddings_folder = settings.BASE_DIR / 'Embedding_Gemini_3072'
-            self.embedding_model_name = 'models/gemini-embedding-001'
-            self.embedding_dim = 3072
-            
+        embedding_config = get_embedding_config(embedding_model_type)
+        self.embeddings_folder = embedding_config['folder']
+        self.embedding_model_name = embedding_config['model_name']
+        self.embedding_dim = embedding_config['dim']
+        
+        if embedding_model_type == 'gemini':
             # Configurer Gemini pour les embeddings si nécessaire
             import google.generativeai as genai
             if not settings.GEMINI_API_KEY:
                 print("Clé API Gemini manquante dans les settings")
             else:
                 genai.configure(api_key=settings.GEMINI_API_KEY)
-        else:
-            # Par défaut: OpenAI ada-002
-            self.embeddings_folder = settings.EMBEDDINGS_FOLDER
-            self.embedding_model_name = settings.EMBEDDING_MODEL
-            self.embedding_dim = 1536
             
         
         self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
@@ -181,17 +201,42 @@ Réponds UNIQUEMENT au format JSON:
             print(f" Erreur génération embedding ({self.embedding_model_type}): {str(e)}")
             raise
     
-    def find_best_match(self, query, top_k=5, aggregation='max', model=None):
-       
-        import os
-        folder_path = Path(self.embeddings_folder)
-
+    def get_embeddings(self, texts, task_type="retrieval_query"):
+        """Embeddings d'une liste de textes en un seul appel API (même ordre que `texts`)."""
+        texts = [text.replace("\n", " ") for text in texts]
+        if not texts:
+            return []
+        
         try:
-            parent = folder_path.parent
-            for item in os.listdir(parent):
-                print(f"  - {item}")
+            if self.embedding_model_type == 'gemini':
+                import google.generativeai as genai
+                result = genai.embed_content(
+                    model=self.embedding_model_name,
+                    content=texts,
+                    task_type=task_type
+                )
+                return [np.array(embedding) for embedding in result['embedding']]
+            
+            response = self.client.embeddings.create(
+                input=texts,
+                model=self.embedding_model_name
+            )
+            return [np.array(item.embedding) for item in sorted(response.data, key=lambda item: item.index)]
+        
         except Exception as e:
-            print(f"DEBUG: Erreur lors du listage: {e}")
+            print(f" Erreur génération embeddings par lot ({self.embedding_model_type}): {str(e)}")
+            raise
+    
+    def find_best_match(self, query, top_k=5, aggregation='max', model=None, filters=None, query_embedding=None):
+        """
+        Rechercher les pathologies les plus proches de la requête.
+
+        `filters` (optionnel) restreint la recherche à certaines familles de troubles :
+        {'include_categories': [...], 'exclude_categories': [...],
+         'include_locations': [...], 'exclude_locations': [...]}
+        `query_embedding` (optionnel) remplace l'embedding de la requête (ex. vecteur enrichi par l'historique).
+        """
+        folder_path = Path(self.embeddings_folder)
         
         if not folder_path.exists():
             return {
@@ -200,25 +245,35 @@ Réponds UNIQUEMENT au format JSON:
                 'results': []
             }
         
-        npy_files = list(folder_path.rglob("*.npy"))
+        index = search_index.get_index(folder_path)
         
-        if len(npy_files) == 0:
+        if len(index.files) == 0:
             return {
                 'success': False,
                 'error': "Aucun fichier d'embedding trouvé (.npy)",
                 'results': []
             }
         
+        # Lignes de l'index à scorer (toutes, ou celles des familles retenues)
+        selection = index.select(filters)
+        if not selection.file_indices:
+            return {
+                'success': True,
+                'results': [],
+                'diagnostic_info': {
+                    'suspected_pathology': None,
+                    'confidence': 0,
+                    'confidence_level': 'none',
+                    'message': 'Aucune pathologie ne correspond aux filtres de catégorie'
+                },
+                'total_files_searched': 0
+            }
+        
         # Obtenir l'embedding de la requête avec le modèle sélectionné
-        query_embedding = self.get_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.get_embedding(query)
         query_dimension = len(query_embedding)
-        
-        # Vérifier la dimension des embeddings stockés (prendre le premier fichier comme référence)
-        stored_dimension = None
-        if len(npy_files) > 0:
-            sample_embeddings = np.load(npy_files[0])
-            if len(sample_embeddings) > 0:
-                stored_dimension = len(sample_embeddings[0])
+        stored_dimension = index.dimension
         
         # Ne PAS utiliser de fallback automatique - cela masque le problème
         if stored_dimension and query_dimension != stored_dimension:
@@ -232,121 +287,11 @@ Réponds UNIQUEMENT au format JSON:
                 'results': []
             }
         
-        # Rechercher dans tous les fichiers
-        file_results = {}
+        other_models = index.embedding_models - {self.embedding_model_name, 'unknown'}
+        if other_models:
+            print(f"ATTENTION - Embeddings générés avec {sorted(other_models)} mais modèle sélectionné est '{self.embedding_model_name}'")
         
-        for emb_file in npy_files:
-            # Charger les embeddings
-            embeddings = np.load(emb_file)
-            
-            # Vérifier que la dimension correspond toujours
-            if len(embeddings) > 0 and len(embeddings[0]) != query_dimension:
-                continue
-            
-            # Charger les métadonnées
-            metadata_file = str(Path(emb_file).with_suffix('.json'))
-            try:
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-            
-                embedding_model_used = metadata.get('embedding_model') or metadata.get('model', 'unknown')
-                if embedding_model_used != 'unknown':
-                    # Vérifier si le modèle correspond au modèle sélectionné
-                    expected_model = self.embedding_model_name
-                    if embedding_model_used != expected_model:
-                        print(f"ATTENTION - Fichier {Path(emb_file).name}: embeddings générés avec '{embedding_model_used}' mais modèle sélectionné est '{expected_model}'")
-                    else:
-                        print(f"Fichier {Path(emb_file).name}: embeddings générés avec {embedding_model_used} (correspond au modèle sélectionné)")
-            except:
-                continue
-            
-            chunk_similarities = []
-            best_chunk_id = 0
-            best_chunk_text = ""
-            best_similarity = 0
-            
-            for i, chunk_emb in enumerate(embeddings):
-                # Vérification supplémentaire de la dimension
-                if len(chunk_emb) != query_dimension:
-                    continue
-                    
-                similarity = np.dot(query_embedding, chunk_emb) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(chunk_emb)
-                )
-                chunk_similarities.append(similarity)
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_chunk_id = i
-                    # 🆕 Vérifier que 'chunks' existe dans les métadonnées
-                    chunks = metadata.get('chunks', [])
-                    if i < len(chunks) and isinstance(chunks[i], dict):
-                        best_chunk_text = chunks[i].get('text_preview', '')
-                    else:
-                        best_chunk_text = ''
-            
-            # Agréger les scores par fichier
-            if aggregation == 'max':
-                file_score = max(chunk_similarities)
-            elif aggregation == 'mean':
-                file_score = np.mean(chunk_similarities)
-            elif aggregation == 'weighted_mean':
-                weights = np.array([1.0 / (i + 1) for i in range(len(chunk_similarities))])
-                weights = weights / weights.sum()
-                file_score = np.sum(np.array(chunk_similarities) * weights)
-            else:
-                file_score = max(chunk_similarities)
-            
-            hierarchy = metadata.get('hierarchy', {})
-            location = None
-            
-            # Essayer de récupérer le location depuis hierarchy
-            if isinstance(hierarchy, dict) and 'location' in hierarchy:
-                location = hierarchy.get('location')
-            
-            # Si location n'est pas disponible, le construire à partir du chemin du fichier
-            if not location or location == 'N/A':
-                try:
-                    # Obtenir le chemin relatif du fichier JSON par rapport au dossier embeddings
-                    emb_file_path = Path(emb_file)
-                    embeddings_folder_path = Path(self.embeddings_folder)
-                    
-                    # Calculer le chemin relatif
-                    try:
-                        relative_path = emb_file_path.relative_to(embeddings_folder_path)
-                    except ValueError:
-                        # Si le fichier n'est pas dans le dossier embeddings, utiliser le nom du fichier
-                        relative_path = emb_file_path.name
-                
-                    path_parts = relative_path.parts[:-1]  # Exclure le nom du fichier
-                    file_stem = relative_path.stem  # Nom sans extension
-                    
-                    if path_parts:
-                        location = ' > '.join(path_parts) + ' > ' + file_stem
-                    else:
-                        location = file_stem
-                except Exception as e:
-                    # En dernier recours, utiliser le nom du fichier
-                    location = Path(metadata.get('source_file', emb_file)).stem
-            
-            file_results[str(emb_file)] = {
-                'file': metadata['source_file'],
-                'file_name': Path(metadata['source_file']).name,
-                'location': location,
-                'similarity': float(file_score),
-                'num_chunks': len(embeddings),
-                'best_chunk_id': best_chunk_id,
-                'best_chunk_text': best_chunk_text,
-                'all_chunk_scores': [float(s) for s in chunk_similarities],
-                'html_page': metadata.get('html_page', '')  # Ajouter le chemin HTML
-            }
-        
-        # Trier par similarité
-        results = sorted(
-            file_results.values(), 
-            key=lambda x: x['similarity'], 
-            reverse=True
-        )[:top_k]
+        results = index.search(query_embedding, top_k=top_k, aggregation=aggregation, selection=selection)
         
         # Ajouter des informations diagnostiques
         diagnostic_info = self._generate_diagnostic_info(results) if results else {
@@ -360,7 +305,7 @@ Réponds UNIQUEMENT au format JSON:
             'success': True,
             'results': results if results else [],
             'diagnostic_info': diagnostic_info,
-            'total_files_searched': len(file_results)
+            'total_files_searched': len(selection.file_indices)
         }
     
     def _generate_diagnostic_info(self, results):
@@ -386,14 +331,24 @@ Réponds UNIQUEMENT au format JSON:
             confidence_level = 'low'
             message = "Faible confiance - Informations cliniques supplémentaires nécessaires"
         
+        # Diagnostics différentiels de la pathologie suspectée (matrice précalculée, sans nouvel embedding)
+        try:
+            entry = differentials.find_entry(self.embeddings_folder, file_name=top_match['file_name'])
+            top_differentials = differentials.get_differentials(self.embeddings_folder, entry, limit=3)
+        except Exception as e:
+            print(f"Erreur lors du calcul des diagnostics différentiels: {e}")
+            top_differentials = []
+        
         return {
             'suspected_pathology': pathology,
             'confidence': similarity_percent,
             'confidence_level': confidence_level,
-            'message': message
+            'message': message,
+            'differentials': top_differentials
         }
     
-    def generate_ai_diagnosis(self, pathology_name, form_data, similarity_score, medical_text="", historical_symptoms=None):
+    def generate_ai_diagnosis(self, pathology_name, form_data, similarity_score, medical_text="", historical_symptoms=None,
+                              historical_symptoms_total=None):
 
         try:
             # Message système pour le PLAN DE TRAITEMENT
@@ -412,7 +367,8 @@ Réponds UNIQUEMENT au format JSON:
                 form_data, 
                 "",  # Pas de diagnostic text, on génère directement le plan
                 medical_text, 
-                historical_symptoms
+                historical_symptoms,
+                historical_symptoms_total
             )
             
             
@@ -524,7 +480,8 @@ Réponds UNIQUEMENT au format JSON:
                 'model_used': self.model
             }
     
-    def _build_diagnosis_prompt(self, pathology_name, form_data, similarity_score, medical_text="", historical_symptoms=None):
+    def _build_diagnosis_prompt(self, pathology_name, form_data, similarity_score, medical_text="", historical_symptoms=None,
+                                historical_symptoms_total=None):
         
         # Charger le fichier complet de la pathologie depuis le dossier disorders
         complete_pathology_text = self._load_complete_pathology_file(pathology_name)
@@ -551,12 +508,13 @@ Critères et éléments cliniques déclarés :
         
         
         if historical_symptoms and len(historical_symptoms) > 0:
-            prompt += f"\nANTÉCÉDENTS MÉDICAUX DU PATIENT ({len(historical_symptoms)} symptômes enregistrés):\n"
+            total = historical_symptoms_total or len(historical_symptoms)
+            prompt += f"\nANTÉCÉDENTS MÉDICAUX DU PATIENT ({total} symptômes enregistrés):\n"
             prompt += "Le patient présente également les antécédents cliniques suivants, issus de consultations précédentes:\n"
-            for i, symptom in enumerate(historical_symptoms[:15], 1):
+            for i, symptom in enumerate(historical_symptoms[:PROMPT_HISTORY_SYMPTOMS], 1):
                 prompt += f"  • {symptom}\n"
-            if len(historical_symptoms) > 15:
-                prompt += f"  • ... et {len(historical_symptoms) - 15} autres symptômes enregistrés\n"
+            if total > PROMPT_HISTORY_SYMPTOMS:
+                prompt += f"  • ... et {total - PROMPT_HISTORY_SYMPTOMS} autres symptômes enregistrés\n"
             prompt += "\n**IMPORTANT : Intégrer ces antécédents dans l'analyse diagnostique.**\n\n"
         
         prompt += """
@@ -596,7 +554,8 @@ Structure attendue (respecter EXACTEMENT ces titres) :
         
         return prompt
     
-    def _generate_treatment_plan(self, pathology_name, form_data, diagnosis_text, medical_text="", historical_symptoms=None, system_message=None):
+    def _generate_treatment_plan(self, pathology_name, form_data, diagnosis_text, medical_text="", historical_symptoms=None, system_message=None,
+                                 historical_symptoms_total=None):
     
         try:
             # Construire le prompt pour le plan de traitement
@@ -605,7 +564,8 @@ Structure attendue (respecter EXACTEMENT ces titres) :
                 form_data, 
                 diagnosis_text, 
                 medical_text, 
-                historical_symptoms
+                historical_symptoms,
+                historical_symptoms_total
             )
             
             # Générer le plan de traitement avec le même modèle
@@ -668,7 +628,8 @@ Structure attendue (respecter EXACTEMENT ces titres) :
             print(f"Erreur lors de la génération du plan de traitement: {str(e)}")
             return f"Erreur lors de la génération du plan de traitement: {str(e)}"
     
-    def _build_treatment_prompt(self, pathology_name, form_data, diagnosis_text="", medical_text="", historical_symptoms=None):
+    def _build_treatment_prompt(self, pathology_name, form_data, diagnosis_text="", medical_text="", historical_symptoms=None,
+                                historical_symptoms_total=None):
         
         # Charger le fichier complet de la pathologie depuis le dossier disorders
         complete_pathology_text = self._load_complete_pathology_file(pathology_name)
@@ -702,7 +663,7 @@ CRITÈRES VALIDÉS :
         if historical_symptoms and len(historical_symptoms) > 0:
             # Limiter à 3 symptômes les plus récents pour éviter les prompts trop longs avec GPT-5
             limited_symptoms = historical_symptoms[:3]
-            prompt += f"\nANTÉCÉDENTS MÉDICAUX (3 symptômes les plus récents sur {len(historical_symptoms)}):\n"
+            prompt += f"\nANTÉCÉDENTS MÉDICAUX (3 symptômes les plus récents sur {historical_symptoms_total or len(historical_symptoms)}):\n"
             for symptom in limited_symptoms:
                 # Limiter la longueur de chaque symptôme à 50 caractères pour GPT-5
                 symptom_short = symptom[:50] + "..." if len(symptom) > 50 else symptom
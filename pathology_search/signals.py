@@ -0,0 +1,65 @@
+"""
+Mise à jour, à chaque création, modification ou suppression de consultation
+quelle qu'en soit l'origine (vues, administration, suppression d'un patient) :
+
+- du profil de symptômes des patients (symptom_profile) ;
+- des agrégats du tableau de bord (analytics) ;
+- de l'embedding des cas similaires quand la description ou les critères
+  d'une consultation existante changent (similar_cases).
+
+Les rapports PDF en cache d'un patient modifié sont supprimés (reports).
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import analytics, reports, similar_cases, symptom_profile
+from .models import Consultation, Medecin, Patient
+
+
+@receiver(pre_save, sender=Consultation)
+def consultation_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Lignes d'agrégat à décrémenter si la modification en change la clé
+    instance._stat_previous = analytics.previous_values(instance, update_fields)
+
+
+@receiver(post_save, sender=Consultation)
+def consultation_saved(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Chargement de fixtures : profil et agrégats reconstruits par rebuild_symptom_profiles
+    # et refresh_consultation_stats
+    if raw:
+        return
+    symptom_profile.sync_consultation(instance)
+    analytics.record_saved(instance, getattr(instance, '_stat_previous', None))
+    # Création : vectorisée par la vue (similar_cases.schedule_indexing) ou par index_consultations
+    if not created and (update_fields is None or {'description_clinique', 'criteres_valides'} & set(update_fields)):
+        similar_cases.refresh_consultation(instance)
+
+
+@receiver(pre_delete, sender=Consultation)
+def consultation_deleting(sender, instance, **kwargs):
+    # Les sources sont supprimées en cascade avant post_delete : relever les symptômes concernés
+    instance._symptom_hashes = symptom_profile.consultation_symptom_hashes(instance)
+
+
+@receiver(post_delete, sender=Consultation)
+def consultation_deleted(sender, instance, **kwargs):
+    hashes = getattr(instance, '_symptom_hashes', None)
+    if hashes:
+        symptom_profile.refresh_patient_symptoms(instance.patient_id, hashes)
+    analytics.record_deleted(instance)
+
+
+@receiver(pre_delete, sender=Medecin)
+def medecin_deleting(sender, instance, **kwargs):
+    # Ses consultations passent à medecin=NULL par un UPDATE, sans signal
+    analytics.detach_medecin(instance.pk)
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, created=False, raw=False, **kwargs):
+    # Nom, dossier ou date de naissance imprimés dans les rapports
+    if created or raw:
+        return
+    reports.schedule_patient_invalidation(instance.pk)
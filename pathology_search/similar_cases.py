@@ -0,0 +1,406 @@
+"""
+Recherche de cas similaires parmi les consultations enregistrées.
+
+Chaque consultation (description clinique et critères validés) est vectorisée
+une fois, par lots et en arrière-plan après sa création, puis conservée en base
+(ConsultationEmbedding). Les vecteurs (float32 normalisés, dimension réduite)
+sont recopiés dans un index local en ajout seul :
+
+    CASE_INDEX_DIR/<modèle>-<dimension>/vectors.f32   une ligne par vecteur
+    CASE_INDEX_DIR/<modèle>-<dimension>/ids.i64       identifiant ConsultationEmbedding de chaque ligne
+
+Les fichiers sont projetés en mémoire (memmap) : à chaque recherche seules les
+lignes ajoutées en base depuis la dernière synchronisation sont écrites, puis
+les similarités sont un seul produit matrice × vecteur. Les lignes des
+consultations supprimées ou revectorisées restent dans l'index et sont
+écartées à la lecture ; `manage.py index_consultations --rebuild` les compacte.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from openai import OpenAI
+
+from .models import Consultation, ConsultationEmbedding
+from .symptom_history import consultation_symptoms, normalize_symptom
+from .utils import clean_pathology_name
+
+
+logger = logging.getLogger(__name__)
+
+# Identifiants relus à chaque synchronisation sous le dernier identifiant indexé :
+# rattrape les lignes validées en base après une ligne d'identifiant supérieur
+SYNC_OVERLAP = 1000
+
+# Lignes écrites par bloc lors d'une synchronisation
+SYNC_CHUNK_SIZE = 2000
+
+# Candidats examinés par résultat demandé (filtres appliqués après le classement)
+CANDIDATES_PER_RESULT = 5
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='case-embedding')
+
+
+def consultation_text(description_clinique, criteres_valides):
+    """Texte vectorisé d'une consultation : description clinique puis critères validés."""
+    parts = [normalize_symptom(description_clinique or '')]
+    symptoms = consultation_symptoms(criteres_valides)
+    if symptoms:
+        parts.append('Critères : ' + '; '.join(symptoms))
+    return '\n'.join(part for part in parts if part)
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def embed_texts(texts):
+    """Vecteurs float32 normalisés (CASE_EMBEDDING_DIMENSIONS) des textes, en un appel API."""
+    if not texts:
+        return np.zeros((0, settings.CASE_EMBEDDING_DIMENSIONS), dtype=np.float32)
+    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    response = client.embeddings.create(
+        input=[text.replace("\n", " ") for text in texts],
+        model=settings.CASE_EMBEDDING_MODEL,
+        dimensions=settings.CASE_EMBEDDING_DIMENSIONS,
+    )
+    vectors = np.array(
+        [item.embedding for item in sorted(response.data, key=lambda item: item.index)], dtype=np.float32
+    )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# --- Indexation ---
+
+def index_consultations(consultation_ids=None, limit=None):
+    """
+    Vectoriser par lots les consultations sans embedding pour le modèle courant
+    (toutes, ou seulement `consultation_ids`). Retourne le nombre de vecteurs créés.
+    """
+    model_name = settings.CASE_EMBEDDING_MODEL
+    dimension = settings.CASE_EMBEDDING_DIMENSIONS
+    batch_size = settings.CASE_EMBEDDING_BATCH_SIZE
+
+    pending = Consultation.objects.filter(embedding__isnull=True).order_by('date_creation')
+    if consultation_ids is not None:
+        pending = pending.filter(id__in=list(consultation_ids))
+    rows = pending.values_list('id', 'description_clinique', 'criteres_valides')
+    if limit:
+        rows = rows[:limit]
+
+    created = 0
+    batch = []
+    for consultation_id, description_clinique, criteres_valides in rows.iterator(chunk_size=batch_size):
+        text = consultation_text(description_clinique, criteres_valides)
+        if text:
+            batch.append((consultation_id, text))
+        if len(batch) >= batch_size:
+            created += _embed_batch(batch, model_name, dimension)
+            batch = []
+    if batch:
+        created += _embed_batch(batch, model_name, dimension)
+    return created
+
+
+def _embed_batch(batch, model_name, dimension):
+    """Enregistrer les vecteurs d'un lot ; retourne le nombre de lignes réellement insérées."""
+    vectors = embed_texts([text for _, text in batch])
+    # Lignes déjà créées par un autre passage (ignore_conflicts) : non comptées
+    existing = ConsultationEmbedding.objects.filter(consultation_id__in=[consultation_id for consultation_id, _ in batch])
+    with transaction.atomic():
+        before = existing.count()
+        ConsultationEmbedding.objects.bulk_create(
+            [
+                ConsultationEmbedding(
+                    consultation_id=consultation_id,
+                    texte_hash=text_hash(text),
+                    modele_embedding=model_name,
+                    vecteur=vector.tobytes(),
+                    dimension=dimension,
+                )
+                for (consultation_id, text), vector in zip(batch, vectors)
+            ],
+            ignore_conflicts=True,
+        )
+        return existing.count() - before
+
+
+def refresh_consultation(consultation):
+    """Supprimer l'embedding d'une consultation dont le texte a changé et la revectoriser en arrière-plan."""
+    text = consultation_text(consultation.description_clinique, consultation.criteres_valides)
+    deleted = ConsultationEmbedding.objects.filter(consultation=consultation).exclude(texte_hash=text_hash(text)).delete()[0]
+    if deleted:
+        schedule_indexing(consultation.id)
+    return deleted
+
+
+_pending_ids = set()
+_pending_lock = threading.Lock()
+
+
+def _index_in_background():
+    close_old_connections()
+    try:
+        # Les consultations créées pendant un lot sont traitées au tour suivant
+        while True:
+            with _pending_lock:
+                consultation_ids = list(_pending_ids)
+                _pending_ids.clear()
+            if not consultation_ids:
+                break
+            created = index_consultations(consultation_ids)
+            if created:
+                logger.info(f"{created} consultation embedding(s) created")
+    except Exception as e:
+        logger.warning(f"Consultation embedding failed: {e}")
+    finally:
+        # Connexions propres à ce thread
+        connections.close_all()
+
+
+def schedule_indexing(consultation_id):
+    """Vectoriser la consultation en arrière-plan une fois la transaction validée."""
+
+    def submit():
+        with _pending_lock:
+            start = not _pending_ids
+            _pending_ids.add(consultation_id)
+        # Un seul passage en file suffit : il vide tout le lot en attente
+        if start:
+            _executor.submit(_index_in_background)
+
+    transaction.on_commit(submit)
+
+
+# --- Index local ---
+
+@contextmanager
+def _file_lock(path):
+    # Plusieurs workers peuvent partager le même dossier d'index
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CaseIndex:
+
+    def __init__(self, directory, model_name, dimension):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.directory = Path(directory) / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)}-{dimension}"
+        self.vectors_path = self.directory / 'vectors.f32'
+        self.ids_path = self.directory / 'ids.i64'
+        self.lock_path = self.directory / '.lock'
+        self.row_bytes = dimension * 4
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.sorted_ids = self.ids
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rows(self):
+        return ConsultationEmbedding.objects.filter(modele_embedding=self.model_name, dimension=self.dimension)
+
+    def _disk_count(self, repair=False):
+        """Lignes complètes de l'index (les vecteurs sont écrits avant leurs identifiants)."""
+        vectors_size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        ids_size = self.ids_path.stat().st_size if self.ids_path.exists() else 0
+        count = min(vectors_size // self.row_bytes, ids_size // 8)
+        if repair:
+            # Ajout interrompu : ramener les deux fichiers au même nombre de lignes (sous verrou)
+            if vectors_size != count * self.row_bytes:
+                os.truncate(self.vectors_path, count * self.row_bytes)
+            if ids_size != count * 8:
+                os.truncate(self.ids_path, count * 8)
+        return count
+
+    def _map(self, count):
+        if count == 0:
+            self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            self.ids = np.zeros(0, dtype=np.int64)
+        else:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(count, self.dimension))
+            self.ids = np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(count,))
+        self.sorted_ids = np.sort(self.ids)
+
+    def _missing_ids(self):
+        """Identifiants en base absents de l'index (au-delà du dernier indexé, ou dans la fenêtre de rattrapage)."""
+        last_id = int(self.sorted_ids[-1]) if len(self.sorted_ids) else 0
+        candidates = np.fromiter(
+            self._rows().filter(id__gt=max(last_id - SYNC_OVERLAP, 0)).values_list('id', flat=True),
+            dtype=np.int64,
+        )
+        if not len(candidates) or not len(self.sorted_ids):
+            return candidates
+        positions = np.searchsorted(self.sorted_ids, candidates).clip(max=len(self.sorted_ids) - 1)
+        return candidates[self.sorted_ids[positions] != candidates]
+
+    def sync(self):
+        """Ajouter à l'index les vecteurs créés en base depuis la dernière synchronisation."""
+        with self._lock:
+            count = self._disk_count()
+            if count != len(self.ids):
+                # Premier accès, ou lignes ajoutées par un autre processus
+                self._map(count)
+            missing = self._missing_ids()
+            if not len(missing):
+                return 0
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with _file_lock(self.lock_path):
+                self._map(self._disk_count(repair=True))
+                appended = self._append(self._missing_ids())
+                self._map(self._disk_count())
+            return appended
+
+    def _append(self, embedding_ids):
+        appended = 0
+        embedding_ids = [int(i) for i in embedding_ids]
+        with open(self.vectors_path, 'ab') as vectors_file, open(self.ids_path, 'ab') as ids_file:
+            for i in range(0, len(embedding_ids), SYNC_CHUNK_SIZE):
+                rows = (
+                    self._rows()
+                    .filter(id__in=embedding_ids[i:i + SYNC_CHUNK_SIZE])
+                    .order_by('id')
+                    .values_list('id', 'vecteur')
+                )
+                ids = []
+                for embedding_id, vecteur in rows:
+                    vector = np.frombuffer(bytes(vecteur), dtype=np.float32)
+                    if len(vector) != self.dimension:
+                        continue
+                    vectors_file.write(vector.tobytes())
+                    ids.append(embedding_id)
+                # Vecteurs écrits avant leurs identifiants : une ligne n'est visible que complète
+                vectors_file.flush()
+                ids_file.write(np.asarray(ids, dtype=np.int64).tobytes())
+                ids_file.flush()
+                appended += len(ids)
+        return appended
+
+    def rebuild(self):
+        """Réécrire l'index depuis la base (supprime les lignes des consultations supprimées)."""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with _file_lock(self.lock_path):
+                for path in (self.vectors_path, self.ids_path):
+                    if path.exists():
+                        path.unlink()
+                self._map(0)
+                ids = list(self._rows().order_by('id').values_list('id', flat=True).iterator(chunk_size=SYNC_CHUNK_SIZE))
+                appended = self._append(ids)
+                self._map(self._disk_count())
+            return appended
+
+    def search(self, query_vector, limit=10):
+        """[(identifiant ConsultationEmbedding, similarité)] des `limit` vecteurs les plus proches."""
+        self.sync()
+        vectors, ids = self.vectors, self.ids
+        if not len(ids) or limit <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = vectors @ query
+
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Index local du modèle d'embedding courant, chargé au premier appel."""
+    global _index
+    index = _index
+    if index is None or (index.model_name, index.dimension) != (settings.CASE_EMBEDDING_MODEL, settings.CASE_EMBEDDING_DIMENSIONS):
+        with _index_lock:
+            index = _index
+            if index is None or (index.model_name, index.dimension) != (settings.CASE_EMBEDDING_MODEL, settings.CASE_EMBEDDING_DIMENSIONS):
+                index = CaseIndex(settings.CASE_INDEX_DIR, settings.CASE_EMBEDDING_MODEL, settings.CASE_EMBEDDING_DIMENSIONS)
+                _index = index
+    return index
+
+
+# --- Recherche ---
+
+def consultation_vector(consultation):
+    """Vecteur enregistré d'une consultation, ou None si elle n'est pas encore indexée."""
+    row = ConsultationEmbedding.objects.filter(
+        consultation=consultation,
+        modele_embedding=settings.CASE_EMBEDDING_MODEL,
+        dimension=settings.CASE_EMBEDDING_DIMENSIONS,
+    ).values_list('vecteur', flat=True).first()
+    return np.frombuffer(bytes(row), dtype=np.float32) if row is not None else None
+
+
+def find_similar_cases(query_vector, limit=10, exclude_consultation_id=None, exclude_patient_id=None, statuts=None):
+    """
+    Consultations les plus proches du vecteur, avec patient et issue (pathologie, statut).
+    Les filtres sont appliqués sur un nombre limité de candidats déjà classés.
+    """
+    matches = get_index().search(query_vector, limit=max(limit * CANDIDATES_PER_RESULT, 50))
+    if not matches:
+        return []
+
+    embeddings = (
+        ConsultationEmbedding.objects
+        .filter(id__in=[embedding_id for embedding_id, _ in matches])
+        .select_related('consultation__patient')
+    )
+    if exclude_consultation_id:
+        embeddings = embeddings.exclude(consultation_id=exclude_consultation_id)
+    if exclude_patient_id:
+        embeddings = embeddings.exclude(consultation__patient_id=exclude_patient_id)
+    if statuts:
+        embeddings = embeddings.filter(consultation__statut__in=statuts)
+    by_id = {embedding.id: embedding.consultation for embedding in embeddings}
+
+    cases = []
+    for embedding_id, similarity in matches:
+        consultation = by_id.get(embedding_id)
+        # Ligne périmée (consultation supprimée ou revectorisée) ou filtrée
+        if consultation is None:
+            continue
+        patient = consultation.patient
+        cases.append({
+            'consultation_id': str(consultation.id),
+            'date_consultation': consultation.date_consultation.isoformat(),
+            'description_clinique': consultation.description_clinique[:300],
+            'pathologie_identifiee': clean_pathology_name(consultation.pathologie_identifiee),
+            'statut': consultation.statut,
+            'statut_display': consultation.get_statut_display(),
+            'score_similarite': consultation.score_similarite,
+            'patient': {
+                'id': patient.id,
+                'nom_complet': patient.nom_complet,
+                'patient_identifier': patient.patient_identifier,
+            },
+            'similarity': similarity,
+            'similarity_percent': round(similarity * 100, 1),
+        })
+        if len(cases) >= limit:
+            break
+    return cases
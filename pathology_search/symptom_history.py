@@ -0,0 +1,181 @@
+"""
+Recherche tenant compte de l'historique du patient.
+
+Les symptômes (critères cochés) des consultations validées sont vectorisés une
+seule fois, par lots, et conservés en base (SymptomEmbedding) par texte
+distinct et par modèle d'embedding. Une recherche avec historique lit les
+symptômes validés du patient dans son profil (symptom_profile, une requête)
+et combine le vecteur de la requête avec leurs vecteurs en cache, pondérés par
+l'ancienneté de la dernière consultation validée : aucun appel API
+supplémentaire par recherche.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import PatientSymptom, SymptomEmbedding
+
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='symptom-embedding')
+
+
+def normalize_symptom(text):
+    return ' '.join(str(text).split())
+
+
+def symptom_hash(text):
+    return hashlib.sha256(normalize_symptom(text).lower().encode('utf-8')).hexdigest()
+
+
+def consultation_symptoms(criteres_valides):
+    """Symptômes (libellés des critères) d'une consultation, sans les métadonnées."""
+    symptoms = []
+    for key, value in (criteres_valides or {}).items():
+        if key == '_metadata':
+            continue
+        if isinstance(value, list):
+            values = value
+        elif isinstance(value, dict):
+            values = list(value.values())
+        else:
+            values = [value]
+        for item in values:
+            item = normalize_symptom(item) if item is not None else ''
+            if len(item) >= 2:
+                symptoms.append(item)
+    return symptoms
+
+
+def patient_symptom_history(patient_id, limit=None):
+    """[(symptôme, date de la dernière consultation validée)] du profil du patient, du plus récent au plus ancien."""
+    limit = limit or settings.HISTORY_SEARCH_MAX_SYMPTOMS
+    return list(
+        PatientSymptom.objects
+        .filter(patient_id=patient_id, occurrences_validees__gt=0)
+        .order_by('-derniere_date_validee', 'symptome')
+        .values_list('symptome', 'derniere_date_validee')[:limit]
+    )
+
+
+def cached_embeddings(symptoms, embedding_model_name):
+    """{empreinte: vecteur} des symptômes déjà vectorisés avec ce modèle."""
+    hashes = {symptom_hash(symptom) for symptom in symptoms}
+    if not hashes:
+        return {}
+    rows = SymptomEmbedding.objects.filter(
+        modele_embedding=embedding_model_name, texte_hash__in=hashes
+    ).values_list('texte_hash', 'vecteur')
+    return {texte_hash: np.frombuffer(bytes(vecteur), dtype=np.float32) for texte_hash, vecteur in rows}
+
+
+def embed_symptoms(symptoms, embedding_model_type='openai-ada', service=None):
+    """Vectoriser par lots les symptômes absents du cache. Retourne le nombre de vecteurs créés."""
+    from .services import PathologySearchService
+
+    service = service or PathologySearchService(embedding_model_type=embedding_model_type)
+    distinct = {}
+    for symptom in symptoms:
+        distinct.setdefault(symptom_hash(symptom), normalize_symptom(symptom))
+    existing = set(cached_embeddings(distinct.values(), service.embedding_model_name))
+    missing = [(key, text) for key, text in distinct.items() if key not in existing]
+
+    created = 0
+    batch_size = settings.SYMPTOM_EMBEDDING_BATCH_SIZE
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        vectors = service.get_embeddings([text for _, text in batch])
+        # Textes vectorisés entre-temps par un autre passage (ignore_conflicts) : non comptés
+        existing = SymptomEmbedding.objects.filter(
+            modele_embedding=service.embedding_model_name, texte_hash__in=[key for key, _ in batch]
+        )
+        with transaction.atomic():
+            before = existing.count()
+            SymptomEmbedding.objects.bulk_create(
+                [
+                    SymptomEmbedding(
+                        texte_hash=key,
+                        texte=text,
+                        modele_embedding=service.embedding_model_name,
+                        vecteur=np.asarray(vector, dtype=np.float32).tobytes(),
+                        dimension=len(vector),
+                    )
+                    for (key, text), vector in zip(batch, vectors)
+                ],
+                ignore_conflicts=True,
+            )
+            created += existing.count() - before
+    return created
+
+
+def _embed_in_background(symptoms, embedding_model_type):
+    close_old_connections()
+    try:
+        created = embed_symptoms(symptoms, embedding_model_type)
+        if created:
+            logger.info(f"{created} symptom embedding(s) cached for {embedding_model_type}")
+    except Exception as e:
+        logger.warning(f"Symptom embedding failed ({embedding_model_type}): {e}")
+    finally:
+        # Connexions propres à ce thread
+        connections.close_all()
+
+
+def schedule_embedding(symptoms, embedding_model_type='openai-ada'):
+    """Vectoriser les symptômes en arrière-plan une fois la transaction validée."""
+    symptoms = list(symptoms)
+    if symptoms:
+        transaction.on_commit(lambda: _executor.submit(_embed_in_background, symptoms, embedding_model_type))
+
+
+def history_query_embedding(service, query_embedding, patient_id, now=None):
+    """
+    Combiner le vecteur de la requête avec les symptômes validés du patient.
+
+    Poids d'un symptôme : 0.5 ** (ancienneté en jours / demi-vie). Le vecteur
+    d'historique (moyenne pondérée) compte pour 1 - HISTORY_SEARCH_QUERY_WEIGHT.
+    Les symptômes pas encore vectorisés sont ignorés et mis en file d'attente.
+    """
+    query_weight = settings.HISTORY_SEARCH_QUERY_WEIGHT
+    info = {'symptoms_used': 0, 'symptoms_pending': 0, 'query_weight': query_weight}
+
+    history = patient_symptom_history(patient_id)
+    if not history:
+        return query_embedding, info
+
+    vectors = cached_embeddings([symptom for symptom, _ in history], service.embedding_model_name)
+    pending = [symptom for symptom, _ in history if symptom_hash(symptom) not in vectors]
+    if pending:
+        schedule_embedding(pending, service.embedding_model_type)
+    info['symptoms_pending'] = len(pending)
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    now = now or timezone.now()
+    half_life = settings.HISTORY_SEARCH_HALF_LIFE_DAYS
+    weighted_sum = np.zeros_like(query)
+    total_weight = 0.0
+    for symptom, date_consultation in history:
+        vector = vectors.get(symptom_hash(symptom))
+        if vector is None or len(vector) != len(query):
+            continue
+        age_days = max((now - date_consultation).total_seconds() / 86400, 0)
+        weight = 0.5 ** (age_days / half_life) if half_life > 0 else 1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            weighted_sum += weight * (vector / norm)
+            total_weight += weight
+            info['symptoms_used'] += 1
+
+    history_norm = np.linalg.norm(weighted_sum)
+    query_norm = np.linalg.norm(query)
+    if not total_weight or not history_norm or not query_norm:
+        return query_embedding, info
+
+    blended = query_weight * (query / query_norm) + (1 - query_weight) * (weighted_sum / history_norm)
+    return blended, info
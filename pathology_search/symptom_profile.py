@@ -0,0 +1,194 @@
+"""
+Profil de symptômes par patient, tenu à jour incrémentalement.
+
+Chaque symptôme coché dans une consultation est une ligne ConsultationSymptom
+(supprimée avec la consultation). PatientSymptom en est l'agrégat par patient
+et par symptôme distinct : nombre de consultations (dont validées), dates de
+première et de dernière observation.
+
+À l'enregistrement ou à la suppression d'une consultation (signals.py), seuls
+les symptômes ajoutés, retirés ou dont la date ou le statut de la consultation
+ont changé sont ré-agrégés. L'historique d'un patient se lit ensuite en une
+requête indexée (patient_symptom_recent_idx), sans parcourir le JSON des
+consultations.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+
+from .models import Consultation, ConsultationSymptom, Patient, PatientSymptom
+from .symptom_history import consultation_symptoms, symptom_hash
+
+
+AGGREGATE_FIELDS = ['symptome', 'occurrences', 'occurrences_validees', 'premiere_date', 'derniere_date', 'derniere_date_validee']
+
+
+def symptoms_by_hash(criteres_valides):
+    """{empreinte: libellé} des symptômes d'une consultation (premier libellé rencontré)."""
+    symptoms = {}
+    for symptom in consultation_symptoms(criteres_valides):
+        symptoms.setdefault(symptom_hash(symptom), symptom)
+    return symptoms
+
+
+def refresh_patient_symptoms(patient_id, hashes, labels=None, labels_date=None):
+    """
+    Ré-agréger les symptômes `hashes` du patient depuis leurs consultations sources.
+
+    `labels` : libellés observés le `labels_date` ; un symptôme garde le libellé
+    de sa consultation la plus récente.
+    """
+    hashes = set(hashes)
+    if not hashes:
+        return
+    labels = labels or {}
+    aggregates = (
+        ConsultationSymptom.objects
+        .filter(patient_id=patient_id, symptome_hash__in=hashes)
+        .values('symptome_hash')
+        .annotate(
+            occurrences=Count('id'),
+            occurrences_validees=Count('id', filter=Q(valide=True)),
+            premiere_date=Min('date_consultation'),
+            derniere_date=Max('date_consultation'),
+            derniere_date_validee=Max('date_consultation', filter=Q(valide=True)),
+        )
+    )
+    rows = [
+        PatientSymptom(
+            patient_id=patient_id,
+            symptome_hash=aggregate['symptome_hash'],
+            symptome=labels.get(aggregate['symptome_hash'], ''),
+            occurrences=aggregate['occurrences'],
+            occurrences_validees=aggregate['occurrences_validees'],
+            premiere_date=aggregate['premiere_date'],
+            derniere_date=aggregate['derniere_date'],
+            derniere_date_validee=aggregate['derniere_date_validee'],
+        )
+        for aggregate in aggregates
+    ]
+    # Symptômes déjà connus : libellé remplacé seulement par celui de leur dernière consultation
+    known = dict(
+        PatientSymptom.objects.filter(patient_id=patient_id, symptome_hash__in=[row.symptome_hash for row in rows])
+        .values_list('symptome_hash', 'id')
+    )
+    new_rows = []
+    relabeled = []
+    updated = []
+    for row in rows:
+        row.pk = known.get(row.symptome_hash)
+        if row.pk is None:
+            new_rows.append(row)
+        elif row.symptome and labels_date is not None and labels_date >= row.derniere_date:
+            relabeled.append(row)
+        else:
+            updated.append(row)
+    PatientSymptom.objects.bulk_create(new_rows)
+    PatientSymptom.objects.bulk_update(relabeled, AGGREGATE_FIELDS)
+    PatientSymptom.objects.bulk_update(updated, AGGREGATE_FIELDS[1:])
+
+    # Symptômes qui n'apparaissent plus dans aucune consultation
+    PatientSymptom.objects.filter(patient_id=patient_id, symptome_hash__in=hashes - {row.symptome_hash for row in rows}).delete()
+
+
+def sync_consultation(consultation):
+    """Mettre à jour les sources et le profil du patient après l'enregistrement d'une consultation."""
+    symptoms = symptoms_by_hash(consultation.criteres_valides)
+    valide = consultation.statut == 'valide'
+
+    with transaction.atomic():
+        existing = {
+            key: (date_consultation, was_valide)
+            for key, date_consultation, was_valide in ConsultationSymptom.objects.filter(consultation=consultation)
+            .values_list('symptome_hash', 'date_consultation', 'valide')
+        }
+        removed = set(existing) - set(symptoms)
+        added = set(symptoms) - set(existing)
+        kept = set(existing) & set(symptoms)
+        # Date ou statut modifiés : les symptômes conservés changent aussi d'agrégat
+        moved = {
+            key for key in kept
+            if existing[key] != (consultation.date_consultation, valide)
+        }
+        if not (removed or added or moved):
+            return
+
+        # Un seul recalcul à la fois par patient (PostgreSQL)
+        list(Patient.objects.select_for_update().filter(id=consultation.patient_id).values_list('id', flat=True))
+        if removed:
+            ConsultationSymptom.objects.filter(consultation=consultation, symptome_hash__in=removed).delete()
+        if moved:
+            ConsultationSymptom.objects.filter(consultation=consultation, symptome_hash__in=moved).update(
+                date_consultation=consultation.date_consultation, valide=valide
+            )
+        if added:
+            ConsultationSymptom.objects.bulk_create(
+                [
+                    ConsultationSymptom(
+                        consultation=consultation,
+                        patient_id=consultation.patient_id,
+                        symptome_hash=key,
+                        date_consultation=consultation.date_consultation,
+                        valide=valide,
+                    )
+                    for key in added
+                ],
+                ignore_conflicts=True,
+            )
+        refresh_patient_symptoms(
+            consultation.patient_id, removed | added | moved,
+            labels=symptoms, labels_date=consultation.date_consultation
+        )
+
+
+def consultation_symptom_hashes(consultation):
+    return list(ConsultationSymptom.objects.filter(consultation=consultation).values_list('symptome_hash', flat=True))
+
+
+def rebuild_patient(patient_id):
+    """Reconstruire entièrement les sources et le profil d'un patient depuis ses consultations."""
+    with transaction.atomic():
+        list(Patient.objects.select_for_update().filter(id=patient_id).values_list('id', flat=True))
+        ConsultationSymptom.objects.filter(patient_id=patient_id).delete()
+        PatientSymptom.objects.filter(patient_id=patient_id).delete()
+
+        sources = []
+        labels = {}
+        consultations = (
+            Consultation.objects.filter(patient_id=patient_id)
+            .order_by('-date_consultation')
+            .values_list('id', 'criteres_valides', 'date_consultation', 'statut')
+        )
+        for consultation_id, criteres_valides, date_consultation, statut in consultations.iterator(chunk_size=200):
+            for key, label in symptoms_by_hash(criteres_valides).items():
+                # Libellé de la consultation la plus récente
+                labels.setdefault(key, label)
+                sources.append(ConsultationSymptom(
+                    consultation_id=consultation_id,
+                    patient_id=patient_id,
+                    symptome_hash=key,
+                    date_consultation=date_consultation,
+                    valide=statut == 'valide',
+                ))
+        ConsultationSymptom.objects.bulk_create(sources, batch_size=1000)
+        refresh_patient_symptoms(patient_id, labels, labels=labels)
+    return len(labels)
+
+
+def patient_symptoms(patient_id, validated_only=False, limit=None):
+    """Profil du patient, symptômes les plus récemment observés d'abord."""
+    profile = PatientSymptom.objects.filter(patient_id=patient_id)
+    if validated_only:
+        profile = profile.filter(occurrences_validees__gt=0).order_by('-derniere_date_validee', 'symptome')
+    else:
+        profile = profile.order_by('-derniere_date', 'symptome')
+    if limit:
+        profile = profile[:limit]
+    return profile
+
+
+def symptom_labels(patient_id, limit=None):
+    return list(patient_symptoms(patient_id, limit=limit).values_list('symptome', flat=True))
+
+
+def symptom_count(patient_id):
+    return PatientSymptom.objects.filter(patient_id=patient_id).count()
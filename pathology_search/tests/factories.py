@@ -0,0 +1,54 @@
+"""
+Création de données de test (médecins, patients, consultations, dossier d'embeddings).
+"""
+import itertools
+import tempfile
+from pathlib import Path
+
+from django.test import override_settings
+from django.utils import timezone
+
+from .. import catalog
+from ..models import Consultation, Medecin, Patient
+
+
+_sequence = itertools.count(1)
+
+
+def make_medecin(**fields):
+    number = next(_sequence)
+    values = {'nom': 'Alaoui', 'prenom': 'Sara', 'specialite': 'Psychiatrie', 'numero_ordre': f'ORD-{number}'}
+    values.update(fields)
+    return Medecin.objects.create(**values)
+
+
+def make_patient(**fields):
+    number = next(_sequence)
+    values = {'last_name': 'Benali', 'first_name': 'Karim', 'patient_identifier': f'PAT-{number}'}
+    values.update(fields)
+    return Patient.objects.create(**values)
+
+
+def make_consultation(patient, medecin=None, **fields):
+    values = {
+        'date_consultation': timezone.now(),
+        'description_clinique': 'Humeur dépressive et insomnie depuis trois semaines',
+        'pathologie_identifiee': 'Épisode dépressif caractérisé',
+        'score_similarite': 0.8,
+        'criteres_valides': {'symptomes': ['Humeur dépressive', 'Insomnie']},
+        'statut': 'valide',
+    }
+    values.update(fields)
+    return Consultation.objects.create(patient=patient, medecin=medecin, **values)
+
+
+def use_embeddings_folder(test_case):
+    """Dossier d'embeddings temporaire (EMBEDDINGS_FOLDER) pour la durée du test ; à peupler puis catalog.reload_catalog()."""
+    folder = tempfile.TemporaryDirectory()
+    test_case.addCleanup(folder.cleanup)
+    path = Path(folder.name)
+    settings_override = override_settings(EMBEDDINGS_FOLDER=path)
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+    test_case.addCleanup(catalog._catalogs.pop, str(path), None)
+    return path
@@ -0,0 +1,166 @@
+"""
+Agrégats du tableau de bord clinique (analytics, ConsultationStat, /api/analytics/).
+"""
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import analytics, consultation_stats
+from ..models import Consultation, ConsultationStat
+from .factories import make_consultation, make_medecin, make_patient
+
+
+def local_datetime(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+def stored_stats():
+    return {
+        tuple(row[:5]): (row[5], round(row[6], 6))
+        for row in ConsultationStat.objects.values_list(*analytics.KEY_FIELDS, 'consultations', 'somme_scores')
+    }
+
+
+def recomputed_stats():
+    return {
+        key: (total, round(scores, 6))
+        for key, (total, scores) in consultation_stats.totals(Consultation.objects.all()).items()
+    }
+
+
+class IncrementalStatsTests(TestCase):
+
+    def setUp(self):
+        self.medecin = make_medecin()
+        self.patient = make_patient()
+        self.consultation = make_consultation(
+            self.patient, self.medecin, pathologie_identifiee='Trouble panique', score_similarite=0.6,
+            date_consultation=local_datetime(2024, 3, 15, 10, 0),
+            criteres_valides={'_metadata': {'model_used': 'gpt-4o', 'embedding_model': 'e5-large'}},
+        )
+
+    def assertStatsMatchConsultations(self):
+        self.assertEqual(stored_stats(), recomputed_stats())
+
+    def test_creation_adds_one_row_per_dimension_and_granularity(self):
+        stats = stored_stats()
+        self.assertEqual(len(stats), len(consultation_stats.DIMENSIONS) * 2)
+        self.assertEqual(stats[('pathologie', consultation_stats.MONTH, date(2024, 3, 1), 'Trouble panique', 'valide')],
+                         (1, 0.6))
+        self.assertEqual(stats[('modele', consultation_stats.DAY, date(2024, 3, 15), 'gpt-4o', 'valide')], (1, 0.6))
+        self.assertStatsMatchConsultations()
+
+    def test_local_day_is_used(self):
+        # 23h30 UTC le 31 mars : 1er avril à Paris
+        make_consultation(self.patient, date_consultation=datetime(2024, 3, 31, 23, 30, tzinfo=dt_timezone.utc))
+        self.assertIn(('medecin', consultation_stats.DAY, date(2024, 4, 1), '0', 'valide'), stored_stats())
+        self.assertStatsMatchConsultations()
+
+    def test_updates_move_counts(self):
+        make_consultation(self.patient, self.medecin, pathologie_identifiee='Trouble panique',
+                          date_consultation=local_datetime(2024, 3, 20, 10, 0))
+        self.consultation.statut = 'non_valide'
+        self.consultation.pathologie_identifiee = 'Agoraphobie'
+        self.consultation.date_consultation = local_datetime(2024, 4, 2, 10, 0)
+        self.consultation.score_similarite = 0.9
+        self.consultation.save()
+        self.assertStatsMatchConsultations()
+
+        self.consultation.medecin = None
+        self.consultation.save(update_fields=['medecin'])
+        self.assertStatsMatchConsultations()
+
+    def test_unrelated_partial_save_is_ignored(self):
+        stats = stored_stats()
+        self.consultation.notes_medecin = 'Revoir dans un mois'
+        self.consultation.save(update_fields=['notes_medecin'])
+        self.assertEqual(stored_stats(), stats)
+
+    def test_deletion_removes_empty_rows(self):
+        other = make_consultation(self.patient, self.medecin, pathologie_identifiee='Trouble panique',
+                                  date_consultation=local_datetime(2024, 3, 16, 10, 0))
+        self.consultation.delete()
+        self.assertStatsMatchConsultations()
+        other.delete()
+        self.assertFalse(ConsultationStat.objects.exists())
+
+    def test_physician_deletion_moves_rows_to_no_physician(self):
+        make_consultation(self.patient, date_consultation=local_datetime(2024, 3, 15, 11, 0))
+        self.medecin.delete()
+        self.assertStatsMatchConsultations()
+        self.assertIn(('medecin', consultation_stats.MONTH, date(2024, 3, 1), '0', 'valide'), stored_stats())
+
+    def test_patient_deletion_cascades(self):
+        self.patient.delete()
+        self.assertFalse(ConsultationStat.objects.exists())
+
+
+class RefreshTests(TestCase):
+
+    def setUp(self):
+        patient = make_patient()
+        self.march = make_consultation(patient, date_consultation=local_datetime(2024, 3, 15, 10, 0))
+        self.may = make_consultation(patient, date_consultation=local_datetime(2024, 5, 15, 10, 0))
+
+    def test_refresh_after_writes_without_signals(self):
+        Consultation.objects.update(statut='non_valide')
+        self.assertNotEqual(stored_stats(), recomputed_stats())
+        self.assertEqual(analytics.refresh(), len(recomputed_stats()))
+        self.assertEqual(stored_stats(), recomputed_stats())
+
+    def test_refresh_is_limited_to_covering_months(self):
+        Consultation.objects.update(statut='non_valide')
+        analytics.refresh(date(2024, 3, 20), date(2024, 3, 21))
+        statuts = set(ConsultationStat.objects.filter(periode__month=3).values_list('statut', flat=True))
+        self.assertEqual(statuts, {'non_valide'})
+        statuts = set(ConsultationStat.objects.filter(periode__month=5).values_list('statut', flat=True))
+        self.assertEqual(statuts, {'valide'})
+
+
+class DashboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medecin = make_medecin(nom='Alaoui', prenom='Sara')
+        patient = make_patient()
+        for day, statut, pathologie, score in (
+            ((2024, 2, 10), 'valide', 'Trouble panique', 0.5),      # avant la période
+            ((2024, 2, 20), 'valide', 'Trouble panique', 0.7),      # jour d'un mois entamé
+            ((2024, 3, 5), 'non_valide', 'Agoraphobie', 0.4),       # mois complet
+            ((2024, 3, 25), 'valide', 'Trouble panique', 0.9),      # mois complet
+            ((2024, 4, 3), 'en_cours', 'Agoraphobie', 0.6),         # jour d'un mois entamé
+            ((2024, 4, 20), 'valide', 'Trouble panique', 0.8),      # après la période
+        ):
+            make_consultation(patient, cls.medecin, date_consultation=local_datetime(*day, 10, 0),
+                              statut=statut, pathologie_identifiee=pathologie, score_similarite=score)
+
+    def test_period_mixes_month_and_day_rows(self):
+        data = analytics.dashboard(date(2024, 2, 15), date(2024, 4, 10))
+        self.assertEqual(data['total'], {
+            'consultations': 4, 'valides': 2, 'non_valides': 1,
+            'taux_validation': 0.5, 'taux_non_validation': 0.25, 'score_moyen': 0.65,
+        })
+        self.assertEqual([(row['periode'], row['consultations']) for row in data['par_periode']],
+                         [('2024-02-01', 1), ('2024-03-01', 2), ('2024-04-01', 1)])
+        self.assertEqual([(row['pathologie'], row['consultations']) for row in data['par_pathologie']],
+                         [('Agoraphobie', 2), ('Trouble panique', 2)])
+        [medecin] = data['par_medecin']
+        self.assertEqual((medecin['medecin'], medecin['consultations']), ('Dr. Sara Alaoui', 4))
+
+    def test_day_and_week_granularities(self):
+        data = analytics.dashboard(date(2024, 3, 1), date(2024, 3, 31), 'day')
+        self.assertEqual([row['periode'] for row in data['par_periode']], ['2024-03-05', '2024-03-25'])
+        data = analytics.dashboard(date(2024, 3, 1), date(2024, 3, 31), 'week')
+        self.assertEqual([row['periode'] for row in data['par_periode']], ['2024-03-04', '2024-03-25'])
+        self.assertEqual(data['pathologies_par_periode'][0]['series'], {'2024-03-04': 1})
+
+    def test_api(self):
+        url = reverse('pathology_search:get_analytics')
+        response = self.client.get(url, {'date_from': '2024-02-15', 'date_to': '2024-04-10'})
+        self.assertEqual(response.json()['total']['consultations'], 4)
+        for params in ({'granularity': 'year'}, {'date_from': '2024-02-30'}, {'date_to': 'demain'},
+                       {'date_from': '2024-04-10', 'date_to': '2024-02-15'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
@@ -0,0 +1,123 @@
+"""
+Catalogue en mémoire des pathologies (catalog, /api/pathologies/).
+"""
+import json
+import os
+
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import catalog
+from .factories import use_embeddings_folder
+
+
+class PathologyCatalogTests(TestCase):
+
+    def setUp(self):
+        self.folder = use_embeddings_folder(self)
+        self.write_json('Anxiety_Disorders_out/Trouble_anxieux.json', {
+            'source_file': 'corpus/Trouble_anxieux_generalise.txt',
+            'html_page': 'Anxiety_Disorders_out/Trouble anxieux.html',
+            'hierarchy': {'parsed_name': '["SubSection 3.1 Trouble anxieux généralisé"]', 'location': 'Anxiété > TAG'},
+            'chunks': [{'text_preview': 'Anxiété excessive'}, {'text_preview': 'Suite'}],
+            'embedding_model': 'text-embedding-3-large',
+        })
+        # Dossier 3072 : pas de hiérarchie, nom tiré du fichier source
+        self.write_json('Depressive_Disorders_3072/episode.json', {
+            'source_file': 'Episode_depressif.txt',
+            'html_page': 'Depressive_Disorders_3072/Episode_depressif.html',
+            'model': 'text-embedding-3-small',
+        })
+        self.write_json('Bipolar_out/Sans_page.json', {'source_file': 'Trouble_bipolaire.txt'})
+        self.write_json('Anxiety_Disorders_out/Trouble_anxieux.criteria.json', {'source_file': 'schema.txt'})
+        self.write_json('Anxiety_Disorders_out/liste.json', ['source_file'])
+        (self.folder / 'Anxiety_Disorders_out' / 'invalide.json').write_text('{', encoding='utf-8')
+        self.catalog = catalog.reload_catalog()
+
+    def write_json(self, relative_path, data):
+        path = self.folder / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data), encoding='utf-8')
+        return path
+
+    def test_only_embedding_sidecars_are_entries(self):
+        self.assertEqual(sorted(entry['json_path'] for entry in self.catalog.entries), [
+            'Anxiety_Disorders_out/Trouble_anxieux.json', 'Bipolar_out/Sans_page.json',
+            'Depressive_Disorders_3072/episode.json',
+        ])
+
+    def test_entry_fields(self):
+        entry = self.catalog.by_stem['Trouble_anxieux']
+        self.assertEqual(
+            (entry['name'], entry['file_name'], entry['location'], entry['first_chunk_text'], entry['embedding_model']),
+            ('Trouble anxieux généralisé', 'Trouble_anxieux_generalise.txt', 'Anxiété > TAG', 'Anxiété excessive',
+             'text-embedding-3-large'),
+        )
+        entry = self.catalog.by_stem['episode']
+        self.assertEqual((entry['original_name'], entry['name'], entry['first_chunk_text'], entry['embedding_model']),
+                         ('Episode depressif', 'Episode depressif', '', 'text-embedding-3-small'))
+
+    def test_find_by_file_name(self):
+        expected = self.catalog.by_stem['Trouble_anxieux']
+        self.assertIs(self.catalog.find_by_file_name('Trouble_anxieux_generalise.txt'), expected)
+        self.assertIs(self.catalog.find_by_file_name('Trouble_anxieux_generalise'), expected)
+        # Correspondance partielle sur le chemin source
+        self.assertIs(self.catalog.find_by_file_name('corpus/Trouble_anxieux'), expected)
+        self.assertIsNone(self.catalog.find_by_file_name('Schizophrenie.txt'))
+        self.assertIsNone(self.catalog.find_by_file_name(''))
+
+    def test_find_by_html_page(self):
+        expected = self.catalog.by_stem['Trouble_anxieux']
+        for html_page in ('Anxiety_Disorders_out/Trouble anxieux.html', 'Anxiety_Disorders_out/Trouble%20anxieux.html',
+                          'Anxiety_Disorders_out\\Trouble anxieux.html', '/Anxiety_Disorders_out/Trouble anxieux.html',
+                          f'{self.folder}/Anxiety_Disorders_out/Trouble anxieux.html'):
+            with self.subTest(html_page=html_page):
+                self.assertIs(self.catalog.find_by_html_page(html_page), expected)
+        self.assertIsNone(self.catalog.find_by_html_page('Anxiety_Disorders_out/Autre.html'))
+        self.assertIsNone(self.catalog.find_by_html_page(None))
+
+    def test_find_by_name(self):
+        expected = self.catalog.by_stem['Trouble_anxieux']
+        self.assertIs(self.catalog.find_by_name('trouble anxieux GÉNÉRALISÉ'), expected)
+        self.assertIs(self.catalog.find_by_name('SubSection 3.1 Trouble anxieux généralisé'), expected)
+        self.assertIsNone(self.catalog.find_by_name('Trouble panique'))
+
+    def test_pathology_list_is_sorted_and_has_pages(self):
+        self.assertEqual([pathology['name'] for pathology in self.catalog.pathology_list],
+                         ['Episode depressif', 'Trouble anxieux généralisé'])
+        self.assertEqual(self.catalog.pathology_list[1], {
+            'name': 'Trouble anxieux généralisé',
+            'original_name': '["SubSection 3.1 Trouble anxieux généralisé"]',
+            'html_page': 'Anxiety_Disorders_out/Trouble anxieux.html',
+            'location': 'Anxiété > TAG',
+        })
+
+    def test_version_follows_json_and_html_files(self):
+        version = self.catalog.version
+        self.assertEqual(catalog.PathologyCatalog(self.folder).version, version)
+        html_file = self.folder / 'Anxiety_Disorders_out' / 'Trouble anxieux.html'
+        html_file.write_text('<html></html>', encoding='utf-8')
+        with_html = catalog.PathologyCatalog(self.folder).version
+        self.assertNotEqual(with_html, version)
+        json_file = self.folder / 'Bipolar_out' / 'Sans_page.json'
+        stat = json_file.stat()
+        os.utime(json_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertNotEqual(catalog.PathologyCatalog(self.folder).version, with_html)
+        # Les schémas de critères ne font pas partie de la version
+        criteria_file = self.folder / 'Anxiety_Disorders_out' / 'Trouble_anxieux.criteria.json'
+        version = catalog.PathologyCatalog(self.folder).version
+        criteria_file.write_text('{}', encoding='utf-8')
+        self.assertEqual(catalog.PathologyCatalog(self.folder).version, version)
+
+    def test_catalog_is_cached_until_reloaded(self):
+        self.assertIs(catalog.get_catalog(), self.catalog)
+        self.write_json('Psychotic_out/Schizophrenie.json', {'source_file': 'Schizophrenie.txt'})
+        self.assertIsNone(catalog.get_catalog().find_by_file_name('Schizophrenie.txt'))
+        reloaded = catalog.reload_catalog()
+        self.assertIs(catalog.get_catalog(), reloaded)
+        self.assertIsNotNone(reloaded.find_by_file_name('Schizophrenie.txt'))
+
+    def test_pathologies_view(self):
+        data = self.client.get(reverse('pathology_search:get_all_pathologies')).json()
+        self.assertEqual((data['success'], data['count']), (True, 2))
+        self.assertEqual(data['pathologies'], self.catalog.pathology_list)
@@ -0,0 +1,141 @@
+"""
+Recherche plein texte dans les consultations (consultation_search, /api/consultations/search/).
+"""
+from datetime import date, datetime
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import consultation_search
+from ..utils import encode_cursor
+from .factories import make_consultation, make_medecin, make_patient
+
+
+def local_datetime(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class Fts5QueryTests(SimpleTestCase):
+
+    def test_terms_are_quoted_without_operators(self):
+        self.assertEqual(consultation_search.fts5_query('insomnie OR "anxiété" -nuit*'),
+                         '"insomnie" "OR" "anxiété" "nuit"')
+        self.assertEqual(consultation_search.fts5_query('*** ()'), '')
+
+    def test_number_of_terms_is_bounded(self):
+        query = consultation_search.fts5_query(' '.join(f'mot{i}' for i in range(20)))
+        self.assertEqual(query.count('"'), 2 * consultation_search.MAX_SEARCH_TERMS)
+
+
+class SearchConsultationsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medecin = make_medecin()
+        cls.other_medecin = make_medecin(nom='Berrada')
+        patient = make_patient()
+        cls.in_pathology = make_consultation(
+            patient, cls.medecin, pathologie_identifiee='Insomnie chronique',
+            description_clinique='Réveils nocturnes', date_consultation=local_datetime(2024, 3, 1, 9, 0),
+        )
+        # Descriptions identiques : même pertinence, départagées par id
+        cls.same_rank = [
+            make_consultation(
+                patient, cls.medecin if i % 2 else cls.other_medecin,
+                description_clinique='Insomnie et humeur dépressive',
+                statut='en_cours' if i == 0 else 'valide',
+                date_consultation=local_datetime(2024, 3, 10 + i, 9, 0),
+            )
+            for i in range(5)
+        ]
+        cls.in_notes = make_consultation(
+            patient, cls.medecin, description_clinique='Anxiété', notes_medecin='Insomnie signalée par la famille',
+            date_consultation=local_datetime(2024, 4, 1, 9, 0),
+        )
+        make_consultation(patient, cls.medecin, description_clinique='Attaques de panique')
+
+    def setUp(self):
+        if consultation_search.fulltext_engine() is None:
+            self.skipTest("Index plein texte absent")
+
+    def search(self, query='insomnie', **params):
+        return consultation_search.search_consultations(query, **params)
+
+    def ids(self, query='insomnie', **params):
+        return [result['id'] for result in self.search(query, **params)[0]]
+
+    def test_weighted_ranking_and_id_tiebreak(self):
+        ids = self.ids(limit=20)
+        self.assertEqual(ids[0], str(self.in_pathology.id))
+        self.assertEqual(ids[-1], str(self.in_notes.id))
+        self.assertEqual(ids[1:-1], sorted(str(consultation.id) for consultation in self.same_rank))
+
+    def test_keyset_pages_have_no_duplicates_or_gaps(self):
+        expected = self.ids(limit=20)
+        seen, cursor = [], None
+        while True:
+            results, cursor = self.search(cursor=cursor, limit=2)
+            seen.extend(result['id'] for result in results)
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_filters(self):
+        self.assertNotIn(str(self.same_rank[0].id), self.ids(statut='valide'))
+        self.assertEqual(set(self.ids(medecin_id=self.other_medecin.id)),
+                         {str(self.same_rank[i].id) for i in (0, 2, 4)})
+        self.assertEqual(
+            self.ids(date_from=date(2024, 3, 11), date_to=date(2024, 3, 12)),
+            sorted(str(self.same_rank[i].id) for i in (1, 2)),
+        )
+
+    def test_index_follows_updates_and_deletes(self):
+        self.assertEqual(len(self.ids('panique')), 1)
+        self.in_notes.notes_medecin = 'Crises de panique'
+        self.in_notes.save()
+        self.assertIn(str(self.in_notes.id), self.ids('panique'))
+        self.assertNotIn(str(self.in_notes.id), self.ids('famille'))
+        self.in_pathology.delete()
+        self.assertNotIn(str(self.in_pathology.id), self.ids())
+
+    def test_query_without_terms(self):
+        self.assertEqual(self.search('  '), ([], None))
+        self.assertEqual(self.search('*** ()'), ([], None))
+
+
+class SearchConsultationsViewTests(TestCase):
+
+    url = reverse('pathology_search:search_consultations')
+
+    def test_response(self):
+        if consultation_search.fulltext_engine() is None:
+            self.skipTest("Index plein texte absent")
+        consultation = make_consultation(make_patient(), make_medecin(nom='Alaoui', prenom='Sara'),
+                                         description_clinique='Insomnie rebelle')
+        data = self.client.get(self.url, {'q': 'insomnie'}).json()
+        self.assertTrue(data['success'])
+        self.assertFalse(data['has_more'])
+        [result] = data['consultations']
+        self.assertEqual((result['id'], result['medecin'], result['extrait']),
+                         (str(consultation.id), 'Dr. Sara Alaoui', 'Insomnie rebelle'))
+
+    def test_bad_requests(self):
+        for params in ({}, {'q': 'a', 'limit': 'x'}, {'q': 'a', 'medecin_id': '1.5'},
+                       {'q': 'a', 'date_from': '2024-02-30'}, {'q': 'a', 'date_to': 'hier'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_invalid_cursor(self):
+        if consultation_search.fulltext_engine() is None:
+            self.skipTest("Index plein texte absent")
+        for cursor in ('###', encode_cursor('x', 'y'), encode_cursor(True, 'not-a-uuid'), encode_cursor(1.5)):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'q': 'insomnie', 'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Curseur invalide')
+
+    def test_missing_index(self):
+        with mock.patch.object(consultation_search, 'fulltext_engine', return_value=None):
+            self.assertEqual(self.client.get(self.url, {'q': 'insomnie'}).status_code, 503)
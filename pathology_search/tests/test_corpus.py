@@ -0,0 +1,233 @@
+"""
+Génération des embeddings du corpus (corpus, embed_corpus) et index compilé.
+"""
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from .. import corpus, search_index
+
+
+class FakeEmbeddingService:
+    """Vecteurs déterministes (longueur du texte, nombre de mots) ; échecs simulés au besoin."""
+
+    embedding_model_name = 'fake-embedding'
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_embeddings(self, texts, task_type=None):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError('429 Too Many Requests')
+            self.calls.append(list(texts))
+        return [np.array([len(text), len(text.split()), 1.0], dtype=np.float32) for text in texts]
+
+
+class CorpusTestCase(SimpleTestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.source = Path(folder.name) / 'sources'
+        self.output = Path(folder.name) / 'embeddings'
+        self.output.mkdir()
+        self.cache = corpus.EmbeddingCache(self.output / corpus.CACHE_FILE_NAME)
+        self.addCleanup(self.cache.close)
+        self.service = FakeEmbeddingService()
+
+    def write_source(self, path, text):
+        source_file = self.source / path
+        source_file.parent.mkdir(parents=True, exist_ok=True)
+        source_file.write_text(text, encoding='utf-8')
+
+    def plan(self, max_words=4, overlap=1):
+        return corpus.plan_corpus(self.source, self.service.embedding_model_name, max_words, overlap)
+
+
+class ChunkingTests(SimpleTestCase):
+
+    def test_chunks_overlap(self):
+        words = ' '.join(f'm{i}' for i in range(10))
+        self.assertEqual(corpus.chunk_words(words, max_words=4, overlap=1),
+                         ['m0 m1 m2 m3', 'm3 m4 m5 m6', 'm6 m7 m8 m9'])
+        self.assertEqual(corpus.chunk_words('a b', max_words=4, overlap=1), ['a b'])
+        self.assertEqual(corpus.chunk_words('  '), [])
+
+    def test_cache_key_depends_on_model(self):
+        self.assertEqual(corpus.chunk_key('ada', 'texte'), corpus.chunk_key('ada', 'texte'))
+        self.assertNotEqual(corpus.chunk_key('ada', 'texte'), corpus.chunk_key('gemini', 'texte'))
+
+    def test_batches_respect_count_and_token_limits(self):
+        chunks = [{'text': 'x' * 40} for _ in range(5)]
+        self.assertEqual([len(batch) for batch, _ in corpus._batches(chunks, 2)], [2, 2, 1])
+        with mock.patch.object(corpus, 'MAX_BATCH_TOKENS', 25):
+            self.assertEqual([len(batch) for batch, _ in corpus._batches(chunks, 10)], [2, 2, 1])
+
+    def test_rate_limiter_lets_an_oversized_batch_through_alone(self):
+        limiter = corpus.RateLimiter(tokens_per_minute=10)
+        with mock.patch.object(corpus.time, 'sleep', side_effect=AssertionError('attente inattendue')):
+            limiter.acquire(100)
+
+
+class EmbedMissingTests(CorpusTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_source('Anxiety_out/Panic.txt', 'un deux trois quatre cinq six sept')
+        # Même texte dans deux sections : un seul appel
+        self.write_source('Anxiety_out/Copy.txt', 'un deux trois quatre cinq six sept')
+        self.write_source('Empty.txt', '   ')
+
+    def test_distinct_chunks_are_embedded_once_and_cached(self):
+        documents = self.plan()
+        self.assertEqual([document['relative_path'].as_posix() for document in documents],
+                         ['Anxiety_out/Copy.txt', 'Anxiety_out/Panic.txt'])
+        self.assertEqual(corpus.embed_missing(documents, self.service, self.cache, batch_size=1), 2)
+        self.assertEqual(sorted(text for call in self.service.calls for text in call),
+                         ['quatre cinq six sept', 'un deux trois quatre'])
+        # Reprise : tout est déjà dans le cache
+        self.assertEqual(corpus.embed_missing(documents, self.service, self.cache), 0)
+        self.assertEqual(len(self.service.calls), 2)
+
+    def test_failed_batches_are_retried(self):
+        service = FakeEmbeddingService(failures=2)
+        with mock.patch.object(corpus.time, 'sleep') as sleep, self.assertLogs('pathology_search.corpus', 'WARNING'):
+            self.assertEqual(corpus.embed_missing(self.plan(), service, self.cache, concurrency=1), 2)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_written_artifacts_are_indexed(self):
+        documents = self.plan()
+        corpus.embed_missing(documents, self.service, self.cache)
+        report = corpus.diff_corpus(documents, self.output, self.service.embedding_model_name, 4, 1)
+        self.assertEqual(corpus.write_corpus(documents, self.cache, self.output, self.service.embedding_model_name,
+                                             report, 4, 1), 2)
+        index = search_index.SearchIndex(self.output)
+        self.assertEqual([file_info['path'] for file_info in index.files], ['Anxiety_out/Copy', 'Anxiety_out/Panic'])
+        self.assertEqual(index.files[1]['location'], 'Anxiety_out > Panic')
+        self.assertEqual(index.chunks.shape, (4, 3))
+
+    def test_write_requires_embedded_chunks(self):
+        documents = self.plan()
+        report = corpus.diff_corpus(documents, self.output, self.service.embedding_model_name, 4, 1)
+        with self.assertRaises(ValueError):
+            corpus.write_corpus(documents, self.cache, self.output, self.service.embedding_model_name, report, 4, 1)
+
+
+class CompiledIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = Path(folder.name)
+        for path in ('Anxiety_out/Panic', 'Sleep_out/Insomnia'):
+            npy_file = self.folder / f'{path}.npy'
+            npy_file.parent.mkdir(parents=True, exist_ok=True)
+            np.save(npy_file, np.eye(2, 4, dtype=np.float32))
+            npy_file.with_suffix('.json').write_text(f'{{"source_file": "{path}.txt"}}', encoding='utf-8')
+
+    def test_compiled_index_is_ignored_once_stale(self):
+        built = search_index.build_compiled_index(self.folder)
+        loaded = search_index.load_compiled(self.folder)
+        self.assertEqual(loaded.files, built.files)
+        np.testing.assert_array_equal(loaded.chunks, built.chunks)
+
+        npy_file = self.folder / 'Sleep_out' / 'Insomnia.npy'
+        stat = npy_file.stat()
+        os.utime(npy_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertIsNone(search_index.load_compiled(self.folder))
+
+    def test_unreadable_compiled_index_is_ignored(self):
+        search_index.compiled_path(self.folder).write_bytes(b'corrompu')
+        self.assertIsNone(search_index.load_compiled(self.folder))
+        self.assertIsNone(search_index.load_compiled(self.folder / 'absent'))
+
+
+class IncrementalRebuildTests(CorpusTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_source('Anxiety_out/Panic.txt', 'un deux trois quatre cinq six sept')
+        self.write_source('Anxiety_out/Phobia.txt', 'peur des lieux ouverts')
+        self.write_source('Sleep_out/Insomnia.txt', 'réveils nocturnes fréquents')
+        self.build()
+        self.service.calls.clear()
+
+    def build(self):
+        documents = self.plan()
+        corpus.seed_cache(documents, self.output, self.cache, self.service.embedding_model_name)
+        report = corpus.diff_corpus(documents, self.output, self.service.embedding_model_name, 4, 1)
+        corpus.embed_missing(documents, self.service, self.cache)
+        corpus.write_corpus(documents, self.cache, self.output, self.service.embedding_model_name, report, 4, 1)
+        return report
+
+    def test_only_changed_chunks_are_embedded(self):
+        self.write_source('Anxiety_out/Panic.txt', 'un deux trois quatre cinq six huit')
+        self.write_source('Bipolar_out/Mania.txt', 'humeur expansive')
+        (self.source / 'Sleep_out' / 'Insomnia.txt').unlink()
+        report = self.build()
+        self.assertEqual(report, {
+            'added': ['Bipolar_out/Mania'], 'modified': ['Anxiety_out/Panic'],
+            'unchanged': ['Anxiety_out/Phobia'], 'orphans': ['Sleep_out/Insomnia'],
+        })
+        self.assertEqual(sorted(text for call in self.service.calls for text in call),
+                         ['humeur expansive', 'quatre cinq six huit'])
+        self.assertEqual(self.build(), {
+            'added': [], 'modified': [], 'unchanged': ['Anxiety_out/Panic', 'Anxiety_out/Phobia', 'Bipolar_out/Mania'],
+            'orphans': ['Sleep_out/Insomnia'],
+        })
+
+    def test_chunking_change_marks_sections_modified(self):
+        documents = corpus.plan_corpus(self.source, self.service.embedding_model_name, 3, 1)
+        report = corpus.diff_corpus(documents, self.output, self.service.embedding_model_name, 3, 1)
+        self.assertEqual(report['unchanged'], [])
+
+    def test_existing_vectors_are_adopted_into_new_cache(self):
+        self.cache.close()
+        (self.output / corpus.CACHE_FILE_NAME).unlink()
+        self.cache = corpus.EmbeddingCache(self.output / corpus.CACHE_FILE_NAME)
+        documents = self.plan()
+        self.assertEqual(corpus.seed_cache(documents, self.output, self.cache, self.service.embedding_model_name), 4)
+        self.assertEqual(corpus.embed_missing(documents, self.service, self.cache), 0)
+        # Autre modèle : rien n'est repris
+        self.assertEqual(corpus.seed_cache(documents, self.output, self.cache, 'autre-modele'), 0)
+
+    def test_original_files_without_hashes_are_matched_by_preview(self):
+        json_file = self.output / 'Anxiety_out' / 'Phobia.json'
+        metadata = json.loads(json_file.read_text(encoding='utf-8'))
+        for chunk in metadata['chunks']:
+            del chunk['content_hash']
+        json_file.write_text(json.dumps(metadata), encoding='utf-8')
+        cache = corpus.EmbeddingCache(self.output.parent / 'vide.sqlite3')
+        self.addCleanup(cache.close)
+        documents = [document for document in self.plan() if document['relative_path'].stem == 'Phobia']
+        self.assertEqual(corpus.seed_cache(documents, self.output, cache, self.service.embedding_model_name), 1)
+
+    def test_prune_removes_orphan_artifacts_only(self):
+        (self.output / 'Sleep_out' / 'Insomnia.html').write_text('<html></html>', encoding='utf-8')
+        corpus.remove_artifacts(self.output, ['Sleep_out/Insomnia'])
+        self.assertEqual(sorted(path.name for path in (self.output / 'Sleep_out').iterdir()), ['Insomnia.html'])
+
+    def test_patched_index_matches_full_rebuild(self):
+        previous = search_index.SearchIndex(self.output)
+        self.write_source('Anxiety_out/Phobia.txt', 'peur des espaces clos et des lieux ouverts')
+        self.write_source('Bipolar_out/Mania.txt', 'humeur expansive')
+        (self.source / 'Sleep_out' / 'Insomnia.txt').unlink()
+        report = self.build()
+        corpus.remove_artifacts(self.output, report['orphans'])
+
+        patched = previous.patched(set(report['added']) | set(report['modified']), report['orphans'])
+        rebuilt = search_index.SearchIndex(self.output)
+        self.assertEqual(patched.files, rebuilt.files)
+        self.assertEqual(patched.categories, rebuilt.categories)
+        self.assertEqual(patched.version, rebuilt.version)
+        np.testing.assert_allclose(patched.chunks, rebuilt.chunks)
@@ -0,0 +1,116 @@
+"""
+Critères diagnostiques structurés (criteria, /api/pathologies/criteria/).
+"""
+import os
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from .. import catalog, criteria
+from .factories import use_embeddings_folder
+
+
+PAGE_HTML = """
+<html><head><style>label { color: red; }</style></head><body>
+<h2 class="section-title">Critères diagnostiques</h2>
+<form id="formulaire">
+  <fieldset id="critereA">
+    <legend>Critère A –  Anxiété excessive</legend>
+    <p class="subtitle">Au moins trois symptômes</p>
+    <label><input type="checkbox" name="critereA" value="Agitation"> Agitation ou
+      sensation d'être survolté</label>
+    <label><input type="checkbox" name="critereA" value="Fatigabilité"> Fatigabilité</label>
+    <p>Chez l'enfant, un seul symptôme suffit.</p>
+  </fieldset>
+  <fieldset id="duree" class="hidden">
+    <legend>Durée</legend>
+    <label><input type="radio" name="duree" value="6 mois"> 6 mois</label>
+    <input type="text" name="precision" placeholder="Précisions">
+  </fieldset>
+  <fieldset id="vide"><legend>Sans élément</legend></fieldset>
+</form>
+<script>var label = '<label><input type="checkbox"></label>';</script>
+</body></html>
+"""
+
+
+class ExtractCriteriaTests(SimpleTestCase):
+
+    def setUp(self):
+        self.schema = criteria.extract_criteria(PAGE_HTML)
+
+    def test_sections_and_groups(self):
+        self.assertEqual(self.schema['schema_version'], criteria.SCHEMA_VERSION)
+        [section] = self.schema['sections']
+        self.assertEqual((section['id'], section['title']), ('formulaire', 'Critères diagnostiques'))
+        # Groupes sans élément ignorés
+        self.assertEqual([group['id'] for group in section['groups']], ['critereA', 'duree'])
+
+    def test_group_texts(self):
+        group = self.schema['sections'][0]['groups'][0]
+        self.assertEqual(group['legend'], 'Critère A – Anxiété excessive')
+        self.assertEqual(group['subtitle'], 'Au moins trois symptômes')
+        self.assertEqual(group['notes'], ["Chez l'enfant, un seul symptôme suffit."])
+        self.assertFalse(group['hidden'])
+        self.assertTrue(self.schema['sections'][0]['groups'][1]['hidden'])
+
+    def test_items(self):
+        agitation, fatigue = self.schema['sections'][0]['groups'][0]['items']
+        self.assertEqual(agitation, {
+            'id': 'critereA-0', 'type': 'checkbox', 'name': 'critereA',
+            'value': 'Agitation', 'label': "Agitation ou sensation d'être survolté",
+        })
+        # Valeur identique au libellé : omise
+        self.assertNotIn('value', fatigue)
+        radio, text = self.schema['sections'][0]['groups'][1]['items']
+        self.assertEqual(radio['type'], 'radio')
+        self.assertEqual((text['type'], text['label'], text['placeholder']), ('text', 'precision', 'Précisions'))
+
+    def test_scripts_are_ignored(self):
+        items = [item for section in self.schema['sections'] for group in section['groups'] for item in group['items']]
+        self.assertEqual(len(items), 4)
+
+    def test_form_data_from_selection(self):
+        selection = {'critereA-0': True, 'critereA-1': False, 'duree-0': True, 'duree-1': '  depuis 2022 ', 'inconnu': True}
+        self.assertEqual(criteria.form_data_from_selection(self.schema, selection), {
+            'Critère A – Anxiété excessive': ["Agitation ou sensation d'être survolté"],
+            'Durée': ['6 mois'],
+            'precision': 'depuis 2022',
+        })
+        self.assertEqual(criteria.form_data_from_selection(self.schema, None), {})
+
+
+class CriteriaFileTests(TestCase):
+
+    def setUp(self):
+        self.folder = use_embeddings_folder(self)
+        self.html_file = self.folder / 'Anxiety_out' / 'TAG.html'
+        self.html_file.parent.mkdir()
+        self.html_file.write_text(PAGE_HTML, encoding='utf-8')
+        catalog.reload_catalog()
+
+    def test_build_criteria_file_skips_up_to_date_schema(self):
+        self.assertTrue(criteria.build_criteria_file(self.html_file))
+        self.assertFalse(criteria.build_criteria_file(self.html_file))
+        self.assertTrue(criteria.build_criteria_file(self.html_file, force=True))
+        self.assertTrue(criteria.criteria_path(self.html_file).exists())
+
+    def test_stale_schema_file_is_not_used(self):
+        criteria.criteria_path(self.html_file).write_text('{"schema_version": 1, "sections": []}', encoding='utf-8')
+        stat = self.html_file.stat()
+        os.utime(criteria.criteria_path(self.html_file), (stat.st_atime, stat.st_mtime - 60))
+        self.assertTrue(criteria.has_items(criteria.get_criteria('Anxiety_out/TAG.html')))
+
+    def test_get_criteria_stays_inside_folder(self):
+        self.assertIsNone(criteria.get_criteria('../outside.html'))
+        self.assertIsNone(criteria.get_criteria('Anxiety_out/absente.html'))
+
+    def test_api(self):
+        url = reverse('pathology_search:get_pathology_criteria')
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'html_page': 'absente.html'}).status_code, 404)
+        response = self.client.get(url, {'html_page': 'Anxiety_out/TAG.html'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['criteria'], criteria.extract_criteria(PAGE_HTML))
+        self.assertEqual(self.client.get(url, {'html_page': 'Anxiety_out/TAG.html'},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
@@ -0,0 +1,117 @@
+"""
+Exports en flux des consultations et des patients (data_export, /api/export/...).
+"""
+import codecs
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import data_export, patient_import
+from ..models import Patient
+from .factories import make_consultation, make_medecin, make_patient
+
+
+def local_datetime(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+def csv_records(chunks):
+    content = b''.join(chunks).decode('utf-8')
+    return list(csv.DictReader(io.StringIO(content.lstrip('\ufeff'))))
+
+
+class ConsultationExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        patient = make_patient(nom='ALAMI', prenom='Omar', cin='AB123456')
+        medecin = make_medecin(nom='BERRADA', numero_ordre='MED-2024-001')
+        cls.february = make_consultation(patient, medecin, date_consultation=local_datetime(2024, 2, 29, 23, 30),
+                                         criteres_valides={'A': ['Humeur dépressive']})
+        cls.march = make_consultation(patient, date_consultation=local_datetime(2024, 3, 1, 0, 15), statut='en_cours',
+                                      description_clinique='Ligne 1\nLigne 2, avec virgule')
+        cls.april = make_consultation(patient, medecin, date_consultation=local_datetime(2024, 4, 1, 9, 0))
+
+    def test_csv(self):
+        chunks = list(data_export.export_consultations(data_export.CSV))
+        self.assertTrue(chunks[0].startswith(codecs.BOM_UTF8))
+        records = csv_records(chunks)
+        self.assertEqual([record['id'] for record in records],
+                         [str(self.february.id), str(self.march.id), str(self.april.id)])
+        self.assertEqual(list(records[0]), [name for name, _ in data_export.CONSULTATION_COLUMNS])
+        first = records[0]
+        self.assertEqual((first['patient_nom'], first['patient_cin'], first['medecin_numero_ordre']),
+                         ('ALAMI', 'AB123456', 'MED-2024-001'))
+        self.assertEqual(json.loads(first['criteres_valides']), {'A': ['Humeur dépressive']})
+        self.assertEqual(datetime.fromisoformat(first['date_consultation']), self.february.date_consultation)
+        self.assertEqual((records[1]['medecin_id'], records[1]['description_clinique']),
+                         ('', 'Ligne 1\nLigne 2, avec virgule'))
+
+    def test_ndjson_and_filters(self):
+        content = b''.join(data_export.export_consultations(
+            data_export.NDJSON, date_from=date(2024, 3, 1), date_to=date(2024, 3, 31),
+        ))
+        [line] = content.decode('utf-8').splitlines()
+        record = json.loads(line)
+        self.assertEqual((record['id'], record['statut'], record['medecin_id']), (str(self.march.id), 'en_cours', None))
+        records = csv_records(data_export.export_consultations(data_export.CSV, statut='valide'))
+        self.assertEqual(len(records), 2)
+
+    @override_settings(EXPORT_FLUSH_BYTES=1, EXPORT_CHUNK_SIZE=1)
+    def test_rows_are_flushed_as_they_are_encoded(self):
+        chunks = list(data_export.export_consultations(data_export.NDJSON))
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(chunk.endswith(b'\n') for chunk in chunks))
+
+
+class PatientExportTests(TestCase):
+
+    def test_legacy_and_new_columns_are_merged(self):
+        make_patient(patient_identifier=None, numero_dossier='PAT-001', last_name=None, first_name=None,
+                     nom='ALAMI', prenom='Omar',
+                     date_naissance=date(1975, 1, 2), has_insurance=True)
+        [record] = csv_records(data_export.export_patients(data_export.CSV))
+        self.assertEqual(
+            (record['patient_identifier'], record['last_name'], record['first_name'], record['birth_date'],
+             record['has_insurance']),
+            ('PAT-001', 'ALAMI', 'Omar', '1975-01-02', 'true'),
+        )
+
+    def test_export_can_be_reimported(self):
+        make_patient(last_name='ALAMI', first_name='Omar', cin='AB123456', birth_date=date(1980, 5, 17),
+                     gender='M', city='Rabat', has_insurance=True, insurance_number='CNSS-1')
+        make_patient(last_name='TAZI', first_name='Nadia', mobile_number='0612345678')
+        fields = ('patient_identifier', 'last_name', 'first_name', 'cin', 'birth_date', 'gender', 'city',
+                  'mobile_number', 'has_insurance', 'insurance_number')
+        before = list(Patient.objects.order_by('id').values_list(*fields))
+        for fmt in data_export.FORMATS:
+            with self.subTest(fmt=fmt):
+                content = b''.join(data_export.export_patients(fmt))
+                Patient.objects.all().delete()
+                report = patient_import.import_patients(io.BytesIO(content), fmt, patient_import.ImportReport())
+                self.assertEqual((report.created, report.rejected), (2, 0))
+                self.assertEqual(list(Patient.objects.order_by('id').values_list(*fields)), before)
+
+
+class ExportViewTests(TestCase):
+
+    def test_streamed_attachment(self):
+        make_consultation(make_patient())
+        response = self.client.get(reverse('pathology_search:export_consultations'), {'format': 'ndjson'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], data_export.CONTENT_TYPES[data_export.NDJSON])
+        self.assertRegex(response['Content-Disposition'], r'attachment; filename="consultations_\d{8}_\d{6}\.ndjson"')
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+    def test_bad_requests(self):
+        for name in ('export_consultations', 'export_patients'):
+            for params in ({'format': 'xlsx'}, {'date_from': '2024-13-01'}, {'date_to': 'hier'}):
+                with self.subTest(name=name, params=params):
+                    response = self.client.get(reverse(f'pathology_search:{name}'), params)
+                    self.assertEqual(response.status_code, 400)
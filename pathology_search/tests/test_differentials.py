@@ -0,0 +1,128 @@
+"""
+Matrice de similarité entre pathologies et diagnostics différentiels (differentials, /api/pathologies/differentials/).
+"""
+import io
+import os
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import catalog, differentials, search_index
+from .factories import use_embeddings_folder
+from .test_search_index import write_embeddings
+
+
+class SimilarityMatrixTests(TestCase):
+
+    def setUp(self):
+        self.folder = use_embeddings_folder(self)
+        self.addCleanup(differentials._matrices.pop, str(self.folder), None)
+        # Chunks de normes différentes : seule leur direction compte
+        write_embeddings(self.folder, 'Anxiety_out/Panic', [[2, 0, 0], [0, 0.5, 0]])
+        write_embeddings(self.folder, 'Anxiety_out/Phobia', [[1, 0.9, 0]])
+        write_embeddings(self.folder, 'Depressive_out/Major', [[0, 0, 3]])
+        write_embeddings(self.folder, 'Sleep_out/Insomnia', [[0, 1, 1]])
+        # Ignorés : autre dimension, métadonnées absentes
+        write_embeddings(self.folder, 'Sleep_out/Other', [[1, 0]])
+        np.save(self.folder / 'Sleep_out' / 'Orphan.npy', np.ones((1, 3), dtype=np.float32))
+
+    def test_pathology_vector_is_mean_of_normalized_chunks(self):
+        keys, vectors = differentials.pathology_embeddings(self.folder)
+        self.assertEqual(keys, ['Anxiety_out/Panic.json', 'Anxiety_out/Phobia.json', 'Depressive_out/Major.json',
+                                'Sleep_out/Insomnia.json'])
+        np.testing.assert_allclose(vectors[0], [np.sqrt(0.5), np.sqrt(0.5), 0], rtol=1e-6)
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-6)
+
+    def test_nearest_excludes_itself_and_is_sorted(self):
+        matrix = differentials.SimilarityMatrix.build(self.folder)
+        nearest = matrix.nearest('Anxiety_out/Panic.json', limit=10)
+        self.assertEqual([key for key, _ in nearest],
+                         ['Anxiety_out/Phobia.json', 'Sleep_out/Insomnia.json', 'Depressive_out/Major.json'])
+        similarities = [similarity for _, similarity in nearest]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+        self.assertAlmostEqual(similarities[2], 0.0, places=6)
+        self.assertEqual(len(matrix.nearest('Anxiety_out/Panic.json', limit=1)), 1)
+        self.assertEqual(matrix.nearest('Absent.json'), [])
+
+    def test_matrix_from_search_index_matches_files(self):
+        built = differentials.SimilarityMatrix.build(self.folder)
+        from_index = differentials.SimilarityMatrix.from_index(search_index.SearchIndex(self.folder))
+        self.assertEqual((from_index.keys, from_index.version), (built.keys, built.version))
+        np.testing.assert_allclose(from_index.matrix, built.matrix, atol=1e-6)
+        np.testing.assert_array_equal(from_index.neighbours, built.neighbours)
+
+    def test_saved_matrix_is_used_while_up_to_date(self):
+        saved = differentials.build_matrix_file(self.folder)
+        loaded = differentials.SimilarityMatrix.load(differentials.matrix_path(self.folder))
+        self.assertEqual((loaded.keys, loaded.version), (saved.keys, saved.version))
+        np.testing.assert_array_equal(loaded.neighbours, saved.neighbours)
+
+        # Fichier marqué : prouve qu'il est relu plutôt que recalculé
+        saved.matrix[:] = 0.5
+        saved.save(differentials.matrix_path(self.folder))
+        self.assertEqual(differentials.reload_matrix(self.folder).matrix[0, 1], 0.5)
+
+        npy_file = self.folder / 'Depressive_out' / 'Major.npy'
+        stat = npy_file.stat()
+        os.utime(npy_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        rebuilt = differentials.reload_matrix(self.folder)
+        self.assertNotEqual(rebuilt.matrix[0, 1], 0.5)
+        self.assertEqual(rebuilt.version, search_index.embeddings_version(self.folder))
+
+    def test_corrupt_matrix_file_is_rebuilt(self):
+        differentials.matrix_path(self.folder).write_bytes(b'pas un npz')
+        matrix = differentials.get_matrix(self.folder)
+        self.assertEqual(len(matrix.keys), 4)
+        self.assertIs(differentials.get_matrix(self.folder), matrix)
+
+    def test_single_pathology_has_no_neighbours(self):
+        matrix = differentials.SimilarityMatrix.from_vectors(['A.json'], np.ones((1, 3), dtype=np.float32), 'v')
+        self.assertEqual(matrix.nearest('A.json'), [])
+
+    def test_differentials_carry_catalog_fields(self):
+        catalog.reload_catalog()
+        entry = differentials.find_entry(self.folder, file_name='Panic.txt')
+        self.assertEqual(entry['json_path'], 'Anxiety_out/Panic.json')
+        self.assertIs(differentials.find_entry(self.folder, file_name='Absent.txt', html_page='Anxiety_out/Panic.html'),
+                      entry)
+        [phobia, insomnia] = differentials.get_differentials(self.folder, entry, limit=2)
+        self.assertEqual((phobia['file_name'], phobia['html_page']), ('Phobia.txt', 'Anxiety_out/Phobia.html'))
+        self.assertEqual(phobia['similarity_percent'], round(phobia['similarity'] * 100, 1))
+        self.assertEqual(insomnia['file_name'], 'Insomnia.txt')
+        self.assertEqual(differentials.get_differentials(self.folder, None), [])
+
+    def test_command_writes_matrix_file(self):
+        call_command('build_similarity_matrix', embedding_model=['openai-ada'], stdout=io.StringIO())
+        matrix = differentials.SimilarityMatrix.load(differentials.matrix_path(self.folder))
+        self.assertEqual(matrix.version, search_index.embeddings_version(self.folder))
+
+
+class DifferentialsViewTests(TestCase):
+
+    url = reverse('pathology_search:get_pathology_differentials')
+
+    def setUp(self):
+        self.folder = use_embeddings_folder(self)
+        self.addCleanup(differentials._matrices.pop, str(self.folder), None)
+        write_embeddings(self.folder, 'Anxiety_out/Panic', [[1, 0]])
+        write_embeddings(self.folder, 'Anxiety_out/Phobia', [[1, 1]])
+        write_embeddings(self.folder, 'Depressive_out/Major', [[0, 1]])
+        catalog.reload_catalog()
+
+    def test_response(self):
+        response = self.client.get(self.url, {'file_name': 'Panic.txt', 'limit': 1})
+        data = response.json()
+        self.assertEqual(data['pathology']['html_page'], 'Anxiety_out/Panic.html')
+        self.assertEqual([differential['file_name'] for differential in data['differentials']], ['Phobia.txt'])
+        self.assertEqual(self.client.get(self.url, {'file_name': 'Panic.txt', 'limit': 1},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # limit borné au nombre de voisins conservés
+        data = self.client.get(self.url, {'html_page': 'Anxiety_out/Panic.html', 'limit': 100}).json()
+        self.assertEqual(len(data['differentials']), 2)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'file_name': 'Panic.txt', 'limit': 'cinq'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'name': 'Schizophrénie'}).status_code, 404)
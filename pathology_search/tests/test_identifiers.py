@@ -0,0 +1,68 @@
+"""
+Attribution des identifiants patients et médecins (identifiers).
+"""
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import identifiers
+from ..models import IdentifierCounter
+from .factories import make_medecin, make_patient
+
+
+class AllocateTests(TestCase):
+
+    def test_consecutive_numbers(self):
+        self.assertEqual(identifiers.next_identifier(identifiers.PATIENT, year=2030), 'EE-2030-001')
+        self.assertEqual(identifiers.allocate(identifiers.PATIENT, 3, year=2030),
+                         ['EE-2030-002', 'EE-2030-003', 'EE-2030-004'])
+        self.assertEqual(identifiers.allocate(identifiers.PATIENT, 0, year=2030), [])
+        self.assertEqual(IdentifierCounter.objects.get(prefixe='EE-2030').dernier_numero, 4)
+
+    def test_one_counter_per_kind_and_year(self):
+        identifiers.allocate(identifiers.PATIENT, 5, year=2030)
+        self.assertEqual(identifiers.next_identifier(identifiers.PATIENT, year=2031), 'EE-2031-001')
+        self.assertEqual(identifiers.next_identifier(identifiers.MEDECIN, year=2030), 'MED-2030-001')
+
+    def test_new_counter_starts_after_existing_identifiers(self):
+        make_patient(patient_identifier='EE-2030-999')
+        make_patient(patient_identifier='EE-2030-1000')
+        # Ancien numéro de dossier (colonne historique) et préfixe voisin
+        make_patient(patient_identifier='PAT-X', numero_dossier='EE-2030-1500')
+        make_patient(patient_identifier='EE-2031-9000')
+        self.assertEqual(identifiers.next_identifier(identifiers.PATIENT, year=2030), 'EE-2030-1501')
+
+    def test_physician_counter_reads_order_numbers(self):
+        make_medecin(numero_ordre='MED-2030-042')
+        self.assertEqual(identifiers.next_identifier(identifiers.MEDECIN, year=2030), 'MED-2030-043')
+
+
+class ReserveTests(TestCase):
+
+    def test_reserve_moves_counter_forward_only(self):
+        identifiers.allocate(identifiers.PATIENT, 2, year=2030)
+        identifiers.reserve(identifiers.PATIENT, 'EE-2030-050')
+        self.assertEqual(identifiers.next_identifier(identifiers.PATIENT, year=2030), 'EE-2030-051')
+        identifiers.reserve(identifiers.PATIENT, 'EE-2030-010')
+        self.assertEqual(identifiers.next_identifier(identifiers.PATIENT, year=2030), 'EE-2030-052')
+
+    def test_reserve_creates_missing_counter(self):
+        identifiers.reserve(identifiers.PATIENT, 'EE-2030-007')
+        self.assertEqual(identifiers.next_identifier(identifiers.PATIENT, year=2030), 'EE-2030-008')
+
+    def test_foreign_or_malformed_identifiers_are_ignored(self):
+        for identifier in ('MED-2030-050', 'EE-30-050', 'PAT-12', '', None):
+            with self.subTest(identifier=identifier):
+                identifiers.reserve(identifiers.PATIENT, identifier)
+        self.assertFalse(IdentifierCounter.objects.exists())
+
+    def test_manual_identifier_at_creation_is_reserved(self):
+        prefix = identifiers.counter_prefix(identifiers.PATIENT)
+        response = self.client.post(
+            reverse('pathology_search:create_patient_submit'),
+            json.dumps({'patient_identifier': f'{prefix}-120', 'last_name': 'Chraibi', 'first_name': 'Amine'}),
+            content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(identifiers.next_identifier(identifiers.PATIENT), f'{prefix}-121')
@@ -0,0 +1,159 @@
+"""
+Test de charge du parcours clinique (manage.py loadtest) contre un serveur HTTP simulé.
+"""
+import io
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from ..management.commands import loadtest
+
+
+CSRF_TOKEN = 'jeton-csrf'
+REPORT_ID = '3f2b8c1e-7d4a-4e9b-9c1f-2a6d5e8b7c10'
+
+
+class FakeClinicHandler(BaseHTTPRequestHandler):
+    """Réponses minimales du parcours ; les POST exigent le cookie et l'en-tête CSRF."""
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        if self.path == '/':
+            self.reply(200, b'<html></html>', [('Set-Cookie', f'csrftoken={CSRF_TOKEN}; Path=/')])
+        elif self.path.startswith('/diagnosis/'):
+            self.reply(200, f'<a href="/print/{REPORT_ID}/">Imprimer</a>'.encode('utf-8'))
+        elif self.path in ('/results-selection/', '/validate/?index=1', f'/print/{REPORT_ID}/'):
+            self.reply(200, b'ok')
+        else:
+            self.reply(404)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(('POST', self.path))
+        self.server.payloads.append(payload)
+        if self.headers.get('X-CSRFToken') != CSRF_TOKEN or f'csrftoken={CSRF_TOKEN}' not in self.headers.get('Cookie', ''):
+            self.reply(403)
+        elif self.path == '/search/':
+            self.reply(self.server.search_status, b'{"success": true}')
+        elif self.path == '/validate/action/':
+            self.reply(200, json.dumps({'success': True, 'diagnosis_id': 'diag 1'}).encode('utf-8'))
+        else:
+            self.reply(404)
+
+
+class LoadTestTestCase(SimpleTestCase):
+
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeClinicHandler)
+        server.requests, server.payloads, server.search_status = [], [], 200
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        self.base_url = f'http://127.0.0.1:{server.server_address[1]}/'
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = Path(folder.name)
+
+    def write_scenarios(self, *lines):
+        path = self.folder / 'scenarios.ndjson'
+        path.write_text('\n'.join(lines), encoding='utf-8')
+        return str(path)
+
+
+class LoadTestStatsTests(SimpleTestCase):
+
+    def test_summary_per_endpoint(self):
+        stats = loadtest.LoadTestStats()
+        for i, elapsed in enumerate((0.4, 0.1, 0.3, 0.2)):
+            stats.record('/search/', elapsed, ok=i != 3, size=100)
+        summary = stats.summary(wall_time=2.0)['/search/']
+        self.assertEqual((summary['requests'], summary['errors'], summary['error_rate']), (4, 1, 0.25))
+        self.assertAlmostEqual(summary['throughput_rps'], 2.0)
+        self.assertAlmostEqual(summary['p50_ms'], 250.0)
+        self.assertAlmostEqual(summary['p90_ms'], 370.0)
+        self.assertAlmostEqual(summary['max_ms'], 400.0)
+        self.assertEqual(summary['avg_bytes'], 100)
+
+    def test_percentile_edges(self):
+        self.assertEqual(loadtest.LoadTestStats._percentile([], 50), 0.0)
+        self.assertEqual(loadtest.LoadTestStats._percentile([0.5], 99), 0.5)
+
+
+class LoadScenariosTests(LoadTestTestCase):
+
+    def test_defaults_are_merged_and_comments_skipped(self):
+        path = self.write_scenarios('# parcours', '', '{"query": "Insomnie", "top_k": 3, "print": false}')
+        [scenario] = loadtest.load_scenarios(path)
+        self.assertEqual(scenario, {**loadtest.DEFAULT_SCENARIO, 'query': 'Insomnie', 'top_k': 3, 'print': False})
+
+    def test_invalid_lines(self):
+        for lines, message in ((('{"query": "Insomnie"}', '{'), 'Ligne 2 invalide'),
+                               (('{"top_k": 3}',), "Ligne 1: le champ 'query' est obligatoire")):
+            with self.subTest(lines=lines):
+                with self.assertRaisesMessage(CommandError, message):
+                    loadtest.load_scenarios(self.write_scenarios(*lines))
+
+
+class RunScenarioTests(LoadTestTestCase):
+
+    scenario = {**loadtest.DEFAULT_SCENARIO, 'patient_id': 7, 'validate_index': 1, 'form_data': {'A': ['Peur']}}
+
+    def test_full_workflow_with_csrf(self):
+        stats = loadtest.LoadTestStats()
+        self.assertTrue(loadtest.run_scenario(self.base_url, self.scenario, stats, timeout=5))
+        self.assertEqual(self.server.requests, [
+            ('GET', '/'), ('POST', '/search/'), ('GET', '/results-selection/'), ('GET', '/validate/?index=1'),
+            ('POST', '/validate/action/'), ('GET', '/diagnosis/diag%201/'), ('GET', f'/print/{REPORT_ID}/'),
+        ])
+        search, action = self.server.payloads
+        self.assertEqual((search['patient_id'], search['top_k'], search['use_validation']), (7, 5, True))
+        self.assertEqual((action['current_index'], action['form_data']), (1, {'A': ['Peur']}))
+        self.assertEqual(sorted(stats.latencies), ['/', '/diagnosis/<id>/', '/print/<uuid>/', '/results-selection/',
+                                                   '/search/', '/validate/', '/validate/action/'])
+        self.assertEqual(sum(stats.errors.values()), 0)
+
+    def test_failed_step_stops_the_workflow(self):
+        self.server.search_status = 500
+        stats = loadtest.LoadTestStats()
+        self.assertFalse(loadtest.run_scenario(self.base_url, self.scenario, stats, timeout=5))
+        self.assertEqual(self.server.requests, [('GET', '/'), ('POST', '/search/')])
+        self.assertEqual(dict(stats.errors), {'/search/': 1})
+
+    def test_unreachable_server_is_an_error(self):
+        self.server.shutdown()
+        self.server.server_close()
+        stats = loadtest.LoadTestStats()
+        self.assertFalse(loadtest.run_scenario(self.base_url, self.scenario, stats, timeout=1))
+        self.assertEqual(dict(stats.errors), {'/': 1, '/search/': 1})
+
+
+class LoadTestCommandTests(LoadTestTestCase):
+
+    def test_json_report(self):
+        scenarios = self.write_scenarios('{"query": "Insomnie", "validate_index": 1}')
+        report_path = self.folder / 'rapport.json'
+        out = io.StringIO()
+        call_command('loadtest', base_url=self.base_url, scenarios=scenarios, concurrency=2, iterations=3,
+                     timeout=5, json_output=str(report_path), stdout=out)
+        self.assertIn('Parcours terminés: 3/3 (échecs: 0)', out.getvalue())
+        report = json.loads(report_path.read_text(encoding='utf-8'))
+        self.assertEqual((report['completed'], report['failed'], report['concurrency']), (3, 0, 2))
+        self.assertEqual(report['endpoints']['/search/']['requests'], 3)
+        self.assertEqual(report['endpoints']['/print/<uuid>/']['errors'], 0)
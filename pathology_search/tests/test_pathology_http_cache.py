@@ -0,0 +1,104 @@
+"""
+Cache HTTP du catalogue et des pages de pathologies : ETag, 304, variantes précompressées.
+"""
+import gzip
+import json
+import os
+
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from .. import catalog, pathology_pages
+from ..views import _accepted_encodings
+from .factories import use_embeddings_folder
+
+
+PAGE_HTML = '<html><body><h1>Trouble anxieux généralisé</h1></body></html>'
+HTML_PAGE = 'Anxiety_Disorders_out/Trouble_anxieux.html'
+
+
+class AcceptEncodingTests(TestCase):
+
+    def accepted(self, header):
+        return _accepted_encodings(RequestFactory().get('/', HTTP_ACCEPT_ENCODING=header))
+
+    def test_tokens_and_quality(self):
+        self.assertEqual(self.accepted('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(self.accepted('GZIP;q=0.5'), {'gzip'})
+        self.assertEqual(self.accepted(''), set())
+
+    def test_zero_or_invalid_quality_refuses_encoding(self):
+        self.assertEqual(self.accepted('gzip, br;q=0'), {'gzip'})
+        self.assertEqual(self.accepted('br;q=0.0, gzip;q=0.000'), set())
+        self.assertEqual(self.accepted('gzip;q=abc'), set())
+
+
+class PathologyCacheTests(TestCase):
+
+    def setUp(self):
+        self.folder = use_embeddings_folder(self)
+        self.html_file = self.folder / HTML_PAGE
+        self.html_file.parent.mkdir()
+        self.html_file.write_text(PAGE_HTML, encoding='utf-8')
+        (self.folder / 'Anxiety_Disorders_out' / 'Trouble_anxieux.json').write_text(json.dumps({
+            'source_file': 'Trouble_anxieux.txt',
+            'html_page': HTML_PAGE,
+            'hierarchy': {'parsed_name': 'Trouble anxieux généralisé'},
+        }), encoding='utf-8')
+        self.gzip_file = self.folder / (HTML_PAGE + '.gz')
+        self.gzip_file.write_bytes(gzip.compress(PAGE_HTML.encode('utf-8')))
+        catalog.reload_catalog()
+        self.url = reverse('pathology_search:view_pathology', args=[HTML_PAGE])
+
+    def test_precompressed_variant_is_served(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode('utf-8'), PAGE_HTML)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_identity_without_accepted_encoding(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'), PAGE_HTML)
+
+    def test_stale_variant_is_ignored(self):
+        stat = self.html_file.stat()
+        os.utime(self.gzip_file, (stat.st_atime, stat.st_mtime - 60))
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_etag_depends_on_encoding(self):
+        gzip_etag = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        identity_etag = self.client.get(self.url, HTTP_ACCEPT_ENCODING='identity')['ETag']
+        self.assertNotEqual(gzip_etag, identity_etag)
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzip_etag)
+        self.assertEqual(response.status_code, 304)
+        # Le corps identity ne doit pas être validé par l'ETag de la variante gzip
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='identity', HTTP_IF_NONE_MATCH=gzip_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_validation_mode_injects_buttons_without_precompressed_variant(self):
+        response = self.client.get(self.url, {'mode': 'validation'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        content = b''.join(response.streaming_content)
+        self.assertIn(b'topValidationButtons', content)
+        self.assertIn(pathology_pages.COMMUNICATION_SCRIPT, content)
+        plain_etag = self.client.get(self.url, HTTP_ACCEPT_ENCODING='identity')['ETag']
+        self.assertNotEqual(response['ETag'], plain_etag)
+
+    def test_unknown_page_is_not_found(self):
+        response = self.client.get(reverse('pathology_search:view_pathology', args=['absente.html']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_pathology_list_revalidates(self):
+        url = reverse('pathology_search:get_all_pathologies')
+        response = self.client.get(url)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        # Nouvelle page : nouvelle version du catalogue
+        (self.folder / 'Anxiety_Disorders_out' / 'Phobie.html').write_text(PAGE_HTML, encoding='utf-8')
+        catalog.reload_catalog()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
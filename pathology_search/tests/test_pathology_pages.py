@@ -0,0 +1,119 @@
+"""
+Pages de pathologies préparées en mémoire pour le mode validation (pathology_pages, /pathology/<page>).
+"""
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import catalog, pathology_pages
+from .factories import use_embeddings_folder
+
+
+PAGE_HTML = '<html><head><title>TAG</title></head><body class="page">\n<h1>Trouble anxieux généralisé</h1>\n</body></html>'
+HTML_PAGE = 'Anxiety_Disorders_out/Trouble_anxieux.html'
+
+
+def injected(page_html):
+    """Injection de référence : boutons après <body ...>, script avant </body>."""
+    body_end = page_html.index('>', page_html.lower().index('<body')) + 1
+    body_close = page_html.index('</body>')
+    return (page_html[:body_end].encode('utf-8') + pathology_pages.TOP_BUTTONS_HTML
+            + page_html[body_end:body_close].encode('utf-8') + pathology_pages.COMMUNICATION_SCRIPT
+            + page_html[body_close:].encode('utf-8'))
+
+
+class PreparedPageTests(TestCase):
+
+    def setUp(self):
+        self.folder = use_embeddings_folder(self)
+
+    def prepare(self, content):
+        path = self.folder / 'page.html'
+        path.write_text(content, encoding='utf-8')
+        return pathology_pages.PreparedPage(str(path))
+
+    def test_plain_page_is_sent_unchanged(self):
+        page = self.prepare(PAGE_HTML)
+        self.assertEqual(b''.join(page.chunks()), PAGE_HTML.encode('utf-8'))
+
+    def test_validation_chunks_inject_buttons_and_script(self):
+        page = self.prepare(PAGE_HTML)
+        self.assertEqual(b''.join(page.chunks(validation=True)), injected(PAGE_HTML))
+
+    def test_offsets_are_in_bytes(self):
+        # Caractères multi-octets avant </body>
+        page = self.prepare(PAGE_HTML.replace('TAG', 'Anxiété'))
+        self.assertEqual(b''.join(page.chunks(validation=True)), injected(PAGE_HTML.replace('TAG', 'Anxiété')))
+        self.assertEqual(page.content[page.body_close_start:], b'</body></html>')
+
+    def test_uppercase_body_tag(self):
+        content = '<HTML><BODY onload="init()"><p>Texte</p></body></HTML>'
+        page = self.prepare(content)
+        self.assertEqual(page.content[:page.body_open_end], b'<HTML><BODY onload="init()">')
+        self.assertEqual(b''.join(page.chunks(validation=True)), injected(content))
+
+    def test_missing_body_tags(self):
+        page = self.prepare('<html><body><p>Tronquée')
+        self.assertEqual(b''.join(page.chunks(validation=True)),
+                         b'<html><body>' + pathology_pages.TOP_BUTTONS_HTML + '<p>Tronquée'.encode('utf-8'))
+        page = self.prepare('<p>Fragment</p>')
+        self.assertEqual(page.chunks(validation=True)[:2], [b'', pathology_pages.TOP_BUTTONS_HTML])
+
+
+class GetPageTests(TestCase):
+
+    def setUp(self):
+        self.folder = use_embeddings_folder(self)
+        self.html_file = self.folder / HTML_PAGE
+        self.html_file.parent.mkdir()
+        self.html_file.write_text(PAGE_HTML, encoding='utf-8')
+        catalog.reload_catalog()
+
+    def test_page_is_prepared_once_per_index_version(self):
+        page = pathology_pages.get_page(HTML_PAGE)
+        self.assertIs(pathology_pages.get_page(HTML_PAGE), page)
+        self.html_file.write_text(PAGE_HTML.replace('généralisé', 'sévère'), encoding='utf-8')
+        self.assertIs(pathology_pages.get_page(HTML_PAGE), page)
+        catalog.reload_catalog()
+        reloaded = pathology_pages.get_page(HTML_PAGE)
+        self.assertIsNot(reloaded, page)
+        self.assertIn('sévère'.encode('utf-8'), reloaded.content)
+
+    def test_missing_or_outside_pages(self):
+        self.assertIsNone(pathology_pages.get_page('Anxiety_Disorders_out/Absente.html'))
+        self.assertIsNone(pathology_pages.get_page('Anxiety_Disorders_out'))
+        # Fichier voisin dont le nom commence par celui du dossier d'embeddings
+        sibling = self.folder.parent / f'{self.folder.name}-secret.html'
+        sibling.write_text('secret', encoding='utf-8')
+        self.addCleanup(sibling.unlink)
+        self.assertIsNone(pathology_pages.get_page(f'../{sibling.name}'))
+        self.assertIsNone(pathology_pages.get_page(f'{HTML_PAGE}/../../../{sibling.name}'))
+
+
+class ViewPathologyTests(TestCase):
+
+    def setUp(self):
+        self.folder = use_embeddings_folder(self)
+        html_file = self.folder / HTML_PAGE
+        html_file.parent.mkdir()
+        html_file.write_text(PAGE_HTML, encoding='utf-8')
+        (self.folder / 'Anxiety_Disorders_out' / 'Trouble_anxieux.json').write_text(json.dumps({
+            'source_file': 'Trouble_anxieux.txt', 'html_page': HTML_PAGE,
+        }), encoding='utf-8')
+        catalog.reload_catalog()
+        self.url = reverse('pathology_search:view_pathology', args=[HTML_PAGE])
+
+    def content(self, response):
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        return body
+
+    def test_plain_and_validation_modes(self):
+        self.assertEqual(self.content(self.client.get(self.url)), PAGE_HTML.encode('utf-8'))
+        self.assertEqual(self.content(self.client.get(self.url, {'mode': 'validation'})), injected(PAGE_HTML))
+
+    def test_validation_referer_injects_buttons(self):
+        response = self.client.get(self.url, HTTP_REFERER='http://testserver/validate/?index=0')
+        self.assertEqual(self.content(response), injected(PAGE_HTML))
+        self.assertIn('Referer', response['Vary'])
@@ -0,0 +1,89 @@
+"""
+Annuaire des patients paginé par clé (patient_directory, /api/patients/).
+"""
+from datetime import date
+
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import patient_directory
+from ..utils import encode_cursor
+from .factories import make_patient
+
+
+def make_named_patient(nom, prenom, **fields):
+    return make_patient(nom=nom, prenom=prenom, last_name=nom, first_name=prenom, **fields)
+
+
+class ListPatientsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alami_omar = [make_named_patient('ALAMI', 'Omar') for _ in range(3)]
+        cls.alami_sara = make_named_patient('ALAMI', 'Sara', cin='AB123456')
+        cls.bennani = make_named_patient('BENNANI', 'Karim', telephone='0612345678')
+        cls.chraibi = make_named_patient('CHRAIBI', None, patient_identifier='EE-2024-007')
+        # Ancienne fiche sans nom historique : en tête (nom vide)
+        cls.legacy = make_patient(nom=None, prenom=None, last_name='ZIANI', first_name='Nadia',
+                                  birth_date=date(1980, 5, 17), mobile_number='0700000000')
+
+    def ids(self, **params):
+        return [patient['id'] for patient in patient_directory.list_patients(**params)[0]]
+
+    def test_order_is_name_first_name_id(self):
+        self.assertEqual(self.ids(limit=10), [
+            self.legacy.id, *sorted(patient.id for patient in self.alami_omar),
+            self.alami_sara.id, self.bennani.id, self.chraibi.id,
+        ])
+
+    def test_keyset_pages_have_no_duplicates_or_gaps(self):
+        for limit in (1, 2, 3):
+            with self.subTest(limit=limit):
+                seen, cursor = [], None
+                while True:
+                    patients, cursor = patient_directory.list_patients(cursor=cursor, limit=limit)
+                    self.assertLessEqual(len(patients), limit)
+                    seen.extend(patient['id'] for patient in patients)
+                    if cursor is None:
+                        break
+                self.assertEqual(seen, self.ids(limit=10))
+
+    def test_every_term_must_prefix_a_column(self):
+        self.assertEqual(self.ids(query='alami sa'), [self.alami_sara.id])
+        self.assertEqual(self.ids(query='ab1234'), [self.alami_sara.id])
+        self.assertEqual(self.ids(query='ee-2024'), [self.chraibi.id])
+        self.assertEqual(self.ids(query='lami'), [])
+
+    def test_phone_digits_match_formatted_terms(self):
+        self.assertEqual(self.ids(query='06-12-34'), [self.bennani.id])
+        self.assertEqual(self.ids(query='07 00'), [])
+        self.assertEqual(self.ids(query='0700'), [self.legacy.id])
+
+    def test_serialize_falls_back_to_new_fields(self):
+        [legacy] = patient_directory.list_patients(query='0700')[0]
+        self.assertEqual(legacy['nom_complet'], 'Nadia ZIANI')
+        self.assertEqual(legacy['date_naissance'], '1980-05-17')
+        self.assertEqual(legacy['telephone'], '0700000000')
+        self.assertEqual(legacy['numero_dossier'], self.legacy.patient_identifier)
+
+
+class GetPatientsViewTests(TestCase):
+
+    url = reverse('pathology_search:get_patients')
+
+    def test_pages(self):
+        for nom in ('ALAMI', 'BENNANI', 'CHRAIBI'):
+            make_named_patient(nom, 'Omar')
+        data = self.client.get(self.url, {'limit': 2}).json()
+        self.assertTrue(data['has_more'])
+        self.assertEqual([patient['nom'] for patient in data['patients']], ['ALAMI', 'BENNANI'])
+        data = self.client.get(self.url, {'limit': 2, 'cursor': data['next_cursor']}).json()
+        self.assertEqual(([patient['nom'] for patient in data['patients']], data['has_more']), (['CHRAIBI'], False))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {'limit': 'dix'}).status_code, 400)
+        for cursor in ('%%%', encode_cursor('ALAMI', 'Omar'), encode_cursor('ALAMI', 'Omar', '12'), encode_cursor(1, 2, 3)):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Curseur invalide')
@@ -0,0 +1,138 @@
+"""
+Import en masse de patients (patient_import, /api/patients/import/).
+"""
+import io
+import json
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from .. import identifiers, patient_import
+from ..models import Patient
+from .factories import make_patient
+
+
+def records(text, fmt):
+    return list(patient_import.iter_records(io.BytesIO(text.encode('utf-8')), fmt))
+
+
+def ndjson(*lines):
+    return '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines) + '\n'
+
+
+class IterRecordsTests(SimpleTestCase):
+
+    def test_csv_line_numbers_with_multiline_fields_and_blank_lines(self):
+        rows = records('nom;prenom;cin\nA;B;1\n\n"Multi\nligne";C;2\nD;E\nF;G;3;x\n', patient_import.CSV)
+        self.assertEqual([line_number for line_number, _, _ in rows], [2, 4, 6, 7])
+        self.assertEqual(rows[1][1], {'nom': 'Multi\nligne', 'prenom': 'C', 'cin': '2'})
+
+    def test_csv_missing_and_extra_columns(self):
+        rows = records('nom;prenom;cin\nD;E\nF;G;3;x\n', patient_import.CSV)
+        self.assertEqual(rows[0][1], {'nom': 'D', 'prenom': 'E', 'cin': None})
+        self.assertEqual(rows[1][1], {'nom': 'F', 'prenom': 'G', 'cin': '3', None: ['x']})
+
+    def test_csv_delimiter_bom_and_crlf(self):
+        rows = records('\ufefflast_name,first_name\r\nAmrani,Nadia\r\n', patient_import.CSV)
+        self.assertEqual(rows, [(2, {'last_name': 'Amrani', 'first_name': 'Nadia'}, None)])
+
+    def test_line_split_across_read_chunks(self):
+        # Ligne à cheval sur deux morceaux de 64 Kio
+        name = 'x' * (64 * 1024)
+        rows = records(f'last_name;city\n{name};Rabat\nB;Fès\n', patient_import.CSV)
+        self.assertEqual([(line_number, record['city']) for line_number, record, _ in rows],
+                         [(2, 'Rabat'), (3, 'Fès')])
+
+    def test_ndjson_errors_keep_line_numbers(self):
+        rows = records('{"last_name": "A"}\n\n{invalide\n[1, 2]\n{"last_name": "B"}', patient_import.NDJSON)
+        self.assertEqual([(line_number, record) for line_number, record, _ in rows],
+                         [(1, {'last_name': 'A'}), (3, None), (4, None), (5, {'last_name': 'B'})])
+        self.assertTrue(rows[1][2].startswith('JSON invalide'))
+        self.assertEqual(rows[2][2], 'Objet JSON attendu')
+
+    def test_detect_format(self):
+        self.assertEqual(patient_import.detect_format('patients.CSV'), patient_import.CSV)
+        self.assertEqual(patient_import.detect_format('patients.jsonl'), patient_import.NDJSON)
+        with self.assertRaises(patient_import.ImportFormatError):
+            patient_import.detect_format('patients.xlsx')
+
+
+class NormalizeRecordTests(SimpleTestCase):
+
+    def test_aliases_and_values(self):
+        data = patient_import.normalize_record({
+            'nom': 'Alami', 'last_name': '', 'prenom': 'Omar', 'telephone': 612345678,
+            'has_insurance': True, 'cin': None, None: ['en trop'],
+        })
+        self.assertEqual(data, {
+            'last_name': 'Alami', 'first_name': 'Omar', 'mobile_number': '612345678',
+            'has_insurance': 'true', 'cin': '',
+        })
+
+
+class ImportPatientsTests(TestCase):
+
+    def run_import(self, text, fmt=patient_import.NDJSON, **options):
+        report = patient_import.ImportReport(keep_rejected=10)
+        patient_import.import_patients(io.BytesIO(text.encode('utf-8')), fmt, report, **options)
+        return report
+
+    def test_rejects_invalid_and_duplicate_rows(self):
+        make_patient(cin='AB123456')
+        report = self.run_import(ndjson(
+            {'last_name': 'Alami', 'cin': 'CD654321'},
+            {'first_name': 'Sans nom'},
+            {'last_name': 'Bennani', 'cin': 'invalide'},
+            {'last_name': 'Chraibi', 'birth_date': '12/03/1980'},
+            {'last_name': 'Doukkali', 'cin': 'AB123456'},
+            {'last_name': 'El Fassi', 'cin': 'CD654321'},
+            {'last_name': 'Fassi', 'gender': 'X'},
+        ), batch_size=3)
+        self.assertEqual((report.created, report.rejected), (1, 6))
+        self.assertEqual([row['ligne'] for row in report.rejected_rows], [2, 3, 4, 5, 6, 7])
+        self.assertEqual(report.rejected_rows[0]['erreur'], 'Nom manquant')
+        self.assertIn('cin', report.rejected_rows[1]['erreur'])
+        self.assertIn('CD654321', report.rejected_rows[4]['erreur'])
+        self.assertTrue(Patient.objects.filter(last_name='ALAMI', cin='CD654321').exists())
+
+    def test_identifiers_are_allocated_and_reserved(self):
+        prefix = identifiers.counter_prefix(identifiers.PATIENT)
+        report = self.run_import(ndjson(
+            {'last_name': 'Alami'},
+            {'last_name': 'Bennani', 'patient_identifier': f'{prefix}-040'},
+            {'last_name': 'Chraibi'},
+        ), batch_size=2)
+        self.assertEqual(report.created, 3)
+        patients = dict(Patient.objects.values_list('last_name', 'patient_identifier'))
+        self.assertEqual(patients, {'ALAMI': f'{prefix}-041', 'BENNANI': f'{prefix}-040', 'CHRAIBI': f'{prefix}-042'})
+        self.assertEqual(Patient.objects.get(last_name='ALAMI').numero_dossier, f'{prefix}-041')
+
+    def test_search_text_is_built_despite_bulk_create(self):
+        self.run_import('last_name;first_name\nAlami;Omar\n', patient_import.CSV)
+        self.assertTrue(Patient.objects.get(last_name='ALAMI').search_text)
+
+    def test_dry_run_saves_nothing(self):
+        report = self.run_import(ndjson({'last_name': 'Alami'}, {'first_name': 'Sans nom'}), dry_run=True)
+        self.assertEqual((report.created, report.rejected), (1, 1))
+        self.assertFalse(Patient.objects.exists())
+
+
+class ImportPatientsViewTests(TestCase):
+
+    def post(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'))
+        return self.client.post(reverse('pathology_search:import_patients'), {'file': upload, **data})
+
+    def test_import_report(self):
+        response = self.post('patients.csv', 'nom;prenom\nAlami;Omar\n;Sans nom\n')
+        self.assertEqual(response.json(), {
+            'success': True, 'created': 1, 'rejected': 1,
+            'rejected_rows': [{'ligne': 3, 'erreur': 'Nom manquant'}],
+        })
+
+    def test_bad_requests(self):
+        url = reverse('pathology_search:import_patients')
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.post('patients.xlsx', '').status_code, 400)
+        self.assertEqual(self.post('patients.txt', '', format='xml').status_code, 400)
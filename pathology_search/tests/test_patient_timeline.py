@@ -0,0 +1,121 @@
+"""
+Historique paginé d'un patient (patient_timeline, /api/patients/<id>/timeline/ et /history/summary/).
+"""
+from datetime import datetime
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .. import patient_timeline
+from ..utils import encode_cursor
+from .factories import make_consultation, make_medecin, make_patient
+
+
+def local_datetime(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class TimelineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = make_patient()
+        medecin = make_medecin(nom='Alaoui', prenom='Sara', specialite='Psychiatrie')
+        cls.oldest = make_consultation(cls.patient, medecin, date_consultation=local_datetime(2024, 1, 10, 9, 0),
+                                       pathologie_identifiee='Trouble panique', statut='non_valide')
+        # Même date : départagées par id
+        same_date = local_datetime(2024, 2, 1, 9, 0)
+        cls.same_date = [make_consultation(cls.patient, date_consultation=same_date) for _ in range(3)]
+        cls.latest = make_consultation(
+            cls.patient, medecin, date_consultation=local_datetime(2024, 3, 5, 14, 30),
+            pathologie_identifiee='Épisode dépressif', criteres_valides={'A': ['Humeur', 'Fatigue'], 'B': 'Insomnie'},
+        )
+        make_consultation(make_patient(), date_consultation=local_datetime(2024, 3, 6, 9, 0))
+
+    def ids(self, **params):
+        return [row['id'] for row in patient_timeline.list_consultations(self.patient.id, **params)[0]]
+
+    def test_newest_first_with_id_tiebreak(self):
+        self.assertEqual(self.ids(limit=10), [
+            str(self.latest.id), *sorted((str(c.id) for c in self.same_date), reverse=True), str(self.oldest.id),
+        ])
+
+    def test_keyset_pages_have_no_duplicates_or_gaps(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = patient_timeline.list_consultations(self.patient.id, cursor=cursor, limit=2)
+            seen.extend(row['id'] for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.ids(limit=10))
+
+    def test_default_fields(self):
+        [row] = patient_timeline.list_consultations(self.patient.id, limit=1)[0]
+        self.assertEqual(row, {
+            'id': str(self.latest.id), 'date_consultation': '05/03/2024 à 14:30',
+            'pathologie_identifiee': 'Épisode dépressif', 'statut': 'Validé',
+            'medecin': 'Dr. Sara Alaoui', 'medecin_specialite': 'Psychiatrie', 'nombre_criteres': 3,
+        })
+
+    def test_requested_fields_only(self):
+        fields = patient_timeline.parse_fields('criteres_valides, score_similarite,criteres_valides')
+        self.assertEqual(fields, ('criteres_valides', 'score_similarite'))
+        [row] = patient_timeline.list_consultations(self.patient.id, fields=fields, limit=1)[0]
+        self.assertEqual(row, {'id': str(self.latest.id), 'criteres_valides': ['Humeur', 'Fatigue', 'Insomnie'],
+                               'score_similarite': 0.8})
+        with self.assertRaises(patient_timeline.InvalidFields):
+            patient_timeline.parse_fields('statut,mot_de_passe')
+
+    def test_summary(self):
+        summary = patient_timeline.history_summary(self.patient.id)
+        self.assertEqual(summary['total_consultations'], 5)
+        self.assertEqual(summary['consultations_par_statut'], {'Validé': 4, 'Non validé': 1})
+        self.assertEqual(summary['derniere_pathologie'], 'Épisode dépressif')
+        self.assertEqual(parse_datetime(summary['premiere_consultation']), self.oldest.date_consultation)
+
+
+class TimelineViewTests(TestCase):
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.consultation = make_consultation(self.patient)
+        self.url = reverse('pathology_search:get_patient_timeline', args=[self.patient.id])
+
+    def test_unchanged_history_is_revalidated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # Autres champs : autre représentation
+        other = self.client.get(self.url, {'fields': 'statut'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(other.status_code, 200)
+
+    def test_modification_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.consultation.statut = 'non_valide'
+        self.consultation.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(self.url)['ETag']
+        make_consultation(self.patient)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {'limit': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'fields': 'inconnu'}).status_code, 400)
+        for cursor in ('???', encode_cursor('hier', str(self.consultation.id)), encode_cursor('2024-01-01T00:00:00', 'x')):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(self.url, {'cursor': cursor}).status_code, 400)
+        missing = reverse('pathology_search:get_patient_timeline', args=[self.patient.id + 1000])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_summary_view(self):
+        url = reverse('pathology_search:get_patient_history_summary', args=[self.patient.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['total_consultations'], 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.patient.email = 'patient@example.com'
+        self.patient.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        missing = reverse('pathology_search:get_patient_history_summary', args=[self.patient.id + 1000])
+        self.assertEqual(self.client.get(missing).status_code, 404)
@@ -0,0 +1,101 @@
+"""
+Recherche instantanée des patients (patient_typeahead, /api/patients/typeahead/).
+"""
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import patient_typeahead
+from .factories import make_patient
+
+
+class TypeaheadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.benali = make_patient(last_name='Bénali', first_name='Karim', cin='AB123456')
+        cls.el_fassi = make_patient(last_name='El-Fassi', first_name='Leïla')
+        cls.kafas = make_patient(last_name='Kafas', first_name='Omar')
+        cls.ali = make_patient(last_name='Ali', first_name='Sara')
+        cls.alioui = make_patient(last_name='Alioui', first_name='Amine')
+
+    def setUp(self):
+        if patient_typeahead.trigram_available():
+            self.skipTest("Index trigramme PostgreSQL utilisé")
+        patient_typeahead.reload_index()
+        self.addCleanup(patient_typeahead.reload_index)
+
+    def ids(self, query, limit=patient_typeahead.DEFAULT_LIMIT):
+        patients, engine = patient_typeahead.search_patients(query, limit)
+        self.assertEqual(engine, 'memory')
+        return [patient['id'] for patient in patients]
+
+    def test_accents_and_case_are_ignored(self):
+        self.assertEqual(self.ids('BENALI'), [self.benali.id])
+        self.assertEqual(self.ids('leila'), [self.el_fassi.id])
+        self.assertEqual(self.ids('ab1234'), [self.benali.id])
+
+    def test_terms_match_word_starts_only(self):
+        self.assertEqual(self.ids('fas'), [self.el_fassi.id])
+        self.assertEqual(self.ids('el fassi'), [self.el_fassi.id])
+        self.assertEqual(self.ids('assi'), [])
+        self.assertEqual(self.ids('ali karim'), [])
+
+    def test_whole_words_come_first(self):
+        self.assertEqual(self.ids('ali'), [self.ali.id, self.alioui.id])
+        self.assertEqual(self.ids('ali', limit=1), [self.ali.id])
+
+    def test_empty_query(self):
+        self.assertEqual(patient_typeahead.search_patients('   '), ([], None))
+
+    def test_created_and_renamed_patients_are_visible_immediately(self):
+        patient_typeahead.get_index()
+        patient = make_patient(last_name='Tazi', first_name='Nadia')
+        patient_typeahead.patient_changed(patient)
+        self.assertEqual(self.ids('tazi'), [patient.id])
+
+        patient.last_name = 'Berrada'
+        patient.save()
+        patient_typeahead.patient_changed(patient)
+        self.assertEqual(self.ids('tazi'), [])
+        self.assertEqual(self.ids('berrada nadia'), [patient.id])
+
+    def test_published_index_is_never_modified(self):
+        index = patient_typeahead.get_index()
+        tokens = list(index.tokens)
+        patient_typeahead.patient_changed(make_patient(last_name='Tazi'))
+        self.assertEqual(index.tokens, tokens)
+        self.assertIsNot(patient_typeahead.get_index(), index)
+
+    def test_changes_during_rebuild_are_carried_over(self):
+        patient_typeahead.get_index()
+        patient_typeahead._rebuilding = True
+        self.addCleanup(setattr, patient_typeahead, '_rebuilding', False)
+        patient = make_patient(last_name='Tazi')
+        patient_typeahead.patient_changed(patient)
+        # Index reconstruit avant la création
+        patient_typeahead._publish_rebuild(patient_typeahead.TypeaheadIndex())
+        self.assertFalse(patient_typeahead._rebuilding)
+        self.assertEqual(self.ids('tazi'), [patient.id])
+
+
+class TypeaheadViewTests(TestCase):
+
+    url = reverse('pathology_search:typeahead_patients')
+
+    def setUp(self):
+        patient_typeahead.reload_index()
+        self.addCleanup(patient_typeahead.reload_index)
+
+    def test_response(self):
+        patient = make_patient(last_name='Bénali', first_name='Karim', patient_identifier='EE-2024-001')
+        data = self.client.get(self.url, {'q': 'benali'}).json()
+        self.assertEqual(data['patients'], [{
+            'id': patient.id, 'nom_complet': 'Karim Bénali', 'numero_dossier': 'EE-2024-001',
+            'cin': None, 'date_naissance': None,
+        }])
+
+    def test_limit(self):
+        for _ in range(3):
+            make_patient(last_name='Alami')
+        self.assertEqual(len(self.client.get(self.url, {'q': 'alami', 'limit': 2}).json()['patients']), 2)
+        self.assertEqual(self.client.get(self.url, {'q': 'alami', 'limit': 'x'}).status_code, 400)
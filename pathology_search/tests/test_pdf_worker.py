@@ -0,0 +1,74 @@
+"""
+Contexte de rendu WeasyPrint réutilisé entre les rapports PDF (pdf_worker).
+"""
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from .. import pdf_worker, reports
+from .factories import make_consultation, make_medecin, make_patient
+
+
+class WeasyPrintTestCase(SimpleTestCase):
+    """WeasyPrint remplacé par des doublures : seule la réutilisation du contexte est vérifiée."""
+
+    def setUp(self):
+        patches = {name: mock.patch.object(pdf_worker, name) for name in ('HTML', 'CSS', 'FontConfiguration')}
+        self.weasyprint = {name: patch.start() for name, patch in patches.items()}
+        for patch in patches.values():
+            self.addCleanup(patch.stop)
+        self.document = self.weasyprint['HTML'].return_value.render.return_value
+        self.document.write_pdf.return_value = b'%PDF-1.7'
+        saved = dict(pdf_worker._renderers)
+        pdf_worker._renderers.clear()
+        self.addCleanup(pdf_worker._renderers.update, saved)
+        self.addCleanup(pdf_worker._renderers.clear)
+
+
+class PdfRendererTests(WeasyPrintTestCase):
+
+    def test_stylesheets_are_compiled_once(self):
+        renderer = pdf_worker.PdfRenderer(['rapport.css', Path('impression.css')])
+        font_config = self.weasyprint['FontConfiguration'].return_value
+        self.assertEqual(self.weasyprint['CSS'].call_args_list, [
+            mock.call(filename='rapport.css', font_config=font_config),
+            mock.call(filename='impression.css', font_config=font_config),
+        ])
+        for html in ('<p>Premier</p>', '<p>Second</p>'):
+            pdf_bytes, timings = renderer.render(html)
+            self.assertEqual(pdf_bytes, b'%PDF-1.7')
+            self.assertEqual(set(timings), {'layout', 'drawing'})
+            self.weasyprint['HTML'].assert_called_with(string=html)
+            self.weasyprint['HTML'].return_value.render.assert_called_with(
+                font_config=font_config, stylesheets=renderer.stylesheets,
+            )
+        self.assertEqual(self.weasyprint['CSS'].call_count, 2)
+        self.weasyprint['FontConfiguration'].assert_called_once_with()
+
+    def test_renderer_is_shared_per_stylesheet_set(self):
+        renderer = pdf_worker.get_renderer(['rapport.css'])
+        self.assertIs(pdf_worker.get_renderer((Path('rapport.css'),)), renderer)
+        self.assertIsNot(pdf_worker.get_renderer(()), renderer)
+        self.assertEqual(pdf_worker.html_to_pdf('<p>Rapport</p>', ['rapport.css']), b'%PDF-1.7')
+        self.assertEqual(self.weasyprint['FontConfiguration'].call_count, 2)
+
+
+class ReportRenderingTests(WeasyPrintTestCase, TestCase):
+
+    def test_reports_use_external_stylesheet(self):
+        [stylesheet] = reports.REPORT_STYLESHEETS
+        self.assertTrue(Path(stylesheet).is_file())
+        self.assertNotIn('<style', reports.REPORT_TEMPLATE.read_text(encoding='utf-8'))
+
+    def test_report_render_reuses_renderer_and_logs_timings(self):
+        consultation = make_consultation(make_patient(), make_medecin())
+        with self.assertLogs('pathology_search.reports', 'INFO') as logs:
+            self.assertEqual(reports.render_report_pdf(consultation), b'%PDF-1.7')
+            reports.render_report_pdf(consultation)
+        self.weasyprint['CSS'].assert_called_once_with(
+            filename=reports.REPORT_STYLESHEETS[0], font_config=self.weasyprint['FontConfiguration'].return_value,
+        )
+        html = self.weasyprint['HTML'].call_args.kwargs['string']
+        self.assertIn(str(consultation.id), html)
+        self.assertRegex(logs.output[0], r'template \d+ ms, layout \d+ ms, drawing \d+ ms')
@@ -0,0 +1,85 @@
+"""
+Budgets de requêtes SQL des vues (query_budget.VIEW_BUDGETS).
+
+Chaque vue budgétée est appelée pour un patient à l'historique court et pour
+un patient à l'historique long : le nombre de requêtes doit être identique
+(indépendant du volume de données) et ne pas dépasser le budget.
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ..models import Consultation, Medecin, Patient
+from ..query_budget import VIEW_BUDGETS, budget_requests
+
+
+SHORT_HISTORY = 2
+# Au-delà des tailles de page (historique HTML, timeline)
+LONG_HISTORY = 120
+
+SYMPTOMS = ['Humeur dépressive', 'Insomnie', 'Fatigue', 'Perte d\'appétit', 'Douleur thoracique', 'Anxiété']
+
+
+def create_patient(nom, medecin, consultations):
+    patient = Patient.objects.create(last_name=nom, first_name='Test', patient_identifier=f'T-{nom}')
+    now = timezone.now()
+    for index in range(consultations):
+        Consultation.objects.create(
+            patient=patient,
+            medecin=medecin,
+            date_consultation=now - timedelta(days=index),
+            description_clinique=f"Douleur et fatigue persistantes, consultation {index}",
+            pathologie_identifiee=['Épisode dépressif', 'Trouble anxieux généralisé'][index % 2],
+            score_similarite=0.5 + (index % 5) / 10,
+            criteres_valides={
+                'symptomes': SYMPTOMS[index % 3:index % 3 + 3],
+                '_metadata': {'model_used': 'chatgpt-5.1', 'embedding_model': 'openai-ada'},
+            },
+            statut=['valide', 'non_valide', 'en_cours'][index % 3],
+        )
+    return patient
+
+
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        medecin = Medecin.objects.create(nom='Alaoui', prenom='Sara', specialite='Psychiatrie', numero_ordre='ORD-TEST')
+        cls.short_patient = create_patient('Court', medecin, SHORT_HISTORY)
+        cls.long_patient = create_patient('Long', medecin, LONG_HISTORY)
+
+    def count_queries(self, path):
+        # Premier appel : amorce les caches de processus (moteur plein texte, index de recherche)
+        self.client.get(path)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertLess(response.status_code, 400, path)
+        return len(queries)
+
+    def test_budgeted_views_are_covered(self):
+        names = {name for name, path in budget_requests(self.long_patient.id)}
+        self.assertEqual(names, set(VIEW_BUDGETS))
+
+    def test_query_count_does_not_depend_on_history_length(self):
+        short_paths = dict(budget_requests(self.short_patient.id))
+        for name, path in budget_requests(self.long_patient.id):
+            with self.subTest(view=name):
+                expected = self.count_queries(short_paths[name])
+                self.assertLessEqual(expected, VIEW_BUDGETS[name])
+                self.client.get(path)
+                with self.assertNumQueries(expected):
+                    response = self.client.get(path)
+                self.assertLess(response.status_code, 400, path)
+
+
+class AuditQueriesCommandTests(TestCase):
+
+    def test_fails_without_sample_patient(self):
+        with self.assertRaises(CommandError):
+            call_command('audit_queries', stdout=StringIO())
@@ -0,0 +1,100 @@
+"""
+Export ZIP des rapports PDF (vue export_reports, reports.export_queryset, iter_reports_zip).
+"""
+import io
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import pdf_worker, reports
+from .factories import make_consultation, make_medecin, make_patient
+
+
+def local_datetime(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class ExportQuerysetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medecin = make_medecin()
+        cls.patient = make_patient()
+        cls.before = make_consultation(cls.patient, cls.medecin, date_consultation=local_datetime(2024, 2, 29, 23, 59))
+        cls.first_day = make_consultation(cls.patient, cls.medecin, date_consultation=local_datetime(2024, 3, 1, 0, 0))
+        cls.last_day = make_consultation(cls.patient, date_consultation=local_datetime(2024, 3, 31, 23, 59), statut='en_cours')
+        cls.after = make_consultation(make_patient(), cls.medecin, date_consultation=local_datetime(2024, 4, 1, 0, 0))
+
+    def ids(self, **filters):
+        return list(reports.export_queryset(**filters).values_list('id', flat=True))
+
+    def test_period_includes_both_local_days(self):
+        self.assertEqual(
+            self.ids(date_from=date(2024, 3, 1), date_to=date(2024, 3, 31)),
+            [self.first_day.id, self.last_day.id],
+        )
+
+    def test_filters_combine(self):
+        self.assertEqual(self.ids(patient_id=self.patient.id, medecin_id=self.medecin.id),
+                         [self.before.id, self.first_day.id])
+        self.assertEqual(self.ids(patient_id=self.patient.id, statut='en_cours'), [self.last_day.id])
+
+
+class ExportReportsViewTests(TestCase):
+
+    def test_requires_a_filter(self):
+        response = self.client.get(reverse('pathology_search:export_reports'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_malformed_parameters(self):
+        for query in ('patient_id=abc', 'medecin_id=1.5', 'date_from=abc', 'date_to=2024-13-45'):
+            with self.subTest(query=query):
+                response = self.client.get(f"{reverse('pathology_search:export_reports')}?{query}")
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+
+
+class ReportsZipTests(TestCase):
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(REPORT_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patient = make_patient(patient_identifier='PAT-ZIP')
+        self.cached = make_consultation(patient, date_consultation=local_datetime(2024, 3, 1, 10, 0))
+        self.rendered = make_consultation(patient, date_consultation=local_datetime(2024, 3, 2, 10, 0))
+
+    def archive(self):
+        consultations = reports.export_queryset(patient_id=self.cached.patient_id)
+        return zipfile.ZipFile(io.BytesIO(b''.join(reports.iter_reports_zip(consultations))))
+
+    def test_cached_and_rendered_reports(self):
+        reports.store_pdf(self.cached, b'%PDF-cache')
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        with mock.patch.object(reports, '_get_export_pool', return_value=pool), \
+                mock.patch.object(pdf_worker, 'html_to_pdf', return_value=b'%PDF-rendu'):
+            archive = self.archive()
+        names = archive.namelist()
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(name.startswith('2024-03-0') and '_PAT-ZIP_' in name for name in names))
+        self.assertEqual(archive.read(reports._zip_entry_name(self.cached)), b'%PDF-cache')
+        self.assertEqual(archive.read(reports._zip_entry_name(self.rendered)), b'%PDF-rendu')
+
+    def test_render_error_is_reported_in_archive(self):
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        with mock.patch.object(reports, '_get_export_pool', return_value=pool), \
+                mock.patch.object(pdf_worker, 'html_to_pdf', side_effect=RuntimeError('police absente')), \
+                self.assertLogs('pathology_search.reports', 'ERROR'):
+            archive = self.archive()
+        self.assertEqual(len(archive.namelist()), 2)
+        self.assertTrue(all(name.endswith('_erreur.txt') for name in archive.namelist()))
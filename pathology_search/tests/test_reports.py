@@ -0,0 +1,72 @@
+"""
+Cache des rapports PDF (reports) : version, réutilisation, invalidation.
+"""
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .. import reports
+from .factories import make_consultation, make_medecin, make_patient
+
+
+class ReportCacheTests(TestCase):
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(REPORT_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache_dir = reports._cache_dir()
+        self.patient = make_patient(last_name='Tazi', first_name='Nadia')
+        self.consultation = make_consultation(self.patient, make_medecin())
+
+    def cached_files(self):
+        return sorted(path.name for path in self.cache_dir.glob('*.pdf'))
+
+    def test_version_changes_with_printed_patient_fields(self):
+        version = reports.report_version(self.consultation)
+        self.assertEqual(reports.report_version(self.consultation), version)
+        self.patient.last_name = 'Tazi-Amrani'
+        self.assertNotEqual(reports.report_version(self.consultation), version)
+
+    def test_version_changes_when_consultation_is_modified(self):
+        version = reports.report_version(self.consultation)
+        self.consultation.notes_medecin = 'Revoir dans un mois'
+        self.consultation.save()
+        self.assertNotEqual(reports.report_version(self.consultation), version)
+
+    def test_version_includes_template_version(self):
+        version = reports.report_version(self.consultation)
+        with mock.patch.object(reports, 'REPORT_TEMPLATE_VERSION', 'autre'):
+            self.assertNotEqual(reports.report_version(self.consultation), version)
+
+    def test_pdf_is_rendered_once_then_served_from_cache(self):
+        with mock.patch.object(reports, 'render_report_pdf', return_value=b'%PDF-1') as render:
+            self.assertEqual(reports.get_or_render_pdf(self.consultation), b'%PDF-1')
+            self.assertEqual(reports.get_or_render_pdf(self.consultation), b'%PDF-1')
+        render.assert_called_once()
+        self.assertEqual(self.cached_files(), [f'{reports.report_version(self.consultation)}.pdf'])
+
+    def test_new_version_replaces_previous_file(self):
+        with mock.patch.object(reports, 'render_report_pdf', side_effect=[b'%PDF-1', b'%PDF-2']):
+            reports.get_or_render_pdf(self.consultation)
+            self.patient.first_name = 'Nadia-Lina'
+            self.assertEqual(reports.get_or_render_pdf(self.consultation), b'%PDF-2')
+        self.assertEqual(self.cached_files(), [f'{reports.report_version(self.consultation)}.pdf'])
+
+    def test_invalidate_patient_keeps_other_patients(self):
+        other = make_consultation(make_patient(last_name='Idrissi'))
+        reports.store_pdf(self.consultation, b'%PDF-1')
+        reports.store_pdf(other, b'%PDF-2')
+        reports.invalidate_patient(self.patient.id)
+        self.assertEqual(self.cached_files(), [f'{reports.report_version(other)}.pdf'])
+
+    def test_patient_update_schedules_invalidation(self):
+        with mock.patch.object(reports, 'schedule_patient_invalidation') as schedule:
+            patient = make_patient()
+            schedule.assert_not_called()
+            patient.telephone = '0612345678'
+            patient.save()
+        schedule.assert_called_once_with(patient.pk)
@@ -0,0 +1,64 @@
+"""
+Stockage serveur des résultats (result_store) : aller-retour, type, durée de vie.
+"""
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import result_store
+from ..models import StoredResult
+
+
+# Éviction paresseuse désactivée, sauf dans le test qui la vérifie
+@override_settings(RESULT_STORE_PURGE_PROBABILITY=0.0)
+class ResultStoreTests(TestCase):
+
+    def test_round_trip(self):
+        payload = [{'file_name': 'Trouble anxieux.txt', 'similarity': 0.91, 'texte': 'Anxiété généralisée'}]
+        result_id = result_store.put(result_store.SEARCH, payload)
+        self.assertEqual(result_store.get(result_id, result_store.SEARCH), payload)
+
+    def test_other_type_is_not_returned(self):
+        result_id = result_store.put(result_store.SEARCH, [])
+        self.assertIsNone(result_store.get(result_id, result_store.DIAGNOSIS))
+
+    def test_missing_or_malformed_id(self):
+        self.assertIsNone(result_store.get(None, result_store.SEARCH))
+        self.assertIsNone(result_store.get(str(uuid.uuid4()), result_store.SEARCH))
+        self.assertIsNone(result_store.get('pas-un-uuid', result_store.SEARCH))
+        result_store.delete('pas-un-uuid')
+
+    def test_expires_after_ttl(self):
+        result_id = result_store.put(result_store.DIAGNOSIS, {'plan': 'Suivi'}, ttl=60)
+        now = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(seconds=59)):
+            self.assertEqual(result_store.get(result_id, result_store.DIAGNOSIS), {'plan': 'Suivi'})
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(seconds=61)):
+            self.assertIsNone(result_store.get(result_id, result_store.DIAGNOSIS))
+
+    def test_put_with_id_replaces_payload_and_ttl(self):
+        result_id = result_store.put(result_store.DIAGNOSIS, {'version': 1}, ttl=0)
+        self.assertIsNone(result_store.get(result_id, result_store.DIAGNOSIS))
+        self.assertEqual(result_store.put(result_store.DIAGNOSIS, {'version': 2}, result_id=result_id), result_id)
+        self.assertEqual(result_store.get(result_id, result_store.DIAGNOSIS), {'version': 2})
+        self.assertEqual(StoredResult.objects.count(), 1)
+
+    def test_purge_expired_keeps_live_results(self):
+        expired = result_store.put(result_store.SEARCH, [], ttl=0)
+        live = result_store.put(result_store.SEARCH, [])
+        self.assertEqual(result_store.purge_expired(), 1)
+        self.assertFalse(StoredResult.objects.filter(id=expired).exists())
+        self.assertTrue(StoredResult.objects.filter(id=live).exists())
+
+    @override_settings(RESULT_STORE_PURGE_PROBABILITY=1.0)
+    def test_put_purges_expired_results(self):
+        expired = result_store.put(result_store.SEARCH, [], ttl=0)
+        result_store.put(result_store.SEARCH, [])
+        self.assertFalse(StoredResult.objects.filter(id=expired).exists())
+
+    def test_compact_search_results_drops_chunk_scores(self):
+        results = [{'file_name': 'a.txt', 'all_chunk_scores': [0.1, 0.2], 'similarity': 0.5}]
+        self.assertEqual(result_store.compact_search_results(results), [{'file_name': 'a.txt', 'similarity': 0.5}])
@@ -0,0 +1,104 @@
+"""
+Index de recherche en mémoire et filtres par famille de troubles (search_index).
+"""
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from .. import search_index
+
+
+def write_embeddings(folder, path, embeddings, location=None):
+    npy_file = Path(folder) / f'{path}.npy'
+    npy_file.parent.mkdir(parents=True, exist_ok=True)
+    np.save(npy_file, np.asarray(embeddings, dtype=np.float32))
+    metadata = {
+        'source_file': f'{path}.txt',
+        'html_page': f'{path}.html',
+        'chunks': [{'text_preview': f'{path} #{i}'} for i in range(len(embeddings))],
+    }
+    if location:
+        metadata['hierarchy'] = {'location': location}
+    npy_file.with_suffix('.json').write_text(json.dumps(metadata), encoding='utf-8')
+    return npy_file
+
+
+class SearchIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = Path(folder.name)
+        rng = np.random.default_rng(0)
+        write_embeddings(self.folder, 'Anxiety_Disorders_out/Panic', rng.normal(size=(2, 4)),
+                         location='Anxiety Disorders > Panic Disorder')
+        write_embeddings(self.folder, 'Anxiety_Disorders_out/Phobia', rng.normal(size=(1, 4)))
+        write_embeddings(self.folder, 'Depressive_Disorders_out/Major', rng.normal(size=(3, 4)))
+        write_embeddings(self.folder, 'Sleep_out/Insomnia', rng.normal(size=(2, 4)))
+        # Ignorés : dimension différente, métadonnées absentes
+        write_embeddings(self.folder, 'Sleep_out/Other', rng.normal(size=(2, 3)))
+        np.save(self.folder / 'Sleep_out' / 'Orphan.npy', rng.normal(size=(1, 4)))
+        self.index = search_index.SearchIndex(self.folder)
+        self.query = rng.normal(size=4)
+
+    def paths(self, selection):
+        return [self.index.files[i]['path'] for i in selection.file_indices]
+
+    def test_families_are_contiguous_row_ranges(self):
+        self.assertEqual(len(self.index.files), 4)
+        self.assertEqual(dict(self.index.categories), {
+            'Anxiety_Disorders_out': (0, 3), 'Depressive_Disorders_out': (3, 6), 'Sleep_out': (6, 8),
+        })
+        self.assertEqual(self.index.category_list()[0], {'id': 'Anxiety_Disorders_out', 'label': 'Anxiety Disorders', 'count': 2})
+        np.testing.assert_allclose(np.linalg.norm(self.index.chunks, axis=1), 1.0, rtol=1e-6)
+
+    def test_category_filters(self):
+        selection = self.index.select({'include_categories': ['anxiety disorders', 'Sleep_out']})
+        self.assertEqual(self.paths(selection), ['Anxiety_Disorders_out/Panic', 'Anxiety_Disorders_out/Phobia', 'Sleep_out/Insomnia'])
+        self.assertEqual(selection.ranges, [(0, 3), (6, 8)])
+        self.assertEqual(selection.num_rows, 5)
+        selection = self.index.select({'exclude_categories': 'Depressive Disorders'})
+        self.assertEqual(selection.ranges, [(0, 3), (6, 8)])
+
+    def test_location_filters(self):
+        selection = self.index.select({'include_locations': ['panic disorder']})
+        self.assertEqual(self.paths(selection), ['Anxiety_Disorders_out/Panic'])
+        # Le chemin sert aussi de lieu
+        selection = self.index.select({'exclude_locations': ['phobia', 'insomnia']})
+        self.assertEqual(selection.ranges, [(0, 2), (3, 6)])
+
+    def test_equivalent_filters_share_cached_selection(self):
+        selection = self.index.select({'include_categories': ['Sleep_out', ' Anxiety Disorders ']})
+        self.assertIs(self.index.select({'include_categories': ['anxiety disorders', 'sleep_out']}), selection)
+        self.assertIs(self.index.select(), self.index.select({'include_categories': []}))
+
+    def test_search_matches_per_file_scores(self):
+        query = self.query / np.linalg.norm(self.query)
+        for aggregation in ('max', 'mean', 'weighted_mean'):
+            with self.subTest(aggregation=aggregation):
+                results = self.index.search(self.query, top_k=10, aggregation=aggregation)
+                for result in results:
+                    path = result['file'][:-len('.txt')]
+                    embeddings = np.load(self.folder / f'{path}.npy')
+                    scores = embeddings @ query / np.linalg.norm(embeddings, axis=1)
+                    if aggregation == 'max':
+                        expected = scores.max()
+                    elif aggregation == 'mean':
+                        expected = scores.mean()
+                    else:
+                        weights = 1.0 / np.arange(1, len(scores) + 1)
+                        expected = np.sum(scores * weights / weights.sum())
+                    self.assertAlmostEqual(result['similarity'], float(expected), places=5)
+                    self.assertEqual(result['best_chunk_text'], f"{path} #{int(np.argmax(scores))}")
+                similarities = [result['similarity'] for result in results]
+                self.assertEqual(similarities, sorted(similarities, reverse=True))
+
+    def test_filtered_search_only_scores_selection(self):
+        selection = self.index.select({'include_categories': ['Depressive_Disorders_out']})
+        results = self.index.search(self.query, top_k=10, selection=selection)
+        self.assertEqual([result['category'] for result in results], ['Depressive_Disorders_out'])
+        selection = self.index.select({'include_categories': ['inconnue']})
+        self.assertEqual(self.index.search(self.query, selection=selection), [])
@@ -0,0 +1,267 @@
+"""
+Recherche de cas similaires parmi les consultations (similar_cases, /api/consultations/.../similar/).
+"""
+import io
+import json
+import tempfile
+import uuid
+from unittest import mock
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import similar_cases
+from ..models import ConsultationEmbedding
+from .factories import make_consultation, make_patient
+
+
+KEYWORDS = ('panique', 'dépress', 'insomnie')
+
+
+def fake_embed_texts(texts):
+    """Un axe par mot-clé (dernier axe : aucun), vecteurs normalisés comme embed_texts."""
+    vectors = np.zeros((len(texts), 4), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for axis, keyword in enumerate(KEYWORDS):
+            if keyword in text.lower():
+                vectors[row, axis] = 1.0
+        if not vectors[row].any():
+            vectors[row, 3] = 1.0
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@override_settings(CASE_EMBEDDING_MODEL='fake-embedding', CASE_EMBEDDING_DIMENSIONS=4, CASE_EMBEDDING_BATCH_SIZE=2)
+class SimilarCasesTestCase(TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        settings_override = override_settings(CASE_INDEX_DIR=folder.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        similar_cases._index = None
+        self.addCleanup(setattr, similar_cases, '_index', None)
+        embed = mock.patch.object(similar_cases, 'embed_texts', side_effect=fake_embed_texts)
+        self.embed_texts = embed.start()
+        self.addCleanup(embed.stop)
+        self.patient = make_patient()
+
+    def consult(self, description, patient=None, **fields):
+        return make_consultation(patient or self.patient, description_clinique=description,
+                                 criteres_valides=fields.pop('criteres_valides', {}), **fields)
+
+    def index_rows(self):
+        return sorted(int(i) for i in similar_cases.get_index().ids)
+
+
+class IndexingTests(SimilarCasesTestCase):
+
+    def test_consultation_text(self):
+        self.assertEqual(similar_cases.consultation_text(' Attaques \n de panique ', {'A': ['Palpitations', 'Peur']}),
+                         'Attaques de panique\nCritères : Palpitations; Peur')
+        self.assertEqual(similar_cases.consultation_text('', {'A': ['Peur']}), 'Critères : Peur')
+        self.assertEqual(similar_cases.consultation_text(None, None), '')
+
+    def test_missing_consultations_are_embedded_in_batches(self):
+        consultations = [self.consult(f'Crise de panique {i}') for i in range(3)]
+        self.consult('')
+        self.assertEqual(similar_cases.index_consultations(), 3)
+        self.assertEqual([len(call.args[0]) for call in self.embed_texts.call_args_list], [2, 1])
+        embedding = ConsultationEmbedding.objects.get(consultation=consultations[0])
+        self.assertEqual((embedding.modele_embedding, embedding.dimension, embedding.texte_hash),
+                         ('fake-embedding', 4, similar_cases.text_hash('Crise de panique 0')))
+        np.testing.assert_array_equal(similar_cases.consultation_vector(consultations[0]), [1, 0, 0, 0])
+        self.assertEqual(similar_cases.index_consultations(), 0)
+        self.assertEqual(self.embed_texts.call_count, 2)
+
+    def test_selected_ids_and_limit(self):
+        first, second, third = (self.consult(f'Insomnie {i}') for i in range(3))
+        self.assertEqual(similar_cases.index_consultations([second.id]), 1)
+        self.assertEqual(similar_cases.index_consultations(limit=1), 1)
+        self.assertTrue(ConsultationEmbedding.objects.filter(consultation=first).exists())
+        self.assertIsNone(similar_cases.consultation_vector(third))
+
+    def test_rows_inserted_by_another_run_are_not_counted(self):
+        first, second = self.consult('Insomnie'), self.consult('Panique')
+
+        def concurrent_run(texts):
+            vectors = fake_embed_texts(texts)
+            ConsultationEmbedding.objects.create(consultation=first, texte_hash='x', modele_embedding='fake-embedding',
+                                                 vecteur=vectors[0].tobytes(), dimension=4)
+            return vectors
+
+        self.embed_texts.side_effect = concurrent_run
+        self.assertEqual(similar_cases.index_consultations(), 1)
+        self.assertEqual(ConsultationEmbedding.objects.count(), 2)
+
+    def test_edited_text_is_reembedded(self):
+        consultation = self.consult('Insomnie')
+        similar_cases.index_consultations()
+        with mock.patch.object(similar_cases, 'schedule_indexing') as schedule:
+            consultation.notes_medecin = 'Revoir dans un mois'
+            consultation.save()
+            consultation.save(update_fields=['notes_medecin'])
+            schedule.assert_not_called()
+            consultation.description_clinique = 'Attaques de panique'
+            consultation.save(update_fields=['description_clinique'])
+            schedule.assert_called_once_with(consultation.id)
+        self.assertIsNone(similar_cases.consultation_vector(consultation))
+        similar_cases.index_consultations()
+        np.testing.assert_array_equal(similar_cases.consultation_vector(consultation), [1, 0, 0, 0])
+
+    def test_indexing_starts_once_after_commit(self):
+        first, second = self.consult('Insomnie'), self.consult('Panique')
+        self.addCleanup(similar_cases._pending_ids.clear)
+        with mock.patch.object(similar_cases._executor, 'submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                similar_cases.schedule_indexing(first.id)
+                similar_cases.schedule_indexing(second.id)
+                submit.assert_not_called()
+        submit.assert_called_once_with(similar_cases._index_in_background)
+        self.assertEqual(similar_cases._pending_ids, {first.id, second.id})
+
+    def test_command_drops_other_models_and_rebuilds(self):
+        consultation = self.consult('Insomnie')
+        ConsultationEmbedding.objects.create(consultation=consultation, texte_hash='x', modele_embedding='ancien',
+                                             vecteur=b'', dimension=1536)
+        self.consult('Panique')
+        out = io.StringIO()
+        call_command('index_consultations', stdout=out)
+        self.assertIn("1 embedding(s) d'un autre modèle", out.getvalue())
+        self.assertEqual(len(similar_cases.get_index()), 2)
+        consultation.delete()
+        call_command('index_consultations', rebuild=True, stdout=io.StringIO())
+        self.assertEqual(len(similar_cases.get_index()), 1)
+
+
+class CaseIndexTests(SimilarCasesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.panic = self.consult('Attaques de panique')
+        self.depression = self.consult('Humeur dépressive', criteres_valides={'A': ['Insomnie']})
+        self.insomnia = self.consult('Insomnie')
+        similar_cases.index_consultations()
+
+    def test_sync_appends_only_new_rows(self):
+        index = similar_cases.get_index()
+        self.assertEqual(index.sync(), 3)
+        self.assertEqual(index.sync(), 0)
+        self.consult('Panique nocturne')
+        similar_cases.index_consultations()
+        self.assertEqual(index.sync(), 1)
+        self.assertEqual(self.index_rows(), sorted(ConsultationEmbedding.objects.values_list('id', flat=True)))
+
+    def test_search_ranks_by_cosine(self):
+        matches = similar_cases.get_index().search([0, 0, 2, 0], limit=2)
+        ids = dict(ConsultationEmbedding.objects.values_list('id', 'consultation_id'))
+        self.assertEqual([ids[embedding_id] for embedding_id, _ in matches], [self.insomnia.id, self.depression.id])
+        self.assertAlmostEqual(matches[0][1], 1.0, places=6)
+        self.assertAlmostEqual(matches[1][1], np.sqrt(0.5), places=6)
+        self.assertEqual(similar_cases.get_index().search([1, 0, 0, 0], limit=0), [])
+
+    def test_other_process_sees_appended_rows(self):
+        similar_cases.get_index().sync()
+        other = similar_cases.CaseIndex(similar_cases.get_index().directory.parent, 'fake-embedding', 4)
+        with mock.patch.object(other, '_append') as append:
+            other.sync()
+        append.assert_not_called()
+        self.assertEqual(len(other), 3)
+
+    def test_interrupted_append_is_repaired(self):
+        index = similar_cases.get_index()
+        index.sync()
+        with open(index.vectors_path, 'ab') as f:
+            f.write(b'\0' * 6)
+        self.consult('Insomnie sévère')
+        similar_cases.index_consultations()
+        self.assertEqual(index.sync(), 1)
+        self.assertEqual(index.vectors_path.stat().st_size, 4 * 4 * 4)
+        self.assertEqual(index.ids_path.stat().st_size, 4 * 8)
+
+    def test_late_lower_ids_are_caught_up(self):
+        first = ConsultationEmbedding.objects.get(consultation=self.panic)
+        first_id = first.id
+        first.delete()
+        similar_cases.get_index().sync()
+        # Ligne validée en base après des lignes d'identifiant supérieur
+        ConsultationEmbedding.objects.create(id=first_id, consultation=self.panic, texte_hash='x',
+                                             modele_embedding='fake-embedding',
+                                             vecteur=fake_embed_texts(['panique'])[0].tobytes(), dimension=4)
+        self.assertEqual(similar_cases.get_index().sync(), 1)
+        self.assertIn(first_id, self.index_rows())
+
+    def test_deleted_consultations_are_skipped_then_compacted(self):
+        similar_cases.get_index().sync()
+        self.insomnia.delete()
+        cases = similar_cases.find_similar_cases([0, 0, 1, 0], limit=5)
+        self.assertEqual([case['consultation_id'] for case in cases], [str(self.depression.id), str(self.panic.id)])
+        self.assertEqual(len(similar_cases.get_index()), 3)
+        self.assertEqual(similar_cases.get_index().rebuild(), 2)
+
+    def test_filters_and_hydrated_fields(self):
+        other_patient = make_patient(last_name='Alami', first_name='Omar', patient_identifier='EE-2024-001')
+        other = self.consult('Insomnie chronique', patient=other_patient, statut='non_valide',
+                             pathologie_identifiee='["SubSection 2.1 Insomnie"]')
+        similar_cases.index_consultations()
+        cases = similar_cases.find_similar_cases([0, 0, 1, 0], limit=2, exclude_consultation_id=self.insomnia.id)
+        self.assertEqual([case['consultation_id'] for case in cases], [str(other.id), str(self.depression.id)])
+        self.assertEqual(cases[0]['patient'], {'id': other_patient.id, 'nom_complet': 'Omar Alami',
+                                               'patient_identifier': 'EE-2024-001'})
+        self.assertEqual((cases[0]['pathologie_identifiee'], cases[0]['statut'], cases[0]['similarity_percent']),
+                         ('Insomnie', 'non_valide', 100.0))
+        cases = similar_cases.find_similar_cases([0, 0, 1, 0], exclude_patient_id=self.patient.id)
+        self.assertEqual([case['consultation_id'] for case in cases], [str(other.id)])
+        cases = similar_cases.find_similar_cases([0, 0, 1, 0], statuts=['non_valide', 'en_cours'])
+        self.assertEqual([case['consultation_id'] for case in cases], [str(other.id)])
+
+
+class SimilarCasesViewTests(SimilarCasesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.consultation = self.consult('Insomnie')
+        self.same_patient = self.consult('Insomnie persistante')
+        self.other = self.consult('Insomnie', patient=make_patient())
+        similar_cases.index_consultations()
+        self.embed_texts.reset_mock()
+        self.url = reverse('pathology_search:get_similar_cases', args=[self.consultation.id])
+
+    def case_ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [case['consultation_id'] for case in response.json()['cases']]
+
+    def test_indexed_consultation_uses_stored_vector(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.json()['indexed'])
+        self.assertEqual(self.case_ids(response), [str(self.other.id)])
+        self.embed_texts.assert_not_called()
+        # Vecteurs identiques : ordre indifférent
+        self.assertCountEqual(self.case_ids(self.client.get(self.url, {'same_patient': '1'})),
+                              [str(self.other.id), str(self.same_patient.id)])
+        self.assertEqual(self.case_ids(self.client.get(self.url, {'statut': 'non_valide'})), [])
+
+    def test_unindexed_consultation_is_embedded_for_the_request(self):
+        consultation = self.consult('Insomnie et panique', patient=make_patient())
+        with mock.patch.object(similar_cases, 'schedule_indexing') as schedule:
+            response = self.client.get(reverse('pathology_search:get_similar_cases', args=[consultation.id]))
+        self.assertFalse(response.json()['indexed'])
+        self.assertEqual(len(self.case_ids(response)), 3)
+        schedule.assert_called_once_with(consultation.id)
+        self.embed_texts.assert_called_once()
+
+    def test_free_text_search(self):
+        url = reverse('pathology_search:search_similar_cases')
+        response = self.client.post(url, json.dumps({'description': 'Insomnie', 'patient_id': self.patient.id,
+                                                     'limit': 5}), content_type='application/json')
+        self.assertEqual(self.case_ids(response), [str(self.other.id)])
+        for body in ('{', json.dumps({'description': ' '}), json.dumps({'description': 'Insomnie', 'limit': 'x'})):
+            with self.subTest(body=body):
+                self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 400)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {'limit': 'dix'}).status_code, 400)
+        missing = reverse('pathology_search:get_similar_cases', args=[uuid.uuid4()])
+        self.assertEqual(self.client.get(missing).status_code, 404)
@@ -0,0 +1,178 @@
+"""
+Vecteurs de symptômes en cache et recherche tenant compte de l'historique (symptom_history).
+"""
+import io
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import symptom_history
+from ..models import SymptomEmbedding
+from .factories import make_consultation, make_patient
+
+
+def local_datetime(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class FakeSymptomService:
+    """Vecteurs fixés par symptôme (minuscules), un appel enregistré par lot."""
+
+    embedding_model_name = 'fake-embedding'
+    embedding_model_type = 'openai-ada'
+
+    def __init__(self, vectors=None):
+        self.vectors = vectors or {}
+        self.calls = []
+
+    def get_embeddings(self, texts):
+        self.calls.append(list(texts))
+        return [np.asarray(self.vectors.get(text.lower(), [len(text), 1.0, 0.0]), dtype=np.float64) for text in texts]
+
+
+class ConsultationSymptomsTests(TestCase):
+
+    def test_labels_from_every_criteria_shape(self):
+        self.assertEqual(symptom_history.consultation_symptoms({
+            'A': ['Humeur  dépressive', None, 'x'],
+            'B': {'1': 'Insomnie', '2': '\tFatigue '},
+            'C': 'Anhédonie',
+            '_metadata': {'model_used': 'gpt-4o'},
+        }), ['Humeur dépressive', 'Insomnie', 'Fatigue', 'Anhédonie'])
+        self.assertEqual(symptom_history.consultation_symptoms(None), [])
+
+    def test_hash_ignores_case_and_spacing(self):
+        self.assertEqual(symptom_history.symptom_hash(' Humeur   DÉPRESSIVE'), symptom_history.symptom_hash('humeur dépressive'))
+        self.assertNotEqual(symptom_history.symptom_hash('Insomnie'), symptom_history.symptom_hash('Hypersomnie'))
+
+
+@override_settings(SYMPTOM_EMBEDDING_BATCH_SIZE=2)
+class EmbedSymptomsTests(TestCase):
+
+    def test_distinct_missing_symptoms_are_embedded_in_batches(self):
+        service = FakeSymptomService()
+        created = symptom_history.embed_symptoms(['Insomnie', 'INSOMNIE ', 'Fatigue', 'Anxiété', 'Irritabilité'],
+                                                 service=service)
+        self.assertEqual(created, 4)
+        self.assertEqual([len(batch) for batch in service.calls], [2, 2])
+        embedding = SymptomEmbedding.objects.get(texte_hash=symptom_history.symptom_hash('insomnie'))
+        self.assertEqual((embedding.texte, embedding.modele_embedding, embedding.dimension),
+                         ('Insomnie', 'fake-embedding', 3))
+        np.testing.assert_array_equal(np.frombuffer(bytes(embedding.vecteur), dtype=np.float32), [8, 1, 0])
+
+        # Déjà en cache : aucun appel
+        self.assertEqual(symptom_history.embed_symptoms(['fatigue', 'Insomnie'], service=service), 0)
+        self.assertEqual(len(service.calls), 2)
+        self.assertEqual(symptom_history.embed_symptoms(['Fatigue', 'Apathie'], service=service), 1)
+        self.assertEqual(service.calls[-1], ['Apathie'])
+
+    def test_rows_inserted_by_another_run_are_not_counted(self):
+        service = FakeSymptomService()
+        get_embeddings = service.get_embeddings
+
+        def concurrent_run(texts):
+            # Un autre passage vectorise le même texte pendant l'appel API
+            SymptomEmbedding.objects.create(
+                texte_hash=symptom_history.symptom_hash(texts[0]), texte=texts[0],
+                modele_embedding=service.embedding_model_name, vecteur=np.zeros(3, dtype=np.float32).tobytes(),
+                dimension=3,
+            )
+            return get_embeddings(texts)
+
+        service.get_embeddings = concurrent_run
+        self.assertEqual(symptom_history.embed_symptoms(['Insomnie', 'Fatigue'], service=service), 1)
+        self.assertEqual(SymptomEmbedding.objects.count(), 2)
+
+    def test_cache_is_per_embedding_model(self):
+        symptom_history.embed_symptoms(['Insomnie'], service=FakeSymptomService())
+        other = FakeSymptomService()
+        other.embedding_model_name = 'other-embedding'
+        self.assertEqual(symptom_history.embed_symptoms(['Insomnie'], service=other), 1)
+        self.assertEqual(set(symptom_history.cached_embeddings(['insomnie'], 'fake-embedding')),
+                         {symptom_history.symptom_hash('Insomnie')})
+
+    def test_command_embeds_validated_consultations(self):
+        patient = make_patient()
+        make_consultation(patient, criteres_valides={'A': ['Insomnie', 'Fatigue']})
+        make_consultation(patient, criteres_valides={'A': ['Anxiété']}, statut='non_valide')
+        with mock.patch('pathology_search.management.commands.embed_symptoms.embed_symptoms',
+                        return_value=2) as embed:
+            call_command('embed_symptoms', embedding_model='gemini', stdout=io.StringIO())
+        embed.assert_called_once_with({'Insomnie', 'Fatigue'}, 'gemini')
+
+
+@override_settings(HISTORY_SEARCH_QUERY_WEIGHT=0.75, HISTORY_SEARCH_HALF_LIFE_DAYS=30, HISTORY_SEARCH_MAX_SYMPTOMS=50)
+class HistoryQueryEmbeddingTests(TestCase):
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.now = local_datetime(2024, 6, 1, 12, 0)
+        self.service = FakeSymptomService({
+            'insomnie': [1, 0, 0, 0], 'fatigue': [0, 2, 0, 0], 'anxiété': [0, 0, 1, 0], 'autre dimension': [1, 0],
+        })
+        self.query = np.array([0, 0, 0, 3.0])
+
+    def consult(self, days_ago, symptoms, statut='valide'):
+        return make_consultation(self.patient, date_consultation=self.now - timedelta(days=days_ago), statut=statut,
+                                 criteres_valides={'symptomes': symptoms})
+
+    def blend(self):
+        schedule = mock.patch.object(symptom_history, 'schedule_embedding')
+        with schedule as scheduled:
+            embedding, info = symptom_history.history_query_embedding(self.service, self.query, self.patient.id,
+                                                                      now=self.now)
+        return embedding, info, scheduled
+
+    def test_history_is_ordered_and_limited(self):
+        self.consult(40, ['Fatigue'])
+        self.consult(10, ['Insomnie', 'Anxiété'])
+        self.consult(1, ['Apathie'], statut='non_valide')
+        history = symptom_history.patient_symptom_history(self.patient.id)
+        self.assertEqual([symptom for symptom, _ in history], ['Anxiété', 'Insomnie', 'Fatigue'])
+        self.assertEqual(history[2][1], self.now - timedelta(days=40))
+        self.assertEqual(len(symptom_history.patient_symptom_history(self.patient.id, limit=1)), 1)
+
+    def test_without_history_query_is_unchanged(self):
+        self.consult(1, ['Insomnie'], statut='non_valide')
+        embedding, info, scheduled = self.blend()
+        self.assertIs(embedding, self.query)
+        self.assertEqual(info, {'symptoms_used': 0, 'symptoms_pending': 0, 'query_weight': 0.75})
+        scheduled.assert_not_called()
+
+    def test_cached_symptoms_are_weighted_by_recency(self):
+        self.consult(0, ['Insomnie'])
+        self.consult(30, ['Fatigue'])
+        symptom_history.embed_symptoms(['Insomnie', 'Fatigue'], service=self.service)
+        embedding, info, scheduled = self.blend()
+        history = np.array([1, 0.5, 0, 0]) / np.linalg.norm([1, 0.5, 0, 0])
+        np.testing.assert_allclose(embedding, 0.75 * np.array([0, 0, 0, 1]) + 0.25 * history, rtol=1e-6)
+        self.assertEqual((info['symptoms_used'], info['symptoms_pending']), (2, 0))
+        scheduled.assert_not_called()
+
+    def test_missing_vectors_are_queued_not_fetched(self):
+        self.consult(0, ['Insomnie', 'Anxiété'])
+        self.consult(5, ['Autre dimension'])
+        symptom_history.embed_symptoms(['Insomnie', 'Autre dimension'], service=self.service)
+        calls = len(self.service.calls)
+        embedding, info, scheduled = self.blend()
+        self.assertEqual(len(self.service.calls), calls)
+        scheduled.assert_called_once_with(['Anxiété'], 'openai-ada')
+        # Vecteur d'une autre dimension ignoré
+        self.assertEqual((info['symptoms_used'], info['symptoms_pending']), (1, 1))
+        np.testing.assert_allclose(embedding, [0.25, 0, 0, 0.75], rtol=1e-6)
+
+
+class ScheduleEmbeddingTests(TestCase):
+
+    def test_embedding_starts_after_commit(self):
+        with mock.patch.object(symptom_history._executor, 'submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                symptom_history.schedule_embedding(iter(['Insomnie']), 'gemini')
+                symptom_history.schedule_embedding([], 'gemini')
+                submit.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+        submit.assert_called_once_with(symptom_history._embed_in_background, ['Insomnie'], 'gemini')
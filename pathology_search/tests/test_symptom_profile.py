@@ -0,0 +1,97 @@
+"""
+Profil de symptômes des patients tenu à jour incrémentalement (symptom_profile).
+"""
+from datetime import datetime
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .. import symptom_profile
+from ..models import ConsultationSymptom, PatientSymptom
+from .factories import make_consultation, make_patient
+
+
+def local_datetime(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class SymptomProfileTests(TestCase):
+
+    def setUp(self):
+        self.patient = make_patient()
+
+    def consult(self, day, symptoms, statut='valide'):
+        return make_consultation(self.patient, date_consultation=local_datetime(2024, *day, 10, 0), statut=statut,
+                                 criteres_valides={'symptomes': symptoms, '_metadata': {'model_used': 'gpt-4o'}})
+
+    def profile(self):
+        return {
+            row.symptome: (row.occurrences, row.occurrences_validees, row.premiere_date, row.derniere_date,
+                           row.derniere_date_validee)
+            for row in PatientSymptom.objects.filter(patient=self.patient)
+        }
+
+    def assertProfileMatchesRebuild(self):
+        profile = self.profile()
+        symptom_profile.rebuild_patient(self.patient.id)
+        self.assertEqual(self.profile(), profile)
+
+    def test_profile_aggregates_consultations(self):
+        january = self.consult((1, 10), ['Insomnie', 'Fatigue', 'x'])
+        self.consult((2, 10), ['insomnie ', 'Anxiété'], statut='non_valide')
+        self.assertEqual(self.profile(), {
+            'insomnie': (2, 1, january.date_consultation, local_datetime(2024, 2, 10, 10, 0), january.date_consultation),
+            'Fatigue': (1, 1, january.date_consultation, january.date_consultation, january.date_consultation),
+            'Anxiété': (1, 0, local_datetime(2024, 2, 10, 10, 0), local_datetime(2024, 2, 10, 10, 0), None),
+        })
+        self.assertProfileMatchesRebuild()
+
+    def test_older_consultation_keeps_recent_label(self):
+        self.consult((2, 10), ['Insomnie'])
+        self.consult((1, 10), ['INSOMNIE'])
+        self.assertEqual(list(self.profile()), ['Insomnie'])
+        self.assertProfileMatchesRebuild()
+
+    def test_updates_move_only_changed_symptoms(self):
+        consultation = self.consult((1, 10), ['Insomnie', 'Fatigue'])
+        self.consult((3, 10), ['Fatigue'])
+        consultation.criteres_valides = {'symptomes': ['Insomnie', 'Irritabilité']}
+        consultation.statut = 'non_valide'
+        consultation.date_consultation = local_datetime(2024, 2, 1, 10, 0)
+        consultation.save()
+        profile = self.profile()
+        self.assertEqual(set(profile), {'Insomnie', 'Irritabilité', 'Fatigue'})
+        self.assertEqual(profile['Fatigue'][:2], (1, 1))
+        self.assertEqual(profile['Insomnie'][1], 0)
+        self.assertProfileMatchesRebuild()
+
+    def test_unchanged_consultation_is_not_reaggregated(self):
+        consultation = self.consult((1, 10), ['Insomnie'])
+        consultation.notes_medecin = 'Revoir dans un mois'
+        with CaptureQueriesContext(connection) as queries:
+            symptom_profile.sync_consultation(consultation)
+        statements = [query['sql'].split()[0].upper() for query in queries.captured_queries]
+        self.assertEqual([statement for statement in statements if statement in ('INSERT', 'UPDATE', 'DELETE')], [])
+        self.assertEqual(statements.count('SELECT'), 1)
+
+    def test_deletion_removes_orphan_symptoms(self):
+        first = self.consult((1, 10), ['Insomnie', 'Fatigue'])
+        self.consult((2, 10), ['Fatigue'])
+        first.delete()
+        self.assertEqual(list(self.profile()), ['Fatigue'])
+        self.assertEqual(self.profile()['Fatigue'][0], 1)
+        self.assertProfileMatchesRebuild()
+        self.patient.delete()
+        self.assertFalse(ConsultationSymptom.objects.exists())
+        self.assertFalse(PatientSymptom.objects.exists())
+
+    def test_reads_most_recent_first(self):
+        self.consult((1, 10), ['Fatigue', 'Anxiété'])
+        self.consult((2, 10), ['Insomnie'], statut='non_valide')
+        self.assertEqual(symptom_profile.symptom_labels(self.patient.id), ['Insomnie', 'Anxiété', 'Fatigue'])
+        self.assertEqual(symptom_profile.symptom_labels(self.patient.id, limit=1), ['Insomnie'])
+        validated = symptom_profile.patient_symptoms(self.patient.id, validated_only=True)
+        self.assertEqual([row.symptome for row in validated], ['Anxiété', 'Fatigue'])
+        self.assertEqual(symptom_profile.symptom_count(self.patient.id), 3)
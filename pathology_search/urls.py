@@ -18,18 +18,34 @@ urlpatterns = [
     path('consultation/<uuid:consultation_id>/validate/', views.validate_treatment_plan, name='validate_treatment_plan'),
     path('consultation/<uuid:consultation_id>/modify/', views.modify_treatment_plan, name='modify_treatment_plan'),
     path('consultation/<uuid:consultation_id>/delete/', views.delete_consultation, name='delete_consultation'),
+    path('api/consultations/<uuid:consultation_id>/similar/', views.get_similar_cases, name='get_similar_cases'),
+    path('api/consultations/similar/', views.search_similar_cases, name='search_similar_cases'),
+    path('api/consultations/search/', views.search_consultations, name='search_consultations'),
     # API Patients
     path('api/patients/', views.get_patients, name='get_patients'),
+    path('api/patients/typeahead/', views.typeahead_patients, name='typeahead_patients'),
     path('api/patients/create/', views.create_patient, name='create_patient'),
+    path('api/patients/import/', views.import_patients, name='import_patients'),
     path('api/patients/<int:patient_id>/history/', views.get_patient_history, name='get_patient_history'),
+    path('api/patients/<int:patient_id>/history/summary/', views.get_patient_history_summary, name='get_patient_history_summary'),
+    path('api/patients/<int:patient_id>/timeline/', views.get_patient_timeline, name='get_patient_timeline'),
     # API Médecins
     path('api/medecins/', views.get_medecins, name='get_medecins'),
     path('api/medecins/create/', views.create_medecin, name='create_medecin'),
     # API Pathologies
     path('api/pathologies/', views.get_all_pathologies, name='get_all_pathologies'),
+    path('api/pathologies/criteria/', views.get_pathology_criteria, name='get_pathology_criteria'),
+    path('api/pathologies/differentials/', views.get_pathology_differentials, name='get_pathology_differentials'),
+    path('api/pathologies/categories/', views.get_pathology_categories, name='get_pathology_categories'),
     path('direct-access/', views.direct_pathology_access, name='direct_pathology_access'),
     # Rapports et historique
     path('print/<uuid:consultation_id>/', views.print_report, name='print_report'),
+    path('api/reports/export/', views.export_reports, name='export_reports'),
+    path('api/export/consultations/', views.export_consultations, name='export_consultations'),
+    path('api/export/patients/', views.export_patients, name='export_patients'),
     path('patient/<int:patient_id>/history/', views.patient_history, name='patient_history'),
+    # Tableau de bord clinique
+    path('analytics/', views.analytics_page, name='analytics_page'),
+    path('api/analytics/', views.get_analytics, name='get_analytics'),
 ]
 
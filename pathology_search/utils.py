@@ -0,0 +1,153 @@
+import base64
+import json
+import re
+import unicodedata
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def clean_pathology_name(text):
+    if not text:
+        return text
+    text = str(text)
+    
+    # Enlever les crochets et guillemets
+    text = text.strip('[]"\'')
+    text = text.replace('["', '').replace('"]', '')
+    text = text.replace("['", '').replace("']", '')
+    
+    # Enlever les emojis
+    text = re.sub(r'[\U0001F300-\U0001F9FF]', '', text)
+    text = re.sub(r'[\u2600-\u26FF]', '', text)
+    text = re.sub(r'[\u2700-\u27BF]', '', text)
+    
+    # Enlever les préfixes SubSection et Section avec leurs numéros
+    text = re.sub(r'SubSection\s*\d+\.?\d*\s+', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'Section\s*\d+\.?\d*\s+', '', text, flags=re.IGNORECASE)
+    
+    # Enlever aussi les variantes avec tirets bas et points
+    text = re.sub(r'SubSection\d+\.\d+[_\s]+', '', text)
+    text = re.sub(r'Section\d+[_\s]+', '', text)
+    
+    # Enlever les "Section :" et "Sous-section :" en français
+    text = re.sub(r'Section\s+\d+\s*:\s*', '', text)
+    text = re.sub(r'Sous-section\s+[\d.]+\s*:\s*', '', text)
+    
+    # Remplacer les underscores par des espaces
+    text = text.replace('_', ' ')
+    
+    return text.strip()
+
+
+def fold_text(text):
+    """Texte de recherche : sans accents, en minuscules, ponctuation (sauf '-') remplacée par des espaces."""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    text = re.sub(r'[^\w\s-]|_', ' ', text)
+    return ' '.join(text.split())
+
+
+def period_filter(field, date_from=None, date_to=None):
+    """Filtre sur une période en dates locales, en bornes datetime (index utilisable)."""
+    filters = {}
+    if date_from:
+        filters[f'{field}__gte'] = timezone.make_aware(datetime.combine(date_from, time.min))
+    if date_to:
+        filters[f'{field}__lt'] = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    return filters
+
+
+# ============= PAGINATION PAR CURSEUR =============
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values):
+    """Curseur opaque (JSON en base64 URL) : clés de tri de la dernière ligne d'une page."""
+    payload = json.dumps(list(values), ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, *parsers):
+    """Valeurs d'un curseur, converties par parsers (un par valeur, ValueError / TypeError si invalide)."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(payload.decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise InvalidCursor(cursor)
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (ValueError, TypeError, AttributeError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+
+def typed(*types):
+    """Parser de curseur : valeur inchangée si elle est d'un des types (booléens exclus)."""
+    def parse(value):
+        if isinstance(value, bool) or not isinstance(value, types):
+            raise TypeError(value)
+        return value
+    return parse
+
+
+# ============= PROJECTIONS PATIENT =============
+# Les listes lisent des colonnes (values()) au lieu d'instancier les modèles
+
+PATIENT_NAME_FIELDS = ('nom', 'prenom', 'last_name', 'first_name')
+
+
+def patient_full_name(row, prefix=''):
+    """Même format que Patient.nom_complet, depuis une ligne values() (prefix : 'patient__' via une relation)."""
+    nom = row[f'{prefix}last_name'] or row[f'{prefix}nom'] or ''
+    prenom = row[f'{prefix}first_name'] or row[f'{prefix}prenom'] or ''
+    return f"{prenom} {nom}"
+
+
+def clean_text_for_pdf(text):
+    if not text:
+        return text
+    text = str(text)
+    # Enlever les crochets et guillemets
+    text = text.strip('[]"\'')
+    text = text.replace('["', '').replace('"]', '')
+    text = text.replace("['", '').replace("']", '')
+    # Enlever les emojis
+    text = re.sub(r'[\U0001F300-\U0001F9FF]', '', text)
+    text = re.sub(r'[\u2600-\u26FF]', '', text)
+    text = re.sub(r'[\u2700-\u27BF]', '', text)
+    return text.strip()
+
+
+def format_plan_traitement_html(text):
+    if not text:
+        return text
+    text = str(text)
+    
+    # Enlever les emojis
+    text = re.sub(r'[\U0001F300-\U0001F9FF]', '', text)
+    text = re.sub(r'[\u2600-\u26FF]', '', text)
+    text = re.sub(r'[\u2700-\u27BF]', '', text)
+    
+    # Convertir les titres markdown en HTML avec styles (non-gourmand pour éviter ReDoS)
+    text = re.sub(r'^# (.+?)$', r'<div class="plan-h1">\1</div>', text, flags=re.MULTILINE)
+    text = re.sub(r'^## (.+?)$', r'<div class="plan-h2">\1</div>', text, flags=re.MULTILINE)
+    text = re.sub(r'^### (.+?)$', r'<div class="plan-h3">\1</div>', text, flags=re.MULTILINE)
+    
+    # Convertir le gras **texte** en <strong> (déjà sécurisé avec [^\*]+)
+    text = re.sub(r'\*\*([^\*]+)\*\*', r'<strong>\1</strong>', text)
+    
+    # Convertir les listes à puces (non-gourmand pour éviter ReDoS)
+    text = re.sub(r'^\- (.+?)$', r'<div class="plan-bullet">• \1</div>', text, flags=re.MULTILINE)
+    text = re.sub(r'^\* (.+?)$', r'<div class="plan-bullet">• \1</div>', text, flags=re.MULTILINE)
+    
+    # Convertir les numéros de liste (non-gourmand pour éviter ReDoS)
+    text = re.sub(r'^\d+\.\s+(.+?)$', r'<div class="plan-number">\1</div>', text, flags=re.MULTILINE)
+    
+    # Convertir les sauts de ligne en <br>
+    text = text.replace('\n\n', '<br><br>')
+    text = text.replace('\n', '<br>')
+    
+    return text
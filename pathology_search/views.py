@@ -8,98 +8,43 @@ import uuid
 from datetime import datetime
 from pathlib import Path
 from django.conf import settings
-from django.http import Http404, HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.views.decorators.http import require_http_methods
 
 from openai import OpenAI
-from weasyprint import HTML
 
+from . import analytics, catalog, consultation_search, criteria, data_export, differentials, identifiers, pathology_pages, patient_directory, patient_import, patient_timeline, patient_typeahead, reports, result_store, search_index, similar_cases, symptom_history, symptom_profile
 from .models import Consultation, Medecin, Patient
-from .services import PathologySearchService
+from .services import PROMPT_HISTORY_SYMPTOMS, PathologySearchService, get_embedding_config
+from .utils import InvalidCursor, clean_pathology_name
 
 
-def clean_pathology_name(text):
-    if not text:
-        return text
-    text = str(text)
-    
-    # Enlever les crochets et guillemets
-    text = text.strip('[]"\'')
-    text = text.replace('["', '').replace('"]', '')
-    text = text.replace("['", '').replace("']", '')
-    
-    # Enlever les emojis
-    text = re.sub(r'[\U0001F300-\U0001F9FF]', '', text)
-    text = re.sub(r'[\u2600-\u26FF]', '', text)
-    text = re.sub(r'[\u2700-\u27BF]', '', text)
-    
-    # Enlever les préfixes SubSection et Section avec leurs numéros
-    text = re.sub(r'SubSection\s*\d+\.?\d*\s+', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'Section\s*\d+\.?\d*\s+', '', text, flags=re.IGNORECASE)
-    
-    # Enlever aussi les variantes avec tirets bas et points
-    text = re.sub(r'SubSection\d+\.\d+[_\s]+', '', text)
-    text = re.sub(r'Section\d+[_\s]+', '', text)
-    
-    # Enlever les "Section :" et "Sous-section :" en français
-    text = re.sub(r'Section\s+\d+\s*:\s*', '', text)
-    text = re.sub(r'Sous-section\s+[\d.]+\s*:\s*', '', text)
-    
-    # Remplacer les underscores par des espaces
-    text = text.replace('_', ' ')
-    
-    return text.strip()
+logger = logging.getLogger(__name__)
 
 
-def clean_text_for_pdf(text):
-    if not text:
-        return text
-    text = str(text)
-    # Enlever les crochets et guillemets
-    text = text.strip('[]"\'')
-    text = text.replace('["', '').replace('"]', '')
-    text = text.replace("['", '').replace("']", '')
-    # Enlever les emojis
-    text = re.sub(r'[\U0001F300-\U0001F9FF]', '', text)
-    text = re.sub(r'[\u2600-\u26FF]', '', text)
-    text = re.sub(r'[\u2700-\u27BF]', '', text)
-    return text.strip()
-
-
-def format_plan_traitement_html(text):
-    if not text:
-        return text
-    text = str(text)
-    
-    # Enlever les emojis
-    text = re.sub(r'[\U0001F300-\U0001F9FF]', '', text)
-    text = re.sub(r'[\u2600-\u26FF]', '', text)
-    text = re.sub(r'[\u2700-\u27BF]', '', text)
-    
-    # Convertir les titres markdown en HTML avec styles (non-gourmand pour éviter ReDoS)
-    text = re.sub(r'^# (.+?)$', r'<div class="plan-h1">\1</div>', text, flags=re.MULTILINE)
-    text = re.sub(r'^## (.+?)$', r'<div class="plan-h2">\1</div>', text, flags=re.MULTILINE)
-    text = re.sub(r'^### (.+?)$', r'<div class="plan-h3">\1</div>', text, flags=re.MULTILINE)
-    
-    # Convertir le gras **texte** en <strong> (déjà sécurisé avec [^\*]+)
-    text = re.sub(r'\*\*([^\*]+)\*\*', r'<strong>\1</strong>', text)
-    
-    # Convertir les listes à puces (non-gourmand pour éviter ReDoS)
-    text = re.sub(r'^\- (.+?)$', r'<div class="plan-bullet">• \1</div>', text, flags=re.MULTILINE)
-    text = re.sub(r'^\* (.+?)$', r'<div class="plan-bullet">• \1</div>', text, flags=re.MULTILINE)
-    
-    # Convertir les numéros de liste (non-gourmand pour éviter ReDoS)
-    text = re.sub(r'^\d+\.\s+(.+?)$', r'<div class="plan-number">\1</div>', text, flags=re.MULTILINE)
-    
-    # Convertir les sauts de ligne en <br>
-    text = text.replace('\n\n', '<br><br>')
-    text = text.replace('\n', '<br>')
-    
-    return text
+def _store_search_results(request, results):
+    """Stocker les résultats côté serveur et ne garder que leur identifiant en session."""
+    result_store.delete(request.session.get('search_results_id'))
+    request.session['search_results_id'] = result_store.put(
+        result_store.SEARCH, result_store.compact_search_results(results)
+    )
+
+
+def _get_search_results(request):
+    return result_store.get(request.session.get('search_results_id'), result_store.SEARCH) or []
+
+
+def _remember_diagnosis(request, diagnosis_id):
+    """Référencer un diagnostic dans la session (liste bornée aux plus récents)."""
+    diagnosis_ids = request.session.get('diagnosis_ids', [])
+    diagnosis_ids.append(diagnosis_id)
+    request.session['diagnosis_ids'] = diagnosis_ids[-settings.RESULT_STORE_MAX_DIAGNOSES:]
 
 
 def index(request):
@@ -120,6 +65,14 @@ def search(request):
         historical_symptoms = data.get('historical_symptoms', [])  
         
         embedding_model = data.get('embedding_model', 'openai-ada')  
+        use_history = data.get('use_history', False)
+        
+        # Filtres par famille de troubles / emplacement dans la hiérarchie
+        search_filters = {
+            key: data.get(key)
+            for key in ('include_categories', 'exclude_categories', 'include_locations', 'exclude_locations')
+            if data.get(key)
+        }
         
         if not query:
             return JsonResponse({
@@ -248,11 +201,24 @@ Réponds UNIQUEMENT au format JSON:
             })
     
         service = PathologySearchService(model='chatgpt-5.1', embedding_model_type=embedding_model)
+        
+        # Mode historique : vecteur de la requête combiné aux symptômes validés du patient (vecteurs en cache)
+        query_embedding = None
+        history_info = None
+        if use_history and patient_id:
+            query_embedding, history_info = symptom_history.history_query_embedding(
+                service, service.get_embedding(enriched_query), patient_id
+            )
+        
         search_results = service.find_best_match(
             query=enriched_query,  # Utiliser la requête originale (sans antécédents)
             top_k=top_k,
-            aggregation=aggregation
+            aggregation=aggregation,
+            filters=search_filters or None,
+            query_embedding=query_embedding
         )
+        if history_info is not None:
+            search_results['history'] = history_info
         
         if search_results.get('success') and search_results.get('results'):
             for result in search_results['results']:
@@ -261,8 +227,9 @@ Réponds UNIQUEMENT au format JSON:
         
         
         if use_validation and search_results.get('success'):
-            request.session['search_results'] = search_results['results']
+            _store_search_results(request, search_results['results'])
             request.session['search_query'] = query
+            request.session['search_embedding_model'] = embedding_model
             
             request.session['visited_diagnostic_indices'] = []
             request.session.modified = True
@@ -282,7 +249,7 @@ Réponds UNIQUEMENT au format JSON:
 
 
 def results_selection(request):
-    results = request.session.get('search_results', [])
+    results = _get_search_results(request)
     query = request.session.get('search_query', '')
     
     if not results:
@@ -292,6 +259,7 @@ def results_selection(request):
     
 
     visited_indices = set(request.session.get('visited_diagnostic_indices', []))
+    embeddings_folder = get_embedding_config(request.session.get('search_embedding_model', 'openai-ada'))['folder']
 
     prepared_results = []
     for i, result in enumerate(results):
@@ -302,13 +270,17 @@ def results_selection(request):
         similarity = result.get('similarity', 0)
         similarity_percent = round(similarity * 100, 1)
         
+        # Diagnostics différentiels précalculés (matrice de similarité entre pathologies)
+        entry = differentials.find_entry(embeddings_folder, file_name=result.get('file_name', ''), html_page=result.get('html_page', ''))
+        
         prepared_results.append({
             'index': i,
             'pathology_name': pathology_name,
             'location': result.get('location', ''),
             'similarity': similarity,
             'similarity_percent': similarity_percent,
-            'html_page': result.get('html_page', '')
+            'html_page': result.get('html_page', ''),
+            'differentials': differentials.get_differentials(embeddings_folder, entry, limit=3)
         })
     
     if len(visited_indices) >= len(results):
@@ -334,58 +306,13 @@ def create_patient_page(request):
 
 def _generate_patient_identifier():
     """Generate unique patient identifier."""
-    last_patient = Patient.objects.order_by('-id').first()
-    if last_patient and last_patient.patient_identifier and last_patient.patient_identifier.startswith('EE-2025-'):
-        try:
-            last_num = int(last_patient.patient_identifier.split('-')[-1])
-            return f'EE-2025-{last_num + 1:03d}'
-        except (ValueError, IndexError):
-            pass
-    return 'EE-2025-001'
-
-
-def _parse_birth_date(date_str):
-    """Parse birth date string to date object."""
-    if not date_str:
-        return None
-    try:
-        return datetime.strptime(date_str, '%Y-%m-%d').date()
-    except (ValueError, TypeError):
-        return None
+    return identifiers.next_identifier(identifiers.PATIENT)
 
 
 def _extract_patient_data(data):
     """Extract and prepare patient data from request."""
-    birth_date = _parse_birth_date(data.get('birth_date'))
-    has_insurance = data.get('has_insurance') in (True, 'true')
-    
-    return {
-        'patient_identifier': data.get('patient_identifier', '').strip() or _generate_patient_identifier(),
-        'cin': data.get('cin', '').strip() or None,
-        'passport_number': data.get('passport_number', '').strip() or None,
-        'last_name': data.get('last_name', '').strip().upper() or None,
-        'first_name': data.get('first_name', '').strip().capitalize() or None,
-        'gender': data.get('gender', '') or None,
-        'birth_date': birth_date,
-        'nationality': data.get('nationality', 'MA').strip() or 'MA',
-        'profession': data.get('profession', '').strip() or '',
-        'city': data.get('city', '').strip() or '',
-        'email': data.get('email', '').strip() or '',
-        'phone': data.get('phone', '').strip() or '',
-        'mobile_number': data.get('mobile_number', '').strip() or '',
-        'spouse_name': data.get('spouse_name', '').strip() or '',
-        'treating_physician': data.get('treating_physician', '').strip() or None,
-        'referring_physician': data.get('referring_physician', '').strip() or None,
-        'disease_speciality': data.get('disease_speciality', '').strip() or None,
-        'has_insurance': has_insurance,
-        'insurance_number': data.get('insurance_number', '').strip() or None,
-        'affiliation_number': data.get('affiliation_number', '').strip() or None,
-        'nom': data.get('last_name', '').strip().upper() or None,
-        'prenom': data.get('first_name', '').strip().capitalize() or None,
-        'date_naissance': birth_date,
-        'numero_dossier': data.get('patient_identifier', '').strip() or _generate_patient_identifier(),
-        'telephone': data.get('mobile_number', '').strip() or data.get('phone', '').strip() or ''
-    }
+    patient_identifier = data.get('patient_identifier', '').strip() or _generate_patient_identifier()
+    return patient_import.patient_fields(data, patient_identifier)
 
 
 @require_http_methods(["POST"])
@@ -403,6 +330,10 @@ def create_patient_submit(request):
             }, status=400)
         
         patient = Patient.objects.create(**patient_data)
+        if data.get('patient_identifier', '').strip():
+            # Identifiant saisi : ne pas le réattribuer
+            identifiers.reserve(identifiers.PATIENT, patient_identifier)
+        patient_typeahead.patient_changed(patient)
         
         return JsonResponse({
             'success': True,
@@ -432,81 +363,27 @@ def print_report(request, consultation_id):
         
         consultation = Consultation.objects.select_related('patient', 'medecin').get(id=consultation_id)
         
-        logger.info(f"Generating PDF for consultation {consultation_id}")
-        
-        if not consultation.criteres_valides:
-            consultation.criteres_valides = {}
-        
-        model_used = 'chatgpt-5.1'  # Par défaut
-        model_display_name = 'Model 1'
-        if consultation.criteres_valides and '_metadata' in consultation.criteres_valides:
-            metadata = consultation.criteres_valides['_metadata']
-            model_used = metadata.get('model_used', 'chatgpt-5.1')
-            # Convertir le nom du modèle pour l'affichage
-            model_names = {
-                'chatgpt-5.1': 'Model 1',
-                'claude-4.5': 'Model 2'
-            }
-            model_display_name = model_names.get(model_used, metadata.get('model_display_name', 'Model 1'))
-        
-        plan_traitement_a_utiliser = consultation.plan_traitement_valide if consultation.plan_traitement_valide else consultation.plan_traitement
-        
-        plan_traitement_clean = format_plan_traitement_html(plan_traitement_a_utiliser)
-        
-        pathologie_clean = clean_pathology_name(consultation.pathologie_identifiee)
-        
-        criteres_valides_clean = {}
-        for key, value in consultation.criteres_valides.items():
-            if key == '_metadata':  # Exclure les métadonnées de l'affichage
-                continue
-            clean_key = clean_text_for_pdf(key)
-            clean_value = clean_text_for_pdf(value)
-            criteres_valides_clean[clean_key] = clean_value
-        
-        notes_medecin_clean = consultation.notes_medecin if consultation.notes_medecin else ''
-        
-        is_direct_access = consultation.description_clinique.startswith('Accès direct à la pathologie')
-        
-        context = {
-            'consultation': consultation,
-            'patient': consultation.patient,
-            'medecin': consultation.medecin,
-            'date_impression': timezone.now(),
-            'plan_traitement_clean': plan_traitement_clean,
-            'pathologie_clean': pathologie_clean,
-            'notes_medecin': notes_medecin_clean,  # 🆕 Notes du médecin
-            'criteres_valides_clean': criteres_valides_clean,
-            'model_used': model_used,  # 🆕 Modèle utilisé
-            'model_display_name': model_display_name,  # 🆕 Nom formaté pour affichage
-            'is_direct_access': is_direct_access,  # 🆕 Flag pour masquer la description clinique
-        }
+        # Le PDF ne change qu'avec sa version (consultation, patient, médecin, gabarit) : réponse 304 si le
+        # navigateur l'a déjà. Pas de Last-Modified : le patient n'a pas de date de modification.
+        etag = reports.report_etag(consultation)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
         
+        # Créer le PDF avec WeasyPrint (ou le récupérer depuis le cache)
         try:
-            # Rendre le template HTML simplifié pour PDF
-            html = render_to_string('pathology_search/print_report_pdf.html', context)
-            logger.info("HTML template rendered successfully")
-        except Exception as e:
-            logger.error(f"Error rendering template: {str(e)}")
-            return HttpResponse(f'Erreur lors du rendu du template: {str(e)}', status=500)
-        
-        # Créer le PDF avec WeasyPrint
-        try:
-            
-            
-            # Générer le PDF
-            pdf_file = HTML(string=html).write_pdf()
-            
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            # Nettoyer le nom de fichier pour éviter les caractères spéciaux
-            filename = f'rapport_{consultation.patient.nom}_{consultation.patient.prenom}_{consultation.patient.numero_dossier}.pdf'
-            filename = filename.replace(' ', '_').replace("'", '')
-            response['Content-Disposition'] = f'inline; filename="{filename}"'
-            logger.info("PDF generated successfully with WeasyPrint")
-            return response
+            pdf_file = reports.get_or_render_pdf(consultation)
         except Exception as e:
             logger.error(f"Error creating PDF: {str(e)}")
             return HttpResponse(f'Erreur lors de la création du PDF: {str(e)}', status=500)
         
+        response = HttpResponse(pdf_file, content_type='application/pdf')
+        response['Content-Disposition'] = f'inline; filename="{reports.report_filename(consultation)}"'
+        response['ETag'] = etag
+        # Données patient : cache navigateur uniquement, revalidé à chaque affichage
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+        
     except Consultation.DoesNotExist:
         return render(request, 'pathology_search/index.html', {
             'error': 'Consultation non trouvée.'
@@ -518,17 +395,148 @@ def print_report(request, consultation_id):
         return HttpResponse(f'Erreur inattendue: {str(e)}', status=500)
 
 
+def _date_param(request, name):
+    """Date AAAA-MM-JJ du paramètre `name` (None s'il est absent) ; ValueError si elle est invalide."""
+    value = request.GET.get(name, '').strip()
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def _id_param(request, name):
+    """Identifiant entier du paramètre `name` (None s'il est absent) ; ValueError s'il est invalide."""
+    value = request.GET.get(name, '').strip()
+    return int(value) if value else None
+
+
+@require_http_methods(["GET"])
+def export_reports(request):
+    """Export ZIP des rapports PDF d'un patient, d'un médecin ou d'une période."""
+    try:
+        patient_id = _id_param(request, 'patient_id')
+        medecin_id = _id_param(request, 'medecin_id')
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Paramètre patient_id ou medecin_id invalide'}, status=400)
+    try:
+        date_from = _date_param(request, 'date_from')
+        date_to = _date_param(request, 'date_to')
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Date invalide (format AAAA-MM-JJ)'}, status=400)
+    filters = {
+        'patient_id': patient_id,
+        'medecin_id': medecin_id,
+        'date_from': date_from,
+        'date_to': date_to,
+        'statut': request.GET.get('statut') or None,
+    }
+    if not any(filters[key] for key in ('patient_id', 'medecin_id', 'date_from', 'date_to')):
+        return JsonResponse({
+            'success': False,
+            'error': 'Préciser un patient, un médecin ou une période (date_from / date_to au format AAAA-MM-JJ)'
+        }, status=400)
+    
+    consultations = reports.export_queryset(**filters)
+    response = StreamingHttpResponse(reports.iter_reports_zip(consultations), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="rapports_{timezone.now():%Y%m%d_%H%M%S}.zip"'
+    return response
+
+
+def _export_params(request):
+    """(format, date_from, date_to) d'une requête d'export ; ValueError si invalides."""
+    fmt = request.GET.get('format', data_export.CSV)
+    if fmt not in data_export.FORMATS:
+        raise ValueError(f'Format {fmt} non supporté (csv ou ndjson)')
+    try:
+        date_from = _date_param(request, 'date_from')
+        date_to = _date_param(request, 'date_to')
+    except ValueError:
+        raise ValueError('Date invalide (format AAAA-MM-JJ)')
+    return fmt, date_from, date_to
+
+
+def _export_response(chunks, kind, fmt):
+    response = StreamingHttpResponse(chunks, content_type=data_export.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{data_export.export_filename(kind, fmt)}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+@require_http_methods(["GET"])
+def export_consultations(request):
+    """Export en flux des consultations (?format=csv|ndjson, date_from, date_to, statut)."""
+    try:
+        fmt, date_from, date_to = _export_params(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    chunks = data_export.export_consultations(fmt, date_from, date_to, statut=request.GET.get('statut') or None)
+    return _export_response(chunks, 'consultations', fmt)
+
+
+@require_http_methods(["GET"])
+def export_patients(request):
+    """Export en flux des patients (?format=csv|ndjson, date_from, date_to sur la date de création)."""
+    try:
+        fmt, date_from, date_to = _export_params(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return _export_response(data_export.export_patients(fmt, date_from, date_to), 'patients', fmt)
+
+
+def analytics_page(request):
+    """Tableau de bord clinique (graphiques alimentés par /api/analytics/)."""
+    date_from, date_to = analytics.default_period()
+    return render(request, 'pathology_search/analytics.html', {'date_from': date_from, 'date_to': date_to})
+
+
+@require_http_methods(["GET"])
+def get_analytics(request):
+    """Séries du tableau de bord (?date_from=, &date_to=, &granularity=day|week|month), lues dans les agrégats."""
+    granularity = request.GET.get('granularity', 'month')
+    if granularity not in analytics.GRANULARITIES:
+        return JsonResponse({'success': False, 'error': 'Paramètre granularity invalide (day, week ou month)'}, status=400)
+    try:
+        date_from = _date_param(request, 'date_from')
+        date_to = _date_param(request, 'date_to')
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Date invalide (format AAAA-MM-JJ)'}, status=400)
+    default_from, default_to = analytics.default_period()
+    date_from, date_to = date_from or default_from, date_to or default_to
+    if date_from > date_to:
+        return JsonResponse({'success': False, 'error': 'date_from postérieure à date_to'}, status=400)
+
+    try:
+        data = analytics.dashboard(date_from, date_to, granularity)
+        for row in data['par_modele']:
+            row['libelle'] = reports.MODEL_DISPLAY_NAMES.get(row['modele'], row['modele'])
+        return JsonResponse({'success': True, **data})
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors du calcul du tableau de bord: {str(e)}'
+        }, status=500)
+
 def patient_history(request, patient_id):
 
     try:
         
         
         patient = Patient.objects.get(id=patient_id)
-        consultations = Consultation.objects.filter(patient=patient).order_by('-date_consultation')
+        # Page de consultations (curseur de patient_timeline) : trois requêtes quelle que soit la taille de l'historique
+        try:
+            consultations, next_cursor = patient_timeline.consultation_page(
+                patient.id, cursor=request.GET.get('cursor') or None, limit=settings.PATIENT_HISTORY_PAGE_SIZE
+            )
+        except InvalidCursor:
+            consultations, next_cursor = patient_timeline.consultation_page(patient.id, limit=settings.PATIENT_HISTORY_PAGE_SIZE)
         
         context = {
             'patient': patient,
             'consultations': consultations,
+            'consultations_total': Consultation.objects.filter(patient=patient).count(),
+            'next_cursor': next_cursor,
         }
         
         return render(request, 'pathology_search/patient_history.html', context)
@@ -541,24 +549,26 @@ def patient_history(request, patient_id):
 
 @require_http_methods(["GET"])
 def get_patients(request):
-    
+    """Annuaire des patients paginé (?q=, &cursor=, &limit=) : {patients, next_cursor, has_more}."""
+    try:
+        limit = min(max(int(request.GET.get('limit', patient_directory.DEFAULT_PAGE_SIZE)), 1), patient_directory.MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Paramètre limit invalide'}, status=400)
     
     try:
-        patients = Patient.objects.all()
-        patients_data = [
-            {
-                'id': patient.id,
-                'nom': patient.nom,
-                'prenom': patient.prenom,
-                'nom_complet': patient.nom_complet,
-                'numero_dossier': patient.numero_dossier,
-                'date_naissance': patient.date_naissance.isoformat() if patient.date_naissance else None,
-                'telephone': patient.telephone,
-                'email': patient.email
-            }
-            for patient in patients
-        ]
-        return JsonResponse({'success': True, 'patients': patients_data})
+        patients_data, next_cursor = patient_directory.list_patients(
+            query=request.GET.get('q', ''),
+            cursor=request.GET.get('cursor') or None,
+            limit=limit,
+        )
+        return JsonResponse({
+            'success': True,
+            'patients': patients_data,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        })
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Curseur invalide'}, status=400)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -566,6 +576,50 @@ def get_patients(request):
         }, status=500)
 
 
+@require_http_methods(["GET"])
+def typeahead_patients(request):
+    """Recherche instantanée par nom, prénom, CIN ou identifiant (?q=, &limit=)."""
+    try:
+        limit = min(max(int(request.GET.get('limit', patient_typeahead.DEFAULT_LIMIT)), 1), patient_typeahead.MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Paramètre limit invalide'}, status=400)
+    
+    try:
+        patients_data, engine = patient_typeahead.search_patients(request.GET.get('q', ''), limit=limit)
+        return JsonResponse({'success': True, 'patients': patients_data, 'engine': engine})
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la recherche des patients: {str(e)}'
+        }, status=500)
+
+
+@require_http_methods(["POST"])
+def import_patients(request):
+    """Import en masse de patients depuis un fichier CSV ou NDJSON (champ multipart 'file')."""
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': 'Fichier manquant (champ file)'}, status=400)
+    try:
+        fmt = request.POST.get('format') or patient_import.detect_format(upload.name)
+    except patient_import.ImportFormatError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    if fmt not in patient_import.FORMATS:
+        return JsonResponse({'success': False, 'error': f'Format {fmt} non supporté'}, status=400)
+    
+    try:
+        # Fichier lu par morceaux (les gros envois sont conservés sur disque par Django)
+        report = patient_import.ImportReport(keep_rejected=settings.PATIENT_IMPORT_MAX_REPORTED_REJECTS)
+        with upload.open('rb') as stream:
+            patient_import.import_patients(stream, fmt, report, dry_run=request.POST.get('dry_run') == 'true')
+        return JsonResponse({'success': True, **report.as_dict()})
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de l\'import des patients: {str(e)}'
+        }, status=500)
+
+
 def get_patient_history(request, patient_id):
    
     
@@ -574,9 +628,6 @@ def get_patient_history(request, patient_id):
         patient = Patient.objects.get(id=patient_id)
         consultations = Consultation.objects.filter(patient=patient).select_related('medecin').order_by('-date_consultation')
         
-        # Collecter TOUS les symptômes/critères de l'historique
-        all_symptoms = []
-        
         consultations_data = []
         for consultation in consultations:
             # Extraire les critères validés
@@ -587,9 +638,6 @@ def get_patient_history(request, patient_id):
                         criteria_list.extend(value)
                     else:
                         criteria_list.append(str(value))
-                
-                # Ajouter à la liste globale des symptômes
-                all_symptoms.extend(criteria_list)
             
             consultations_data.append({
                 'id': str(consultation.id),
@@ -603,8 +651,8 @@ def get_patient_history(request, patient_id):
                 'nombre_criteres': len(criteria_list)
             })
         
-        # Dédupliquer les symptômes
-        unique_symptoms = list(set(all_symptoms))
+        # Symptômes historiques : profil matérialisé du patient (une requête)
+        unique_symptoms = symptom_profile.symptom_labels(patient.id)
         
         return JsonResponse({
             'success': True,
@@ -631,6 +679,218 @@ def get_patient_history(request, patient_id):
         }, status=500)
 
 
+def _history_response(request, etag, build_payload):
+    """Réponse JSON validée par ETag (données patient : cache navigateur revalidé à chaque affichage)."""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build_payload())
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@require_http_methods(["GET"])
+def get_patient_timeline(request, patient_id):
+    """Consultations du patient, des plus récentes aux plus anciennes (?cursor=, &limit=, &fields=)."""
+    try:
+        limit = min(max(int(request.GET.get('limit', patient_timeline.DEFAULT_PAGE_SIZE)), 1), patient_timeline.MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Paramètre limit invalide'}, status=400)
+    
+    try:
+        fields = patient_timeline.parse_fields(request.GET.get('fields', ''))
+        cursor = request.GET.get('cursor') or None
+        if cursor:
+            patient_timeline.decode_page_cursor(cursor)
+        if not Patient.objects.filter(id=patient_id).exists():
+            return JsonResponse({'success': False, 'error': 'Patient non trouvé'}, status=404)
+        
+        etag = patient_timeline.history_etag(patient_id, patient_timeline.history_state(patient_id), fields, cursor, limit)
+        
+        def build_payload():
+            consultations_data, next_cursor = patient_timeline.list_consultations(
+                patient_id, fields=fields, cursor=cursor, limit=limit
+            )
+            return {
+                'success': True,
+                'consultations': consultations_data,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+        
+        return _history_response(request, etag, build_payload)
+    except patient_timeline.InvalidFields as e:
+        return JsonResponse({'success': False, 'error': f'Champs inconnus : {e}'}, status=400)
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Curseur invalide'}, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la récupération de l\'historique: {str(e)}'
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def get_patient_history_summary(request, patient_id):
+    """Résumé de l'historique : patient, nombre de consultations, dernières dates et symptômes enregistrés."""
+    try:
+        patient = Patient.objects.get(id=patient_id)
+        patient_data = {
+            'nom_complet': patient.nom_complet,
+            'numero_dossier': patient.numero_dossier,
+            'date_naissance': patient.date_naissance.strftime('%d/%m/%Y') if patient.date_naissance else None,
+            'telephone': patient.telephone,
+            'email': patient.email
+        }
+        etag = patient_timeline.history_etag(patient_id, patient_timeline.history_state(patient_id), 'summary', patient_data)
+        
+        def build_payload():
+            return {'success': True, 'patient': patient_data, **patient_timeline.history_summary(patient_id)}
+        
+        return _history_response(request, etag, build_payload)
+    except Patient.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Patient non trouvé'
+        }, status=404)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la récupération de l\'historique: {str(e)}'
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def search_consultations(request):
+    """Recherche plein texte dans les consultations (?q=, &medecin_id=, &statut=, &date_from=, &date_to=, &cursor=, &limit=)."""
+    try:
+        limit = min(max(int(request.GET.get('limit', consultation_search.DEFAULT_PAGE_SIZE)), 1), consultation_search.MAX_PAGE_SIZE)
+        medecin_id = int(request.GET['medecin_id']) if request.GET.get('medecin_id') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Paramètre limit ou medecin_id invalide'}, status=400)
+    try:
+        date_from = _date_param(request, 'date_from')
+        date_to = _date_param(request, 'date_to')
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Date invalide (format AAAA-MM-JJ)'}, status=400)
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'success': False, 'error': 'Paramètre q manquant'}, status=400)
+    
+    try:
+        engine = consultation_search.fulltext_engine()
+        if engine is None:
+            return JsonResponse({'success': False, 'error': 'Index plein texte indisponible (manage.py rebuild_fulltext_index)'}, status=503)
+        consultations_data, next_cursor = consultation_search.search_consultations(
+            query,
+            medecin_id=medecin_id,
+            statut=request.GET.get('statut') or None,
+            date_from=date_from,
+            date_to=date_to,
+            cursor=request.GET.get('cursor') or None,
+            limit=limit,
+        )
+        return JsonResponse({
+            'success': True,
+            'consultations': consultations_data,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'engine': engine
+        })
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Curseur invalide'}, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la recherche des consultations: {str(e)}'
+        }, status=500)
+
+
+def _similar_cases_options(params):
+    """Limite et filtres communs aux recherches de cas similaires."""
+    limit = min(max(int(params.get('limit', 10)), 1), 50)
+    statuts = params.get('statut') or []
+    if isinstance(statuts, str):
+        statuts = [statut for statut in statuts.split(',') if statut]
+    return limit, statuts
+
+
+@require_http_methods(["GET"])
+def get_similar_cases(request, consultation_id):
+    """Cas les plus proches d'une consultation enregistrée (?limit=, &statut=valide,non_valide, &same_patient=1)."""
+    try:
+        limit, statuts = _similar_cases_options(request.GET)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Paramètre limit invalide'}, status=400)
+    
+    try:
+        consultation = Consultation.objects.select_related('patient').get(id=consultation_id)
+        query_vector = similar_cases.consultation_vector(consultation)
+        indexed = query_vector is not None
+        if not indexed:
+            # Consultation pas encore indexée : vectoriser le texte pour cette requête seulement
+            similar_cases.schedule_indexing(consultation.id)
+            text = similar_cases.consultation_text(consultation.description_clinique, consultation.criteres_valides)
+            query_vector = similar_cases.embed_texts([text])[0]
+        
+        cases = similar_cases.find_similar_cases(
+            query_vector,
+            limit=limit,
+            exclude_consultation_id=consultation.id,
+            exclude_patient_id=None if request.GET.get('same_patient') == '1' else consultation.patient_id,
+            statuts=statuts,
+        )
+        return JsonResponse({
+            'success': True,
+            'consultation_id': str(consultation.id),
+            'indexed': indexed,
+            'cases': cases,
+            'count': len(cases)
+        })
+    except Consultation.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Consultation non trouvée'}, status=404)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la recherche de cas similaires: {str(e)}'
+        }, status=500)
+
+
+@require_http_methods(["POST"])
+def search_similar_cases(request):
+    """Cas les plus proches d'une description clinique (JSON : description, criteres, patient_id, limit, statut)."""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'JSON invalide'}, status=400)
+    
+    text = similar_cases.consultation_text(data.get('description', ''), data.get('criteres') or {})
+    if not text:
+        return JsonResponse({'success': False, 'error': 'Description clinique requise'}, status=400)
+    try:
+        limit, statuts = _similar_cases_options(data)
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Paramètre limit invalide'}, status=400)
+    
+    try:
+        cases = similar_cases.find_similar_cases(
+            similar_cases.embed_texts([text])[0],
+            limit=limit,
+            exclude_patient_id=data.get('patient_id') or None,
+            statuts=statuts,
+        )
+        return JsonResponse({
+            'success': True,
+            'cases': cases,
+            'count': len(cases)
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la recherche de cas similaires: {str(e)}'
+        }, status=500)
+
+
 @require_http_methods(["POST"])
 def create_patient(request):
     
@@ -639,17 +899,7 @@ def create_patient(request):
         data = json.loads(request.body)
         
         # Générer un numéro de dossier unique
-        last_patient = Patient.objects.order_by('-id').first()
-        if last_patient and last_patient.numero_dossier.startswith('EE-2025-'):
-            try:
-                last_num = int(last_patient.numero_dossier.split('-')[-1])
-                new_num = last_num + 1
-            except:
-                new_num = 1
-        else:
-            new_num = 1
-        
-        numero_dossier = f'EE-2025-{new_num:03d}'
+        numero_dossier = identifiers.next_identifier(identifiers.PATIENT)
         
         # Convertir la date de naissance si fournie
         date_naissance = None
@@ -667,6 +917,7 @@ def create_patient(request):
             telephone=data.get('telephone', '').strip(),
             email=data.get('email', '').strip()
         )
+        patient_typeahead.patient_changed(patient)
         
         return JsonResponse({
             'success': True,
@@ -721,17 +972,7 @@ def create_medecin(request):
         data = json.loads(request.body)
         
         # Générer un numéro d'ordre unique
-        last_medecin = Medecin.objects.order_by('-id').first()
-        if last_medecin and last_medecin.numero_ordre.startswith('MED-2025-'):
-            try:
-                last_num = int(last_medecin.numero_ordre.split('-')[-1])
-                new_num = last_num + 1
-            except:
-                new_num = 1
-        else:
-            new_num = 1
-        
-        numero_ordre = f'MED-2025-{new_num:03d}'
+        numero_ordre = identifiers.next_identifier(identifiers.MEDECIN)
         
         medecin = Medecin.objects.create(
             nom=data.get('nom', '').strip().upper(),
@@ -762,182 +1003,94 @@ def create_medecin(request):
         }, status=500)
 
 
+def _accepted_encodings(request):
+    encodings = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        token, *params = part.split(';')
+        token = token.strip().lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        # q=0 (quelle qu'en soit l'écriture : 0.0, 0.000, 0.) : encodage refusé
+        if token and quality > 0:
+            encodings.add(token)
+    return encodings
+
+
+def _precompressed_variant(request, full_path):
+    """(encodage, chemin) de la variante .br ou .gz générée par build_pathology_pages, si acceptée et à jour."""
+    accepted = _accepted_encodings(request)
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        compressed_path = str(full_path) + suffix
+        if encoding in accepted and os.path.exists(compressed_path) \
+                and os.path.getmtime(compressed_path) >= os.path.getmtime(full_path):
+            return encoding, compressed_path
+    return None
+
+
+def _precompressed_response(encoding, compressed_path):
+    with open(compressed_path, 'rb') as f:
+        response = HttpResponse(f.read(), content_type='text/html; charset=utf-8')
+    response['Content-Encoding'] = encoding
+    return response
+
+
+def _add_pathology_cache_headers(response, etag, last_modified):
+    """En-têtes de cache des contenus qui ne changent qu'avec l'index des pathologies."""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f'public, max-age={settings.PATHOLOGY_CACHE_MAX_AGE}'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
 @xframe_options_exempt
 def view_pathology(request, html_path):
+    page = pathology_pages.get_page(html_path)
+    if page is None:
+        raise Http404("Page HTML non trouvée")
+    
+    # Déterminer si on doit injecter les boutons de validation
+    mode_validation = request.GET.get('mode') == 'validation'
+    has_validate_referer = 'validate' in request.META.get('HTTP_REFERER', '')
+    inject_buttons = mode_validation or has_validate_referer
+    
+    precompressed = None if inject_buttons else _precompressed_variant(request, page.full_path)
+    
+    # Le contenu ne change qu'avec l'index : réponse 304 si le navigateur l'a déjà
+    # (ETag distinct par corps envoyé : variante et encodage)
+    pathology_catalog = catalog.get_catalog()
+    variant = 'validation' if inject_buttons else 'plain'
+    encoding = precompressed[0] if precompressed else 'identity'
+    etag = f'"{pathology_catalog.version}-{variant}-{encoding}"'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=pathology_catalog.last_modified)
+    if not_modified is not None:
+        patch_vary_headers(not_modified, ('Referer',))
+        return _add_pathology_cache_headers(not_modified, etag, pathology_catalog.last_modified)
+    
+    if precompressed:
+        response = _precompressed_response(*precompressed)
+    else:
+        # Envoyer directement les tranches d'octets préparées (boutons injectés si mode validation)
+        chunks = page.chunks(validation=inject_buttons)
+        response = StreamingHttpResponse(chunks, content_type='text/html; charset=utf-8')
+        response['Content-Length'] = sum(len(chunk) for chunk in chunks)
     
-    
-    
-    try:
-        # Construire le chemin complet vers le fichier HTML
-        full_path = os.path.join(settings.EMBEDDINGS_FOLDER, html_path)
-        
-        # Vérifier que le fichier existe et est dans le dossier autorisé
-        if not os.path.exists(full_path):
-            raise Http404("Page HTML non trouvée")
-        
-        # Vérifier que le chemin est bien dans le dossier embeddings (sécurité)
-        if not os.path.abspath(full_path).startswith(os.path.abspath(settings.EMBEDDINGS_FOLDER)):
-            raise Http404("Accès non autorisé")
-        
-        # Lire le contenu HTML
-        with open(full_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
-        # Déterminer si on doit injecter les boutons de validation
-        mode_validation = request.GET.get('mode') == 'validation'
-        has_validate_referer = 'validate' in request.META.get('HTTP_REFERER', '')
-        
-        # Injecter les boutons de validation si en mode validation
-        if mode_validation or has_validate_referer:
-            top_buttons_html = """
-            <!-- Charger Font Awesome pour les icônes -->
-            <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-            
-            <style>
-            #topValidationButtons {
-                position: -webkit-sticky !important;
-                position: sticky !important;
-                top: 0 !important;
-                left: 0 !important;
-                right: 0 !important;
-                z-index: 999999 !important;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%) !important;
-                padding: 15px 20px !important;
-                box-shadow: 0 4px 15px rgba(0,0,0,0.2) !important;
-                display: flex !important;
-                gap: 15px !important;
-                justify-content: center !important;
-                align-items: center !important;
-                border-bottom: 3px solid rgba(255,255,255,0.2) !important;
-                margin: 0 !important;
-                width: 100% !important;
-                box-sizing: border-box !important;
-            }
-            .validation-btn {
-                flex: 0 0 auto !important;
-                min-width: 180px !important;
-                color: white !important;
-                font-weight: bold !important;
-                padding: 14px 28px !important;
-                border: none !important;
-                border-radius: 10px !important;
-                cursor: pointer !important;
-                font-size: 16px !important;
-                transition: all 0.3s ease !important;
-                display: inline-flex !important;
-                align-items: center !important;
-                justify-content: center !important;
-                gap: 10px !important;
-                font-family: Arial, sans-serif !important;
-            }
-            .validation-btn-valide {
-                background: linear-gradient(135deg, #10b981 0%, #059669 100%) !important;
-                box-shadow: 0 4px 10px rgba(16, 185, 129, 0.4) !important;
-            }
-            .validation-btn-valide:hover {
-                transform: translateY(-3px) !important;
-                box-shadow: 0 6px 15px rgba(16, 185, 129, 0.5) !important;
-            }
-            .validation-btn-non-valide {
-                background: linear-gradient(135deg, #ef4444 0%, #dc2626 100%) !important;
-                box-shadow: 0 4px 10px rgba(239, 68, 68, 0.4) !important;
-            }
-            .validation-btn-non-valide:hover {
-                transform: translateY(-3px) !important;
-                box-shadow: 0 6px 15px rgba(239, 68, 68, 0.5) !important;
-            }
-            @media (max-width: 640px) {
-                #topValidationButtons {
-                    flex-direction: column;
-                    padding: 12px 15px;
-                    gap: 10px;
-                }
-                .validation-btn {
-                    width: 100%;
-                    min-width: auto;
-                }
-            }
-            </style>
-            
-            <script>
-            console.log('Boutons de validation sticky injectés !');
-            console.log('Position: En haut de l\'iframe, sticky');
-            </script>
-            
-            <div id="topValidationButtons">
-                <button onclick="window.validerFormulaire()" class="validation-btn validation-btn-valide">
-                    <i class="fas fa-check-circle" style="font-size: 20px;"></i>
-                    <span>VALIDER</span>
-                </button>
-                <button onclick="window.nonValiderFormulaire()" class="validation-btn validation-btn-non-valide">
-                    <i class="fas fa-times-circle" style="font-size: 20px;"></i>
-                    <span>NON VALIDER</span>
-                </button>
-            </div>
-            """
-            
-
-            body_match = re.search(r'<body[^>]*>', html_content, re.IGNORECASE)
-            if body_match:
-                insert_position = body_match.end()
-                html_content = html_content[:insert_position] + top_buttons_html + html_content[insert_position:]
-            else:
-                html_content = top_buttons_html + html_content
-            
-
-            if 'topValidationButtons' in html_content:
-                print("CONFIRMATION: topValidationButtons présent dans le HTML final !")
-            else:
-                print("ERREUR: topValidationButtons NON présent dans le HTML final !")
-            
-            # Script pour REMPLACER les fonctions de validation et communiquer avec la page parent
-            communication_script = """
-            <script>
-            // REMPLACER complètement les fonctions de validation pour communiquer avec la page parent
-            console.log('Injection du script de communication parent-iframe');
-            
-            // Forcer le remplacement des fonctions
-            window.validerFormulaire = function() {
-                console.log('VALIDER cliqué dans iframe - envoi message au parent');
-                // Envoyer message à la page parent
-                if (window.parent && window.parent !== window) {
-                    window.parent.postMessage({action: 'validate', source: 'pathology'}, '*');
-                    console.log('Message "validate" envoyé au parent');
-                } else {
-                    console.warn('Pas de parent window détecté');
-                    alert('Formulaire validé (mode standalone)');
-                }
-            };
-            
-            window.nonValiderFormulaire = function() {
-                console.log('NON VALIDER cliqué dans iframe - envoi message au parent');
-                // Envoyer message à la page parent
-                if (window.parent && window.parent !== window) {
-                    window.parent.postMessage({action: 'not_validate', source: 'pathology'}, '*');
-                    console.log('Message "not_validate" envoyé au parent');
-                } else {
-                    console.warn('Pas de parent window détecté');
-                    alert('Formulaire non validé (mode standalone)');
-                }
-            };
-            
-            console.log(' Fonctions de validation remplacées avec succès');
-            </script>
-            """
-            # Injecter le script juste avant la fermeture du body (après tous les autres scripts)
-            html_content = html_content.replace('</body>', communication_script + '</body>')
-        
-        return HttpResponse(html_content)
-        
-    except Exception as e:
-        raise Http404(f"Erreur lors du chargement de la page: {str(e)}")
+    # La variante dépend du Referer (page de validation)
+    patch_vary_headers(response, ('Referer',))
+    return _add_pathology_cache_headers(response, etag, pathology_catalog.last_modified)
 
 
 def validate_results(request):
     
     
-    # Récupérer les résultats depuis la session
-    results = request.session.get('search_results', [])
+    # Récupérer les résultats depuis le stockage serveur
+    results = _get_search_results(request)
     current_index = int(request.GET.get('index', 0))
     query = request.session.get('search_query', '')
     patient_id = request.session.get('current_patient_id')
@@ -970,57 +1123,36 @@ def validate_results(request):
     
    
     
-    # Charger le contenu HTML de la pathologie
+    # Critères de la pathologie : schéma structuré servi par /api/pathologies/criteria/
     html_path = current_result.get('html_page', '')
     html_content = ''
     pathology_info = {}
+    pathology_catalog = catalog.get_catalog()
     if not html_path and current_result.get('file_name'):
-        file_name = current_result.get('file_name', '').replace('.txt', '')
-        try:
-            
-            embeddings_folder = Path(settings.EMBEDDINGS_FOLDER)
-            for json_file in embeddings_folder.rglob('*.json'):
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        source_file = data.get('source_file', '')
-                        if file_name in source_file or source_file.endswith(file_name + '.txt'):
-                            html_page = data.get('html_page', '')
-                            if html_page:
-                                html_path = html_page
-                                break
-                except:
-                    continue
-        except Exception as e:
-            pass
+        entry = pathology_catalog.find_by_file_name(current_result.get('file_name', ''))
+        if entry and entry['html_page']:
+            html_path = entry['html_page']
     if html_path:
         try:
             
-            html_path_clean = html_path.lstrip('/')
-            if html_path_clean.startswith(settings.EMBEDDINGS_FOLDER + '/'):
-                html_path_clean = html_path_clean[len(settings.EMBEDDINGS_FOLDER) + 1:]
-            elif html_path_clean.startswith(settings.EMBEDDINGS_FOLDER + '\\'):
-                html_path_clean = html_path_clean[len(settings.EMBEDDINGS_FOLDER) + 1:]
-            
-            full_path = Path(settings.EMBEDDINGS_FOLDER) / html_path_clean
-            if full_path.exists():
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
+            html_path_clean = catalog.normalize_html_page(html_path)
+            schema = criteria.get_criteria(html_path_clean)
+            if schema is not None:
+                if not criteria.has_items(schema):
+                    # Aucun critère extrait : afficher la page HTML telle quelle
+                    page = pathology_pages.get_page(html_path_clean)
+                    html_content = page.content.decode('utf-8') if page else ''
                 
-                # Récupérer les informations de la pathologie depuis le JSON
-                json_path = full_path.with_suffix('.json')
+                # Récupérer les informations de la pathologie depuis le catalogue
+                entry = pathology_catalog.find_by_html_page(html_path_clean)
                 
-                if json_path.exists():
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        pathology_name = data.get('hierarchy', {}).get('parsed_name', '') or \
-                                       data.get('hierarchy', {}).get('file_stem', '')
-                        pathology_info = {
-                            'name': clean_pathology_name(pathology_name),
-                            'location': data.get('hierarchy', {}).get('location', ''),
-                            'html_page': html_path,
-                            'similarity': current_result.get('similarity', 0)
-                        }
+                if entry:
+                    pathology_info = {
+                        'name': entry['name'],
+                        'location': entry['location'],
+                        'html_page': html_path,
+                        'similarity': current_result.get('similarity', 0)
+                    }
                 else:
                     pathology_info = {
                         'name': clean_pathology_name(current_result.get('file_name', '').replace('.txt', '')),
@@ -1032,7 +1164,7 @@ def validate_results(request):
         except Exception as e:
             print(f"Traceback: {traceback.format_exc()}")
     else:
-        print(f"html_path est vide - impossible de charger le HTML")
+        logger.warning("Résultat %s sans page HTML : critères non chargés", current_index)
     
     context = {
         'html_content': html_content,
@@ -1060,7 +1192,13 @@ def validate_action(request):
         form_data = data.get('form_data', {})  
         is_direct_access = data.get('direct_access', False)
         
-        results = request.session.get('search_results', [])
+        # Sélection structurée ({id du critère: true | texte}) : form_data reconstruit depuis le schéma de la page
+        if isinstance(data.get('criteria'), dict) and data.get('html_page'):
+            schema = criteria.get_criteria(data['html_page'])
+            if schema is not None:
+                form_data = criteria.form_data_from_selection(schema, data['criteria'])
+        
+        results = _get_search_results(request)
         
         if action == 'validate':
 
@@ -1086,32 +1224,13 @@ def validate_action(request):
                 similarity_score = 100  # Score de 100% pour accès direct
                 
                 
+                # Texte du premier chunk, depuis le catalogue des pathologies
                 best_chunk_text = ''
-                try:
-                    # Construire le chemin vers le fichier JSON
-                    if html_page:
-                        html_page_clean = html_page.lstrip('/')
-                        # Corriger les problèmes d'encodage URL (décode %2F en /)
-                        html_page_clean = urllib.parse.unquote(html_page_clean)
-                        # Remplacer .html par .json
-                        json_path = Path(settings.EMBEDDINGS_FOLDER) / html_page_clean.replace('.html', '.json')
-                        print(f"DEBUG - html_page_clean: {html_page_clean}")
-                        print(f"DEBUG - json_path: {json_path}")
-                        
-                        # Vérifier que c'est un fichier, pas un répertoire
-                        if json_path.exists() and json_path.is_file():
-                            with open(json_path, 'r', encoding='utf-8') as f:
-                                json_data = json.load(f)
-                                # Récupérer le texte du premier chunk
-                                if json_data.get('chunks') and len(json_data['chunks']) > 0:
-                                    best_chunk_text = json_data['chunks'][0].get('text_preview', '')
-                        else:
-                            print(f"Fichier JSON non trouvé ou est un répertoire: {json_path}")
-                    else:
-                        print(f" html_page est vide")
-                except Exception as e:
-                    print(f"Erreur lors de la lecture du texte médical: {e}")
-                    print(f"Traceback: {traceback.format_exc()}")
+                entry = catalog.get_catalog().find_by_html_page(html_page)
+                if entry:
+                    best_chunk_text = entry['first_chunk_text']
+                else:
+                    print(f"Pathologie non trouvée dans le catalogue: {html_page}")
                 
                 # Créer un résultat factice pour l'accès direct
                 result = {
@@ -1134,14 +1253,21 @@ def validate_action(request):
             
             try:
                 service = PathologySearchService(model=selected_model, embedding_model_type='openai-ada')
-                historical_symptoms = request.session.get('patient_historical_symptoms', [])
+                # Symptômes des consultations précédentes du patient (profil matérialisé)
+                current_patient_id = request.session.get('current_patient_id')
+                # Seuls les plus récents sont cités dans le prompt : pas de chargement du profil complet
+                historical_symptoms, historical_symptoms_total = [], 0
+                if current_patient_id:
+                    historical_symptoms = symptom_profile.symptom_labels(current_patient_id, limit=PROMPT_HISTORY_SYMPTOMS)
+                    historical_symptoms_total = symptom_profile.symptom_count(current_patient_id)
                 
                 diagnosis_result = service.generate_ai_diagnosis(
                     pathology_name=pathology_name,
                     form_data=form_data,
                     similarity_score=similarity_score,
                     medical_text=best_chunk_text,
-                    historical_symptoms=historical_symptoms  
+                    historical_symptoms=historical_symptoms,
+                    historical_symptoms_total=historical_symptoms_total
                 )
             except Exception as e:
                 # Gérer les erreurs de l'API (Claude, ChatGPT, etc.) et retourner du JSON
@@ -1158,16 +1284,12 @@ def validate_action(request):
                 }, status=500)
             diagnosis_id = str(uuid.uuid4())
             
-            if 'diagnoses' not in request.session:
-                request.session['diagnoses'] = {}
-            
-            request.session['diagnoses'][diagnosis_id] = {
+            diagnosis_entry = {
                 'diagnosis': diagnosis_result,
                 'result': result,
                 'form_data': form_data,
                 'model_used': selected_model  
             }
-            request.session.modified = True
             try:
                 patient_id = request.session.get('current_patient_id')
                 medecin_id = request.session.get('current_medecin_id')
@@ -1187,7 +1309,8 @@ def validate_action(request):
                         'model_display_name': {
                             'chatgpt-5.1': 'Model 1',
                             'claude-4.5': 'Model 2',
-                        }.get(selected_model, selected_model)
+                        }.get(selected_model, selected_model),
+                        'embedding_model': request.session.get('search_embedding_model', 'openai-ada'),
                     }
                     
                     # Récupérer uniquement le plan de traitement (pas de diagnostic summary)
@@ -1206,13 +1329,27 @@ def validate_action(request):
                         statut='valide'
                     )
                     
-                    # Stocker l'ID de la consultation dans la session pour le rapport
-                    request.session['diagnoses'][diagnosis_id]['consultation_id'] = str(consultation.id)
-                    request.session.modified = True
+                    # Conserver l'ID de la consultation avec le diagnostic pour le rapport
+                    diagnosis_entry['consultation_id'] = str(consultation.id)
+                    
+                    # Indexer la consultation pour la recherche de cas similaires (en arrière-plan)
+                    similar_cases.schedule_indexing(consultation.id)
+                    # Consultation validée : pré-rendre le rapport PDF pour que l'impression soit immédiate
+                    reports.schedule_render(consultation.id)
+                    
+                    # Vectoriser les symptômes validés pour les prochaines recherches avec historique
+                    symptom_history.schedule_embedding(
+                        symptom_history.consultation_symptoms(form_data),
+                        request.session.get('search_embedding_model', 'openai-ada')
+                    )
             except Exception as e:
                 # Si erreur, continuer quand même (ne pas bloquer l'utilisateur)
                 print(f"Erreur lors de la sauvegarde de la consultation: {e}")
             
+            # Stocker le diagnostic côté serveur, la session ne garde que la référence
+            result_store.put(result_store.DIAGNOSIS, diagnosis_entry, result_id=diagnosis_id)
+            _remember_diagnosis(request, diagnosis_id)
+            
             return JsonResponse({
                 'success': True,
                 'action': 'validated',
@@ -1288,69 +1425,8 @@ def validate_action(request):
                     )
                     
                     print(f"✅ Consultation NON VALIDÉE sauvegardée (ID: {consultation.id}) avec {len(form_data) if form_data else 0} critères")
-                    
-                    # 🆕 Extraire TOUS les symptômes des critères cochés pour les sauvegarder dans l'historique
-                    # Fonction pour nettoyer et valider un symptôme (réutilisée)
-                    def clean_and_validate_symptom(symptom_text):
-                        """Nettoyer et valider un symptôme avant de l'ajouter à l'historique"""
-                        if not symptom_text:
-                            return None
-                        
-                        symptom_text = str(symptom_text).strip()
-                        
-                        # Ignorer les chaînes trop courtes (moins de 2 caractères)
-                        if len(symptom_text) < 2:
-                            return None
-                        
-                        # Ignorer les chaînes qui ne contiennent que des symboles
-                        if not re.search(r'[a-zA-ZÀ-ÿ]', symptom_text):
-                            return None
-                        
-                        # Ignorer les chaînes répétitives (comme "aaaa", "test test test")
-                        words = symptom_text.split()
-                        if len(words) > 1 and len(set(words)) == 1:
-                            return None
-                        
-                        # Ignorer les chaînes qui sont clairement des métadonnées
-                        if symptom_text.lower().startswith('_metadata') or symptom_text.lower() == '_metadata':
-                            return None
-                        
-                        return symptom_text
-                    
-                    symptoms = []
-                    if form_data:
-                        for key, value in form_data.items():
-                            # Ignorer les métadonnées
-                            if key == '_metadata':
-                                continue
-                            if isinstance(value, list):
-                                # Si c'est une liste, extraire chaque symptôme
-                                for item in value:
-                                    cleaned = clean_and_validate_symptom(item)
-                                    if cleaned:
-                                        symptoms.append(cleaned)
-                            elif isinstance(value, dict):
-                                # Si c'est un dictionnaire, extraire les valeurs
-                                for sub_key, sub_value in value.items():
-                                    cleaned = clean_and_validate_symptom(sub_value)
-                                    if cleaned:
-                                        symptoms.append(cleaned)
-                            else:
-                                cleaned = clean_and_validate_symptom(value)
-                                if cleaned:
-                                    symptoms.append(cleaned)
-                    
-                    # Dédupliquer les symptômes
-                    symptoms = list(set(symptoms))
-                    
-                    # Ajouter les symptômes à l'historique du patient dans la session (seulement les valides)
-                    if 'patient_historical_symptoms' not in request.session:
-                        request.session['patient_historical_symptoms'] = []
-                    request.session['patient_historical_symptoms'].extend(symptoms)
-                    # Dédupliquer l'historique complet
-                    request.session['patient_historical_symptoms'] = list(set(request.session['patient_historical_symptoms']))
-                    request.session.modified = True
-                    print(f" {len(symptoms)} symptômes (critères cochés) ajoutés à l'historique du patient: {symptoms[:5]}...")
+                    # Les symptômes cochés rejoignent le profil du patient via signals (symptom_profile)
+                    similar_cases.schedule_indexing(consultation.id)
             except Exception as e:
                 print(f"Erreur lors de la sauvegarde de la consultation non validée: {e}")
             
@@ -1399,14 +1475,15 @@ def show_diagnosis(request, diagnosis_id):
     """
     Afficher le diagnostic IA généré pour une pathologie validée.
     """
-    diagnoses = request.session.get('diagnoses', {})
+    diagnosis_data = None
+    if diagnosis_id in request.session.get('diagnosis_ids', []):
+        diagnosis_data = result_store.get(diagnosis_id, result_store.DIAGNOSIS)
     
-    if diagnosis_id not in diagnoses:
+    if not diagnosis_data:
         return render(request, 'pathology_search/index.html', {
             'error': 'Diagnostic non trouvé. Veuillez effectuer une nouvelle recherche.'
         })
     
-    diagnosis_data = diagnoses[diagnosis_id]
     diagnosis_result = diagnosis_data['diagnosis']
     result = diagnosis_data['result']
     form_data = diagnosis_data['form_data']
@@ -1423,8 +1500,10 @@ def show_diagnosis(request, diagnosis_id):
     patient_nom = ''
     patient_prenom = ''
     patient_identite = ''
+    consultation = None
     if consultation_id:
         try:
+            # Une seule lecture : patient, statut, plan validé et notes
             consultation = Consultation.objects.select_related('patient').get(id=consultation_id)
             patient = consultation.patient
             patient_nom = patient.last_name or patient.nom or ''
@@ -1452,15 +1531,10 @@ def show_diagnosis(request, diagnosis_id):
     consultation_statut = 'en_cours'
     plan_valide = ''
     notes_medecin = ''  # Initialiser par défaut
-    if consultation_id:
-        try:
-            consultation = Consultation.objects.get(id=consultation_id)
-            consultation_statut = consultation.statut
-            plan_valide = consultation.plan_traitement_valide if consultation.plan_traitement_valide else ''
-            notes_medecin = consultation.notes_medecin if consultation.notes_medecin else ''
-        except Exception as e:
-            print(f"Erreur lors de la récupération de la consultation: {e}")
-            notes_medecin = ''  # S'assurer que notes_medecin est défini même en cas d'erreur
+    if consultation is not None:
+        consultation_statut = consultation.statut
+        plan_valide = consultation.plan_traitement_valide if consultation.plan_traitement_valide else ''
+        notes_medecin = consultation.notes_medecin if consultation.notes_medecin else ''
     
     context = {
         'diagnosis_id': diagnosis_id,
@@ -1513,6 +1587,9 @@ def validate_treatment_plan(request, consultation_id):
         consultation.statut = 'valide'
         consultation.save()
         
+        # Pré-rendre le rapport PDF pour que l'impression soit immédiate
+        reports.schedule_render(consultation.id)
+        
         return JsonResponse({
             'success': True,
             'message': 'Plan de traitement validé avec succès'
@@ -1541,6 +1618,7 @@ def modify_treatment_plan(request, consultation_id):
         consultation.notes_medecin = notes_medecin
         consultation.statut = 'en_cours'  # Remettre en cours après modification
         consultation.save()
+        reports.invalidate(consultation.id)
         
         return JsonResponse({
             'success': True,
@@ -1563,6 +1641,7 @@ def delete_consultation(request, consultation_id):
     try:
         consultation = Consultation.objects.get(id=consultation_id)
         consultation.delete()
+        reports.invalidate(consultation_id)
         
         return JsonResponse({
             'success': True,
@@ -1621,20 +1700,16 @@ def direct_pathology_access(request):
             except:
                 pass
         
-        # Récupérer les informations de la pathologie depuis le JSON
-        json_path = full_path.with_suffix('.json')
+        # Récupérer les informations de la pathologie depuis le catalogue
+        entry = catalog.get_catalog().find_by_html_page(html_path)
         pathology_info = {}
         
-        if json_path.exists():
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                pathology_name = data.get('hierarchy', {}).get('parsed_name', '') or \
-                               data.get('hierarchy', {}).get('file_stem', '')
-                pathology_info = {
-                    'name': clean_pathology_name(pathology_name),
-                    'location': data.get('hierarchy', {}).get('location', ''),
-                    'html_page': html_path
-                }
+        if entry:
+            pathology_info = {
+                'name': entry['name'],
+                'location': entry['location'],
+                'html_page': html_path
+            }
         
         context = {
             'html_content': html_content,
@@ -1653,53 +1728,130 @@ def direct_pathology_access(request):
         })
 
 
-def get_all_pathologies(request):
+def get_pathology_criteria(request):
+    """Schéma des critères diagnostiques d'une page de pathologie (?html_page=...)."""
+    html_page = request.GET.get('html_page', '')
+    if not html_page:
+        return JsonResponse({'success': False, 'error': 'Paramètre html_page requis'}, status=400)
+    
+    try:
+        pathology_catalog = catalog.get_catalog()
+        etag = f'"{pathology_catalog.version}-criteria"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=pathology_catalog.last_modified)
+        if not_modified is not None:
+            return _add_pathology_cache_headers(not_modified, etag, pathology_catalog.last_modified)
+        
+        schema = criteria.get_criteria(html_page)
+        if schema is None:
+            return JsonResponse({'success': False, 'error': 'Pathologie non trouvée'}, status=404)
+        
+        entry = pathology_catalog.find_by_html_page(html_page)
+        response = JsonResponse({
+            'success': True,
+            'html_page': catalog.normalize_html_page(html_page),
+            'name': entry['name'] if entry else '',
+            'criteria': schema
+        }, json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+        return _add_pathology_cache_headers(response, etag, pathology_catalog.last_modified)
+    
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la récupération des critères: {str(e)}'
+        }, status=500)
+
+
+def get_pathology_differentials(request):
+    """Diagnostics différentiels d'une pathologie (?file_name= | ?html_page= | ?name=, &embedding_model=, &limit=)."""
+    file_name = request.GET.get('file_name', '')
+    html_page = request.GET.get('html_page', '')
+    name = request.GET.get('name', '')
+    if not (file_name or html_page or name):
+        return JsonResponse({'success': False, 'error': 'Paramètre file_name, html_page ou name requis'}, status=400)
     
+    try:
+        limit = min(max(int(request.GET.get('limit', 5)), 1), differentials.MAX_NEIGHBOURS)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Paramètre limit invalide'}, status=400)
     
     try:
-        embeddings_folder = settings.EMBEDDINGS_FOLDER
+        embedding_model = request.GET.get('embedding_model', 'openai-ada')
+        embeddings_folder = get_embedding_config(embedding_model)['folder']
+        pathology_catalog = catalog.get_catalog(embeddings_folder)
+        matrix = differentials.get_matrix(embeddings_folder)
         
-        if isinstance(embeddings_folder, str):
-            folder_path = Path(embeddings_folder)
-        else:
-            folder_path = embeddings_folder
+        etag = f'"{matrix.version}-{pathology_catalog.version}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=pathology_catalog.last_modified)
+        if not_modified is not None:
+            return _add_pathology_cache_headers(not_modified, etag, pathology_catalog.last_modified)
         
-        pathologies = []
+        entry = differentials.find_entry(embeddings_folder, file_name=file_name, html_page=html_page, name=name)
+        if entry is None:
+            return JsonResponse({'success': False, 'error': 'Pathologie non trouvée'}, status=404)
         
-        # Parcourir récursivement tous les fichiers JSON
-        for json_file in folder_path.rglob('*.json'):
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Vérifier si le fichier a un html_page
-                    if 'html_page' in data and data['html_page']:
-                        # Extraire le nom de la pathologie depuis hierarchy
-                        pathology_name = data.get('hierarchy', {}).get('parsed_name', '') or \
-                                       data.get('hierarchy', {}).get('file_stem', '')
-                        
-                        if pathology_name:
-                            # Nettoyer le nom de la pathologie
-                            clean_name = clean_pathology_name(pathology_name)
-                            
-                            pathologies.append({
-                                'name': clean_name,
-                                'original_name': pathology_name,
-                                'html_page': data['html_page'],
-                                'location': data.get('hierarchy', {}).get('location', '')
-                            })
-            except Exception as e:
-                # Ignorer les fichiers JSON invalides
-                continue
+        response = JsonResponse({
+            'success': True,
+            'embedding_model': embedding_model,
+            'pathology': {
+                'name': entry['name'],
+                'file_name': entry['file_name'],
+                'html_page': entry['html_page'],
+                'location': entry['location'],
+            },
+            'differentials': differentials.get_differentials(embeddings_folder, entry, limit=limit)
+        })
+        return _add_pathology_cache_headers(response, etag, pathology_catalog.last_modified)
+    
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la récupération des diagnostics différentiels: {str(e)}'
+        }, status=500)
+
+
+def get_pathology_categories(request):
+    """Familles de troubles de l'index (?embedding_model=), utilisables comme filtres de recherche."""
+    try:
+        embeddings_folder = get_embedding_config(request.GET.get('embedding_model', 'openai-ada'))['folder']
+        pathology_catalog = catalog.get_catalog(embeddings_folder)
+        etag = f'"{pathology_catalog.version}-categories"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=pathology_catalog.last_modified)
+        if not_modified is not None:
+            return _add_pathology_cache_headers(not_modified, etag, pathology_catalog.last_modified)
+        
+        categories = search_index.get_index(embeddings_folder).category_list()
+        response = JsonResponse({
+            'success': True,
+            'categories': categories,
+            'count': len(categories)
+        })
+        return _add_pathology_cache_headers(response, etag, pathology_catalog.last_modified)
+    
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur lors de la récupération des familles de troubles: {str(e)}'
+        }, status=500)
+
+
+def get_all_pathologies(request):
+    
+    
+    try:
+        pathology_catalog = catalog.get_catalog()
+        etag = f'"{pathology_catalog.version}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=pathology_catalog.last_modified)
+        if not_modified is not None:
+            return _add_pathology_cache_headers(not_modified, etag, pathology_catalog.last_modified)
         
-        # Trier les pathologies par nom
-        pathologies.sort(key=lambda x: x['name'])
+        pathologies = pathology_catalog.pathology_list
         
-        return JsonResponse({
+        response = JsonResponse({
             'success': True,
             'pathologies': pathologies,
             'count': len(pathologies)
         })
+        return _add_pathology_cache_headers(response, etag, pathology_catalog.last_modified)
     
     except Exception as e:
         return JsonResponse({